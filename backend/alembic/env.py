@@ -0,0 +1,67 @@
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine, pool
+
+from app.core.config import settings
+import app.models  # noqa: F401
+from app.models import (  # noqa: F401  (registrar todas las tablas en Base.metadata)
+    apartado,
+    cash_closure,
+    customer_stats,
+    daily_aggregate,
+    data_version,
+    folio_counter,
+    inventory_closure,
+    job,
+    payment,
+    price_history,
+    shift,
+    status_history,
+    stock_ledger,
+    tasa_metal_pedido,
+    ticket,
+    venta_contado,
+)
+from app.models.tenant import Base
+
+config = context.config
+if config.config_file_name is not None and config.attributes.get("configure_logging", True):
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline() -> None:
+    context.configure(
+        url=settings.database_url,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    # Los tests (y scripts) pueden pasar una conexión abierta en config.attributes["connection"]
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _run(connection)
+        return
+
+    engine = create_engine(settings.database_url, poolclass=pool.NullPool)
+    with engine.connect() as connection:
+        _run(connection)
+
+
+def _run(connection) -> None:
+    context.configure(connection=connection, target_metadata=target_metadata)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,74 @@
+"""Índices compuestos tenant/fecha y parciales para reportes y listados
+
+Casi todas las consultas calientes filtran por tenant_id más un rango de created_at
+(corte de caja, listados de ventas/apartados/pedidos, movimientos de inventario) o
+buscan los hijos de un documento (abonos por apartado, pagos por pedido y tipo).
+Los modelos sólo declaraban índices de una columna y pedidos/pagos_pedido/
+productos_pedido no tenían índice de tenant.
+
+Los índices se crean con CREATE INDEX CONCURRENTLY (PostgreSQL) para no bloquear
+escrituras, e IF NOT EXISTS porque las bases creadas con create_all ya los tienen
+(están declarados también en los modelos).
+
+Revision ID: 0001_tenant_time_indexes
+Revises:
+Create Date: 2025-06-01 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001_tenant_time_indexes"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+OPEN_APARTADOS = "credit_status IN ('pendiente', 'vencido')"
+
+# (nombre, tabla, columnas, where parcial)
+INDEXES = [
+    ("ix_ventas_contado_tenant_created", "ventas_contado", ["tenant_id", "created_at"], None),
+    ("ix_apartados_tenant_created", "apartados", ["tenant_id", "created_at"], None),
+    ("ix_apartados_tenant_open", "apartados", ["tenant_id", "created_at"], OPEN_APARTADOS),
+    ("ix_credit_payments_tenant_created", "credit_payments", ["tenant_id", "created_at"], None),
+    ("ix_credit_payments_apartado_created", "credit_payments", ["apartado_id", "created_at"], None),
+    ("ix_pedidos_tenant_created", "pedidos", ["tenant_id", "created_at"], None),
+    ("ix_pedidos_tenant_tipo_estado", "pedidos", ["tenant_id", "tipo_pedido", "estado"], None),
+    ("ix_pagos_pedido_pedido_tipo", "pagos_pedido", ["pedido_id", "tipo_pago"], None),
+    ("ix_pagos_pedido_created", "pagos_pedido", ["created_at"], None),
+    ("ix_productos_pedido_tenant_active", "productos_pedido", ["tenant_id", "active"], None),
+    ("ix_inventory_movements_tenant_created", "inventory_movements", ["tenant_id", "created_at"], None),
+    ("ix_inventory_movements_product_created", "inventory_movements", ["product_id", "created_at"], None),
+    ("ix_tickets_tenant_kind", "tickets", ["tenant_id", "kind"], None),
+    ("ix_status_history_entity", "status_history", ["tenant_id", "entity_type", "entity_id"], None),
+]
+
+
+def upgrade() -> None:
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    # CONCURRENTLY no puede correr dentro de una transacción
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            if table not in existing:
+                # Tabla aún no creada: create_all la creará ya con sus índices
+                continue
+            kwargs = {}
+            if where:
+                kwargs = {"postgresql_where": sa.text(where), "sqlite_where": sa.text(where)}
+            op.create_index(
+                name,
+                table,
+                columns,
+                if_not_exists=True,
+                postgresql_concurrently=True,
+                **kwargs,
+            )
+        if op.get_bind().dialect.name == "postgresql":
+            # Estadísticas frescas para que el planner considere los índices nuevos
+            for table in sorted({table for _, table, _, _ in INDEXES} & existing):
+                op.execute(f"ANALYZE {table}")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
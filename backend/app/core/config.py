@@ -11,8 +11,81 @@ class Settings(BaseSettings):
     refresh_token_expire_minutes: int = 60 * 24 * 30
     database_url: str = "postgresql+psycopg2://erpuser:erppass@db:5432/erppos"
     tenant_header: str = "X-Tenant-ID"
+
+    # Pool de conexiones: tamaño, conexiones extra en picos, espera máxima por una
+    # conexión libre (s), reciclaje de conexiones viejas (s) y ping antes de usarlas
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: int = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    # Detrás de PgBouncer en modo transacción: sin pool propio ni estado de sesión
+    db_pgbouncer: bool = False
+    # statement_timeout de PostgreSQL (ms; 0 = sin límite): global y para reportes
+    db_statement_timeout_ms: int = 0
+    db_report_statement_timeout_ms: int = 30000
     backend_cors_origins: str = "http://localhost:5173"
+
+    # Folios: "strict" (consecutivos sin huecos, serializa por tenant/tipo),
+    # "leased" (bloques por worker, sin candado durante la venta) o
+    # "sequence" (SEQUENCE nativa de PostgreSQL por tenant/tipo)
+    folio_mode: str = "strict"
+    folio_block_size: int = 50
+
+    # Caché en proceso de tenant/usuario para autenticación (segundos; 0 = desactivado)
+    auth_cache_ttl_seconds: int = 60
+
+    # Índice en memoria codigo -> producto para el escáner: se carga al arrancar y se
+    # recarga por tenant al vencer el TTL (segundos; 0 = nunca vence)
+    codigo_index_warm_on_startup: bool = True
+    codigo_index_ttl_seconds: int = 300
+
+    # Trabajos en segundo plano (tabla jobs): hilos por proceso (0 = este proceso no
+    # ejecuta trabajos), espera entre revisiones de la cola, límite de pendientes por
+    # tenant, tiempo sin latido para darlos por caídos y retención de terminados
+    job_workers: int = 2
+    job_poll_seconds: float = 2.0
+    job_max_pending_per_tenant: int = 10
+    job_stale_seconds: int = 900
+    job_retention_hours: int = 48
+
+    # Recálculo de precios por tasa de metal en segundo plano: productos por lote
+    # (cada lote es un UPDATE con su propio commit)
+    metal_repricing_batch_size: int = 2000
+
+    # Vencimiento de apartados/pedidos con saldo: días para vencer y cada cuánto corre
+    # el barrido en la app (segundos; 0 = este proceso no barre, usar el CLI)
+    expiry_days: int = 75
+    expiry_sweep_interval_seconds: int = 3600
     
+    # Hilos del threadpool de AnyIO donde FastAPI ejecuta los endpoints y dependencias
+    # síncronos (todos los que usan la sesión de SQLAlchemy). Conviene que no supere por
+    # mucho el pool de conexiones: un hilo sin conexión sólo espera
+    threadpool_size: int = 40
+
+    # Arranque: correr la compuerta de esquema en cada worker (false si el deploy corre
+    # `python -m app.core.startup` antes) y presupuesto de tiempo de arranque (ms)
+    startup_migrations: bool = True
+    startup_budget_ms: int = 3000
+
+    # Métricas (GET /metrics, /admin/slow-requests, /admin/db-pool): activarlas; token
+    # Bearer para leerlas (vacío = sólo abiertas en dev/test, fuera de ahí 404); desde
+    # cuántos ms un request va al log con su SQL (0 = no registrar); cuántas de sus
+    # sentencias más lentas se guardan por request; y cuántos requests lentos se conservan
+    metrics_enabled: bool = True
+    metrics_token: str = ""
+    slow_request_ms: float = 1000
+    slow_request_statements: int = 5
+    slow_request_log_size: int = 50
+
+    # Listados con ETag (/products/, /productos-pedido/, /metal-rates, /tasas-pedido/):
+    # segundos que un worker confía en la versión de datos que ya leyó (los cambios de
+    # otro worker se ven a lo más con ese retraso; 0 = leerla siempre), respuestas que
+    # guarda la caché en memoria y tamaño máximo de una respuesta para guardarla (bytes)
+    data_version_ttl_seconds: float = 2
+    response_cache_entries: int = 256
+    response_cache_max_body_bytes: int = 2_000_000
+
     # Railway specific - use PORT env var if available
     port: int = int(os.getenv("PORT", "8000"))
     
@@ -1,64 +1,21 @@
-from sqlalchemy import create_engine, text, inspect
-from sqlalchemy.orm import sessionmaker
+from fastapi import Depends
+from sqlalchemy import LargeBinary, create_engine, text, inspect
+from sqlalchemy.orm import Session, sessionmaker
 
 from app.core.config import settings
+from app.core import metrics
+from app.core.db_pool import engine_options, instrument, set_statement_timeout
 from app.models.tenant import Base
 
 
-engine = create_engine(settings.database_url, pool_pre_ping=True)
+# Pool, PgBouncer y statement_timeout según Settings (ver app.core.db_pool)
+engine = create_engine(settings.database_url, **engine_options(settings.database_url))
+instrument(engine)
+# Consultas y tiempo en la base por request (ver app.core.metrics)
+metrics.instrument(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Ejecutar migraciones automáticamente al importar el módulo
-# Esto asegura que las columnas existan antes de que se use el modelo
-try:
-    from sqlalchemy import inspect as sqlalchemy_inspect
-    inspector = sqlalchemy_inspect(engine)
-
-    # Migración para notas_cliente en apartados
-    if 'apartados' in inspector.get_table_names():
-        columns = [col['name'] for col in inspector.get_columns('apartados')]
-        if 'notas_cliente' not in columns:
-            with engine.connect() as connection:
-                connection.execute(text("ALTER TABLE apartados ADD COLUMN IF NOT EXISTS notas_cliente TEXT"))
-                connection.commit()
-
-    # Migración para vip_discount_pct en apartados
-    if 'apartados' in inspector.get_table_names():
-        columns = [col['name'] for col in inspector.get_columns('apartados')]
-        if 'vip_discount_pct' not in columns:
-            with engine.connect() as connection:
-                connection.execute(text("ALTER TABLE apartados ADD COLUMN vip_discount_pct NUMERIC(5,2) NOT NULL DEFAULT 0"))
-                connection.commit()
-
-    # Migración para agregar vip_discount_pct en pedidos
-    if 'pedidos' in inspector.get_table_names():
-        columns = [col['name'] for col in inspector.get_columns('pedidos')]
-        if 'vip_discount_pct' not in columns:
-            try:
-                with engine.connect() as connection:
-                    connection.execute(text("ALTER TABLE pedidos ADD COLUMN vip_discount_pct NUMERIC(5,2) NOT NULL DEFAULT 0"))
-                    connection.commit()
-                    print("✅ Migración completada: columna vip_discount_pct agregada a pedidos")
-            except Exception as e:
-                print(f"⚠️ No se pudo agregar columna vip_discount_pct a pedidos: {e}")
-
-    # Migración para quitar descuento_vip_pct en pedidos (si existe)
-    if 'pedidos' in inspector.get_table_names():
-        columns = [col['name'] for col in inspector.get_columns('pedidos')]
-        if 'descuento_vip_pct' in columns:
-            try:
-                with engine.connect() as connection:
-                    connection.execute(text("ALTER TABLE pedidos DROP COLUMN IF EXISTS descuento_vip_pct"))
-                    connection.commit()
-                    print("✅ Migración completada: columna descuento_vip_pct eliminada de pedidos")
-            except Exception as e:
-                print(f"⚠️ No se pudo eliminar columna descuento_vip_pct: {e}")
-
-
-except Exception:
-    # Si hay algún error (tabla no existe, etc), se ignorará
-    # La migración se ejecutará en init_db() cuando se cree la tabla
-    pass
+# Importar este módulo no abre conexiones: el esquema se revisa al arrancar
+# (app.core.startup) o con `python -m app.core.startup` en el deploy
 
 
 def get_db():
@@ -69,6 +26,12 @@ def get_db():
         db.close()
 
 
+def get_report_db(db: Session = Depends(get_db)) -> Session:
+    """Misma sesión que get_db (una conexión por petición) con el statement_timeout de reportes."""
+    set_statement_timeout(db, settings.db_report_statement_timeout_ms)
+    return db
+
+
 def _run_migration_notas_cliente() -> None:
     """Ejecuta migración para agregar columna notas_cliente a apartados si no existe"""
     try:
@@ -125,7 +88,48 @@ def _run_migration_vip_discount_pedidos() -> None:
 
 
 
+def _run_migration_drop_descuento_vip_pct() -> None:
+    """Quita la columna descuento_vip_pct de pedidos si existe (reemplazada por vip_discount_pct)"""
+    try:
+        inspector = inspect(engine)
+        columns = [col['name'] for col in inspector.get_columns('pedidos')]
+
+        if 'descuento_vip_pct' in columns:
+            with engine.connect() as connection:
+                connection.execute(text("ALTER TABLE pedidos DROP COLUMN IF EXISTS descuento_vip_pct"))
+                connection.commit()
+            print("✅ Migración completada: columna descuento_vip_pct eliminada de pedidos")
+    except Exception as e:
+        print(f"⚠️ No se pudo eliminar columna descuento_vip_pct: {e}")
+
+
+def _run_migration_ticket_storage() -> None:
+    """Columnas de tickets comprimidos (body, html_size, etag) y html opcional"""
+    try:
+        inspector = inspect(engine)
+        columns = {col['name']: col for col in inspector.get_columns('tickets')}
+        binary = LargeBinary().compile(dialect=engine.dialect)
+        added = []
+        with engine.connect() as connection:
+            for name, ddl in (("body", binary), ("html_size", "INTEGER"), ("etag", "VARCHAR(64)")):
+                if name not in columns:
+                    connection.execute(text(f"ALTER TABLE tickets ADD COLUMN {name} {ddl}"))
+                    added.append(name)
+            if engine.dialect.name == "postgresql" and not columns['html']['nullable']:
+                connection.execute(text("ALTER TABLE tickets ALTER COLUMN html DROP NOT NULL"))
+                added.append("html NULL")
+            connection.commit()
+        if added:
+            print(f"✅ Migración completada: tickets ({', '.join(added)})")
+    except Exception as e:
+        print(f"⚠️ No se pudo migrar la tabla tickets: {e}")
+
+
 def init_db() -> None:
+    """
+    Pasos de esquema del arranque. No se llama al importar: corre detrás de la compuerta
+    versionada de app.core.startup (una vez por versión, no por worker).
+    """
     # Create tables in dev/test without running Alembic
     if settings.env in {"dev", "test"}:
         Base.metadata.create_all(bind=engine)
@@ -134,5 +138,17 @@ def init_db() -> None:
     _run_migration_notas_cliente()
     _run_migration_vip_discount()
     _run_migration_vip_discount_pedidos()
+    _run_migration_drop_descuento_vip_pct()
+    _run_migration_ticket_storage()
+
+    # Índices pg_trgm para la búsqueda de productos (solo PostgreSQL)
+    from app.services.product_search import ensure_search_indexes
+    ensure_search_indexes(engine)
+    # ... y para la búsqueda de clientes
+    from app.services import customer_stats
+    customer_stats.ensure_search_indexes(engine)
+    # customer_stats se mantiene al escribir; aquí se llena (o corrige) desde las ventas
+    # que ya existían. Corre una vez por SCHEMA_VERSION
+    customer_stats.backfill(engine)
 
 
@@ -0,0 +1,176 @@
+"""
+Configuración y telemetría del pool de conexiones.
+
+engine_options() arma los argumentos de create_engine a partir de Settings:
+- Pool propio (QueuePool): db_pool_size, db_max_overflow, db_pool_timeout, db_pool_recycle.
+- Modo PgBouncer (db_pgbouncer=true, pooling por transacción): NullPool, porque el pool
+  es PgBouncer, y nada de estado de sesión. Por eso el statement_timeout global no va en
+  los parámetros de arranque (PgBouncer los rechaza); se aplica con
+  set_config(..., true) al iniciar cada transacción. El resto del código ya es compatible:
+  los candados advisory son de transacción y los cursores del lado del servidor viven
+  dentro de la transacción.
+
+statement_timeout: db_statement_timeout_ms para todo (0 = sin límite) y
+db_report_statement_timeout_ms para los reportes (ver get_report_db en
+app.core.database). Sólo aplica en PostgreSQL.
+
+InstrumentedQueuePool mide cuánto espera cada checkout por una conexión libre;
+pool_stats() lo expone en GET /admin/db-pool.
+"""
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event, select, func
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool, QueuePool
+
+from app.core.config import settings
+
+STATEMENT_TIMEOUT_KEY = "statement_timeout_ms"
+
+
+class _Stats:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.checkouts = 0
+        self.waited = 0  # checkouts que esperaron más de 1 ms
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.connects = 0
+
+    def record(self, seconds: float, timed_out: bool = False) -> None:
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total += seconds
+            if seconds > 0.001:
+                self.waited += 1
+            if seconds > self.wait_max:
+                self.wait_max = seconds
+
+
+_stats = _Stats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que registra el tiempo de espera de cada checkout."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            _stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        _stats.record(time.perf_counter() - started)
+        return connection
+
+
+def _is_memory_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def engine_options(database_url: str) -> Dict[str, Any]:
+    """Argumentos de create_engine según Settings (pool, PgBouncer, statement_timeout)."""
+    url = make_url(database_url)
+    options: Dict[str, Any] = {"pool_pre_ping": settings.db_pool_pre_ping}
+    if _is_memory_sqlite(url):
+        return options  # SQLite en memoria: un pool por hilo, sin tamaño
+    if settings.db_pgbouncer:
+        options["poolclass"] = NullPool
+        return options
+    options.update(
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+    )
+    if url.get_backend_name() == "postgresql" and settings.db_statement_timeout_ms > 0:
+        # Conexión directa: el límite global va en el arranque de la sesión
+        options["connect_args"] = {"options": f"-c statement_timeout={settings.db_statement_timeout_ms}"}
+    return options
+
+
+def instrument(engine: Engine) -> None:
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        with _stats.lock:
+            _stats.connects += 1
+
+
+def set_statement_timeout(db: Session, milliseconds: Optional[int]) -> None:
+    """
+    Límite de tiempo por sentencia para esta sesión (0/None = el global). Se aplica a la
+    transacción en curso y a las siguientes de la misma sesión; es local a la transacción,
+    así que no se queda en la conexión al volver al pool (ni en PgBouncer).
+    """
+    db.info[STATEMENT_TIMEOUT_KEY] = milliseconds or 0
+    if milliseconds and db.in_transaction():
+        _apply_timeout(db.connection(), milliseconds)
+
+
+def _apply_timeout(connection, milliseconds: int) -> None:
+    if connection.dialect.name != "postgresql":
+        return
+    connection.execute(select(func.set_config("statement_timeout", str(int(milliseconds)), True)))
+
+
+@event.listens_for(Session, "after_begin")
+def _timeout_on_begin(session: Session, transaction, connection) -> None:
+    milliseconds = session.info.get(STATEMENT_TIMEOUT_KEY)
+    if not milliseconds and settings.db_pgbouncer:
+        # Sin parámetros de arranque en PgBouncer: el global se aplica por transacción
+        milliseconds = settings.db_statement_timeout_ms
+    if milliseconds:
+        _apply_timeout(connection, milliseconds)
+
+
+def is_statement_timeout(exc: BaseException) -> bool:
+    """True si la base canceló la sentencia por statement_timeout."""
+    return getattr(getattr(exc, "orig", None), "pgcode", None) == "57014"
+
+
+def pool_stats(engine: Engine, reset: bool = False) -> Dict[str, Any]:
+    pool = engine.pool
+    with _stats.lock:
+        data = {
+            "pool_class": type(pool).__name__,
+            "pgbouncer": settings.db_pgbouncer,
+            "size": None,
+            "checked_out": None,
+            "idle": None,
+            "overflow": None,
+            "max_overflow": None,
+            "timeout_seconds": None,
+            "checkouts": _stats.checkouts,
+            "waited": _stats.waited,
+            "wait_avg_ms": round(_stats.wait_total * 1000 / _stats.checkouts, 3) if _stats.checkouts else 0.0,
+            "wait_max_ms": round(_stats.wait_max * 1000, 3),
+            "timeouts": _stats.timeouts,
+            "connects": _stats.connects,
+            "statement_timeout_ms": settings.db_statement_timeout_ms,
+            "report_statement_timeout_ms": settings.db_report_statement_timeout_ms,
+        }
+        if reset:
+            _stats.reset()
+    if isinstance(pool, QueuePool):
+        data.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            idle=pool.checkedin(),
+            # overflow() es negativo mientras el pool no ha llegado a pool_size
+            overflow=max(pool.overflow(), 0),
+            max_overflow=pool._max_overflow,
+            timeout_seconds=pool.timeout(),
+        )
+    return data
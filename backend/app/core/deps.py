@@ -1,8 +1,12 @@
-from typing import Optional
+import secrets
+import threading
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
 
 from fastapi import Depends, Header, HTTPException, Request, status
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, load_only, make_transient_to_detached
 
+from app.core import metrics
 from app.core.config import settings
 from app.core.database import get_db
 from app.core.security import decode_token
@@ -22,10 +26,110 @@ def get_tenant_slug(request: Request, x_tenant_id: Optional[str] = Header(None))
     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing tenant header")
 
 
+# Los endpoints que usan la sesión síncrona de SQLAlchemy se declaran con `def` para que
+# FastAPI los ejecute en el threadpool y no bloqueen el event loop. Lo único que necesita
+# await es leer el cuerpo; estas dependencias lo hacen antes de entrar al hilo.
+async def get_raw_body(request: Request) -> bytes:
+    return await request.body()
+
+
+async def get_json_body(request: Request) -> Dict[str, Any]:
+    return await request.json()
+
+
+# Columnas que necesita la autenticación. El resto (p. ej. Tenant.logo en base64)
+# se carga de forma diferida solo si una ruta lo usa.
+_TENANT_AUTH_COLUMNS = ("id", "name", "slug", "is_active", "plan")
+_USER_AUTH_COLUMNS = ("id", "email", "role", "tenant_id", "username")
+
+
+class _TTLCache:
+    """Diccionario con expiración y tamaño máximo, seguro entre hilos."""
+
+    def __init__(self, maxsize: int = 10_000):
+        self.maxsize = maxsize
+        self._data: Dict[Hashable, Tuple[float, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, values = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return values
+
+    def set(self, key: Hashable, values: Dict[str, Any], ttl: float) -> None:
+        with self._lock:
+            if key not in self._data and len(self._data) >= self.maxsize:
+                self._data.pop(next(iter(self._data)))
+            self._data[key] = (time.monotonic() + ttl, values)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_tenant_cache = _TTLCache()  # slug -> columnas de Tenant
+_user_cache = _TTLCache()  # (tenant_id, user_id) -> columnas de User
+
+
+def _snapshot(obj: Any, columns: Tuple[str, ...]) -> Dict[str, Any]:
+    return {name: getattr(obj, name) for name in columns}
+
+
+def _attach(db: Session, model, values: Dict[str, Any]):
+    """
+    Reconstruir la instancia en la sesión del request sin consultar la BD.
+    Cada request recibe su propia instancia; las columnas no cacheadas quedan
+    expiradas y se cargan solo si se acceden.
+    """
+    obj = model(**values)
+    make_transient_to_detached(obj)
+    return db.merge(obj, load=False)
+
+
+def invalidate_tenant(slug: Optional[str] = None) -> None:
+    """Invalidar el tenant cacheado (o todos si no se indica slug)."""
+    if slug is None:
+        _tenant_cache.clear()
+    else:
+        _tenant_cache.pop(slug)
+
+
+def invalidate_user(tenant_id: Optional[int] = None, user_id: Optional[int] = None) -> None:
+    """Invalidar el usuario cacheado (o todos si no se indica)."""
+    if tenant_id is None or user_id is None:
+        _user_cache.clear()
+    else:
+        _user_cache.pop((tenant_id, user_id))
+
+
 def get_tenant(db: Session = Depends(get_db), tenant_slug: str = Depends(get_tenant_slug)) -> Tenant:
-    tenant = db.query(Tenant).filter(Tenant.slug == tenant_slug).first()
+    ttl = settings.auth_cache_ttl_seconds
+    cached = _tenant_cache.get(tenant_slug) if ttl > 0 else None
+    if cached is not None:
+        metrics.tag_tenant(tenant_slug)
+        return _attach(db, Tenant, cached)
+
+    tenant = (
+        db.query(Tenant)
+        .options(load_only(*(getattr(Tenant, c) for c in _TENANT_AUTH_COLUMNS)))
+        .filter(Tenant.slug == tenant_slug)
+        .first()
+    )
     if not tenant:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tenant not found")
+    if ttl > 0:
+        _tenant_cache.set(tenant_slug, _snapshot(tenant, _TENANT_AUTH_COLUMNS), ttl)
+    metrics.tag_tenant(tenant_slug)
     return tenant
 
 
@@ -40,10 +144,24 @@ def get_current_user(
     payload = decode_token(token)
     if not payload or payload.get("type") != "access":
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    user_id = payload.get("sub")
-    user = db.query(User).filter(User.id == int(user_id), User.tenant_id == tenant.id).first()
+    user_id = int(payload.get("sub"))
+
+    ttl = settings.auth_cache_ttl_seconds
+    key = (tenant.id, user_id)
+    cached = _user_cache.get(key) if ttl > 0 else None
+    if cached is not None:
+        return _attach(db, User, cached)
+
+    user = (
+        db.query(User)
+        .options(load_only(*(getattr(User, c) for c in _USER_AUTH_COLUMNS)))
+        .filter(User.id == user_id, User.tenant_id == tenant.id)
+        .first()
+    )
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    if ttl > 0:
+        _user_cache.set(key, _snapshot(user, _USER_AUTH_COLUMNS), ttl)
     return user
 
 
@@ -58,3 +176,19 @@ def require_owner(user: User = Depends(get_current_user)) -> User:
     return user
 
 
+def require_ops_token(authorization: Optional[str] = Header(None)) -> None:
+    """
+    Endpoints de operación del proceso (/metrics, pool, requests lentos): muestran datos de
+    todos los tenants, así que no basta con ser owner de uno. Con METRICS_TOKEN piden
+    `Authorization: Bearer <token>`; sin token sólo se abren en dev/test y fuera de ahí
+    responden 404.
+    """
+    if not settings.metrics_token:
+        if settings.env not in {"dev", "test"}:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+        return
+    expected = f"Bearer {settings.metrics_token}"
+    if not authorization or not secrets.compare_digest(authorization, expected):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token de métricas inválido")
+
+
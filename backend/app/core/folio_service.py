@@ -1,13 +1,42 @@
 """
 Servicio centralizado para generación de folios.
 Maneja la generación de folios únicos por tenant y tipo usando FolioCounter.
+
+Modos (settings.folio_mode):
+- "strict": consecutivos sin huecos. Un UPDATE ... RETURNING incrementa el contador dentro
+  de la transacción de la venta; el renglón queda bloqueado hasta el commit, así que las
+  ventas de un mismo tenant/tipo se serializan (es el precio de no tener huecos).
+- "leased": cada proceso reserva bloques de settings.folio_block_size números en una
+  transacción corta e independiente y los reparte en memoria. La venta no bloquea el
+  contador; puede haber huecos (reinicios, rollbacks) y el orden entre workers no es global.
+- "sequence": SEQUENCE nativa de PostgreSQL por tenant/tipo (nextval no bloquea ni se
+  revierte con rollback). En otros motores se comporta como "leased".
+
+Cambiar de modo (reiniciando todos los workers) no repite folios: la primera vez que un
+proceso usa la SEQUENCE la adelanta hasta el contador, y la primera vez que usa el
+contador en strict/leased lo adelanta hasta lo que la SEQUENCE ya entregó.
 """
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func, text, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.models.tenant import Tenant
 from app.models.folio_counter import FolioCounter
 
 
+FOLIO_MODES = ("strict", "leased", "sequence")
+
+# (tenant_id, tipo) -> [siguiente, fin) del bloque reservado por este proceso
+_leases: Dict[Tuple[int, str], List[int]] = {}
+_leases_lock = threading.Lock()
+_sequences_ready: Set[str] = set()
+_counters_synced: Set[Tuple[int, str]] = set()
+
+
 def get_tenant_slug(db: Session, tenant_id: int) -> str:
     """
     Obtiene el slug del tenant para usar en el folio.
@@ -18,64 +47,161 @@ def get_tenant_slug(db: Session, tenant_id: int) -> str:
     return tenant.slug
 
 
-def get_next_folio_seq(db: Session, tenant_id: int, tipo: str) -> int:
+def _ensure_counter(conn, tenant_id: int, tipo: str) -> None:
+    """Crear el contador si no existe, sin fallar si otra transacción lo crea a la vez."""
+    dialect = conn.get_bind().dialect.name if isinstance(conn, Session) else conn.dialect.name
+    table = FolioCounter.__table__
+    if dialect in ("postgresql", "sqlite"):
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        conn.execute(
+            insert(table)
+            .values(tenant_id=tenant_id, tipo=tipo, next_seq=1)
+            .on_conflict_do_nothing(index_elements=["tenant_id", "tipo"])
+        )
+    else:
+        exists = conn.execute(
+            table.select().where(table.c.tenant_id == tenant_id, table.c.tipo == tipo)
+        ).first()
+        if not exists:
+            conn.execute(table.insert().values(tenant_id=tenant_id, tipo=tipo, next_seq=1))
+
+
+def _advance_counter(conn, tenant_id: int, tipo: str, step: int) -> int:
+    """
+    Avanzar el contador `step` posiciones con un solo UPDATE ... RETURNING.
+    Devuelve el primer número del rango reservado.
+    """
+    table = FolioCounter.__table__
+    stmt = (
+        update(table)
+        .where(table.c.tenant_id == tenant_id, table.c.tipo == tipo)
+        .values(next_seq=table.c.next_seq + step)
+        .returning(table.c.next_seq)
+    )
+    row = conn.execute(stmt).first()
+    if row is None:
+        _ensure_counter(conn, tenant_id, tipo)
+        row = conn.execute(stmt).first()
+    return row[0] - step
+
+
+def _next_seq_leased(db: Session, tenant_id: int, tipo: str) -> int:
+    key = (tenant_id, tipo)
+    with _leases_lock:
+        lease = _leases.get(key)
+        if lease is None or lease[0] >= lease[1]:
+            block = max(1, settings.folio_block_size)
+            # Transacción propia y corta: el contador queda libre en cuanto se reserva el bloque
+            with db.get_bind().connect() as conn:
+                start = _advance_counter(conn, tenant_id, tipo, block)
+                conn.commit()
+            lease = _leases[key] = [start, start + block]
+        seq = lease[0]
+        lease[0] += 1
+    return seq
+
+
+def _sequence_name(tenant_id: int, tipo: str) -> str:
+    return f"folio_seq_{int(tenant_id)}_{tipo.lower()}"
+
+
+def _sequence_next(name: str) -> str:
+    """SQL del número que daría el siguiente nextval de la SEQUENCE."""
+    return f"(SELECT CASE WHEN is_called THEN last_value + 1 ELSE last_value END FROM {name})"
+
+
+def _next_seq_sequence(db: Session, tenant_id: int, tipo: str) -> int:
+    name = _sequence_name(tenant_id, tipo)
+    if name not in _sequences_ready:
+        with db.get_bind().connect() as conn:
+            try:
+                conn.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {name}"))
+                conn.commit()
+            except Exception:
+                # Otro worker la creó al mismo tiempo
+                conn.rollback()
+            # Continuar donde se quedó el contador (por si antes se usó strict/leased); sólo
+            # hacia adelante. El renglón del contador queda bloqueado hasta el commit
+            start = _advance_counter(conn, tenant_id, tipo, 0)
+            conn.execute(
+                text(f"SELECT setval(:name, greatest({_sequence_next(name)}, :start), false)"),
+                {"name": name, "start": int(start)},
+            )
+            conn.commit()
+        _sequences_ready.add(name)
+    return int(db.execute(text("SELECT nextval(:name)"), {"name": name}).scalar())
+
+
+def _sync_counter_from_sequence(db: Session, tenant_id: int, tipo: str) -> None:
+    """
+    Adelantar el contador hasta lo que ya entregó la SEQUENCE (si alguna vez se usó el modo
+    "sequence"), una vez por proceso antes de usar strict/leased.
+    """
+    key = (tenant_id, tipo)
+    if key in _counters_synced:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        name = _sequence_name(tenant_id, tipo)
+        with db.get_bind().connect() as conn:
+            if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+                _ensure_counter(conn, tenant_id, tipo)
+                table = FolioCounter.__table__
+                conn.execute(
+                    update(table)
+                    .where(table.c.tenant_id == tenant_id, table.c.tipo == tipo)
+                    .values(next_seq=func.greatest(table.c.next_seq, text(_sequence_next(name))))
+                )
+                conn.commit()
+    _counters_synced.add(key)
+
+
+def get_next_folio_seq(db: Session, tenant_id: int, tipo: str, mode: Optional[str] = None) -> int:
     """
     Obtiene el siguiente número de secuencia para un tipo de folio.
     Crea el contador si no existe.
-    
-    Usa with_for_update() para evitar condiciones de carrera en entornos concurrentes.
-    NO hace commit - el caller debe hacer commit después de asignar el folio.
-    
+
+    En modo "strict" NO hace commit: el contador queda bloqueado hasta que el caller
+    haga commit (o rollback, que libera el número sin dejar hueco).
+
     Args:
         db: Sesión de base de datos
         tenant_id: ID del tenant
         tipo: Tipo de folio ('VENTA', 'APARTADO', 'PEDIDO')
-    
+        mode: 'strict', 'leased' o 'sequence' (por defecto settings.folio_mode)
+
     Returns:
-        Número de secuencia actual (antes de incrementar)
+        Número de secuencia asignado
     """
-    # Intentar con lock primero, si falla usar sin lock
-    try:
-        # Buscar o crear el contador con lock para evitar condiciones de carrera
-        counter = db.query(FolioCounter).filter(
-            FolioCounter.tenant_id == tenant_id,
-            FolioCounter.tipo == tipo
-        ).with_for_update().first()
-    except Exception:
-        # Si with_for_update falla (puede ser por nivel de aislamiento), intentar sin lock
-        counter = db.query(FolioCounter).filter(
-            FolioCounter.tenant_id == tenant_id,
-            FolioCounter.tipo == tipo
-        ).first()
-    
-    if not counter:
-        # Crear nuevo contador
-        counter = FolioCounter(
-            tenant_id=tenant_id,
-            tipo=tipo,
-            next_seq=1
-        )
-        db.add(counter)
-        db.flush()  # Flush para obtener el ID, pero no commit
-    
-    # Obtener secuencia actual y actualizar
-    current_seq = counter.next_seq
-    counter.next_seq += 1
-    # NO hacer commit aquí - el caller debe hacer commit después de asignar el folio
-    
-    return current_seq
+    mode = mode or settings.folio_mode
+    if mode not in FOLIO_MODES:
+        raise ValueError(f"Modo de folio inválido: {mode}. Debe ser uno de {', '.join(FOLIO_MODES)}")
+
+    if mode == "sequence" and db.get_bind().dialect.name == "postgresql":
+        return _next_seq_sequence(db, tenant_id, tipo)
+    _sync_counter_from_sequence(db, tenant_id, tipo)
+    if mode in ("leased", "sequence"):
+        return _next_seq_leased(db, tenant_id, tipo)
+    return _advance_counter(db, tenant_id, tipo, 1)
+
+
+def reset_folio_leases() -> None:
+    """Descartar los bloques reservados en memoria (tests / cambio de modo en caliente)."""
+    with _leases_lock:
+        _leases.clear()
+    _sequences_ready.clear()
+    _counters_synced.clear()
 
 
 def generate_folio(db: Session, tenant_id: int, tipo: str) -> str:
     """
     Genera un folio único con formato: {PREFIX}-{SEQ:06d}
     (SIN slug del tenant)
-    
+
     Args:
         db: Sesión de base de datos
         tenant_id: ID del tenant
         tipo: Tipo de folio ('VENTA', 'APARTADO', 'PEDIDO')
-    
+
     Returns:
         Folio generado (ej: 'V-000001', 'AP-000001', 'PED-000001')
     """
@@ -85,13 +211,12 @@ def generate_folio(db: Session, tenant_id: int, tipo: str) -> str:
         'APARTADO': 'AP',
         'PEDIDO': 'PED'
     }
-    
+
     if tipo not in prefix_map:
         raise ValueError(f"Tipo de folio inválido: {tipo}. Debe ser 'VENTA', 'APARTADO' o 'PEDIDO'")
-    
+
     prefix = prefix_map[tipo]
     # REMOVIDO: slug del tenant - ahora solo PREFIX-SEQ
     seq = get_next_folio_seq(db, tenant_id, tipo)
-    
-    return f"{prefix}-{str(seq).zfill(6)}"
 
+    return f"{prefix}-{str(seq).zfill(6)}"
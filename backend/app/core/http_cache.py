@@ -0,0 +1,90 @@
+"""
+GET condicional y caché de respuestas para los listados que dependen de una versión de
+datos (app.services.data_versions).
+
+ETag = "<tenant>-<recurso>-<versión>": si el navegador manda ese If-None-Match se responde
+304 sin consultar ni serializar nada. Si no, la respuesta ya serializada se guarda en
+memoria por (tenant, recurso, versión, ruta, query string): la misma consulta entre dos
+escrituras se sirve de ahí. Al subir la versión las entradas viejas dejan de coincidir y
+salen por antigüedad (LRU de settings.response_cache_entries).
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional, Tuple, Type
+
+from fastapi import Request, Response
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.services import data_versions
+
+CacheKey = Tuple[int, str, int, str, Tuple[Tuple[str, str], ...]]
+
+_cache: "OrderedDict[CacheKey, bytes]" = OrderedDict()
+_lock = threading.Lock()
+_adapters: dict = {}
+
+
+def clear() -> None:
+    with _lock:
+        _cache.clear()
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    ]
+
+
+def _get(key: CacheKey) -> Optional[bytes]:
+    with _lock:
+        body = _cache.get(key)
+        if body is not None:
+            _cache.move_to_end(key)
+        return body
+
+
+def _put(key: CacheKey, body: bytes) -> None:
+    if settings.response_cache_entries <= 0 or len(body) > settings.response_cache_max_body_bytes:
+        return
+    with _lock:
+        _cache[key] = body
+        _cache.move_to_end(key)
+        while len(_cache) > settings.response_cache_entries:
+            _cache.popitem(last=False)
+
+
+def _serialize(model: Type[BaseModel], rows: Iterable) -> bytes:
+    adapter = _adapters.get(model)
+    if adapter is None:
+        adapter = _adapters[model] = TypeAdapter(List[model])
+    return adapter.dump_json([model.model_validate(row) for row in rows], by_alias=True)
+
+
+def cached_list(
+    request: Request,
+    db: Session,
+    tenant_id: int,
+    resource: str,
+    model: Type[BaseModel],
+    build: Callable[[], Iterable],
+) -> Response:
+    """
+    Responder un listado de `model` con ETag por versión de datos. `build` hace la
+    consulta y sólo se llama si no hay 304 ni respuesta en caché.
+    """
+    version = data_versions.current(db, tenant_id, resource)
+    etag = f'"{tenant_id}-{resource}-{version}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    key = (tenant_id, resource, version, request.url.path, tuple(sorted(request.query_params.multi_items())))
+    body = _get(key)
+    if body is None:
+        body = _serialize(model, build())
+        _put(key, body)
+    return Response(body, media_type="application/json", headers=headers)
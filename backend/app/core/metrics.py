@@ -0,0 +1,368 @@
+"""
+Instrumentación por request: consultas SQL, tiempo en la base y latencia.
+
+- instrument(engine) engancha before/after_cursor_execute: cada sentencia suma al registro
+  del request en curso (contextvar, que FastAPI copia a los hilos del threadpool) o, si no
+  hay request (trabajos, barridos), sólo a los totales del proceso.
+- MetricsMiddleware abre el registro, lo etiqueta con la ruta (la plantilla, no la URL) y
+  al terminar lo vuelca en los histogramas. El tenant lo pone get_tenant (tag_tenant) una
+  vez resuelto: un header inventado no crea series nuevas.
+- render() arma el texto de GET /metrics (formato de exposición de Prometheus): latencia,
+  consultas y tiempo de base por ruta, totales por tenant y el pool (app.core.db_pool).
+- Los requests que pasan de settings.slow_request_ms se imprimen en el log con sus
+  sentencias más lentas y la más repetida (los N+1 se ven ahí), y los últimos quedan en
+  slow_requests() (GET /admin/slow-requests).
+
+Los valores son del proceso: con varios workers, Prometheus los suma por instancia.
+"""
+import heapq
+import re
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+STATEMENT_MAX_CHARS = 1000
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class RequestStats:
+    """Consultas de un request: cuántas, tiempo total y las más lentas."""
+
+    __slots__ = ("method", "route", "tenant", "started", "queries", "db_seconds", "slowest", "counts")
+
+    def __init__(self, method: str, tenant: Optional[str] = None) -> None:
+        self.method = method
+        self.route: Optional[str] = None
+        self.tenant = tenant
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slowest: List[Tuple[float, int, str]] = []  # heap con las N más lentas
+        self.counts: Dict[str, int] = {}
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.queries += 1
+        self.db_seconds += seconds
+        self.counts[statement] = self.counts.get(statement, 0) + 1
+        item = (seconds, self.queries, statement)
+        if len(self.slowest) < settings.slow_request_statements:
+            heapq.heappush(self.slowest, item)
+        elif self.slowest and seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, item)
+
+    def most_repeated(self) -> Optional[Tuple[str, int]]:
+        if not self.counts:
+            return None
+        statement, count = max(self.counts.items(), key=lambda kv: kv[1])
+        return (statement, count) if count > 1 else None
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current() -> Optional[RequestStats]:
+    return _current.get()
+
+
+def tag_tenant(slug: str) -> None:
+    """Asociar el request en curso al tenant (lo llama get_tenant)."""
+    stats = _current.get()
+    if stats is not None:
+        stats.tenant = slug
+
+
+# ---------------------------------------------------------------------------
+# Registro de métricas
+# ---------------------------------------------------------------------------
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class _Registry:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.latency: Dict[Tuple[str, str], _Histogram] = {}
+        self.queries: Dict[Tuple[str, str], _Histogram] = {}
+        self.db_time: Dict[Tuple[str, str], _Histogram] = {}
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+        self.tenant_requests: Dict[str, int] = {}
+        self.tenant_queries: Dict[str, int] = {}
+        self.tenant_db_seconds: Dict[str, float] = {}
+        self.statements = {"request": 0, "background": 0}
+        self.statement_seconds = {"request": 0.0, "background": 0.0}
+        self.slow_requests = 0
+        self.slow_log: Deque[Dict[str, Any]] = deque(maxlen=max(settings.slow_request_log_size, 1))
+
+    def observe_request(self, stats: RequestStats, status: int, seconds: float) -> None:
+        key = (stats.method, stats.route or "unmatched")
+        with self.lock:
+            self.latency.setdefault(key, _Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.queries.setdefault(key, _Histogram(QUERY_BUCKETS)).observe(stats.queries)
+            self.db_time.setdefault(key, _Histogram(LATENCY_BUCKETS)).observe(stats.db_seconds)
+            status_key = key + (str(status),)
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            if stats.tenant:
+                tenant = stats.tenant
+                self.tenant_requests[tenant] = self.tenant_requests.get(tenant, 0) + 1
+                self.tenant_queries[tenant] = self.tenant_queries.get(tenant, 0) + stats.queries
+                self.tenant_db_seconds[tenant] = self.tenant_db_seconds.get(tenant, 0.0) + stats.db_seconds
+
+    def observe_statement(self, context: str, seconds: float) -> None:
+        with self.lock:
+            self.statements[context] += 1
+            self.statement_seconds[context] += seconds
+
+
+_registry = _Registry()
+
+
+def reset() -> None:
+    """Borrar histogramas, contadores y el log de requests lentos (tests)."""
+    with _registry.lock:
+        _registry.reset()
+
+
+# ---------------------------------------------------------------------------
+# SQL
+# ---------------------------------------------------------------------------
+
+def _normalize(statement: str) -> str:
+    return _WHITESPACE_RE.sub(" ", statement).strip()[:STATEMENT_MAX_CHARS]
+
+
+def instrument(engine: Engine) -> None:
+    """Medir cada sentencia del engine (sin parámetros: pueden traer datos de clientes)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("metrics_started")
+        if not started:
+            return
+        seconds = time.perf_counter() - started.pop()
+        stats = _current.get()
+        if stats is None:
+            _registry.observe_statement("background", seconds)
+            return
+        _registry.observe_statement("request", seconds)
+        stats.record(_normalize(statement), seconds)
+
+    @event.listens_for(engine, "handle_error")
+    def _on_error(exception_context):
+        # La sentencia falló: no dejar su inicio en la pila de la conexión
+        connection = exception_context.connection
+        started = connection.info.get("metrics_started") if connection is not None else None
+        if started:
+            started.pop()
+
+
+# ---------------------------------------------------------------------------
+# Middleware
+# ---------------------------------------------------------------------------
+
+class MetricsMiddleware:
+    """Middleware ASGI: un RequestStats por request HTTP, volcado al registro al terminar."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+        self._routes: Dict[Any, str] = {}
+
+    def _route_path(self, scope) -> Optional[str]:
+        # El router deja el endpoint en el scope; la plantilla sale de las rutas de la app
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return None
+        if endpoint not in self._routes:
+            router = scope.get("router")
+            for route in getattr(router, "routes", []):
+                self._routes.setdefault(getattr(route, "endpoint", None), getattr(route, "path", None))
+        return self._routes.get(endpoint)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.metrics_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope["method"])
+        token = _current.set(stats)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            stats.route = self._route_path(scope)
+            finish(stats, status)
+
+
+def finish(stats: RequestStats, status: int) -> None:
+    """Registrar el request terminado y, si fue lento, dejarlo en el log."""
+    seconds = time.perf_counter() - stats.started
+    _registry.observe_request(stats, status, seconds)
+    threshold = settings.slow_request_ms
+    if threshold > 0 and seconds * 1000 >= threshold:
+        _log_slow(stats, status, seconds)
+
+
+def _log_slow(stats: RequestStats, status: int, seconds: float) -> None:
+    slowest = [
+        {"ms": round(s * 1000, 2), "sql": statement}
+        for s, _, statement in sorted(stats.slowest, reverse=True)
+    ]
+    repeated = stats.most_repeated()
+    entry = {
+        "at": datetime.utcnow().isoformat(),
+        "method": stats.method,
+        "route": stats.route or "unmatched",
+        "tenant": stats.tenant,
+        "status": status,
+        "ms": round(seconds * 1000, 1),
+        "queries": stats.queries,
+        "db_ms": round(stats.db_seconds * 1000, 1),
+        "slowest": slowest,
+        "most_repeated": {"count": repeated[1], "sql": repeated[0]} if repeated else None,
+    }
+    with _registry.lock:
+        _registry.slow_requests += 1
+        _registry.slow_log.append(entry)
+    lines = [
+        f"⚠️ Request lento: {entry['method']} {entry['route']} tenant={entry['tenant']} "
+        f"status={status} {entry['ms']}ms, {entry['queries']} consultas ({entry['db_ms']}ms en la base)"
+    ]
+    lines += [f"    {item['ms']}ms {item['sql']}" for item in slowest]
+    if repeated:
+        lines.append(f"    repetida {repeated[1]}x: {repeated[0]}")
+    print("\n".join(lines))
+
+
+def slow_requests() -> List[Dict[str, Any]]:
+    """Los últimos requests lentos, del más reciente al más viejo."""
+    with _registry.lock:
+        return list(reversed(_registry.slow_log))
+
+
+# ---------------------------------------------------------------------------
+# Exposición (GET /metrics)
+# ---------------------------------------------------------------------------
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items())
+
+
+def _histogram_lines(name: str, help_text: str, series: Dict[Tuple[str, str], _Histogram]) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for (method, route), histogram in sorted(series.items()):
+        base = _labels(method=method, route=route)
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{base},le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{base},le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum{{{base}}} {histogram.sum:.6f}")
+        lines.append(f"{name}_count{{{base}}} {histogram.count}")
+    return lines
+
+
+def _metric(name: str, kind: str, help_text: str, samples: List[Tuple[str, Any]]) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+    return lines
+
+
+def render(pool: Optional[Dict[str, Any]] = None) -> str:
+    """Texto para Prometheus con las métricas del proceso y el estado del pool."""
+    with _registry.lock:
+        lines = _histogram_lines(
+            "pos_http_request_duration_seconds", "Latencia de los requests HTTP por ruta.", _registry.latency
+        )
+        lines += _histogram_lines(
+            "pos_http_request_queries", "Sentencias SQL por request.", _registry.queries
+        )
+        lines += _histogram_lines(
+            "pos_http_request_db_seconds", "Tiempo en la base por request.", _registry.db_time
+        )
+        lines += _metric("pos_http_requests_total", "counter", "Requests HTTP por ruta y status.", [
+            (_labels(method=m, route=r, status=s), n) for (m, r, s), n in sorted(_registry.requests.items())
+        ])
+        lines += _metric("pos_http_slow_requests_total", "counter", "Requests sobre slow_request_ms.", [
+            ("", _registry.slow_requests)
+        ])
+        lines += _metric("pos_tenant_requests_total", "counter", "Requests HTTP por tenant.", [
+            (_labels(tenant=t), n) for t, n in sorted(_registry.tenant_requests.items())
+        ])
+        lines += _metric("pos_tenant_db_queries_total", "counter", "Sentencias SQL de requests por tenant.", [
+            (_labels(tenant=t), n) for t, n in sorted(_registry.tenant_queries.items())
+        ])
+        lines += _metric("pos_tenant_db_seconds_total", "counter", "Tiempo en la base de requests por tenant.", [
+            (_labels(tenant=t), f"{s:.6f}") for t, s in sorted(_registry.tenant_db_seconds.items())
+        ])
+        lines += _metric("pos_db_statements_total", "counter", "Sentencias SQL (request o segundo plano).", [
+            (_labels(context=c), n) for c, n in sorted(_registry.statements.items())
+        ])
+        lines += _metric("pos_db_statement_seconds_total", "counter", "Tiempo en sentencias SQL.", [
+            (_labels(context=c), f"{s:.6f}") for c, s in sorted(_registry.statement_seconds.items())
+        ])
+
+    if pool is not None:
+        gauges = {
+            "size": "Conexiones del pool (pool_size).",
+            "checked_out": "Conexiones en uso.",
+            "idle": "Conexiones libres en el pool.",
+            "overflow": "Conexiones de overflow abiertas.",
+        }
+        counters = {
+            "checkouts": "Checkouts de conexión.",
+            "waited": "Checkouts que esperaron una conexión libre.",
+            "timeouts": "Checkouts que agotaron db_pool_timeout.",
+            "connects": "Conexiones nuevas a la base.",
+        }
+        for key, help_text in gauges.items():
+            if pool.get(key) is not None:
+                lines += _metric(f"pos_db_pool_{key}", "gauge", help_text, [("", pool[key])])
+        for key, help_text in counters.items():
+            lines += _metric(f"pos_db_pool_{key}_total", "counter", help_text, [("", pool[key])])
+        lines += _metric("pos_db_pool_wait_max_seconds", "gauge", "Espera máxima por una conexión.", [
+            ("", pool["wait_max_ms"] / 1000)
+        ])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,173 @@
+"""
+Arranque de la app: compuerta de esquema versionada y tiempos de arranque.
+
+Importar app.main ya no toca la base. Los pasos de esquema (init_db: create_all en dev,
+columnas agregadas a mano, índices pg_trgm) y el seed de dev corren detrás de una
+compuerta: la tabla app_schema_version guarda la versión aplicada y cada worker sólo hace
+un SELECT al arrancar. Si la versión no coincide con SCHEMA_VERSION, el primero que toma
+el candado advisory (PostgreSQL) corre los pasos; los demás esperan y ya la encuentran
+al día. Subir SCHEMA_VERSION al agregar o cambiar un paso de init_db.
+
+Para correrla una sola vez en el deploy (y arrancar los workers con
+STARTUP_MIGRATIONS=false):
+
+    python -m app.core.startup [--force]
+
+Los tiempos de importación y de cada paso del arranque quedan en report() (GET /health);
+si el total pasa de settings.startup_budget_ms se avisa en el log.
+"""
+import argparse
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, delete, func, insert, select
+from sqlalchemy.exc import DBAPIError
+
+from app.core.config import settings
+
+# Versión de los pasos de init_db + seed; subirla para que corran otra vez
+SCHEMA_VERSION = "2025.10.3"
+
+_LOCK_KEY = 2021_0001  # pg_advisory_xact_lock de la compuerta
+
+# Fuera de Base.metadata: no es parte del modelo ni de Alembic
+_metadata = MetaData()
+schema_version = Table(
+    "app_schema_version",
+    _metadata,
+    Column("id", Integer, primary_key=True),
+    Column("version", String(50), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+_import_started = time.perf_counter()
+_phases: Dict[str, float] = {}
+_lock = threading.Lock()
+_ready_ms: Optional[float] = None
+
+
+# ---------------------------------------------------------------------------
+# Compuerta de esquema
+# ---------------------------------------------------------------------------
+
+def applied_version(engine) -> Optional[str]:
+    """Versión registrada en la base, o None si la tabla aún no existe."""
+    with engine.connect() as connection:
+        try:
+            return connection.execute(select(schema_version.c.version).where(schema_version.c.id == 1)).scalar()
+        except DBAPIError:
+            connection.rollback()
+            return None
+
+
+def _run_steps() -> None:
+    from app.core.database import SessionLocal, init_db
+
+    init_db()
+    # Only seed in development or when explicitly requested
+    if settings.env == "dev" or os.getenv("FORCE_SEED") == "true":
+        from app.services.seed import seed_demo
+
+        try:
+            with SessionLocal() as db:
+                seed_demo(db)
+        except Exception as e:
+            print(f"⚠️ No se pudo sembrar el tenant demo: {e}")
+
+
+def migrate(force: bool = False) -> bool:
+    """Correr los pasos de esquema si la base no está en SCHEMA_VERSION. True si corrieron."""
+    from app.core.database import engine
+
+    if not force and applied_version(engine) == SCHEMA_VERSION:
+        return False
+    # Candado de transacción (se suelta solo con el commit o rollback): con PgBouncer en
+    # pooling por transacción un candado de sesión podía soltarse en otra conexión del
+    # servidor y quedarse tomado. La transacción sigue abierta mientras corren los pasos
+    # (en sus propias conexiones) y en ella se registra la versión
+    with engine.begin() as lock_connection:
+        if engine.dialect.name == "postgresql":
+            # Un solo worker migra; los demás esperan aquí y vuelven a revisar
+            lock_connection.execute(select(func.pg_advisory_xact_lock(_LOCK_KEY)))
+        if not force and applied_version(engine) == SCHEMA_VERSION:
+            return False
+        _run_steps()
+        _metadata.create_all(bind=lock_connection)
+        lock_connection.execute(delete(schema_version))
+        lock_connection.execute(insert(schema_version).values(
+            id=1, version=SCHEMA_VERSION, applied_at=datetime.utcnow()
+        ))
+    print(f"✅ Esquema en versión {SCHEMA_VERSION}")
+    return True
+
+
+def run_migrations() -> None:
+    """Hook de arranque: la compuerta, salvo que el deploy la corra aparte."""
+    if not settings.startup_migrations:
+        return
+    try:
+        migrate()
+    except Exception as e:
+        print(f"⚠️ No se pudo revisar el esquema al arrancar: {e}")
+
+
+# ---------------------------------------------------------------------------
+# Tiempos de arranque
+# ---------------------------------------------------------------------------
+
+def mark_imported() -> None:
+    """Llamar al terminar de importar app.main."""
+    _record("import", time.perf_counter() - _import_started)
+
+
+def _record(name: str, seconds: float) -> None:
+    with _lock:
+        _phases[name] = round(seconds * 1000, 1)
+
+
+def timed(name: str, hook: Callable[[], None]) -> Callable[[], None]:
+    """Envuelve un hook de arranque para registrar cuánto tardó."""
+    def run() -> None:
+        started = time.perf_counter()
+        try:
+            hook()
+        finally:
+            _record(name, time.perf_counter() - started)
+    return run
+
+
+def finish() -> None:
+    """Último hook de arranque: total desde la importación y aviso si pasa del presupuesto."""
+    global _ready_ms
+    with _lock:
+        _ready_ms = round(sum(_phases.values()), 1)
+    if _ready_ms > settings.startup_budget_ms:
+        slowest: List[str] = [f"{k}={v}ms" for k, v in sorted(_phases.items(), key=lambda kv: -kv[1])[:3]]
+        print(f"⚠️ Arranque en {_ready_ms}ms (presupuesto {settings.startup_budget_ms}ms): {', '.join(slowest)}")
+
+
+def report() -> dict:
+    with _lock:
+        return {
+            "ready": _ready_ms is not None,
+            "total_ms": _ready_ms,
+            "budget_ms": settings.startup_budget_ms,
+            "within_budget": _ready_ms is not None and _ready_ms <= settings.startup_budget_ms,
+            "phases_ms": dict(_phases),
+            "schema_version": SCHEMA_VERSION,
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Aplicar los pasos de esquema de arranque (una vez por versión)")
+    parser.add_argument("--force", action="store_true", help="Correrlos aunque la versión ya esté aplicada")
+    args = parser.parse_args(argv)
+    if not migrate(force=args.force):
+        print(f"✅ Esquema ya en versión {SCHEMA_VERSION}")
+
+
+if __name__ == "__main__":
+    main()
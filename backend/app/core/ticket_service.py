@@ -1,12 +1,151 @@
 """
 Servicio centralizado para gestión de tickets.
 Maneja el guardado y recuperación de tickets HTML generados.
+
+Almacenamiento: cada ticket guardaba su HTML completo, con el logo del tenant en base64 y
+el mismo CSS, así que la mayor parte de la tabla eran copias de lo mismo. Ahora:
+- Los bloques <style> y los data: URI de más de FRAGMENT_MIN_CHARS se guardan una sola vez
+  en ticket_fragments, con el sha256 del contenido como llave; en el ticket queda un
+  marcador \\x00<sha256>\\x00 (NUL no puede aparecer en HTML válido).
+- El resto (Ticket.body) se guarda comprimido con zlib, junto con el tamaño original y el
+  sha256 del HTML completo (ETag).
+- Los listados sólo leen metadatos; ticket_html() rearma el HTML de un ticket, con los
+  fragmentos (inmutables) en caché en proceso.
+
+Los tickets viejos (columna html) se siguen leyendo igual; para compactarlos:
+
+    python -m app.core.ticket_service [--batch-size 200]
 """
-from sqlalchemy.orm import Session
-from typing import Optional, List
+import argparse
+import hashlib
+import re
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, defer
+
+from app.models.credit_payment import CreditPayment
+from app.models.ticket import Ticket, TicketFragment
+
+FRAGMENT_MIN_CHARS = 1024
+FRAGMENT_CACHE_SIZE = 256
+
+_STYLE_RE = re.compile(r"(<style[^>]*>)([\s\S]*?)(</style>)", re.IGNORECASE)
+_DATA_URI_RE = re.compile(r"data:[\w/+.-]+;base64,[A-Za-z0-9+/=]+")
+_PLACEHOLDER_RE = re.compile("\x00([0-9a-f]{64})\x00")
+
+_fragment_cache: Dict[str, str] = {}
+_cache_lock = threading.Lock()
+_table_ready = False
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _ensure_fragment_table(db: Session) -> None:
+    global _table_ready
+    if not _table_ready:
+        try:
+            with db.begin_nested():
+                TicketFragment.__table__.create(bind=db.connection(), checkfirst=True)
+            _table_ready = True
+        except Exception as e:
+            print(f"⚠️ No se pudo crear la tabla ticket_fragments: {e}")
+
+
+def split_fragments(html: str) -> Tuple[str, Dict[str, str]]:
+    """HTML con los fragmentos grandes reemplazados por marcadores, y los fragmentos por hash."""
+    fragments: Dict[str, str] = {}
+    if "\x00" in html:
+        return html, fragments
+
+    def extract(content: str) -> str:
+        if len(content) < FRAGMENT_MIN_CHARS:
+            return content
+        digest = _sha256(content)
+        fragments[digest] = content
+        return f"\x00{digest}\x00"
+
+    # Primero el CSS (puede traer data: URIs adentro), luego las imágenes del resto
+    skeleton = _STYLE_RE.sub(lambda m: m.group(1) + extract(m.group(2)) + m.group(3), html)
+    skeleton = _DATA_URI_RE.sub(lambda m: extract(m.group(0)), skeleton)
+    return skeleton, fragments
+
+
+def _cache_fragments(fragments: Dict[str, str]) -> None:
+    with _cache_lock:
+        if len(_fragment_cache) + len(fragments) > FRAGMENT_CACHE_SIZE:
+            _fragment_cache.clear()
+        _fragment_cache.update(fragments)
+
+
+def _store_fragments(db: Session, fragments: Dict[str, str]) -> None:
+    # Siempre se intenta el INSERT (ON CONFLICT DO NOTHING): la caché sólo sirve para leer,
+    # una transacción que insertó el fragmento pudo no haber hecho commit
+    if not fragments:
+        return
+    _ensure_fragment_table(db)
+    rows = [
+        {"hash": h, "data": zlib.compress(c.encode("utf-8")), "size": len(c.encode("utf-8"))}
+        for h, c in fragments.items()
+    ]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        db.execute(insert(TicketFragment.__table__).on_conflict_do_nothing(index_elements=["hash"]), rows)
+    else:
+        existing = set(db.execute(
+            select(TicketFragment.hash).where(TicketFragment.hash.in_(list(fragments)))
+        ).scalars())
+        new_rows = [row for row in rows if row["hash"] not in existing]
+        if new_rows:
+            db.execute(TicketFragment.__table__.insert(), new_rows)
+
+
+def store_html(db: Session, ticket: Ticket, html: str) -> None:
+    """Guardar el HTML del ticket comprimido y con sus fragmentos aparte. No hace commit."""
+    skeleton, fragments = split_fragments(html)
+    _store_fragments(db, fragments)
+    ticket.body = zlib.compress(skeleton.encode("utf-8"))
+    ticket.html = None
+    ticket.html_size = len(html.encode("utf-8"))
+    ticket.etag = _sha256(html)
+
+
+def _load_fragments(db: Session, hashes: Iterable[str]) -> Dict[str, str]:
+    hashes = set(hashes)
+    with _cache_lock:
+        found = {h: _fragment_cache[h] for h in hashes if h in _fragment_cache}
+    missing = hashes - set(found)
+    if missing:
+        loaded = {
+            row.hash: zlib.decompress(row.data).decode("utf-8")
+            for row in db.query(TicketFragment).filter(TicketFragment.hash.in_(list(missing)))
+        }
+        _cache_fragments(loaded)
+        found.update(loaded)
+    return found
+
+
+def ticket_html(db: Session, ticket: Ticket) -> str:
+    """HTML completo del ticket (legacy o comprimido)."""
+    if ticket.body is None:
+        return ticket.html or ""
+    skeleton = zlib.decompress(ticket.body).decode("utf-8")
+    hashes = _PLACEHOLDER_RE.findall(skeleton)
+    if not hashes:
+        return skeleton
+    fragments = _load_fragments(db, hashes)
+    return _PLACEHOLDER_RE.sub(lambda m: fragments[m.group(1)], skeleton)
 
-from app.models.ticket import Ticket
-from app.models.tenant import Tenant
+
+def ticket_etag(ticket: Ticket) -> str:
+    """ETag del ticket; los legacy lo calculan del HTML guardado."""
+    return ticket.etag or _sha256(ticket.html or "")
 
 
 def save_ticket(
@@ -21,7 +160,7 @@ def save_ticket(
 ) -> Ticket:
     """
     Guarda o actualiza un ticket en la base de datos.
-    
+
     Args:
         db: Sesión de base de datos
         tenant_id: ID del tenant
@@ -31,45 +170,19 @@ def save_ticket(
         venta_contado_id: ID de venta de contado (opcional)
         apartado_id: ID de apartado (opcional)
         pedido_id: ID de pedido (opcional)
-    
+
     Returns:
         Ticket guardado o actualizado
     """
-    # Buscar ticket existente
-    existing = None
-    
-    if venta_contado_id is not None:
-        existing = db.query(Ticket).filter(
-            Ticket.tenant_id == tenant_id,
-            Ticket.venta_contado_id == venta_contado_id,
-            Ticket.kind == kind
-        ).first()
-    elif apartado_id is not None:
-        existing = db.query(Ticket).filter(
-            Ticket.tenant_id == tenant_id,
-            Ticket.apartado_id == apartado_id,
-            Ticket.kind == kind
-        ).first()
-    elif pedido_id is not None:
-        existing = db.query(Ticket).filter(
-            Ticket.tenant_id == tenant_id,
-            Ticket.pedido_id == pedido_id,
-            Ticket.kind == kind
-        ).first()
-    elif sale_id is not None:
-        existing = db.query(Ticket).filter(
-            Ticket.tenant_id == tenant_id,
-            Ticket.sale_id == sale_id,
-            Ticket.kind == kind
-        ).first()
-    
+    existing = find_ticket(db, tenant_id, kind, sale_id, venta_contado_id, apartado_id, pedido_id)
+
     if existing:
         # Actualizar ticket existente
-        existing.html = html
+        store_html(db, existing, html)
         db.commit()
         db.refresh(existing)
         return existing
-    
+
     # Crear nuevo ticket
     ticket = Ticket(
         tenant_id=tenant_id,
@@ -78,24 +191,53 @@ def save_ticket(
         apartado_id=apartado_id,
         pedido_id=pedido_id,
         kind=kind,
-        html=html
     )
+    store_html(db, ticket, html)
     db.add(ticket)
     db.commit()
     db.refresh(ticket)
     return ticket
 
 
+def find_ticket(
+    db: Session,
+    tenant_id: int,
+    kind: str,
+    sale_id: Optional[int] = None,
+    venta_contado_id: Optional[int] = None,
+    apartado_id: Optional[int] = None,
+    pedido_id: Optional[int] = None,
+) -> Optional[Ticket]:
+    """Ticket existente del documento y tipo (venta de contado, apartado, pedido o legacy)."""
+    for column, value in (
+        (Ticket.venta_contado_id, venta_contado_id),
+        (Ticket.apartado_id, apartado_id),
+        (Ticket.pedido_id, pedido_id),
+        (Ticket.sale_id, sale_id),
+    ):
+        if value is not None:
+            return db.query(Ticket).filter(
+                Ticket.tenant_id == tenant_id,
+                column == value,
+                Ticket.kind == kind
+            ).first()
+    return None
+
+
+def _metadata_query(db: Session, tenant_id: int):
+    # Listados: sin el HTML ni el cuerpo comprimido
+    return db.query(Ticket).options(defer(Ticket.html), defer(Ticket.body)).filter(Ticket.tenant_id == tenant_id)
+
+
 def get_tickets_by_venta_contado(
     db: Session,
     tenant_id: int,
     venta_contado_id: int
 ) -> List[Ticket]:
     """
-    Obtiene todos los tickets asociados a una venta de contado.
+    Obtiene todos los tickets asociados a una venta de contado (sólo metadatos).
     """
-    return db.query(Ticket).filter(
-        Ticket.tenant_id == tenant_id,
+    return _metadata_query(db, tenant_id).filter(
         Ticket.venta_contado_id == venta_contado_id
     ).order_by(Ticket.created_at.asc()).all()
 
@@ -106,10 +248,9 @@ def get_tickets_by_apartado(
     apartado_id: int
 ) -> List[Ticket]:
     """
-    Obtiene todos los tickets asociados a un apartado.
+    Obtiene todos los tickets asociados a un apartado (sólo metadatos).
     """
-    return db.query(Ticket).filter(
-        Ticket.tenant_id == tenant_id,
+    return _metadata_query(db, tenant_id).filter(
         Ticket.apartado_id == apartado_id
     ).order_by(Ticket.created_at.asc()).all()
 
@@ -120,10 +261,61 @@ def get_tickets_by_pedido(
     pedido_id: int
 ) -> List[Ticket]:
     """
-    Obtiene todos los tickets asociados a un pedido.
+    Obtiene todos los tickets asociados a un pedido (sólo metadatos).
     """
-    return db.query(Ticket).filter(
-        Ticket.tenant_id == tenant_id,
+    return _metadata_query(db, tenant_id).filter(
         Ticket.pedido_id == pedido_id
     ).order_by(Ticket.created_at.asc()).all()
 
+
+def get_tickets_by_sale(db: Session, tenant_id: int, sale_id: int) -> List[Ticket]:
+    """
+    Tickets de una venta o apartado (sólo metadatos), en una consulta: por venta_contado_id,
+    apartado_id o sale_id legacy, más los de abonos (kind 'payment-{id}') del apartado.
+    """
+    payment_ids = db.execute(
+        select(CreditPayment.id).where(CreditPayment.tenant_id == tenant_id, CreditPayment.apartado_id == sale_id)
+    ).scalars().all()
+    conditions = [
+        Ticket.venta_contado_id == sale_id,
+        Ticket.apartado_id == sale_id,
+        Ticket.sale_id == sale_id,
+    ]
+    if payment_ids:
+        conditions.append(Ticket.kind.in_([f"payment-{pid}" for pid in payment_ids]))
+    return _metadata_query(db, tenant_id).filter(or_(*conditions)).order_by(Ticket.created_at.asc(), Ticket.id.asc()).all()
+
+
+def compact_legacy(db: Session, batch_size: int = 200) -> int:
+    """Pasar los tickets con HTML sin comprimir al formato nuevo, por lotes con commit."""
+    done = 0
+    while True:
+        tickets = (
+            db.query(Ticket)
+            .filter(Ticket.body.is_(None), Ticket.html.isnot(None))
+            .order_by(Ticket.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not tickets:
+            return done
+        for ticket in tickets:
+            store_html(db, ticket, ticket.html)
+        db.commit()
+        done += len(tickets)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Comprimir los tickets guardados con HTML completo")
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    from app.core.database import SessionLocal
+
+    with SessionLocal() as db:
+        done = compact_legacy(db, args.batch_size)
+    print(f"✅ Tickets compactados: {done}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,17 @@
-from fastapi import FastAPI
+from app.core import startup  # primero: marca el inicio de la importación
+import anyio.to_thread
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-import os
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import OperationalError
 
 from app.core.config import settings
+from app.core.db_pool import is_statement_timeout
+from app.core.metrics import MetricsMiddleware
 from app.routes.auth import router as auth_router
 from app.routes.products import router as products_router
 from app.routes.health import router as health_router
+from app.routes.metrics import router as metrics_router
 from app.routes.admin import router as admin_router
 from app.routes.billing import router as billing_router
 from app.routes.ventas import router as ventas_router
@@ -22,8 +28,20 @@ from app.routes.tasas_pedido import router as tasas_pedido_router
 from app.routes.status_history import router as status_history_router
 from app.routes.customers import router as customers_router
 from app.routes.tickets import router as tickets_router
-from app.core.database import SessionLocal, init_db
-from app.services.seed import seed_demo
+from app.routes.jobs import router as jobs_router
+from app.services import codigo_index, expiry_sweeper, jobs
+
+
+def _configure_threadpool() -> None:
+    # Los endpoints `def` (sesión síncrona, pandas) corren en este threadpool
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.threadpool_size
+
+
+async def _statement_timeout_handler(request: Request, exc: OperationalError):
+    # statement_timeout (reportes): 504 en lugar de un 500 genérico
+    if is_statement_timeout(exc):
+        return JSONResponse(status_code=504, content={"detail": "La consulta tardó demasiado, intenta con un rango menor"})
+    raise exc
 
 
 def create_app() -> FastAPI:
@@ -37,9 +55,17 @@ def create_app() -> FastAPI:
             allow_credentials=True,
             allow_methods=["*"],
             allow_headers=["*"],
+            # Headers de respuesta que lee el frontend (paginación)
+            expose_headers=["X-Next-Cursor", "X-Total-Count"],
         )
 
+    # Consultas, tiempo en la base y latencia por ruta/tenant (GET /metrics)
+    app.add_middleware(MetricsMiddleware)
+
+    app.add_exception_handler(OperationalError, _statement_timeout_handler)
+
     app.include_router(health_router, tags=["health"])
+    app.include_router(metrics_router, tags=["metrics"])
     app.include_router(init_router, prefix="/init", tags=["init"])
     app.include_router(auth_router, prefix="/auth", tags=["auth"]) 
     app.include_router(products_router, prefix="/products", tags=["products"]) 
@@ -58,19 +84,29 @@ def create_app() -> FastAPI:
     app.include_router(status_history_router, prefix="/status-history", tags=["status-history"])
     app.include_router(customers_router, prefix="/customers", tags=["customers"])
     app.include_router(tickets_router, tags=["tickets"])
+    app.include_router(jobs_router, prefix="/jobs", tags=["jobs"])
 
-    return app
+    # Cada hook se mide (ver app.core.startup y GET /health)
+    app.add_event_handler("startup", startup.timed("threadpool", _configure_threadpool))
+    # Esquema y seed de dev: una vez por versión (ya no al importar)
+    app.add_event_handler("startup", startup.timed("migrations", startup.run_migrations))
 
+    if settings.codigo_index_warm_on_startup:
+        # En un hilo aparte: el arranque no espera a cargar los catálogos
+        app.add_event_handler("startup", startup.timed("codigo_index", codigo_index.warm_all_in_background))
 
-app = create_app()
+    # Workers de la cola de trabajos (importaciones, exportaciones, cierres)
+    app.add_event_handler("startup", startup.timed("jobs", jobs.start_runner))
+    app.add_event_handler("shutdown", jobs.stop_runner)
+
+    # Barrido periódico de apartados/pedidos vencidos (los listados ya no escriben)
+    app.add_event_handler("startup", startup.timed("expiry_sweeper", expiry_sweeper.start_scheduler))
+    app.add_event_handler("shutdown", expiry_sweeper.stop_scheduler)
 
-# Only seed in development or when explicitly requested
-if settings.env == "dev" or os.getenv("FORCE_SEED") == "true":
-    try:
-        init_db()
-        with SessionLocal() as db:
-            seed_demo(db)
-    except Exception:
-        pass
+    app.add_event_handler("startup", startup.finish)
+
+    return app
 
 
+app = create_app()
+startup.mark_imported()
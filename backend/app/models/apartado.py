@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import Column, Integer, Numeric, ForeignKey, DateTime, String, Text
+from sqlalchemy import Column, Integer, Numeric, ForeignKey, DateTime, String, Text, Index, text
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 
@@ -9,6 +9,17 @@ from app.models.tenant import Base
 
 class Apartado(Base):
     __tablename__ = "apartados"
+    __table_args__ = (
+        Index("ix_apartados_tenant_created", "tenant_id", "created_at"),
+        # Apartados abiertos (cuentas por cobrar, vencimientos): índice parcial, pequeño
+        Index(
+            "ix_apartados_tenant_open",
+            "tenant_id",
+            "created_at",
+            postgresql_where=text("credit_status IN ('pendiente', 'vencido')"),
+            sqlite_where=text("credit_status IN ('pendiente', 'vencido')"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     tenant_id = Column(Integer, ForeignKey("tenants.id", ondelete="CASCADE"), nullable=False, index=True)
@@ -1,11 +1,15 @@
 from datetime import datetime, timezone
-from sqlalchemy import Column, Integer, String, Numeric, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Numeric, DateTime, ForeignKey, Index
 
 from app.models.tenant import Base
 
 
 class CreditPayment(Base):
     __tablename__ = "credit_payments"
+    __table_args__ = (
+        Index("ix_credit_payments_tenant_created", "tenant_id", "created_at"),
+        Index("ix_credit_payments_apartado_created", "apartado_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False, index=True)
@@ -0,0 +1,28 @@
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, Numeric, String
+
+from app.models.tenant import Base
+
+
+class CustomerStats(Base):
+    """
+    Totales por cliente (mismo teléfono = mismo cliente) de ventas de contado, apartados y
+    pedidos. Lo mantiene app.services.customer_stats en cada flush; phone '' agrupa las
+    ventas sin teléfono.
+    """
+    __tablename__ = "customer_stats"
+    __table_args__ = (
+        Index("ix_customer_stats_tenant_total", "tenant_id", "total_gastado"),
+    )
+
+    tenant_id = Column(Integer, ForeignKey("tenants.id", ondelete="CASCADE"), primary_key=True)
+    phone = Column(String(50), primary_key=True)
+    total_ventas = Column(Numeric(12, 2), nullable=False, default=0)  # suma de ventas_contado.total
+    num_ventas = Column(Integer, nullable=False, default=0)
+    total_apartados = Column(Numeric(12, 2), nullable=False, default=0)  # suma de apartados.amount_paid
+    num_apartados = Column(Integer, nullable=False, default=0)
+    total_pedidos = Column(Numeric(12, 2), nullable=False, default=0)  # suma de pedidos.anticipo_pagado
+    num_pedidos = Column(Integer, nullable=False, default=0)
+    total_gastado = Column(Numeric(12, 2), nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
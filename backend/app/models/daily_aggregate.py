@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from sqlalchemy import Column, Date, DateTime, ForeignKey, Integer, Numeric, String, UniqueConstraint
+
+from app.models.tenant import Base
+
+
+class DailyAggregate(Base):
+    """
+    Totales pre-agregados por tenant, día local (México), vendedor, concepto y método de pago.
+    Se actualizan al registrar ventas, abonos y pagos de pedidos; se pueden reconstruir
+    desde las tablas fuente con app.services.daily_aggregates.
+    """
+    __tablename__ = "daily_aggregates"
+    __table_args__ = (
+        UniqueConstraint(
+            "tenant_id", "fecha", "vendedor_id", "concepto", "metodo",
+            name="uq_daily_aggregate_bucket",
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id", ondelete="CASCADE"), nullable=False)
+    # El unique (tenant_id, fecha, ...) sirve también como índice para consultas por rango
+    fecha = Column(Date, nullable=False)
+    # 0 = sin vendedor (no se usa NULL para que el ON CONFLICT del upsert funcione)
+    vendedor_id = Column(Integer, nullable=False, default=0)
+    # venta_contado, devolucion, pago_venta, anticipo_apartado, abono_apartado,
+    # anticipo_pedido, abono_pedido, contado_pedido
+    concepto = Column(String(30), nullable=False)
+    metodo = Column(String(30), nullable=False, default="")  # efectivo, tarjeta, transferencia...
+    num_operaciones = Column(Integer, nullable=False, default=0)
+    monto = Column(Numeric(14, 2), nullable=False, default=0)
+    costo = Column(Numeric(14, 2), nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
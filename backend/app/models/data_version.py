@@ -0,0 +1,19 @@
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
+
+from app.models.tenant import Base
+
+
+class DataVersion(Base):
+    """
+    Versión de los datos de un recurso (products, productos_pedido, metal_rates,
+    tasas_pedido) por tenant. Sube en cada commit que los modifica; la mantiene
+    app.services.data_versions y alimenta los ETag de los listados.
+    """
+    __tablename__ = "data_versions"
+
+    tenant_id = Column(Integer, ForeignKey("tenants.id", ondelete="CASCADE"), primary_key=True)
+    resource = Column(String(30), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
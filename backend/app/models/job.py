@@ -0,0 +1,38 @@
+from datetime import datetime
+
+from sqlalchemy import JSON, Column, DateTime, ForeignKey, Index, Integer, LargeBinary, String, Text
+from sqlalchemy.orm import deferred
+
+from app.models.tenant import Base
+
+
+class Job(Base):
+    """
+    Trabajo en segundo plano (importaciones, exportaciones, cierres del día).
+    La tabla es la cola: los workers de app.services.jobs toman los renglones 'queued'.
+    """
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_status_id", "status", "id"),
+        Index("ix_jobs_tenant_created", "tenant_id", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    kind = Column(String(50), nullable=False)  # products_import, ventas_export, cash_close_day...
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, succeeded, failed
+    progress = Column(Integer, nullable=False, default=0)  # 0-100
+    message = Column(String(255), nullable=True)
+    params = Column(JSON, nullable=True)
+    # Archivo de entrada (Excel a importar) y archivo resultado; se cargan sólo cuando se piden
+    input_file = deferred(Column(LargeBinary, nullable=True))
+    result = Column(JSON, nullable=True)
+    result_file = deferred(Column(LargeBinary, nullable=True))
+    result_filename = Column(String(255), nullable=True)
+    result_media_type = Column(String(100), nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
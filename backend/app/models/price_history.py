@@ -0,0 +1,29 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, Numeric, String
+
+from app.models.tenant import Base
+
+
+class PriceHistory(Base):
+    """
+    Precio anterior y nuevo de un producto en cada cambio de tasa de metal.
+    Lo escribe app.services.metal_repricing (un INSERT ... SELECT por recálculo).
+    """
+    __tablename__ = "price_history"
+    __table_args__ = (
+        Index("ix_price_history_product_created", "product_id", "created_at"),
+        Index("ix_price_history_tenant_created", "tenant_id", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id", ondelete="CASCADE"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    metal_rate_id = Column(Integer, ForeignKey("metal_rates.id", ondelete="SET NULL"), nullable=True)
+    metal_type = Column(String(50), nullable=False)
+    old_rate = Column(Numeric(10, 2), nullable=True)  # NULL si la tasa anterior no se conoce
+    new_rate = Column(Numeric(10, 2), nullable=False)
+    old_price = Column(Numeric(10, 2), nullable=True)
+    new_price = Column(Numeric(10, 2), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Numeric, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Numeric, DateTime, Boolean, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -6,6 +6,9 @@ from .tenant import Base
 
 class ProductoPedido(Base):
     __tablename__ = "productos_pedido"
+    __table_args__ = (
+        Index("ix_productos_pedido_tenant_active", "tenant_id", "active"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False)
@@ -40,6 +43,10 @@ class ProductoPedido(Base):
 
 class Pedido(Base):
     __tablename__ = "pedidos"
+    __table_args__ = (
+        Index("ix_pedidos_tenant_created", "tenant_id", "created_at"),
+        Index("ix_pedidos_tenant_tipo_estado", "tenant_id", "tipo_pedido", "estado"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False)
@@ -113,6 +120,10 @@ class PedidoItem(Base):
 
 class PagoPedido(Base):
     __tablename__ = "pagos_pedido"
+    __table_args__ = (
+        Index("ix_pagos_pedido_pedido_tipo", "pedido_id", "tipo_pago"),
+        Index("ix_pagos_pedido_created", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     pedido_id = Column(Integer, ForeignKey("pedidos.id"), nullable=False)
@@ -0,0 +1,42 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Date, DateTime, ForeignKey, Index, Integer, String, UniqueConstraint
+
+from app.models.tenant import Base
+
+
+class StockLedgerEntry(Base):
+    """
+    Un renglón por cada cambio de stock de un producto, con el saldo resultante.
+    Lo escribe app.services.stock_ledger (ventas, devoluciones, apartados, movimientos,
+    ediciones e importaciones); nunca se actualiza.
+    """
+    __tablename__ = "stock_ledger"
+    __table_args__ = (
+        Index("ix_stock_ledger_tenant_created", "tenant_id", "created_at"),
+        Index("ix_stock_ledger_product_created", "product_id", "created_at", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id", ondelete="CASCADE"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    delta = Column(Integer, nullable=True)  # NULL si no se conocía el stock anterior
+    balance = Column(Integer, nullable=False)  # stock después del cambio
+    reason = Column(String(20), nullable=False)  # venta, devolucion, apartado, entrada, salida, ajuste, alta, importacion
+    created_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+
+class StockSnapshot(Base):
+    """Saldo de cada producto con stock al corte `as_of` (uno por tenant y día)."""
+    __tablename__ = "stock_snapshots"
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "snapshot_date", "product_id", name="uq_stock_snapshots_day_product"),
+        Index("ix_stock_snapshots_tenant_as_of", "tenant_id", "as_of"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id", ondelete="CASCADE"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    snapshot_date = Column(Date, nullable=False)
+    as_of = Column(DateTime(timezone=True), nullable=False)  # incluye los cambios hasta este momento
+    balance = Column(Integer, nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, DateTime, ForeignKey, String, Text, UniqueConstraint
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, LargeBinary, String, Text, UniqueConstraint, Index
 from datetime import datetime
 from app.models.tenant import Base
 
@@ -9,6 +9,7 @@ class Ticket(Base):
         UniqueConstraint("tenant_id", "venta_contado_id", "kind", name="uq_tickets_venta_contado"),
         UniqueConstraint("tenant_id", "apartado_id", "kind", name="uq_tickets_apartado"),
         UniqueConstraint("tenant_id", "pedido_id", "kind", name="uq_tickets_pedido"),
+        Index("ix_tickets_tenant_kind", "tenant_id", "kind"),
     )
 
     id = Column(Integer, primary_key=True, index=True)
@@ -18,7 +19,22 @@ class Ticket(Base):
     apartado_id = Column(Integer, ForeignKey("apartados.id"), nullable=True, index=True)  # Apartados
     pedido_id = Column(Integer, ForeignKey("pedidos.id"), nullable=True, index=True)  # Pedidos
     kind = Column(String(50), nullable=False, default="sale")  # sale | payment | pedido-payment-{id} | pedido-abono-{id}
-    html = Column(Text, nullable=False)
+    # Legacy: HTML completo sin comprimir. Los tickets nuevos guardan `body` (ver
+    # app.core.ticket_service): HTML comprimido con el logo/CSS en ticket_fragments
+    html = Column(Text, nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    html_size = Column(Integer, nullable=True)  # Bytes del HTML completo
+    etag = Column(String(64), nullable=True)  # sha256 del HTML completo
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class TicketFragment(Base):
+    """Fragmento grande y repetido de los tickets (logo en base64, CSS), por contenido."""
+    __tablename__ = "ticket_fragments"
+
+    hash = Column(String(64), primary_key=True)  # sha256 del fragmento
+    data = Column(LargeBinary, nullable=False)  # zlib
+    size = Column(Integer, nullable=False)
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
 
 
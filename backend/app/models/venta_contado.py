@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import Column, Integer, Numeric, ForeignKey, DateTime, String
+from sqlalchemy import Column, Integer, Numeric, ForeignKey, DateTime, String, Index
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 
@@ -9,6 +9,9 @@ from app.models.tenant import Base
 
 class VentasContado(Base):
     __tablename__ = "ventas_contado"
+    __table_args__ = (
+        Index("ix_ventas_contado_tenant_created", "tenant_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     tenant_id = Column(Integer, ForeignKey("tenants.id", ondelete="CASCADE"), nullable=False, index=True)
@@ -1,10 +1,12 @@
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel, EmailStr
 from sqlalchemy.orm import Session
 
-from app.core.deps import get_current_user, get_tenant, require_owner
-from app.core.database import get_db
+from app.core.deps import get_current_user, get_tenant, invalidate_user, require_ops_token, require_owner
+from app.core.database import engine, get_db
+from app.core.db_pool import pool_stats
+from app.core.metrics import slow_requests
 from app.core.security import hash_password
 from app.models.tenant import Tenant
 from app.models.user import User
@@ -116,6 +118,7 @@ def update_user(
             user_to_update.username = data.username
     
     db.commit()
+    invalidate_user(tenant.id, user_id)
     db.refresh(user_to_update)
     return user_to_update
 
@@ -141,6 +144,7 @@ def delete_user(
     
     db.delete(user_to_delete)
     db.commit()
+    invalidate_user(tenant.id, user_id)
     return {"message": "User deleted successfully"}
 
 
@@ -152,4 +156,21 @@ def reseed_demo(db: Session = Depends(get_db), tenant: Tenant = Depends(get_tena
     return {"ok": True}
 
 
-
+@router.get("/db-pool", dependencies=[Depends(require_ops_token)])
+def db_pool_stats(reset: bool = Query(False, description="Reiniciar los contadores de espera")):
+    """
+    Estado del pool de conexiones de este proceso: conexiones en uso, libres y de overflow,
+    checkouts, cuántos esperaron por una conexión (promedio y máximo en ms) y timeouts.
+    El pool es de todos los tenants: con el token de métricas, como /metrics.
+    """
+    return pool_stats(engine, reset=reset)
+
+
+@router.get("/slow-requests", dependencies=[Depends(require_ops_token)])
+def get_slow_requests():
+    """
+    Últimos requests de este proceso que pasaron de SLOW_REQUEST_MS: ruta, tenant, consultas,
+    tiempo en la base, sus sentencias más lentas y la más repetida (N+1). Son de todos los
+    tenants: con el token de métricas, no con el rol owner.
+    """
+    return slow_requests()
@@ -5,12 +5,12 @@ from typing import List, Optional
 from decimal import Decimal
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, condecimal
 from sqlalchemy.orm import Session
 
 from app.core.database import get_db
-from app.core.deps import get_current_user, get_tenant, require_admin
+from app.core.deps import get_current_user, get_json_body, get_tenant, require_admin
 from app.core.folio_service import generate_folio
 from app.models.tenant import Tenant
 from app.models.user import User
@@ -25,6 +25,8 @@ from app.routes.ventas import (
     PaymentIn
 )
 from app.services.customer_service import upsert_customer
+from app.services.daily_aggregates import record_credit_payment
+from app.services.stock_reservation import InsufficientStockError, merge_quantities, reserve_stock
 
 router = APIRouter()
 
@@ -66,8 +68,7 @@ class ApartadoUpdate(BaseModel):
 
 
 @router.post("/", response_model=ApartadoOut)
-async def create_apartado_route(
-    request: Request,
+def create_apartado_route(
     items: List[SaleItemIn],
     payments: List[PaymentIn] | None = None,
     discount_amount: condecimal(max_digits=10, decimal_places=2) | None = Decimal("0"),
@@ -75,13 +76,13 @@ async def create_apartado_route(
     db: Session = Depends(get_db),
     tenant: Tenant = Depends(get_tenant),
     user: User = Depends(get_current_user),
+    body: dict = Depends(get_json_body),
 ):
     """
     Crea un apartado (venta a crédito).
     Requiere un anticipo inicial mayor a 0.
     """
-    # Get the raw JSON data from request body
-    body = await request.json()
+    # body: JSON crudo (vendedor, cliente, utilidad...), leído por get_json_body
     print(f"DEBUG APARTADO ENDPOINT: Body received: {body}")
 
     vendedor_id = body.get('vendedor_id') or user.id
@@ -107,22 +108,26 @@ async def create_apartado_route(
             raise HTTPException(status_code=400, detail=f"Producto inválido: {it.product_id}")
         product_map[it.product_id] = p
 
+    # Apartar inventario de todo el carrito en un solo UPDATE condicional
+    try:
+        reserve_stock(
+            db, tenant.id, merge_quantities((it.product_id, max(1, int(it.quantity))) for it in items), reason="apartado"
+        )
+    except InsufficientStockError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Stock insuficiente para {product_map[e.product_id].name}")
+
     # Calculate totals
     subtotal = Decimal("0")
     for it in items:
         p = product_map[it.product_id]
         q = max(1, int(it.quantity))
-        if p.stock is not None and p.stock < q:
-            raise HTTPException(status_code=400, detail=f"Stock insuficiente para {p.name}")
         unit = Decimal(str(p.price)).quantize(Decimal("0.01"))
         line_subtotal = (unit * q).quantize(Decimal("0.01"))
         line_disc_pct = Decimal(str(getattr(it, 'discount_pct', Decimal('0')) or 0)).quantize(Decimal("0.01"))
         line_disc_amount = (line_subtotal * line_disc_pct / Decimal('100')).quantize(Decimal('0.01'))
         line_total = (line_subtotal - line_disc_amount).quantize(Decimal('0.01'))
         subtotal += line_total
-        # Decrement stock
-        if p.stock is not None:
-            p.stock = int(p.stock) - q
 
     subtotal_val = subtotal.quantize(Decimal("0.01"))
     discount_val = Decimal(str(discount_amount or 0)).quantize(Decimal("0.01"))
@@ -210,6 +215,7 @@ async def create_apartado_route(
             )
             db.add(cp)
             db.flush()  # Flush after each payment to avoid bulk insert issues
+            record_credit_payment(db, cp, apartado)
             payments_list.append({"method": p_in.method, "amount": float(amt)})
     
     db.commit()
@@ -1,9 +1,10 @@
+import json
 import os
 from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
-from app.core.deps import get_current_user, get_tenant, require_owner
+from app.core.deps import get_current_user, get_raw_body, get_tenant, invalidate_tenant, require_owner
 from app.core.database import get_db
 from app.models.tenant import Tenant
 from app.models.user import User
@@ -42,13 +43,12 @@ def create_checkout_session(
 
 
 @router.post("/webhook")
-async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
+def stripe_webhook(request: Request, payload: bytes = Depends(get_raw_body), db: Session = Depends(get_db)):
     try:
         import stripe as stripe_lib
     except ImportError:
         # Allow noop webhook if stripe not installed in dev
         return {"received": True}
-    payload = await request.body()
     sig_header = request.headers.get("stripe-signature")
     endpoint_secret = os.getenv("STRIPE_WEBHOOK_SECRET", "")
     stripe_secret = os.getenv("STRIPE_SECRET_KEY", "")
@@ -59,7 +59,7 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
             event = stripe_lib.Webhook.construct_event(payload, sig_header, endpoint_secret)
         else:
             # Unsafe parse for dev only
-            event = stripe_lib.Event.construct_from(request.json(), stripe_lib.api_key)
+            event = stripe_lib.Event.construct_from(json.loads(payload), stripe_lib.api_key)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid payload")
 
@@ -74,6 +74,7 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
                 tenant.stripe_customer_id = data.get("customer")
                 tenant.stripe_subscription_id = data.get("subscription") or tenant.stripe_subscription_id
                 db.commit()
+                invalidate_tenant(tenant_slug)
     return {"received": True}
 
 
@@ -1,9 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from typing import List, Optional
-from datetime import datetime
+from typing import Dict, List, Optional
+from datetime import date, datetime
 
 from app.core.database import get_db
 from app.core.deps import get_tenant, get_current_user, require_admin
@@ -13,6 +13,8 @@ from app.models.credit_payment import CreditPayment
 from app.models.payment import Payment
 from app.models.apartado import Apartado
 from app.routes.status_history import create_status_history
+from app.services import credit_sales, pagination
+from app.services.daily_aggregates import record_credit_payment
 
 router = APIRouter()
 
@@ -56,112 +58,78 @@ class CreditSaleDetail(BaseModel):
         from_attributes = True
 
 
+class CreditStatusTotals(BaseModel):
+    count: int
+    total: float
+    amount_paid: float
+    balance: float
+
+
+class CreditSalesTotals(CreditStatusTotals):
+    by_status: Dict[str, CreditStatusTotals]
+
+
+class CreditSalesPage(BaseModel):
+    items: List[CreditSaleDetail]
+    next_cursor: Optional[str] = None
+    totals: Optional[CreditSalesTotals] = None
+
+
+def _credit_sales_query(db: Session, tenant: Tenant, status, vendedor_id, date_from, date_to, customer_phone):
+    return credit_sales.filtered_query(
+        db,
+        tenant.id,
+        status=status,
+        vendedor_id=vendedor_id,
+        date_from=date_from,
+        date_to=date_to,
+        customer_phone=customer_phone,
+    )
+
+
 @router.get("/sales", response_model=List[CreditSaleDetail])
 def get_credit_sales(
     status: Optional[str] = None,
     vendedor_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    customer_phone: Optional[str] = None,
     db: Session = Depends(get_db),
     tenant: Tenant = Depends(get_tenant),
     current_user: User = Depends(get_current_user)
 ):
-    """Get all credit sales with optional filters"""
-    from datetime import datetime, timedelta
-    
-    query = db.query(Apartado).filter(Apartado.tenant_id == tenant.id)
-
-    if status:
-        query = query.filter(Apartado.credit_status == status)
+    """Get all credit sales with optional filters (sin paginar; ver /sales/page)"""
+    # Solo lectura: el estado 'vencido' lo marca app.services.expiry_sweeper
+    query = _credit_sales_query(db, tenant, status, vendedor_id, date_from, date_to, customer_phone)
+    sales = query.order_by(Apartado.created_at.desc(), Apartado.id.desc()).all()
+    return credit_sales.serialize(db, sales)
 
-    if vendedor_id:
-        query = query.filter(Apartado.vendedor_id == vendedor_id)
 
-    sales = query.order_by(Apartado.created_at.desc()).all()
-    
-    # Verificar y actualizar estado vencido (75 días = 2 meses + 15 días)
-    fecha_limite = datetime.utcnow() - timedelta(days=75)
-    for sale in sales:
-        balance = float(sale.total) - float(sale.amount_paid or 0)
-        # Si tiene balance pendiente, no está pagado/cancelado, y han pasado 75 días
-        if (balance > 0 and 
-            sale.credit_status not in ['paid', 'cancelled', 'vencido'] and
-            sale.created_at.replace(tzinfo=None) < fecha_limite):
-            sale.credit_status = 'vencido'
-            db.add(sale)
-    
-    # Commit cambios de estados
-    db.commit()
-
-    # Add payments and balance to each sale
-    result = []
-    for sale in sales:
-        # No consolidamos pagos iniciales desde Payment; ahora todos los abonos viven en credit_payments.apartado_id
-        initial_payments_query = []
-        credit_payments_query = db.query(CreditPayment).filter(
-            CreditPayment.apartado_id == sale.id
-        ).all()
-        
-        # Combinar ambos tipos de pagos
-        payments = []
-        
-        # Consolidar pagos iniciales (anticipo) en una sola entrada
-        if initial_payments_query:
-            # Sumar todos los pagos iniciales
-            total_inicial = sum(float(p.amount) for p in initial_payments_query)
-            metodo_efectivo = sum(float(p.amount) for p in initial_payments_query if p.method == 'cash')
-            metodo_tarjeta = sum(float(p.amount) for p in initial_payments_query if p.method == 'card')
-            
-            # Determinar el método de pago a mostrar
-            if metodo_efectivo > 0 and metodo_tarjeta > 0:
-                metodo_display = f"mixto (E:${metodo_efectivo:.2f} T:${metodo_tarjeta:.2f})"
-            elif metodo_tarjeta > 0:
-                metodo_display = "card"
-            else:
-                metodo_display = "cash"
-            
-            # Agregar un solo registro consolidado para el anticipo inicial
-            pass
-        
-        # Agregar abonos posteriores
-        for p in credit_payments_query:
-            payments.append({
-                "id": p.id,
-                "sale_id": sale.id,
-                "amount": float(p.amount),
-                "payment_method": p.payment_method,
-                "user_id": p.user_id,
-                "notes": p.notes,
-                "created_at": p.created_at.isoformat()
-            })
-        
-        # Ordenar todos los pagos por fecha
-        payments.sort(key=lambda x: x["created_at"])
-        
-        balance = float(sale.total) - float(sale.amount_paid or 0)
-        
-        # Obtener email del vendedor si existe
-        vendedor_email = None
-        if sale.vendedor_id:
-            vendedor = db.query(User).filter(User.id == sale.vendedor_id).first()
-            if vendedor:
-                vendedor_email = vendedor.email
-        
-        result.append({
-            "id": sale.id,
-            "customer_name": sale.customer_name,
-            "customer_phone": sale.customer_phone,
-            "notas_cliente": sale.notas_cliente,
-            "total": float(sale.total),
-            "amount_paid": float(sale.amount_paid or 0),
-            "balance": balance,
-            "credit_status": sale.credit_status,
-            "vendedor_id": sale.vendedor_id,
-            "vendedor_email": vendedor_email,
-            "created_at": sale.created_at.isoformat(),
-            "vip_discount_pct": float(sale.vip_discount_pct),
-            "payments": payments
-        })
-    
-    return result
+@router.get("/sales/page", response_model=CreditSalesPage)
+def get_credit_sales_page(
+    status: Optional[str] = None,
+    vendedor_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    customer_phone: Optional[str] = None,
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior"),
+    limit: int = Query(50, ge=1, le=200),
+    include_totals: bool = Query(True, description="Totales de todo el conjunto filtrado"),
+    db: Session = Depends(get_db),
+    tenant: Tenant = Depends(get_tenant),
+    current_user: User = Depends(get_current_user)
+):
+    """Apartados a crédito paginados por llave (más recientes primero), con totales globales"""
+    query = _credit_sales_query(db, tenant, status, vendedor_id, date_from, date_to, customer_phone)
+    try:
+        sales, next_cursor = credit_sales.list_page(query, limit, cursor)
+    except pagination.InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "items": credit_sales.serialize(db, sales),
+        "next_cursor": next_cursor,
+        "totals": credit_sales.totals(query) if include_totals else None,
+    }
 
 
 @router.post("/payments", response_model=CreditPaymentResponse)
@@ -218,6 +186,8 @@ def register_payment(
     if sale.amount_paid >= sale.total:
         sale.credit_status = "pagado"
     
+    db.flush()
+    record_credit_payment(db, payment, sale)
     db.commit()
     db.refresh(payment)
     
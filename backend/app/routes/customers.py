@@ -1,18 +1,15 @@
 from typing import List, Optional
 from datetime import datetime
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Response
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_, case
 
 from app.core.database import get_db
 from app.core.deps import get_current_user, get_tenant
 from app.models.tenant import Tenant
 from app.models.user import User
 from app.models.customer import Customer
-from app.models.venta_contado import VentasContado
-from app.models.apartado import Apartado
-from app.models.producto_pedido import Pedido
+from app.services import customer_stats
 
 
 router = APIRouter()
@@ -50,98 +47,40 @@ class CustomerOut(BaseModel):
 
 @router.get("/", response_model=List[CustomerReport])
 def get_customers(
+    response: Response,
     search: Optional[str] = Query(None),
     order_by: Optional[str] = Query("nombre"),
     order_dir: Optional[str] = Query("asc"),
+    skip: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
     db: Session = Depends(get_db),
     tenant: Tenant = Depends(get_tenant),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Get all customers with their total spending and registration date.
+    Get customers with their total spending and registration date.
     Uses Customer model (agrupado por teléfono: mismo teléfono = mismo cliente).
+    Los totales salen de customer_stats (mantenida al escribir); búsqueda, orden y
+    paginación se hacen en SQL. Sin limit devuelve todos (la pantalla de clientes no pagina);
+    X-Total-Count trae el total de clientes que coinciden.
     """
-    # Obtener todos los clientes de la tabla customers
-    customers = db.query(Customer).filter(Customer.tenant_id == tenant.id).all()
-    
-    # Obtener estadísticas de ventas de contado por cliente (agrupado por teléfono)
-    ventas_stats = db.query(
-        VentasContado.customer_phone.label('telefono'),
-        func.sum(VentasContado.total).label('total_ventas'),
-        func.count(VentasContado.id).label('num_ventas')
-    ).filter(
-        VentasContado.tenant_id == tenant.id,
-        VentasContado.customer_name != None,
-        VentasContado.customer_name != ''
-    ).group_by(VentasContado.customer_phone).all()
-    
-    # Obtener estadísticas de apartados por cliente (agrupado por teléfono)
-    apartados_stats = db.query(
-        Apartado.customer_phone.label('telefono'),
-        func.sum(Apartado.amount_paid).label('total_pagado'),
-        func.count(Apartado.id).label('num_apartados')
-    ).filter(
-        Apartado.tenant_id == tenant.id,
-        Apartado.customer_name != None,
-        Apartado.customer_name != ''
-    ).group_by(Apartado.customer_phone).all()
-    
-    # Obtener estadísticas de pedidos por cliente (agrupado por teléfono)
-    pedidos_stats = db.query(
-        Pedido.cliente_telefono.label('telefono'),
-        func.sum(Pedido.anticipo_pagado).label('total_pagado'),
-        func.count(Pedido.id).label('num_pedidos')
-    ).filter(
-        Pedido.tenant_id == tenant.id,
-        Pedido.cliente_nombre != None,
-        Pedido.cliente_nombre != ''
-    ).group_by(Pedido.cliente_telefono).all()
-    
-    # Crear diccionarios de estadísticas por teléfono
-    ventas_dict = {v.telefono or '': {'total': float(v.total_ventas or 0), 'count': v.num_ventas} for v in ventas_stats}
-    apartados_dict = {a.telefono or '': {'total': float(a.total_pagado or 0), 'count': a.num_apartados} for a in apartados_stats}
-    pedidos_dict = {p.telefono or '': {'total': float(p.total_pagado or 0), 'count': p.num_pedidos} for p in pedidos_stats}
-    
-    # Construir lista de CustomerReport
+    rows, total = customer_stats.list_customers(
+        db, tenant.id, search=search, order_by=order_by, order_dir=order_dir, skip=skip, limit=limit
+    )
+    response.headers["X-Total-Count"] = str(total)
+
     customers_list = []
-    for customer in customers:
-        phone_key = customer.phone or ''
-        ventas_data = ventas_dict.get(phone_key, {'total': 0, 'count': 0})
-        apartados_data = apartados_dict.get(phone_key, {'total': 0, 'count': 0})
-        pedidos_data = pedidos_dict.get(phone_key, {'total': 0, 'count': 0})
-        
-        total_gastado = ventas_data['total'] + apartados_data['total'] + pedidos_data['total']
-        
+    for customer, stats in rows:
         customers_list.append(CustomerReport(
             id=customer.id,
             nombre=customer.name,
             telefono=customer.phone or "",
-            total_gastado=total_gastado,
+            total_gastado=float(stats.total_gastado or 0) if stats else 0,
             fecha_registro=customer.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-            num_ventas_contado=ventas_data['count'],
-            num_apartados=apartados_data['count'],
-            num_pedidos=pedidos_data['count']
+            num_ventas_contado=stats.num_ventas if stats else 0,
+            num_apartados=stats.num_apartados if stats else 0,
+            num_pedidos=stats.num_pedidos if stats else 0
         ))
-    
-    # Aplicar filtro de búsqueda
-    if search:
-        search_lower = search.lower()
-        customers_list = [
-            c for c in customers_list 
-            if search_lower in c.nombre.lower() or search_lower in c.telefono
-        ]
-    
-    # Aplicar ordenamiento
-    reverse = order_dir == "desc"
-    if order_by == "nombre":
-        customers_list.sort(key=lambda x: x.nombre.lower(), reverse=reverse)
-    elif order_by == "telefono":
-        customers_list.sort(key=lambda x: x.telefono, reverse=reverse)
-    elif order_by == "total_gastado":
-        customers_list.sort(key=lambda x: x.total_gastado, reverse=reverse)
-    elif order_by == "fecha_registro":
-        customers_list.sort(key=lambda x: x.fecha_registro, reverse=reverse)
-    
     return customers_list
 
 
@@ -1,11 +1,14 @@
 from fastapi import APIRouter
 
+from app.core import startup
+
 router = APIRouter()
 
 
 @router.get("/health")
 def health_check():
-    return {"status": "ok"}
+    # Sin consultas a la base: tiempos de arranque contra el presupuesto (app.core.startup)
+    return {"status": "ok", "startup": startup.report()}
 
 
 
@@ -1,7 +1,6 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Form
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Form, Query
 from sqlalchemy.orm import Session
 from typing import Optional
-import pandas as pd
 from io import BytesIO
 
 from app.core.database import get_db
@@ -9,15 +8,18 @@ from app.core.deps import get_tenant, get_current_user
 from app.models.tenant import Tenant
 from app.models.user import User
 from app.models.product import Product
-from app.models.metal_rate import MetalRate
+from app.services import codigo_index
+from app.routes.jobs import enqueue_job
+from app.services import jobs
 
 router = APIRouter()
 
 
 @router.post("/products/import")
-async def import_products(
+def import_products(
     file: UploadFile = File(...),
     mode: str = Form("add"),  # "add" or "replace"
+    background: bool = Query(False, description="Procesar como trabajo en segundo plano"),
     db: Session = Depends(get_db),
     tenant: Tenant = Depends(get_tenant),
     current_user: User = Depends(get_current_user)
@@ -43,183 +45,48 @@ async def import_products(
     if not file.filename.endswith(('.xlsx', '.xls')):
         raise HTTPException(status_code=400, detail="El archivo debe ser Excel (.xlsx o .xls)")
     
+    # Endpoint síncrono: corre en el threadpool, así que lectura, pandas y escritura no
+    # bloquean el event loop
+    contents = file.file.read()
+    if background:
+        # Archivos grandes: responder de inmediato con el id del trabajo (ver /jobs/{id})
+        return enqueue_job(db, tenant, current_user, "products_import", {"filename": file.filename}, contents)
+
+    # mode 'add' y 'replace' se comportan igual: alta de nuevos y actualización por código
     try:
-        # Read Excel file
-        contents = await file.read()
-        df = pd.read_excel(BytesIO(contents))
-        
-        # Normalize column names to lowercase and strip spaces
-        df.columns = df.columns.str.lower().str.strip()
-        
-        # Normalize column names (accept both 'name' and 'nombre')
-        if 'nombre' in df.columns and 'name' not in df.columns:
-            df['name'] = df['nombre']
-        
-        # Debug: verificar columnas después de normalizar
-        import sys
-        print(f"DEBUG IMPORT PRODUCTS: Columnas después de normalizar: {list(df.columns)}", file=sys.stderr)
-        print(f"DEBUG IMPORT PRODUCTS: Columnas después de normalizar: {list(df.columns)}")
-        if 'quilataje' in df.columns:
-            print(f"DEBUG IMPORT PRODUCTS: Columna 'quilataje' encontrada", file=sys.stderr)
-            sample_values = df['quilataje'].head(3).tolist()
-            print(f"DEBUG IMPORT PRODUCTS: Primeros 3 valores de quilataje: {sample_values}", file=sys.stderr)
-        else:
-            print("DEBUG IMPORT PRODUCTS: ERROR - Columna 'quilataje' NO encontrada", file=sys.stderr)
-        
-        # Validate required columns (only codigo is required)
-        required_cols = ['codigo']
-        missing_cols = [col for col in required_cols if col not in df.columns]
-        if missing_cols:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Columnas requeridas faltantes: {', '.join(missing_cols)}"
-            )
-        
-        # Get metal rates for price calculation (case-insensitive lookup)
-        metal_rates = {}
-        metal_rates_lower = {}  # For case-insensitive lookup
-        for rate in db.query(MetalRate).filter(MetalRate.tenant_id == tenant.id).all():
-            metal_rates[rate.metal_type] = rate.rate_per_gram
-            metal_rates_lower[rate.metal_type.lower()] = rate.rate_per_gram
-        
-        added = 0
-        updated = 0
-        errors = []
-        
-        print(f"DEBUG: Import mode = {mode}")
-        
-        for idx, row in df.iterrows():
-            try:
-                codigo_raw = row.get('codigo')
-                # Handle NaN values from pandas
-                if pd.isna(codigo_raw):
-                    errors.append(f"Fila {idx+2}: código es requerido")
-                    continue
-                
-                codigo = str(codigo_raw).strip()
-                name_raw = row.get('name')
-                
-                # Name is optional - if empty, leave it blank
-                if pd.isna(name_raw):
-                    name = ""
-                else:
-                    name = str(name_raw).strip()
-                
-                if not codigo:
-                    errors.append(f"Fila {idx+2}: código es requerido")
-                    continue
-                
-                # Check if product exists
-                existing = db.query(Product).filter(
-                    Product.tenant_id == tenant.id,
-                    Product.codigo == codigo
-                ).first()
-                
-                print(f"DEBUG: Fila {idx+2} - codigo={codigo}, existing={existing is not None}, mode={mode}")
-                
-                # Process quilataje with improved validation
-                quilataje = None
-                if 'quilataje' in df.columns:
-                    try:
-                        raw_quilataje = row['quilataje']  # Direct access to pandas Series
-                        if pd.notna(raw_quilataje):
-                            quilataje_str = str(raw_quilataje).strip()
-                            if quilataje_str and quilataje_str.lower() != 'nan':
-                                quilataje = quilataje_str
-                            else:
-                                print(f"DEBUG IMPORT PRODUCTS: Quilataje vacío o 'nan' para código {codigo}: '{quilataje_str}'", file=sys.stderr)
-                        else:
-                            print(f"DEBUG IMPORT PRODUCTS: Quilataje es NaN para código {codigo}", file=sys.stderr)
-                    except (KeyError, IndexError) as e:
-                        print(f"DEBUG IMPORT PRODUCTS: Error accediendo quilataje para código {codigo}: {e}", file=sys.stderr)
-                else:
-                    print(f"DEBUG IMPORT PRODUCTS: Columna 'quilataje' no está en df.columns para código {codigo}", file=sys.stderr)
-                
-                # Calculate price
-                peso_gramos = float(row.get('peso_gramos', 0)) if pd.notna(row.get('peso_gramos')) else None
-                descuento_pct = float(row.get('descuento_porcentaje', 0)) if pd.notna(row.get('descuento_porcentaje')) else 0
-                precio_manual = float(row.get('precio_manual')) if pd.notna(row.get('precio_manual')) else None
-                
-                # Auto-calculate price if no manual price
-                if precio_manual:
-                    precio_venta = precio_manual
-                elif quilataje and peso_gramos:
-                    # Case-insensitive lookup for quilataje
-                    quilataje_lower = quilataje.lower()
-                    if quilataje in metal_rates:
-                        rate_per_gram = metal_rates[quilataje]
-                    elif quilataje_lower in metal_rates_lower:
-                        rate_per_gram = metal_rates_lower[quilataje_lower]
-                    else:
-                        rate_per_gram = None
-                    
-                    if rate_per_gram:
-                        # Convert Decimal to float to avoid type mismatch
-                        base_price = round(float(rate_per_gram) * peso_gramos)
-                        precio_venta = round(base_price - (base_price * descuento_pct / 100))
-                else:
-                    # Use costo with markup if available
-                    costo = float(row.get('costo', 0)) if pd.notna(row.get('costo')) else 0
-                    precio_venta = round(costo * 1.5) if costo > 0 else 0
-                
-                product_data = {
-                    'name': name,
-                    'codigo': codigo,
-                    'marca': str(row.get('marca', '')).strip() if pd.notna(row.get('marca')) else None,
-                    'modelo': str(row.get('modelo', '')).strip() if pd.notna(row.get('modelo')) else None,
-                    'color': str(row.get('color', '')).strip() if pd.notna(row.get('color')) else None,
-                    'quilataje': quilataje,
-                    'base': str(row.get('base', '')).strip() if pd.notna(row.get('base')) else None,
-                    'tipo_joya': str(row.get('tipo_joya', '')).strip() if pd.notna(row.get('tipo_joya')) else None,
-                    'talla': str(row.get('talla', '')).strip() if pd.notna(row.get('talla')) else None,
-                    'peso_gramos': peso_gramos,
-                    'descuento_porcentaje': descuento_pct,
-                    'precio_manual': precio_manual,
-                    'costo': float(row.get('costo', 0)) if pd.notna(row.get('costo')) else 0,
-                    'cost_price': float(row.get('costo', 0)) if pd.notna(row.get('costo')) else 0,
-                    'precio_venta': precio_venta,
-                    'price': precio_venta,
-                    'stock': int(row.get('stock', 0)) if pd.notna(row.get('stock')) else 0,
-                    'codigo': str(row.get('codigo', '')).strip() if pd.notna(row.get('codigo')) else None,
-                    'active': True,
-                    'tenant_id': tenant.id
-                }
-                
-                if existing:
-                    # Update existing product (both 'add' and 'replace' modes update)
-                    print(f"DEBUG: Updating existing product {codigo}")
-                    for key, value in product_data.items():
-                        if key != 'tenant_id':  # Don't update tenant_id
-                            setattr(existing, key, value)
-                    updated += 1
-                else:
-                    # Add new product
-                    print(f"DEBUG: Adding new product {codigo}")
-                    new_product = Product(**product_data)
-                    db.add(new_product)
-                    added += 1
-                
-            except Exception as e:
-                errors.append(f"Fila {idx+2}: {str(e)}")
-                continue
-        
+        from app.services.product_import import import_products_excel
+
+        result = import_products_excel(db, tenant.id, contents)
         db.commit()
-        
-        return {
-            "success": True,
-            "added": added,
-            "updated": updated,
-            "errors": errors,
-            "total_rows": len(df)
-        }
-        
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error procesando archivo: {str(e)}")
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    # El INSERT masivo no pasa por los eventos del ORM
+    codigo_index.invalidate_tenant(tenant.id)
+
+    return {"success": True, **result}
+
+
+@jobs.register("products_import")
+def _products_import_job(db: Session, job, progress):
+    def report(done: int, total: int) -> None:
+        progress(done * 100 // max(total, 1), f"{done} de {total} productos")
+
+    from app.services.product_import import import_products_excel
+
+    try:
+        result = import_products_excel(db, job.tenant_id, job.input_file, progress=report)
+    except ValueError as e:
+        raise jobs.JobError(str(e))
+    db.commit()
+    codigo_index.invalidate_tenant(job.tenant_id)
+    return {"success": True, **result}
 
 
 @router.get("/products/export-template")
-async def export_template():
+def export_template():
     """Download Excel template for product import"""
+    import pandas as pd
     
     # Create sample data
     data = {
@@ -276,74 +143,94 @@ async def export_template():
     )
 
 
-@router.get("/products/export")
-async def export_products(
-    db: Session = Depends(get_db),
-    tenant: Tenant = Depends(get_tenant),
-    current_user: User = Depends(get_current_user)
-):
-    """Export all products to Excel file"""
-
-    try:
-        # Get all active products for the tenant
-        products = db.query(Product).filter(
-            Product.tenant_id == tenant.id,
-            Product.active == True
-        ).all()
+def build_products_excel(db: Session, tenant_id: int) -> bytes:
+    """Excel con los productos activos del tenant (mismo formato que la plantilla)."""
+    import pandas as pd
+    # Get all active products for the tenant
+    products = db.query(Product).filter(
+        Product.tenant_id == tenant_id,
+        Product.active == True
+    ).all()
+
+    if not products:
+        raise HTTPException(status_code=404, detail="No hay productos para exportar")
+
+    # Prepare data for export
+    data = []
+    for product in products:
+        row = {
+            'codigo': product.codigo or '',
+            'nombre': product.name,
+            'modelo': product.modelo or '',
+            'color': product.color or '',
+            'quilataje': product.quilataje or '',
+            'talla': product.talla or '',
+            'peso_gramos': product.peso_gramos or '',
+            'descuento_porcentaje': product.descuento_porcentaje or '',
+            'precio_manual': product.precio_manual or '',
+            'costo': product.costo or product.cost_price or '',
+            'stock': product.stock or ''
+        }
+        data.append(row)
 
-        if not products:
-            raise HTTPException(status_code=404, detail="No hay productos para exportar")
+    df = pd.DataFrame(data)
 
-        # Prepare data for export
-        data = []
-        for product in products:
-            row = {
-                'codigo': product.codigo or '',
-                'nombre': product.name,
-                'modelo': product.modelo or '',
-                'color': product.color or '',
-                'quilataje': product.quilataje or '',
-                'talla': product.talla or '',
-                'peso_gramos': product.peso_gramos or '',
-                'descuento_porcentaje': product.descuento_porcentaje or '',
-                'precio_manual': product.precio_manual or '',
-                'costo': product.costo or product.cost_price or '',
-                'stock': product.stock or ''
-            }
-            data.append(row)
+    # Create Excel file in memory
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='Productos')
 
-        df = pd.DataFrame(data)
+        # Get worksheet
+        worksheet = writer.sheets['Productos']
 
-        # Create Excel file in memory
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Productos')
+        # Auto-adjust column widths
+        for column in worksheet.columns:
+            max_length = 0
+            column_letter = column[0].column_letter
+            for cell in column:
+                try:
+                    if len(str(cell.value)) > max_length:
+                        max_length = len(str(cell.value))
+                except:
+                    pass
+            adjusted_width = min(max_length + 2, 50)  # Max width of 50
+            worksheet.column_dimensions[column_letter].width = adjusted_width
 
-            # Get worksheet
-            worksheet = writer.sheets['Productos']
+    return output.getvalue()
 
-            # Auto-adjust column widths
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)  # Max width of 50
-                worksheet.column_dimensions[column_letter].width = adjusted_width
 
-        output.seek(0)
+PRODUCTS_EXPORT_FILENAME = "productos_exportados.xlsx"
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
 
-        from fastapi.responses import StreamingResponse
 
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": "attachment; filename=productos_exportados.xlsx"}
-        )
+@router.get("/products/export")
+def export_products(
+    background: bool = Query(False, description="Generar como trabajo en segundo plano"),
+    db: Session = Depends(get_db),
+    tenant: Tenant = Depends(get_tenant),
+    current_user: User = Depends(get_current_user)
+):
+    """Export all products to Excel file"""
+    if background:
+        return enqueue_job(db, tenant, current_user, "products_export")
 
+    try:
+        content = build_products_excel(db, tenant.id)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error exportando productos: {str(e)}")
+
+    from fastapi.responses import StreamingResponse
+
+    return StreamingResponse(
+        BytesIO(content),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={"Content-Disposition": f"attachment; filename={PRODUCTS_EXPORT_FILENAME}"}
+    )
+
+
+@jobs.register("products_export")
+def _products_export_job(db: Session, job, progress):
+    content = build_products_excel(db, job.tenant_id)
+    return jobs.JobFile(content, PRODUCTS_EXPORT_FILENAME, XLSX_MEDIA_TYPE)
@@ -11,9 +11,12 @@ from app.models.user import User
 from app.models.inventory_movement import InventoryMovement
 from app.models.product import Product
 from app.models.inventory_closure import InventoryClosure
+from app.routes.jobs import enqueue_job
+from app.services import jobs, stock_ledger
 from app.services.inventory_service import (
     get_inventory_report,
     get_stock_grouped,
+    get_stock_grouped_diff,
     get_stock_grouped_historical,
     get_stock_pedidos,
     get_stock_eliminado,
@@ -175,21 +178,9 @@ def get_inventory_report(
     return report
 
 
-@router.post("/close-day")
-def close_inventory_day(
-    for_date: Optional[date] = None,
-    db: Session = Depends(get_db),
-    tenant: Tenant = Depends(get_tenant),
-    current_user: User = Depends(require_admin),
-):
-    """
-    Close inventory for a day: calculates inventory metrics for the day and saves them once.
-    If a closure already exists for that day, returns a 400 error.
-    """
+def _close_inventory_day(db: Session, tenant: Tenant, target_date: date) -> dict:
     _ensure_inventory_closure_table(db)
 
-    target_date = for_date or date.today()
-
     # Check if already closed
     existing = (
         db.query(InventoryClosure)
@@ -219,12 +210,38 @@ def close_inventory_day(
         data=snapshot,
     )
     db.add(closure)
+    # Foto del stock del día para el kardex (consultas de stock a una fecha)
+    stock_ledger.take_snapshot(db, tenant.id, target_date)
     db.commit()
     db.refresh(closure)
 
     return {"status": "ok", "message": "Cierre de inventario guardado", "date": target_date.isoformat(), "closure_id": closure.id}
 
 
+@router.post("/close-day")
+def close_inventory_day(
+    for_date: Optional[date] = None,
+    background: bool = Query(False, description="Ejecutar como trabajo en segundo plano"),
+    db: Session = Depends(get_db),
+    tenant: Tenant = Depends(get_tenant),
+    current_user: User = Depends(require_admin),
+):
+    """
+    Close inventory for a day: calculates inventory metrics for the day and saves them once.
+    If a closure already exists for that day, returns a 400 error.
+    """
+    target_date = for_date or date.today()
+    if background:
+        return enqueue_job(db, tenant, current_user, "inventory_close_day", {"date": target_date.isoformat()})
+    return _close_inventory_day(db, tenant, target_date)
+
+
+@jobs.register("inventory_close_day")
+def _inventory_close_day_job(db: Session, job, progress):
+    tenant = db.query(Tenant).filter(Tenant.id == job.tenant_id).first()
+    return _close_inventory_day(db, tenant, date.fromisoformat(job.params["date"]))
+
+
 @router.get("/closure")
 def get_day_closure(
     for_date: Optional[date] = None,
@@ -345,6 +362,7 @@ def remove_pieces(
 @router.get("/stock-grouped")
 def get_stock_grouped_endpoint(
     for_date: Optional[date] = Query(None, description="Calculate historical stock for this date (YYYY-MM-DD)"),
+    compare_to: Optional[date] = Query(None, description="Compare stock at for_date (or today) against this date"),
     db: Session = Depends(get_db),
     tenant: Tenant = Depends(get_tenant),
     current_user: User = Depends(get_current_user),
@@ -353,7 +371,13 @@ def get_stock_grouped_endpoint(
     Get stock grouped by nombre, modelo, quilataje, marca, color, base, tipo_joya, talla.
     If for_date is provided, calculates historical stock for that date.
     Otherwise, returns current stock.
+    With compare_to, returns cantidad_inicial (compare_to), cantidad_final (for_date or today)
+    and diferencia per group.
     """
+    if compare_to:
+        return get_stock_grouped_diff(
+            from_date=compare_to, to_date=for_date or date.today(), db=db, tenant=tenant
+        )
     if for_date:
         stock = get_stock_grouped_historical(target_date=for_date, db=db, tenant=tenant)
     else:
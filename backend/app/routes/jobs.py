@@ -0,0 +1,125 @@
+from datetime import datetime
+from typing import Any, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+from sqlalchemy.orm import Session, undefer
+
+from app.core.database import get_db
+from app.core.deps import get_current_user, get_tenant
+from app.models.job import Job
+from app.models.tenant import Tenant
+from app.models.user import User
+from app.services import jobs
+
+router = APIRouter()
+
+
+class JobOut(BaseModel):
+    id: int
+    kind: str
+    status: str
+    progress: int
+    message: Optional[str] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    result_filename: Optional[str] = None
+    download_url: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+def _job_out(job: Job) -> JobOut:
+    return JobOut(
+        id=job.id,
+        kind=job.kind,
+        status=job.status,
+        progress=job.progress,
+        message=job.message,
+        result=job.result,
+        error=job.error,
+        result_filename=job.result_filename,
+        download_url=f"/jobs/{job.id}/download" if job.result_filename and job.status == "succeeded" else None,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+    )
+
+
+def enqueue_job(
+    db: Session,
+    tenant: Tenant,
+    user: User,
+    kind: str,
+    params: Optional[dict] = None,
+    input_file: Optional[bytes] = None,
+) -> JSONResponse:
+    """Encolar un trabajo desde una ruta y responder 202 con su id."""
+    try:
+        job = jobs.enqueue(db, tenant.id, user.id, kind, params=params, input_file=input_file)
+    except jobs.TooManyJobsError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"},
+    )
+
+
+def _get_job(db: Session, tenant: Tenant, job_id: int) -> Job:
+    jobs.ensure_table(db)
+    job = db.query(Job).filter(Job.id == job_id, Job.tenant_id == tenant.id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+
+@router.get("/", response_model=List[JobOut])
+def list_jobs(
+    status: Optional[str] = Query(None, description="queued, running, succeeded, failed"),
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+    tenant: Tenant = Depends(get_tenant),
+    user: User = Depends(get_current_user),
+):
+    jobs.ensure_table(db)
+    query = db.query(Job).filter(Job.tenant_id == tenant.id)
+    if status:
+        query = query.filter(Job.status == status)
+    return [_job_out(job) for job in query.order_by(Job.id.desc()).limit(limit).all()]
+
+
+@router.get("/{job_id}", response_model=JobOut)
+def get_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    tenant: Tenant = Depends(get_tenant),
+    user: User = Depends(get_current_user),
+):
+    return _job_out(_get_job(db, tenant, job_id))
+
+
+@router.get("/{job_id}/download")
+def download_job_result(
+    job_id: int,
+    db: Session = Depends(get_db),
+    tenant: Tenant = Depends(get_tenant),
+    user: User = Depends(get_current_user),
+):
+    jobs.ensure_table(db)
+    job = (
+        db.query(Job)
+        .options(undefer(Job.result_file))
+        .filter(Job.id == job_id, Job.tenant_id == tenant.id)
+        .first()
+    )
+    if not job:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    if job.status != "succeeded" or job.result_file is None:
+        raise HTTPException(status_code=409, detail="El trabajo no tiene un archivo para descargar")
+    return Response(
+        content=job.result_file,
+        media_type=job.result_media_type or "application/octet-stream",
+        headers={"Content-Disposition": f"attachment; filename={job.result_filename}"},
+    )
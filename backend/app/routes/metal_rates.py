@@ -1,15 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from pydantic import BaseModel, ConfigDict, model_validator
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 
+from app.core.config import settings
 from app.core.database import get_db
 from app.core.deps import get_tenant, get_current_user, require_admin
+from app.core.http_cache import cached_list
 from app.models.tenant import Tenant
 from app.models.user import User
 from app.models.metal_rate import MetalRate
-from app.models.product import Product
+from app.models.price_history import PriceHistory
+from app.routes.jobs import enqueue_job
+from app.services import codigo_index, data_versions, jobs, metal_repricing
 
 router = APIRouter()
 
@@ -44,15 +48,43 @@ class MetalRateResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class PriceHistoryResponse(BaseModel):
+    id: int
+    product_id: int
+    metal_rate_id: Optional[int] = None
+    metal_type: str
+    old_rate: Optional[float] = None
+    new_rate: float
+    old_price: Optional[float] = None
+    new_price: float
+    user_id: Optional[int] = None
+    created_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+def _get_rate(db: Session, tenant: Tenant, rate_id: int) -> MetalRate:
+    rate = db.query(MetalRate).filter(
+        MetalRate.id == rate_id,
+        MetalRate.tenant_id == tenant.id
+    ).first()
+    if not rate:
+        raise HTTPException(status_code=404, detail="Metal rate not found")
+    return rate
+
+
 @router.get("", response_model=List[MetalRateResponse])
 def get_metal_rates(
+    request: Request,
     db: Session = Depends(get_db),
     tenant: Tenant = Depends(get_tenant),
     current_user: User = Depends(get_current_user)
 ):
-    """Get all metal rates for the current tenant"""
-    rates = db.query(MetalRate).filter(MetalRate.tenant_id == tenant.id).all()
-    return rates
+    """Get all metal rates for the current tenant (ETag por versión de las tasas)"""
+    return cached_list(
+        request, db, tenant.id, data_versions.METAL_RATES, MetalRateResponse,
+        lambda: db.query(MetalRate).filter(MetalRate.tenant_id == tenant.id).all(),
+    )
 
 
 @router.post("", response_model=MetalRateResponse)
@@ -88,18 +120,14 @@ def update_metal_rate(
     rate_id: int,
     data: MetalRateUpdate,
     recalculate_prices: bool = True,
+    background: bool = Query(False, description="Recalcular precios como trabajo en segundo plano"),
     db: Session = Depends(get_db),
     tenant: Tenant = Depends(get_tenant),
     current_user: User = Depends(require_admin)
 ):
     """Update a metal rate and optionally recalculate product prices"""
-    rate = db.query(MetalRate).filter(
-        MetalRate.id == rate_id,
-        MetalRate.tenant_id == tenant.id
-    ).first()
-    
-    if not rate:
-        raise HTTPException(status_code=404, detail="Metal rate not found")
+    rate = _get_rate(db, tenant, rate_id)
+    old_rate = float(rate.rate_per_gram)
     
     # Update metal_type if provided and not empty
     if data.metal_type is not None and data.metal_type != '':
@@ -109,32 +137,81 @@ def update_metal_rate(
     if data.rate_per_gram is not None:
         rate.rate_per_gram = data.rate_per_gram
     
-    # Recalculate prices for all products using this metal type
+    if recalculate_prices and background:
+        # La tasa se guarda ya; los precios se recalculan por lotes en el trabajo
+        db.commit()
+        return enqueue_job(db, tenant, current_user, "metal_rate_reprice", {"rate_id": rate_id, "old_rate": old_rate})
+
+    # Recalculate prices for all products using this metal type (UPDATE ... FROM en SQL)
     if recalculate_prices:
-        products = db.query(Product).filter(
-            Product.tenant_id == tenant.id,
-            Product.quilataje == rate.metal_type,
-            Product.precio_manual == None,  # Only auto-calculate if no manual override
-            Product.peso_gramos != None
-        ).all()
-        
-        for product in products:
-            # Calculate: (metal_rate × weight_grams) - discount% (redondeado a entero)
-            base_price = round(float(rate.rate_per_gram) * float(product.peso_gramos))
-            if product.descuento_porcentaje:
-                discount = base_price * (float(product.descuento_porcentaje) / 100)
-                final_price = round(base_price - discount)
-            else:
-                final_price = base_price
-
-            product.price = final_price
-            product.precio_venta = final_price
+        metal_repricing.reprice(db, tenant.id, rate.id, old_rate=old_rate, user_id=current_user.id)
     
     db.commit()
+    if recalculate_prices:
+        # El UPDATE masivo no pasa por los eventos del ORM
+        codigo_index.invalidate_tenant(tenant.id)
     db.refresh(rate)
     return rate
 
 
+@jobs.register("metal_rate_reprice")
+def _metal_rate_reprice_job(db: Session, job, progress):
+    def report(done: int, total: int) -> None:
+        progress(done * 100 // max(total, 1), f"Lote {done} de {total}")
+
+    try:
+        result = metal_repricing.reprice(
+            db,
+            job.tenant_id,
+            job.params["rate_id"],
+            old_rate=job.params.get("old_rate"),
+            user_id=job.user_id,
+            batch_size=settings.metal_repricing_batch_size,
+            progress=report,
+            commit=True,
+        )
+    except ValueError as e:
+        raise jobs.JobError(str(e))
+    codigo_index.invalidate_tenant(job.tenant_id)
+    return result
+
+
+@router.get("/{rate_id}/preview")
+def preview_metal_rate(
+    rate_id: int,
+    rate_per_gram: Optional[float] = Query(None, gt=0, description="Tasa propuesta; por defecto la actual"),
+    db: Session = Depends(get_db),
+    tenant: Tenant = Depends(get_tenant),
+    current_user: User = Depends(require_admin)
+):
+    """Dry run: impacto agregado de aplicar la tasa a los productos, sin escribir nada"""
+    rate = _get_rate(db, tenant, rate_id)
+    proposed = rate_per_gram if rate_per_gram is not None else float(rate.rate_per_gram)
+    return {
+        "current_rate_per_gram": float(rate.rate_per_gram),
+        **metal_repricing.preview(db, tenant.id, rate.metal_type, proposed),
+    }
+
+
+@router.get("/price-history", response_model=List[PriceHistoryResponse])
+def get_price_history(
+    product_id: Optional[int] = None,
+    rate_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    tenant: Tenant = Depends(get_tenant),
+    current_user: User = Depends(get_current_user)
+):
+    """Cambios de precio por tasa de metal, más recientes primero"""
+    metal_repricing.ensure_table(db)
+    query = db.query(PriceHistory).filter(PriceHistory.tenant_id == tenant.id)
+    if product_id is not None:
+        query = query.filter(PriceHistory.product_id == product_id)
+    if rate_id is not None:
+        query = query.filter(PriceHistory.metal_rate_id == rate_id)
+    return query.order_by(PriceHistory.created_at.desc(), PriceHistory.id.desc()).limit(limit).all()
+
+
 @router.delete("/{rate_id}")
 def delete_metal_rate(
     rate_id: int,
@@ -143,13 +220,7 @@ def delete_metal_rate(
     current_user: User = Depends(require_admin)
 ):
     """Delete a metal rate"""
-    rate = db.query(MetalRate).filter(
-        MetalRate.id == rate_id,
-        MetalRate.tenant_id == tenant.id
-    ).first()
-    
-    if not rate:
-        raise HTTPException(status_code=404, detail="Metal rate not found")
+    rate = _get_rate(db, tenant, rate_id)
     
     db.delete(rate)
     db.commit()
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.database import engine
+from app.core.deps import require_ops_token
+from app.core.db_pool import pool_stats
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_ops_token)])
+def get_metrics():
+    """
+    Métricas del proceso en formato de texto de Prometheus: latencia, sentencias SQL y
+    tiempo en la base por ruta, totales por tenant y el pool de conexiones. Sin consultas
+    a la base; pide `Authorization: Bearer <METRICS_TOKEN>` (sin token, sólo en dev/test).
+    """
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return PlainTextResponse(
+        metrics.render(pool_stats(engine)),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -6,7 +6,6 @@ from sqlalchemy.orm import Session
 from sqlalchemy import or_, func
 from typing import List, Optional
 from pydantic import BaseModel
-from datetime import datetime, timedelta
 from decimal import Decimal
 
 from app.core.deps import get_db, get_tenant, get_current_user
@@ -28,6 +27,7 @@ from app.routes.productos_pedido import (
     PagoPedidoOut
 )
 from app.services.customer_service import upsert_customer
+from app.services.daily_aggregates import record_pago_pedido
 
 router = APIRouter()
 
@@ -42,6 +42,7 @@ def list_pedidos(
     limit: int = Query(50, ge=1, le=200),
 ):
     """Listar todos los pedidos"""
+    # Solo lectura: el estado 'vencido' lo marca app.services.expiry_sweeper
     query = db.query(Pedido).filter(Pedido.tenant_id == tenant.id)
     
     if estado:
@@ -49,19 +50,6 @@ def list_pedidos(
     
     pedidos = query.offset(skip).limit(limit).all()
     
-    # Verificar y actualizar estado vencido (75 días = 2 meses + 15 días)
-    fecha_limite = datetime.utcnow() - timedelta(days=75)
-    for pedido in pedidos:
-        # Si tiene saldo pendiente, no está pagado/entregado/cancelado, y han pasado 75 días
-        if (float(pedido.saldo_pendiente) > 0 and 
-            pedido.estado not in ['pagado', 'entregado', 'cancelado', 'vencido'] and
-            pedido.created_at.replace(tzinfo=None) < fecha_limite):
-            pedido.estado = 'vencido'
-            db.add(pedido)
-    
-    # Commit cambios de estados
-    db.commit()
-    
     # Agregar información del producto, items y vendedor a cada pedido
     for pedido in pedidos:
         hydrate_pedido_products(db, pedido, tenant.id)
@@ -214,6 +202,7 @@ def create_pedido(
                 tipo_pago="total"
             )
             db.add(pago_efectivo)
+            record_pago_pedido(db, pago_efectivo, db_pedido)
         
         if pedido.metodo_pago_tarjeta and pedido.metodo_pago_tarjeta > 0:
             pago_tarjeta = PagoPedido(
@@ -223,6 +212,7 @@ def create_pedido(
                 tipo_pago="total"
             )
             db.add(pago_tarjeta)
+            record_pago_pedido(db, pago_tarjeta, db_pedido)
         
         db.commit()
         
@@ -301,12 +291,14 @@ def create_pedido(
             db.add(pedido_item)
         
         # Crear pago inicial
-        db.add(PagoPedido(
+        pago_inicial = PagoPedido(
             pedido_id=db_pedido.id,
             monto=pedido.anticipo_pagado,
             metodo_pago="efectivo",  # Por defecto, se puede ajustar después
             tipo_pago="anticipo"
-        ))
+        )
+        db.add(pago_inicial)
+        record_pago_pedido(db, pago_inicial, db_pedido)
         
         upsert_customer(db, tenant.id, pedido.cliente_nombre, pedido.cliente_telefono)
         db.commit()
@@ -643,6 +635,7 @@ def registrar_pago_pedido(
     if pedido.saldo_pendiente <= 0:
         pedido.estado = "pagado"
     
+    record_pago_pedido(db, db_pago, pedido)
     db.commit()
     db.refresh(db_pago)
     
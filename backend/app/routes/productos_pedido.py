@@ -1,19 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile, File
 from sqlalchemy.orm import Session
 from sqlalchemy import or_, func
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime, timedelta
-import pandas as pd
 import io
 
 from ..core.deps import get_db, get_tenant, get_current_user
 from ..core.folio_service import generate_folio
+from ..core.http_cache import cached_list
 from ..core.serialization_helpers import serialize_decimal, serialize_datetime
 from ..models.producto_pedido import ProductoPedido, Pedido, PagoPedido, PedidoItem
 from ..models.tenant import Tenant
 from ..models.user import User
+from ..routes.jobs import enqueue_job
 from ..routes.status_history import create_status_history
+from ..services import data_versions, jobs
 
 router = APIRouter()
 
@@ -253,6 +255,7 @@ class PagoPedidoOut(BaseModel):
 # Endpoints para Productos sobre Pedido
 @router.get("/", response_model=List[ProductoPedidoOut])
 def list_productos_pedido(
+    request: Request,
     db: Session = Depends(get_db),
     tenant: Tenant = Depends(get_tenant),
     user: User = Depends(get_current_user),
@@ -281,8 +284,11 @@ def list_productos_pedido(
     if activo is not None:
         query = query.filter(ProductoPedido.active == activo)
     
-    items = query.offset(skip).limit(limit).all()
-    return items
+    # La consulta sólo corre si no hay 304 ni respuesta en caché para esta versión
+    return cached_list(
+        request, db, tenant.id, data_versions.PRODUCTOS_PEDIDO, ProductoPedidoOut,
+        lambda: query.offset(skip).limit(limit).all(),
+    )
 
 @router.post("/", response_model=ProductoPedidoOut)
 def create_producto_pedido(
@@ -365,21 +371,11 @@ def delete_producto_pedido(
 # Ver routes/pedidos.py para la gestión de pedidos
 
 # Import/Export endpoints
-@router.post("/import/")
-def import_productos_pedido(
-    file: UploadFile = File(...),
-    mode: str = "add",  # "add" or "replace"
-    db: Session = Depends(get_db),
-    tenant: Tenant = Depends(get_tenant),
-    user: User = Depends(get_current_user)
-):
-    if not file.filename.endswith(('.xlsx', '.xls')):
-        raise HTTPException(status_code=400, detail="Solo se permiten archivos Excel (.xlsx, .xls)")
-    
-    try:
-        # Leer el archivo Excel
-        contents = file.file.read()
+def _import_productos_pedido(db: Session, tenant_id: int, contents: bytes, mode: str = "add") -> dict:
+    """Importar el catálogo de pedidos desde el contenido de un Excel (ruta y trabajo en segundo plano)."""
+    import pandas as pd  # diferido: pandas tarda en importarse y sólo lo usan importación/exportación
 
+    try:
         # Leer inicialmente con keep_default_na=False para evitar NaN en celdas vacías
         df = pd.read_excel(io.BytesIO(contents), keep_default_na=False, na_values=[''])
 
@@ -473,14 +469,16 @@ def import_productos_pedido(
         
         # Si es modo replace, eliminar productos existentes
         if mode == "replace":
-            db.query(ProductoPedido).filter(ProductoPedido.tenant_id == tenant.id).delete()
+            db.query(ProductoPedido).filter(ProductoPedido.tenant_id == tenant_id).delete()
+            # DELETE masivo: no pasa por el flush, la versión del catálogo sube con el commit
+            data_versions.touch(db, tenant_id, data_versions.PRODUCTOS_PEDIDO)
         
         # Cargar tasas de metal de pedidos para cálculo automático de precios
         from ..models.tasa_metal_pedido import TasaMetalPedido
         
         # Obtener tasas de metal de pedidos para cálculo de precios
         tasas_pedido = db.query(TasaMetalPedido).filter(
-            TasaMetalPedido.tenant_id == tenant.id,
+            TasaMetalPedido.tenant_id == tenant_id,
             TasaMetalPedido.tipo == 'precio'  # Solo tasas de precio
         ).all()
         
@@ -504,7 +502,7 @@ def import_productos_pedido(
             
             # Buscar producto existente por código
             existing_product = db.query(ProductoPedido).filter(
-                ProductoPedido.tenant_id == tenant.id,
+                ProductoPedido.tenant_id == tenant_id,
                 ProductoPedido.codigo == str(row['codigo']).strip()
             ).first()
             
@@ -661,7 +659,7 @@ def import_productos_pedido(
             
             # Preparar datos del producto
             producto_data = {
-                'tenant_id': tenant.id,
+                'tenant_id': tenant_id,
                 'modelo': modelo_value,
                 'precio': precio_calculado,
                 'nombre': nombre_value,
@@ -706,55 +704,98 @@ def import_productos_pedido(
         db.rollback()
         raise HTTPException(status_code=400, detail=f"Error procesando archivo: {str(e)}")
 
+
+@router.post("/import/")
+def import_productos_pedido(
+    file: UploadFile = File(...),
+    mode: str = "add",  # "add" or "replace"
+    background: bool = Query(False, description="Procesar como trabajo en segundo plano"),
+    db: Session = Depends(get_db),
+    tenant: Tenant = Depends(get_tenant),
+    user: User = Depends(get_current_user)
+):
+    if not file.filename.endswith(('.xlsx', '.xls')):
+        raise HTTPException(status_code=400, detail="Solo se permiten archivos Excel (.xlsx, .xls)")
+
+    # Leer el archivo Excel
+    contents = file.file.read()
+    if background:
+        return enqueue_job(db, tenant, user, "productos_pedido_import", {"filename": file.filename, "mode": mode}, contents)
+    return _import_productos_pedido(db, tenant.id, contents, mode)
+
+
+@jobs.register("productos_pedido_import")
+def _productos_pedido_import_job(db: Session, job, progress):
+    return _import_productos_pedido(db, job.tenant_id, job.input_file, (job.params or {}).get("mode", "add"))
+
+
+PRODUCTOS_PEDIDO_EXPORT_FILENAME = "productos_pedido.xlsx"
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _build_productos_pedido_excel(db: Session, tenant_id: int) -> bytes:
+    import pandas as pd
+    # Obtener productos
+    productos = db.query(ProductoPedido).filter(ProductoPedido.tenant_id == tenant_id).all()
+    
+    # Crear DataFrame
+    data = []
+    for p in productos:
+        data.append({
+            'modelo': p.modelo,
+            'nombre': p.nombre,
+            'codigo': p.codigo,
+            'marca': p.marca,
+            'color': p.color,
+            'quilataje': p.quilataje,
+            'base': p.base,
+            'talla': p.talla,
+            'peso': p.peso,
+            'peso_gramos': p.peso_gramos,
+            'precio': p.precio,
+            'cost_price': p.cost_price,
+            'precio_manual': p.precio_manual,
+            'category': p.category,
+            'default_discount_pct': p.default_discount_pct,
+            'anticipo_sugerido': p.anticipo_sugerido,
+            'disponible': p.disponible,
+            'active': p.active
+        })
+    
+    df = pd.DataFrame(data)
+    
+    # Crear archivo Excel en memoria
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, sheet_name='Productos Pedido', index=False)
+    
+    return output.getvalue()
+
+
 @router.get("/export/")
 def export_productos_pedido(
+    background: bool = Query(False, description="Generar como trabajo en segundo plano"),
     db: Session = Depends(get_db),
     tenant: Tenant = Depends(get_tenant),
     user: User = Depends(get_current_user)
 ):
+    if background:
+        return enqueue_job(db, tenant, user, "productos_pedido_export")
     try:
-        # Obtener productos
-        productos = db.query(ProductoPedido).filter(ProductoPedido.tenant_id == tenant.id).all()
-        
-        # Crear DataFrame
-        data = []
-        for p in productos:
-            data.append({
-                'modelo': p.modelo,
-                'nombre': p.nombre,
-                'codigo': p.codigo,
-                'marca': p.marca,
-                'color': p.color,
-                'quilataje': p.quilataje,
-                'base': p.base,
-                'talla': p.talla,
-                'peso': p.peso,
-                'peso_gramos': p.peso_gramos,
-                'precio': p.precio,
-                'cost_price': p.cost_price,
-                'precio_manual': p.precio_manual,
-                'category': p.category,
-                'default_discount_pct': p.default_discount_pct,
-                'anticipo_sugerido': p.anticipo_sugerido,
-                'disponible': p.disponible,
-                'active': p.active
-            })
-        
-        df = pd.DataFrame(data)
-        
-        # Crear archivo Excel en memoria
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Productos Pedido', index=False)
-        
-        output.seek(0)
-        
+        content = _build_productos_pedido_excel(db, tenant.id)
+
         from fastapi.responses import StreamingResponse
         return StreamingResponse(
-            io.BytesIO(output.read()),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": "attachment; filename=productos_pedido.xlsx"}
+            io.BytesIO(content),
+            media_type=XLSX_MEDIA_TYPE,
+            headers={"Content-Disposition": f"attachment; filename={PRODUCTOS_PEDIDO_EXPORT_FILENAME}"}
         )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error exportando productos: {str(e)}")
+
+
+@jobs.register("productos_pedido_export")
+def _productos_pedido_export_job(db: Session, job, progress):
+    content = _build_productos_pedido_excel(db, job.tenant_id)
+    return jobs.JobFile(content, PRODUCTOS_PEDIDO_EXPORT_FILENAME, XLSX_MEDIA_TYPE)
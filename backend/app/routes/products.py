@@ -1,17 +1,19 @@
 from typing import List, Optional
 import logging
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from pydantic import BaseModel, condecimal
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_, case
 from sqlalchemy.exc import IntegrityError
 
 from app.core.database import get_db
+from app.core.http_cache import cached_list
 from app.core.deps import get_current_user, get_tenant, require_admin
 from app.models.product import Product
 from app.models.tenant import Tenant
 from app.models.user import User
+from app.services import codigo_index, data_versions
+from app.services.product_search import search_products
 
 
 router = APIRouter()
@@ -61,8 +63,18 @@ class BulkUpdateResponse(BaseModel):
     message: str
 
 
+class BatchLookupRequest(BaseModel):
+    codigos: List[str]
+
+
+class BatchLookupResponse(BaseModel):
+    products: List[ProductOut]
+    missing: List[str]
+
+
 @router.get("/", response_model=List[ProductOut])
 def list_products(
+    request: Request,
     db: Session = Depends(get_db),
     tenant: Tenant = Depends(get_tenant),
     user: User = Depends(get_current_user),
@@ -72,38 +84,13 @@ def list_products(
     active: Optional[bool] = Query(None, description="Filter by active status"),
 ):
     logging.getLogger(__name__).info("list_products q=%s skip=%s limit=%s", q, skip, limit)
-    query = db.query(Product).filter(Product.tenant_id == tenant.id)
-    if q:
-        qn = q.strip().lower()
-        if qn:
-            query = query.filter(
-                or_(
-                    func.lower(Product.name).like(f"%{qn}%"),
-                    func.lower(Product.codigo).like(f"%{qn}%"),
-                    func.lower(Product.category).like(f"%{qn}%"),
-                    func.lower(Product.modelo).like(f"%{qn}%"),
-                    func.lower(Product.talla).like(f"%{qn}%"),
-                )
-            )
-    if active is not None:
-        query = query.filter(Product.active == active)
-
-    # When searching, prioritize products where codigo contains the search term,
-    # ordered by code length (shorter codes first), then by other matches
-    if q:
-        qn = q.strip().lower()
-        # Order by: 1) whether codigo contains search term, 2) length of codigo, 3) product id
-        query = query.order_by(
-            case(
-                (func.lower(Product.codigo).like(f"%{qn}%"), 0),
-                else_=1
-            ),
-            func.length(Product.codigo),
-            Product.id
-        )
-
-    items = query.offset(skip).limit(limit).all()
-    return items
+    # Búsqueda indexada (pg_trgm en PostgreSQL); prioriza coincidencias en codigo,
+    # con el código más corto primero. Con ETag por versión del catálogo: sin cambios,
+    # 304 o la respuesta ya serializada
+    return cached_list(
+        request, db, tenant.id, data_versions.PRODUCTS, ProductOut,
+        lambda: search_products(db, tenant.id, q=q, active=active, skip=skip, limit=limit),
+    )
 
 
 @router.post("/", response_model=ProductOut, dependencies=[Depends(require_admin)])
@@ -172,6 +159,43 @@ def create_product(
     return product
 
 
+@router.get("/lookup", response_model=ProductOut)
+def lookup_product(
+    db: Session = Depends(get_db),
+    tenant: Tenant = Depends(get_tenant),
+    user: User = Depends(get_current_user),
+    codigo: Optional[str] = Query(None, description="Product code"),
+):
+    if not codigo:
+        raise HTTPException(status_code=400, detail="Provide codigo")
+    # Índice en memoria: con el tenant cargado no se consulta la BD
+    product = codigo_index.lookup(db, tenant.id, codigo)
+    if not product:
+        raise HTTPException(status_code=404, detail="Not found")
+    return product
+
+
+@router.post("/lookup/batch", response_model=BatchLookupResponse)
+def lookup_products_batch(
+    data: BatchLookupRequest,
+    db: Session = Depends(get_db),
+    tenant: Tenant = Depends(get_tenant),
+    user: User = Depends(get_current_user),
+):
+    """
+    Resolver varios códigos en una sola llamada (escaneos acumulados en caja).
+    Devuelve los productos encontrados en el orden pedido y los códigos que no existen.
+    """
+    if len(data.codigos) > 1000:
+        raise HTTPException(status_code=400, detail="Máximo 1000 códigos por consulta")
+    found = codigo_index.lookup_many(db, tenant.id, data.codigos)
+    codigos = list(dict.fromkeys(c for c in data.codigos if c))
+    return BatchLookupResponse(
+        products=[found[c] for c in codigos if c in found],
+        missing=[c for c in codigos if c not in found],
+    )
+
+
 @router.get("/{product_id}", response_model=ProductOut)
 def get_product(
     product_id: int,
@@ -251,24 +275,6 @@ def update_product(
     return product
 
 
-@router.get("/lookup", response_model=ProductOut)
-def lookup_product(
-    db: Session = Depends(get_db),
-    tenant: Tenant = Depends(get_tenant),
-    user: User = Depends(get_current_user),
-    codigo: Optional[str] = Query(None, description="Product code"),
-):
-    if not codigo:
-        raise HTTPException(status_code=400, detail="Provide codigo")
-    product = db.query(Product).filter(
-        Product.tenant_id == tenant.id,
-        Product.codigo == codigo
-    ).first()
-    if not product:
-        raise HTTPException(status_code=404, detail="Not found")
-    return product
-
-
 @router.post("/{product_id}/archive", response_model=ProductOut, dependencies=[Depends(require_admin)])
 def archive_product(
     product_id: int,
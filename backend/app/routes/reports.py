@@ -5,7 +5,7 @@ from sqlalchemy import func, and_, or_, text
 from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime, date
 
-from app.core.database import get_db
+from app.core.database import get_db, get_report_db
 from app.core.deps import get_tenant, get_current_user, require_admin
 from app.models.tenant import Tenant
 from app.models.user import User
@@ -15,6 +15,8 @@ from app.models.payment import Payment
 from app.models.credit_payment import CreditPayment
 from app.models.producto_pedido import Pedido, PagoPedido
 from app.models.cash_closure import CashClosure
+from app.routes.jobs import enqueue_job
+from app.services import jobs
 
 router = APIRouter()
 
@@ -108,21 +110,9 @@ def _ensure_cash_closure_table(db: Session) -> None:
         pass
 
 
-@router.post("/close-day")
-def close_day(
-    for_date: Optional[date] = None,
-    db: Session = Depends(get_db),
-    tenant: Tenant = Depends(get_tenant),
-    current_user: User = Depends(require_admin),
-):
-    """
-    Cerrar Caja para un día: calcula las métricas existentes del día y las guarda una sola vez.
-    Si ya existe un cierre para ese día, devuelve un error 400 informando que ya fue realizado.
-    """
+def _close_cash_day(db: Session, tenant: Tenant, target_date: date) -> dict:
     _ensure_cash_closure_table(db)
 
-    target_date = for_date or date.today()
-
     # Checar si ya está cerrado
     existing = (
         db.query(CashClosure)
@@ -155,10 +145,34 @@ def close_day(
     return {"status": "ok", "message": "Cierre guardado", "date": target_date.isoformat(), "closure_id": closure.id}
 
 
+@router.post("/close-day")
+def close_day(
+    for_date: Optional[date] = None,
+    background: bool = Query(False, description="Ejecutar como trabajo en segundo plano"),
+    db: Session = Depends(get_db),
+    tenant: Tenant = Depends(get_tenant),
+    current_user: User = Depends(require_admin),
+):
+    """
+    Cerrar Caja para un día: calcula las métricas existentes del día y las guarda una sola vez.
+    Si ya existe un cierre para ese día, devuelve un error 400 informando que ya fue realizado.
+    """
+    target_date = for_date or date.today()
+    if background:
+        return enqueue_job(db, tenant, current_user, "cash_close_day", {"date": target_date.isoformat()})
+    return _close_cash_day(db, tenant, target_date)
+
+
+@jobs.register("cash_close_day")
+def _cash_close_day_job(db: Session, job, progress):
+    tenant = db.query(Tenant).filter(Tenant.id == job.tenant_id).first()
+    return _close_cash_day(db, tenant, date.fromisoformat(job.params["date"]))
+
+
 @router.get("/closure")
 def get_day_closure(
     for_date: Optional[date] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_report_db),
     tenant: Tenant = Depends(get_tenant),
     current_user: User = Depends(get_current_user),
 ):
@@ -187,7 +201,7 @@ def get_day_closure(
 def get_closure_range(
     start_date: date,
     end_date: date,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_report_db),
     tenant: Tenant = Depends(get_tenant),
     current_user: User = Depends(get_current_user),
 ):
@@ -287,7 +301,7 @@ def get_closure_range(
 def get_corte_de_caja(
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_report_db),
     tenant: Tenant = Depends(get_tenant),
     current_user: User = Depends(require_admin)
 ):
@@ -618,7 +632,7 @@ class DetailedCorteCajaReport(BaseModel):
 def get_sales_by_vendor(
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_report_db),
     tenant: Tenant = Depends(get_tenant),
     current_user: User = Depends(get_current_user)
 ):
@@ -717,7 +731,7 @@ def get_sales_by_vendor(
 def get_detailed_corte_caja(
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_report_db),
     tenant: Tenant = Depends(get_tenant),
     current_user: User = Depends(require_admin)
 ):
@@ -736,3 +750,54 @@ def get_detailed_corte_caja(
     # Call the service
     return service_get_detailed_corte_caja(start_date, end_date, db, tenant)
 
+
+
+@router.get("/daily-aggregates")
+def get_daily_aggregates(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: Session = Depends(get_report_db),
+    tenant: Tenant = Depends(get_tenant),
+    current_user: User = Depends(require_admin)
+):
+    """
+    Totales de caja por rango leyendo los agregados diarios (no recorre transacciones).
+    Incluye desglose por concepto/método, por vendedor y por día.
+    """
+    from app.services.daily_aggregates import get_range_summary, local_day
+
+    if not start_date:
+        start_date = local_day(None)  # día actual en México
+    if not end_date:
+        end_date = start_date
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must be <= end_date")
+
+    return get_range_summary(db, tenant.id, start_date, end_date)
+
+
+@router.post("/daily-aggregates/rebuild")
+def rebuild_daily_aggregates(
+    start_date: date,
+    end_date: Optional[date] = None,
+    verify_only: bool = False,
+    db: Session = Depends(get_db),
+    tenant: Tenant = Depends(get_tenant),
+    current_user: User = Depends(require_admin)
+):
+    """
+    Recalcular los agregados del rango desde ventas, abonos y pagos de pedidos.
+    Con verify_only=true solo compara y devuelve las diferencias sin escribir.
+    """
+    from app.services.daily_aggregates import rebuild_range, verify_range
+
+    end_date = end_date or start_date
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must be <= end_date")
+
+    if verify_only:
+        diffs = verify_range(db, tenant.id, start_date, end_date)
+        return {"status": "ok" if not diffs else "mismatch", "differences": diffs}
+
+    rows = rebuild_range(db, tenant.id, start_date, end_date)
+    return {"status": "ok", "rows": rows, "start_date": start_date.isoformat(), "end_date": end_date.isoformat()}
@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from typing import List
 from pydantic import BaseModel
 
 from ..core.deps import get_db, get_current_user, get_tenant, require_admin
+from ..core.http_cache import cached_list
 from ..models.tasa_metal_pedido import TasaMetalPedido
 from ..models.tenant import Tenant
 from ..models.user import User
+from ..services import data_versions
 
 router = APIRouter()
 
@@ -32,15 +34,16 @@ class TasaMetalPedidoOut(TasaMetalPedidoBase):
 
 @router.get("/", response_model=List[TasaMetalPedidoOut])
 def list_tasas_pedido(
+    request: Request,
     db: Session = Depends(get_db),
     tenant: Tenant = Depends(get_tenant),
     user: User = Depends(get_current_user)
 ):
-    """Listar todas las tasas de metal para pedidos del tenant"""
-    tasas = db.query(TasaMetalPedido).filter(
-        TasaMetalPedido.tenant_id == tenant.id
-    ).all()
-    return tasas
+    """Listar todas las tasas de metal para pedidos del tenant (ETag por versión de las tasas)"""
+    return cached_list(
+        request, db, tenant.id, data_versions.TASAS_PEDIDO, TasaMetalPedidoOut,
+        lambda: db.query(TasaMetalPedido).filter(TasaMetalPedido.tenant_id == tenant.id).all(),
+    )
 
 
 @router.post("/", response_model=TasaMetalPedidoOut)
@@ -1,15 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from fastapi.responses import HTMLResponse
 from pydantic import BaseModel, field_serializer
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy.orm import Session, defer
 from typing import Optional, List
 from datetime import datetime
 
+from app.core import ticket_service
 from app.core.database import get_db
 from app.core.deps import get_tenant, get_current_user
 from app.models.tenant import Tenant
 from app.models.ticket import Ticket
-from app.models.credit_payment import CreditPayment
 
 router = APIRouter()
 
@@ -23,14 +23,16 @@ class TicketCreate(BaseModel):
     html: str
 
 
-class TicketOut(BaseModel):
+class TicketMeta(BaseModel):
+    """Ticket sin HTML (listados); el HTML se pide aparte en /tickets/{id}/html."""
     id: int
     sale_id: Optional[int]
     venta_contado_id: Optional[int]  # Nuevo
     apartado_id: Optional[int]  # Nuevo
     pedido_id: Optional[int]
     kind: str
-    html: str
+    html_size: Optional[int] = None
+    etag: Optional[str] = None
     created_at: datetime
 
     @field_serializer('created_at')
@@ -41,6 +43,10 @@ class TicketOut(BaseModel):
         from_attributes = True
 
 
+class TicketOut(TicketMeta):
+    html: str
+
+
 def _ensure_ticket_table(db: Session) -> None:
     try:
         Ticket.__table__.create(bind=db.get_bind(), checkfirst=True)
@@ -48,7 +54,19 @@ def _ensure_ticket_table(db: Session) -> None:
         pass
 
 
-@router.post("/tickets", response_model=TicketOut)
+def _with_html(db: Session, ticket: Ticket) -> TicketOut:
+    meta = TicketMeta.model_validate(ticket).model_dump(exclude={"etag"})
+    return TicketOut(**meta, etag=ticket_service.ticket_etag(ticket), html=ticket_service.ticket_html(db, ticket))
+
+
+def _get_ticket(db: Session, tenant: Tenant, ticket_id: int, *options) -> Ticket:
+    t = db.query(Ticket).options(*options).filter(Ticket.id == ticket_id, Ticket.tenant_id == tenant.id).first()
+    if not t:
+        raise HTTPException(status_code=404, detail="Ticket no encontrado")
+    return t
+
+
+@router.post("/tickets", response_model=TicketMeta)
 def create_ticket(
     payload: TicketCreate,
     db: Session = Depends(get_db),
@@ -58,55 +76,16 @@ def create_ticket(
     _ensure_ticket_table(db)
 
     # Upsert logic: replace if already exists
-    existing = None
-    
-    # Check for existing ticket by venta_contado_id
-    if payload.venta_contado_id is not None:
-        existing = (
-            db.query(Ticket)
-            .filter(
-                Ticket.tenant_id == tenant.id, 
-                Ticket.venta_contado_id == payload.venta_contado_id, 
-                Ticket.kind == payload.kind
-            )
-            .first()
-        )
-    # Check for existing ticket by apartado_id
-    elif payload.apartado_id is not None:
-        existing = (
-            db.query(Ticket)
-            .filter(
-                Ticket.tenant_id == tenant.id, 
-                Ticket.apartado_id == payload.apartado_id, 
-                Ticket.kind == payload.kind
-            )
-            .first()
-        )
-    # Check for existing ticket by sale_id (legacy)
-    elif payload.sale_id is not None:
-        existing = (
-            db.query(Ticket)
-            .filter(
-                Ticket.tenant_id == tenant.id, 
-                Ticket.sale_id == payload.sale_id, 
-                Ticket.kind == payload.kind
-            )
-            .first()
-        )
-    # Check for existing ticket by pedido_id
-    elif payload.pedido_id is not None:
-        existing = (
-            db.query(Ticket)
-            .filter(
-                Ticket.tenant_id == tenant.id, 
-                Ticket.pedido_id == payload.pedido_id, 
-                Ticket.kind == payload.kind
-            )
-            .first()
-        )
-    
+    existing = ticket_service.find_ticket(
+        db, tenant.id, payload.kind,
+        sale_id=payload.sale_id,
+        venta_contado_id=payload.venta_contado_id,
+        apartado_id=payload.apartado_id,
+        pedido_id=payload.pedido_id,
+    )
+
     if existing:
-        existing.html = payload.html
+        ticket_service.store_html(db, existing, payload.html)
         # Actualizar también los nuevos campos si se proporcionan
         if payload.venta_contado_id is not None:
             existing.venta_contado_id = payload.venta_contado_id
@@ -114,21 +93,21 @@ def create_ticket(
             existing.apartado_id = payload.apartado_id
         db.commit()
         db.refresh(existing)
-        return existing
+        return TicketMeta.model_validate(existing)
 
     ticket = Ticket(
-        tenant_id=tenant.id, 
+        tenant_id=tenant.id,
         sale_id=payload.sale_id,  # Legacy
         venta_contado_id=payload.venta_contado_id,  # Nuevo
         apartado_id=payload.apartado_id,  # Nuevo
         pedido_id=payload.pedido_id,
-        kind=payload.kind, 
-        html=payload.html
+        kind=payload.kind,
     )
+    ticket_service.store_html(db, ticket, payload.html)
     db.add(ticket)
     db.commit()
     db.refresh(ticket)
-    return ticket
+    return TicketMeta.model_validate(ticket)
 
 
 @router.get("/tickets/{ticket_id}", response_model=TicketOut)
@@ -139,13 +118,32 @@ def get_ticket(
     user=Depends(get_current_user),
 ):
     _ensure_ticket_table(db)
-    t = db.query(Ticket).filter(Ticket.id == ticket_id, Ticket.tenant_id == tenant.id).first()
-    if not t:
-        raise HTTPException(status_code=404, detail="Ticket no encontrado")
-    return t
+    return _with_html(db, _get_ticket(db, tenant, ticket_id))
 
 
-@router.get("/tickets/by-sale/{sale_id}", response_model=List[TicketOut])
+@router.get("/tickets/{ticket_id}/html", response_class=HTMLResponse)
+def get_ticket_html(
+    ticket_id: int,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    tenant: Tenant = Depends(get_tenant),
+    user=Depends(get_current_user),
+):
+    """
+    HTML del ticket, con ETag (sha256 del HTML): si el navegador ya lo tiene responde 304
+    sin leer ni descomprimir el cuerpo.
+    """
+    _ensure_ticket_table(db)
+    # El cuerpo sólo se lee si hay que enviarlo
+    t = _get_ticket(db, tenant, ticket_id, defer(Ticket.body), defer(Ticket.html))
+    etag = f'"{ticket_service.ticket_etag(t)}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match and etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(ticket_service.ticket_html(db, t), headers=headers)
+
+
+@router.get("/tickets/by-sale/{sale_id}", response_model=List[TicketMeta])
 def get_tickets_by_sale(
     sale_id: int,
     db: Session = Depends(get_db),
@@ -153,8 +151,9 @@ def get_tickets_by_sale(
     user=Depends(get_current_user),
 ):
     """
-    Get tickets for a sale or apartado (credit sale).
-    
+    Get tickets for a sale or apartado (credit sale). Metadata only: el HTML de cada uno se
+    pide en /tickets/{id}/html.
+
     This endpoint searches for:
     1. Tickets where venta_contado_id matches (new schema)
     2. Tickets where apartado_id matches (new schema)
@@ -162,77 +161,16 @@ def get_tickets_by_sale(
     4. Apartado tickets linked through credit_payments (new schema)
     """
     _ensure_ticket_table(db)
-    
-    # Get tickets by venta_contado_id (new schema)
-    venta_tickets = (
-        db.query(Ticket)
-        .filter(Ticket.tenant_id == tenant.id, Ticket.venta_contado_id == sale_id)
-        .all()
-    )
-    
-    # Get tickets by apartado_id (new schema)
-    apartado_tickets = (
-        db.query(Ticket)
-        .filter(Ticket.tenant_id == tenant.id, Ticket.apartado_id == sale_id)
-        .all()
-    )
-    
-    # Get legacy tickets by sale_id (old schema)
-    legacy_tickets = (
-        db.query(Ticket)
-        .filter(Ticket.tenant_id == tenant.id, Ticket.sale_id == sale_id)
-        .all()
-    )
-    
-    # Get tickets for apartados via credit_payments (new schema)
-    # Find all credit_payments where apartado_id matches the sale_id
-    credit_payments = (
-        db.query(CreditPayment)
-        .filter(CreditPayment.apartado_id == sale_id)
-        .all()
-    )
-    
-    # For each payment, find tickets with kind='payment-{payment_id}'
-    payment_tickets = []
-    for payment in credit_payments:
-        payment_tickets_list = (
-            db.query(Ticket)
-            .filter(
-                Ticket.tenant_id == tenant.id,
-                Ticket.kind == f"payment-{payment.id}"
-            )
-            .all()
-        )
-        payment_tickets.extend(payment_tickets_list)
-    
-    # Combine and sort by created_at
-    all_tickets = venta_tickets + apartado_tickets + legacy_tickets + payment_tickets
-    # Remove duplicates based on id
-    seen_ids = set()
-    unique_tickets = []
-    for ticket in all_tickets:
-        if ticket.id not in seen_ids:
-            seen_ids.add(ticket.id)
-            unique_tickets.append(ticket)
-    unique_tickets.sort(key=lambda t: t.created_at)
-    
-    return unique_tickets
-
-
-@router.get("/tickets/by-pedido/{pedido_id}", response_model=List[TicketOut])
+    return [TicketMeta.model_validate(t) for t in ticket_service.get_tickets_by_sale(db, tenant.id, sale_id)]
+
+
+@router.get("/tickets/by-pedido/{pedido_id}", response_model=List[TicketMeta])
 def get_tickets_by_pedido(
     pedido_id: int,
     db: Session = Depends(get_db),
     tenant: Tenant = Depends(get_tenant),
     user=Depends(get_current_user),
 ):
+    """Tickets de un pedido, sólo metadatos (el HTML en /tickets/{id}/html)."""
     _ensure_ticket_table(db)
-    tickets = (
-        db.query(Ticket)
-        .filter(Ticket.tenant_id == tenant.id, Ticket.pedido_id == pedido_id)
-        .order_by(Ticket.created_at.asc())
-        .all()
-    )
-    return tickets
-
-
+    return [TicketMeta.model_validate(t) for t in ticket_service.get_tickets_by_pedido(db, tenant.id, pedido_id)]
@@ -2,22 +2,28 @@ from typing import List
 from decimal import Decimal
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, Response, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, condecimal
 from sqlalchemy.orm import Session
 
 from app.core.database import get_db
-from app.core.deps import get_current_user, get_tenant, require_admin
+from app.core.deps import get_current_user, get_json_body, get_tenant, require_admin
 from app.core.folio_service import generate_folio
 from app.models.tenant import Tenant
 from app.models.user import User
 from app.models.product import Product
 from app.models.payment import Payment
 from app.models.credit_payment import CreditPayment
+from app.routes.jobs import enqueue_job
 from app.routes.status_history import create_status_history
 from app.models.venta_contado import VentasContado, ItemVentaContado
 from app.models.apartado import Apartado, ItemApartado
+from app.services import jobs, pagination, sales_feed
 from app.services.customer_service import upsert_customer
+from app.services.daily_aggregates import record_venta
+from app.services.sales_export import iter_sales_csv
+from app.services.stock_reservation import InsufficientStockError, merge_quantities, release_stock, reserve_stock
 from app.core.serialization_helpers import serialize_decimal, serialize_datetime
 
 
@@ -181,8 +187,7 @@ class SaleOut(BaseModel):
 
 
 @router.post("/", response_model=SaleOut)
-async def create_sale(
-    request: Request,
+def create_sale(
     items: List[SaleItemIn],
     payments: List[PaymentIn] | None = None,
     discount_amount: condecimal(max_digits=10, decimal_places=2) | None = Decimal("0"),
@@ -190,9 +195,9 @@ async def create_sale(
     db: Session = Depends(get_db),
     tenant: Tenant = Depends(get_tenant),
     user: User = Depends(get_current_user),
+    body: dict = Depends(get_json_body),
 ):
-    # Get the raw JSON data from request body
-    body = await request.json()
+    # body: JSON crudo (vendedor, cliente, utilidad...), leído por get_json_body
     tipo_venta = body.get('tipo_venta')
     vendedor_id = body.get('vendedor_id')
     utilidad = body.get('utilidad')
@@ -213,23 +218,25 @@ async def create_sale(
             raise HTTPException(status_code=400, detail=f"Producto inválido: {it.product_id}")
         product_map[it.product_id] = p
 
-    # Calcularemos totales e inventario; luego insertaremos en tabla según tipo_venta
+    # Descontar inventario de todo el carrito en un solo UPDATE condicional
+    try:
+        reserve_stock(db, tenant.id, merge_quantities((it.product_id, max(1, int(it.quantity))) for it in items))
+    except InsufficientStockError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Stock insuficiente para {product_map[e.product_id].name}")
+
+    # Calcularemos totales; luego insertaremos en tabla según tipo_venta
 
     subtotal = Decimal("0")
     for it in items:
         p = product_map[it.product_id]
         q = max(1, int(it.quantity))
-        if p.stock is not None and p.stock < q:
-            raise HTTPException(status_code=400, detail=f"Stock insuficiente para {p.name}")
         unit = Decimal(str(round(float(p.price))))
         line_subtotal = Decimal(str(round(float(unit * q))))
         line_disc_pct = Decimal(str(getattr(it, 'discount_pct', Decimal('0')) or 0)).quantize(Decimal("0.01"))
         line_disc_amount = Decimal(str(round(float(line_subtotal * line_disc_pct / Decimal('100')))))
         line_total = Decimal(str(round(float(line_subtotal - line_disc_amount))))
         subtotal += line_total
-        # decrement stock
-        if p.stock is not None:
-            p.stock = int(p.stock) - q
 
     subtotal_val = Decimal(str(round(float(subtotal))))
     discount_val = Decimal(str(round(float(discount_amount or 0))))
@@ -254,17 +261,9 @@ async def create_sale(
 
     # Crear venta de contado (solo contado, apartados se manejan en /apartados)
     if (tipo_venta or "contado") == "contado":
-        try:
-            # Generar folio ANTES de crear la venta (no depende del ID)
-            folio_venta = generate_folio(db, tenant.id, "VENTA")
-        except Exception as e:
-            # Si falla la generación del folio, usar un folio temporal y continuar
-            import traceback
-            print(f"Error generando folio: {e}")
-            print(traceback.format_exc())
-            # Usar un folio temporal basado en timestamp
-            from datetime import datetime
-            folio_venta = f"V-TEMP-{int(datetime.utcnow().timestamp())}"
+        # Generar folio ANTES de crear la venta (no depende del ID).
+        # Si falla, la venta falla completa: no se emiten folios temporales.
+        folio_venta = generate_folio(db, tenant.id, "VENTA")
         
         venta = VentasContado(
             tenant_id=tenant.id,
@@ -307,11 +306,15 @@ async def create_sale(
             ))
         # Guardar pagos de contado
         payments_list = []
+        payment_rows = []
         if payments:
             for p_in in payments:
                 amt = Decimal(str(p_in.amount)).quantize(Decimal("0.01"))
-                db.add(Payment(venta_contado_id=venta.id, method=p_in.method, amount=amt))
+                payment_row = Payment(venta_contado_id=venta.id, method=p_in.method, amount=amt)
+                db.add(payment_row)
+                payment_rows.append(payment_row)
                 payments_list.append({"method": p_in.method, "amount": float(amt)})
+        record_venta(db, venta, payment_rows)
         db.commit()
         db.refresh(venta)
         # Respuesta
@@ -368,12 +371,7 @@ def return_sale(
             raise HTTPException(status_code=400, detail="Esta venta ya es una devolución")
         
         # Crear venta negativa como devolución
-        try:
-            folio_venta = generate_folio(db, tenant.id, "VENTA")
-        except Exception as e:
-            # Si falla la generación del folio, usar un folio temporal
-            from datetime import datetime
-            folio_venta = f"V-TEMP-{int(datetime.utcnow().timestamp())}"
+        folio_venta = generate_folio(db, tenant.id, "VENTA")
         
         ret = VentasContado(
             tenant_id=tenant.id,
@@ -393,6 +391,7 @@ def return_sale(
         db.flush()
         
         # Agregar items negativos y restock
+        restock = []
         for it in db.query(ItemVentaContado).filter(ItemVentaContado.venta_id == orig_venta.id).all():
             db.add(ItemVentaContado(
                 venta_id=ret.id,
@@ -407,13 +406,10 @@ def return_sale(
                 product_snapshot=it.product_snapshot
             ))
             if it.product_id:
-                p = db.query(Product).filter(
-                    Product.id == it.product_id, 
-                    Product.tenant_id == tenant.id
-                ).first()
-                if p and p.stock is not None:
-                    p.stock = int(p.stock) + int(it.quantity)
+                restock.append((it.product_id, int(it.quantity)))
+        release_stock(db, tenant.id, merge_quantities(restock))
         
+        record_venta(db, ret)
         db.commit()
         db.refresh(ret)
         
@@ -445,71 +441,52 @@ def return_sale(
     raise HTTPException(status_code=404, detail="Venta no encontrada")
 
 
+SALES_EXPORT_FILENAME = "ventas.csv"
+
+
 @router.get("/export")
 def export_sales_csv(
     date_from: str | None = None,
     date_to: str | None = None,
     user_id: int | None = None,
+    gzip: bool = Query(False, description="Comprimir el CSV (ventas.csv.gz)"),
+    background: bool = Query(False, description="Generar como trabajo en segundo plano"),
     db: Session = Depends(get_db),
     tenant: Tenant = Depends(get_tenant),
     user: User = Depends(get_current_user),
 ):
-    # Unir contado y apartados
-    cont_q = db.query(VentasContado).filter(VentasContado.tenant_id == tenant.id)
-    ap_q = db.query(Apartado).filter(Apartado.tenant_id == tenant.id)
-    from sqlalchemy import and_
-    if user_id is not None:
-        cont_q = cont_q.filter(
-            or_(VentasContado.vendedor_id == user_id, and_(VentasContado.vendedor_id == None, VentasContado.user_id == user_id))
+    if background:
+        return enqueue_job(
+            db, tenant, user, "ventas_export",
+            {"date_from": date_from, "date_to": date_to, "user_id": user_id},
         )
-        ap_q = ap_q.filter(
-            or_(Apartado.vendedor_id == user_id, and_(Apartado.vendedor_id == None, Apartado.user_id == user_id))
-        )
-    if date_from:
-        try:
-            df = datetime.fromisoformat(date_from)
-            cont_q = cont_q.filter(VentasContado.created_at >= df)
-            ap_q = ap_q.filter(Apartado.created_at >= df)
-        except Exception:
-            pass
-    if date_to:
-        try:
-            dt = datetime.fromisoformat(date_to)
-            cont_q = cont_q.filter(VentasContado.created_at <= dt)
-            ap_q = ap_q.filter(Apartado.created_at <= dt)
-        except Exception:
-            pass
-    cont_q = cont_q.order_by(VentasContado.created_at.desc())
-    ap_q = ap_q.order_by(Apartado.created_at.desc())
-
-    import csv
-    from io import StringIO
-
-    buf = StringIO()
-    writer = csv.writer(buf)
-    writer.writerow(["id", "created_at", "user_id", "total", "tipo_venta"]) 
-    for s in cont_q.all():
-        writer.writerow([
-            s.id,
-            s.created_at.isoformat() if s.created_at else "",
-            s.user_id or "",
-            f"{s.total}",
-            "contado",
-        ])
-    for s in ap_q.all():
-        writer.writerow([
-            s.id,
-            s.created_at.isoformat() if s.created_at else "",
-            s.user_id or "",
-            f"{s.total}",
-            "abono",
-        ])
-    csv_data = buf.getvalue()
-    headers = {
-        "Content-Disposition": "attachment; filename=ventas.csv",
-        "Content-Type": "text/csv; charset=utf-8",
-    }
-    return Response(content=csv_data, media_type="text/csv", headers=headers)
+
+    tenant_id = tenant.id
+    bind = db.get_bind()
+
+    def stream():
+        # Sesión propia: la de la dependencia se cierra antes de terminar de enviar la respuesta
+        with Session(bind=bind) as stream_db:
+            yield from iter_sales_csv(stream_db, tenant_id, date_from, date_to, user_id, gzip=gzip)
+
+    if gzip:
+        media_type = "application/gzip"
+        filename = f"{SALES_EXPORT_FILENAME}.gz"
+    else:
+        media_type = "text/csv; charset=utf-8"
+        filename = SALES_EXPORT_FILENAME
+    return StreamingResponse(
+        stream(),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+@jobs.register("ventas_export")
+def _ventas_export_job(db: Session, job, progress):
+    params = job.params or {}
+    content = b"".join(iter_sales_csv(db, job.tenant_id, params.get("date_from"), params.get("date_to"), params.get("user_id")))
+    return jobs.JobFile(content, SALES_EXPORT_FILENAME, "text/csv; charset=utf-8")
 
 
 @router.get("/{sale_id}", response_model=SaleOut)
@@ -585,6 +562,7 @@ class SaleSummary(BaseModel):
     tipo_venta: str | None = None
     folio_venta: str | None = None
     folio_apartado: str | None = None
+    folio_pedido: str | None = None
     user: dict | None = None
 
     class Config:
@@ -593,79 +571,50 @@ class SaleSummary(BaseModel):
 
 @router.get("/", response_model=List[SaleSummary])
 def list_sales(
+    response: Response,
     skip: int = 0,
     limit: int = 50,
     date_from: str | None = None,
     date_to: str | None = None,
     user_id: int | None = None,
+    cursor: str | None = Query(None, description="X-Next-Cursor de la página anterior (en lugar de skip)"),
+    include_pedidos: bool = False,
     db: Session = Depends(get_db),
     tenant: Tenant = Depends(get_tenant),
     user: User = Depends(get_current_user),
 ):
-    from sqlalchemy import or_, and_
-    cont_q = db.query(VentasContado).filter(VentasContado.tenant_id == tenant.id)
-    ap_q = db.query(Apartado).filter(Apartado.tenant_id == tenant.id)
-    if user_id is not None:
-        cont_q = cont_q.filter(or_(VentasContado.vendedor_id == user_id, and_(VentasContado.vendedor_id == None, VentasContado.user_id == user_id)))
-        ap_q = ap_q.filter(or_(Apartado.vendedor_id == user_id, and_(Apartado.vendedor_id == None, Apartado.user_id == user_id)))
+    """
+    Ventas de contado y apartados (y pedidos con include_pedidos) en un solo feed, más
+    recientes primero. El cursor de la siguiente página va en el encabezado X-Next-Cursor.
+    """
+    df = dt = None
     if date_from:
         try:
             df = datetime.fromisoformat(date_from)
-            cont_q = cont_q.filter(VentasContado.created_at >= df)
-            ap_q = ap_q.filter(Apartado.created_at >= df)
         except Exception:
             pass
     if date_to:
         try:
             dt = datetime.fromisoformat(date_to)
-            cont_q = cont_q.filter(VentasContado.created_at <= dt)
-            ap_q = ap_q.filter(Apartado.created_at <= dt)
         except Exception:
             pass
-    cont_q = cont_q.order_by(VentasContado.created_at.desc())
-    ap_q = ap_q.order_by(Apartado.created_at.desc())
-
-    sales_cont = cont_q.offset(skip).limit(min(200, max(1, limit))).all()
-    sales_ap = ap_q.offset(skip).limit(min(200, max(1, limit))).all()
-
-    result = []
-    # contado
-    for s in sales_cont:
-        user_info = None
-        if s.user_id:
-            u = db.query(User).filter(User.id == s.user_id).first()
-            if u:
-                user_info = {"email": u.email}
-        result.append({
-            "id": s.id,
-            "total": s.total,
-            "created_at": s.created_at,
-            "user_id": s.user_id,
-            "vendedor_id": s.vendedor_id,
-            "tipo_venta": "contado",
-            "folio_venta": s.folio_venta,
-            "user": user_info
-        })
-    # apartados
-    for s in sales_ap:
-        user_info = None
-        if s.user_id:
-            u = db.query(User).filter(User.id == s.user_id).first()
-            if u:
-                user_info = {"email": u.email}
-        result.append({
-            "id": s.id,
-            "total": s.total,
-            "created_at": s.created_at,
-            "user_id": s.user_id,
-            "vendedor_id": s.vendedor_id,
-            "tipo_venta": "abono",
-            "folio_apartado": s.folio_apartado,
-            "user": user_info
-        })
-    # Ordenar por fecha desc
-    result.sort(key=lambda x: x["created_at"] or datetime.min, reverse=True)
-    return result
+    try:
+        items, next_cursor = sales_feed.page(
+            db,
+            tenant.id,
+            limit=min(200, max(1, limit)),
+            cursor=cursor,
+            skip=0 if cursor else max(0, skip),
+            user_id=user_id,
+            date_from=df,
+            date_to=dt,
+            include_pedidos=include_pedidos,
+        )
+    except pagination.InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
 
 
 
@@ -0,0 +1,304 @@
+"""
+Índice en memoria codigo -> producto para el escáner del POS.
+
+Cada proceso mantiene, por tenant, un diccionario codigo -> proyección del producto (las
+mismas columnas que devuelve ProductOut). Un escaneo con el índice cargado se resuelve sin
+tocar la base de datos; si el índice del tenant aún no está cargado se consulta ese código
+en la BD y se programa la carga completa en segundo plano.
+
+Coherencia:
+- Los cambios hechos con el ORM (crear, editar, archivar, borrar, actualización masiva,
+  importación) se capturan con eventos de la sesión en cada flush y se aplican al índice
+  sólo cuando la transacción hace commit; un rollback los descarta.
+- reserve_stock/release_stock actualizan el stock con SQL directo y lo registran con
+  stage_stock() para el mismo ciclo commit/rollback.
+- Con varios workers cada proceso tiene su propio índice: los cambios hechos en otro
+  worker se ven cuando expira settings.codigo_index_ttl_seconds y se recarga el tenant
+  (en segundo plano, mientras tanto se sirve la copia anterior). El stock mostrado es
+  informativo; la venta siempre lo valida con el UPDATE condicional de stock_reservation.
+"""
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.product import Product
+from app.models.tenant import Tenant
+
+PROJECTION_COLUMNS = tuple(c.name for c in Product.__table__.columns if c.name != "created_at")
+
+_PENDING_KEY = "codigo_index_pending"
+
+
+class _TenantIndex:
+    __slots__ = ("by_codigo", "codigo_by_id", "loaded_at", "loading")
+
+    def __init__(self):
+        self.by_codigo: Dict[str, dict] = {}
+        self.codigo_by_id: Dict[int, str] = {}
+        self.loaded_at: Optional[float] = None  # None = índice parcial (sólo códigos consultados)
+        self.loading = False
+
+
+_tenants: Dict[int, _TenantIndex] = {}
+_lock = threading.RLock()
+
+
+def _tenant(tenant_id: int) -> _TenantIndex:
+    index = _tenants.get(tenant_id)
+    if index is None:
+        index = _tenants[tenant_id] = _TenantIndex()
+    return index
+
+
+def _put(index: _TenantIndex, row: dict) -> None:
+    product_id = row["id"]
+    old_codigo = index.codigo_by_id.pop(product_id, None)
+    if old_codigo is not None and index.by_codigo.get(old_codigo, {}).get("id") == product_id:
+        del index.by_codigo[old_codigo]
+    codigo = row.get("codigo")
+    if codigo:
+        index.by_codigo[codigo] = row
+        index.codigo_by_id[product_id] = codigo
+
+
+def _drop(index: _TenantIndex, product_id: int) -> None:
+    codigo = index.codigo_by_id.pop(product_id, None)
+    if codigo is not None and index.by_codigo.get(codigo, {}).get("id") == product_id:
+        del index.by_codigo[codigo]
+
+
+def _is_fresh(index: _TenantIndex) -> bool:
+    if index.loaded_at is None:
+        return False
+    ttl = settings.codigo_index_ttl_seconds
+    return ttl <= 0 or time.monotonic() - index.loaded_at < ttl
+
+
+# ---------------------------------------------------------------------------
+# Carga
+# ---------------------------------------------------------------------------
+
+def _select_projection():
+    table = Product.__table__
+    return select(*(table.c[name] for name in PROJECTION_COLUMNS))
+
+
+def warm(db: Session, tenant_id: int) -> int:
+    """Cargar (o recargar) todos los productos con código del tenant. Devuelve cuántos."""
+    table = Product.__table__
+    rows = db.execute(
+        _select_projection().where(table.c.tenant_id == tenant_id, table.c.codigo.isnot(None))
+    ).mappings().all()
+    fresh = _TenantIndex()
+    for row in rows:
+        _put(fresh, dict(row))
+    fresh.loaded_at = time.monotonic()
+    with _lock:
+        _tenants[tenant_id] = fresh
+    return len(fresh.by_codigo)
+
+
+def warm_all(db: Session) -> int:
+    """Cargar el índice de todos los tenants activos (arranque)."""
+    total = 0
+    tenant_ids = [tid for (tid,) in db.query(Tenant.id).filter(Tenant.is_active.is_(True)).all()]
+    for tenant_id in tenant_ids:
+        total += warm(db, tenant_id)
+        db.rollback()
+    return total
+
+
+def _warm_in_background(tenant_id: int) -> None:
+    with _lock:
+        index = _tenant(tenant_id)
+        if index.loading:
+            return
+        index.loading = True
+
+    def run():
+        from app.core.database import SessionLocal
+        try:
+            with SessionLocal() as db:
+                warm(db, tenant_id)
+        except Exception as e:
+            print(f"⚠️ No se pudo cargar el índice de códigos del tenant {tenant_id}: {e}")
+        finally:
+            with _lock:
+                _tenant(tenant_id).loading = False
+
+    threading.Thread(target=run, name=f"codigo-index-{tenant_id}", daemon=True).start()
+
+
+def warm_all_in_background() -> None:
+    """Cargar todos los tenants en un hilo aparte para no retrasar el arranque."""
+    def run():
+        from app.core.database import SessionLocal
+        try:
+            started = time.perf_counter()
+            with SessionLocal() as db:
+                total = warm_all(db)
+            print(f"✅ Índice de códigos cargado: {total} productos en {time.perf_counter() - started:.1f}s")
+        except Exception as e:
+            print(f"⚠️ No se pudo cargar el índice de códigos: {e}")
+
+    threading.Thread(target=run, name="codigo-index-warm", daemon=True).start()
+
+
+# ---------------------------------------------------------------------------
+# Consulta
+# ---------------------------------------------------------------------------
+
+def lookup_many(db: Session, tenant_id: int, codigos: Iterable[str]) -> Dict[str, dict]:
+    """
+    Resolver varios códigos. Devuelve {codigo: proyección} sólo con los encontrados.
+    Con el índice del tenant cargado y vigente no se hace ninguna consulta.
+    """
+    wanted = list(dict.fromkeys(c for c in codigos if c))
+    found: Dict[str, dict] = {}
+    missing: List[str] = []
+    with _lock:
+        index = _tenants.get(tenant_id)
+        complete = index is not None and index.loaded_at is not None
+        for codigo in wanted:
+            row = index.by_codigo.get(codigo) if index is not None else None
+            if row is not None:
+                found[codigo] = row
+            elif not complete:
+                missing.append(codigo)
+        stale = not _is_fresh(index) if index is not None else True
+
+    if stale:
+        # Índice parcial o vencido: se sirve lo que hay y se recarga en segundo plano
+        _warm_in_background(tenant_id)
+
+    if missing:
+        table = Product.__table__
+        rows = db.execute(
+            _select_projection().where(table.c.tenant_id == tenant_id, table.c.codigo.in_(missing))
+        ).mappings().all()
+        with _lock:
+            index = _tenant(tenant_id)
+            for row in rows:
+                row = dict(row)
+                _put(index, row)
+                found[row["codigo"]] = row
+    return found
+
+
+def lookup(db: Session, tenant_id: int, codigo: str) -> Optional[dict]:
+    return lookup_many(db, tenant_id, [codigo]).get(codigo)
+
+
+# ---------------------------------------------------------------------------
+# Mantenimiento
+# ---------------------------------------------------------------------------
+
+def upsert(tenant_id: int, row: dict) -> None:
+    with _lock:
+        _put(_tenant(tenant_id), row)
+
+
+def remove(tenant_id: int, product_id: int) -> None:
+    with _lock:
+        index = _tenants.get(tenant_id)
+        if index is not None:
+            _drop(index, product_id)
+
+
+def invalidate_tenant(tenant_id: Optional[int] = None) -> None:
+    """Descartar el índice de un tenant (o de todos). La siguiente consulta lo recarga."""
+    with _lock:
+        if tenant_id is None:
+            _tenants.clear()
+        else:
+            _tenants.pop(tenant_id, None)
+
+
+def set_stock(tenant_id: int, stocks: Dict[int, int]) -> None:
+    with _lock:
+        index = _tenants.get(tenant_id)
+        if index is None:
+            return
+        for product_id, stock in stocks.items():
+            codigo = index.codigo_by_id.get(product_id)
+            if codigo is not None:
+                # Copia nueva: quien ya tenga la proyección anterior no la ve cambiar
+                index.by_codigo[codigo] = {**index.by_codigo[codigo], "stock": stock}
+
+
+def stage_stock(db: Session, tenant_id: int, stocks: Dict[int, int]) -> None:
+    """Registrar stock cambiado con SQL directo; se aplica al índice en el commit."""
+    _pending(db).append(("stock", tenant_id, dict(stocks)))
+
+
+# ---------------------------------------------------------------------------
+# Eventos de sesión
+# ---------------------------------------------------------------------------
+
+def _pending(session: Session) -> List[Tuple]:
+    return session.info.setdefault(_PENDING_KEY, [])
+
+
+def _snapshot(product: Product, is_new: bool) -> Optional[dict]:
+    loaded = sa_inspect(product).dict
+    if is_new:
+        # Recién insertado: lo que no se asignó quedó NULL (products no tiene server_default)
+        return {name: loaded.get(name) for name in PROJECTION_COLUMNS}
+    if all(name in loaded for name in PROJECTION_COLUMNS):
+        return {name: loaded[name] for name in PROJECTION_COLUMNS}
+    return None
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_product_changes(session: Session, flush_context) -> None:
+    pending = None
+    for obj in session.new | session.dirty:
+        if isinstance(obj, Product) and obj.tenant_id is not None:
+            pending = pending if pending is not None else _pending(session)
+            row = _snapshot(obj, obj in session.new)
+            if row is not None:
+                pending.append(("put", obj.tenant_id, row))
+            else:
+                # Columnas sin cargar: se saca del índice y el tenant vuelve a ser parcial
+                # (la próxima consulta de ese código va a la BD y se recarga en segundo plano)
+                pending.append(("reload", obj.tenant_id, obj.id))
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            pending = pending if pending is not None else _pending(session)
+            pending.append(("drop", obj.tenant_id, obj.id))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_product_changes(session: Session) -> None:
+    # También se dispara al liberar un SAVEPOINT: se aplica con el commit de afuera
+    if session.in_nested_transaction():
+        return
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    with _lock:
+        for op, tenant_id, payload in pending:
+            index = _tenants.get(tenant_id)
+            if index is None:
+                continue
+            if op == "put":
+                _put(index, payload)
+            elif op == "drop":
+                _drop(index, payload)
+            elif op == "reload":
+                _drop(index, payload)
+                index.loaded_at = None
+            elif op == "stock":
+                set_stock(tenant_id, payload)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_product_changes(session: Session) -> None:
+    # Un SAVEPOINT deshecho no descarta lo que se cambió antes en la transacción
+    if not session.in_nested_transaction():
+        session.info.pop(_PENDING_KEY, None)
@@ -2,20 +2,24 @@
 Service for generating detailed cash cut reports (corte de caja).
 This service contains the business logic extracted from routes/reports.py
 """
+from sqlalchemy import case, func
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
-from typing import Dict, List, Any, Tuple, Optional, TypedDict
+from typing import Dict, Iterable, List, Any, Tuple, Optional, TypedDict
 from datetime import datetime, date, timedelta, timezone
 from datetime import timezone as tz
 
 from app.models.tenant import Tenant
-from app.models.user import User
-from app.models.product import Product
-from app.models.payment import Payment
 from app.models.credit_payment import CreditPayment
-from app.models.producto_pedido import Pedido, PagoPedido, ProductoPedido, PedidoItem
-from app.models.venta_contado import VentasContado, ItemVentaContado
-from app.models.apartado import Apartado, ItemApartado
+from app.models.producto_pedido import Pedido, PagoPedido
+from app.models.venta_contado import VentasContado
+from app.models.apartado import Apartado
+from app.services.corte_context import (
+    ANTICIPO_INICIAL_NOTE,
+    CorteContext,
+    _chunks,
+    is_abono,
+    is_anticipo_inicial,
+)
 
 # Constants
 TARJETA_DISCOUNT_RATE = 0.97  # 3% discount for card payments
@@ -70,6 +74,26 @@ class VentasPasivas(TypedDict):
     total: float
 
 
+class PaymentTotals(TypedDict):
+    count: int
+    bruto: float
+    neto: float
+
+
+# (movimiento, metodo) -> totales; ver _aggregate_pending_payments
+PagosPendientes = Dict[Tuple[str, str], PaymentTotals]
+
+# Movimientos del resumen de pagos (ventas pasivas), en el orden del reporte
+MOVIMIENTOS_PAGOS = [
+    ('anticipo_apartado', "Anticipo de apartado"),
+    ('abono_apartado', "Abono de apartado"),
+    ('anticipo_pedido', "Anticipo de pedido apartado"),
+    ('abono_pedido', "Abono de pedido apartado"),
+]
+APARTADO_EFECTIVO_METHODS = ['efectivo', 'cash', 'transferencia']
+APARTADO_TARJETA_METHODS = ['tarjeta', 'card']
+
+
 class HistorialesData(TypedDict):
     """Structure for historiales data."""
     apartados: List[Dict[str, Any]]
@@ -126,19 +150,19 @@ def get_detailed_corte_caja(
     start_datetime = start_datetime_mexico.astimezone(utc_tz)
     end_datetime = end_datetime_mexico.astimezone(utc_tz)
     
+    # Precargar una sola vez todo lo que usan los helpers
+    ctx = CorteContext.load(db, tenant, start_datetime, end_datetime)
+
     # Get base data
-    sales_data = _get_sales_by_payment_date(db, tenant, start_datetime, end_datetime)
-    pedidos_data = _get_pedidos_by_payment_date(db, tenant, start_datetime, end_datetime)
+    sales_data = _get_sales_by_payment_date(ctx)
+    pedidos_data = _get_pedidos_by_payment_date(ctx)
     
     # Initialize counters
     counters = _initialize_counters()
     
     # Also process ventas/apartados del nuevo esquema (VentasContado/Apartado)
     _process_new_schema_stats(
-        db=db,
-        tenant=tenant,
-        start_datetime=start_datetime,
-        end_datetime=end_datetime,
+        ctx=ctx,
         counters=counters,
         apartados_liquidados=sales_data['apartados_liquidados'],
     )
@@ -147,44 +171,42 @@ def get_detailed_corte_caja(
     
     # Process pedidos de contado
     _process_pedidos_contado(
-        db, pedidos_data['pedidos_contado'], counters
+        ctx, pedidos_data['pedidos_contado'], counters
     )
     
     # Process pedidos liquidados
     _process_pedidos_liquidados(
-        db, pedidos_data['pedidos_liquidados'], counters
+        ctx, pedidos_data['pedidos_liquidados'], counters
     )
     
-    # Process apartados pendientes
-    _process_apartados_pendientes(
-        db, sales_data['apartados_pendientes'], counters
+    # Anticipos/abonos de apartados y pedidos pendientes, agregados en SQL una sola vez
+    pagos_pendientes = _aggregate_pending_payments(
+        ctx, sales_data['apartados_pendientes'], pedidos_data['pedidos_pendientes']
     )
+
+    # Process apartados pendientes
+    _process_apartados_pendientes(pagos_pendientes, counters)
     
     # Process pedidos pendientes
     _process_pedidos_pendientes(
-        db, pedidos_data['pedidos_pendientes'], counters
+        pedidos_data['pedidos_pendientes'], pagos_pendientes, counters
     )
     
     # Calculate main metrics
     ventas_activas = _calculate_ventas_activas(counters)
     ventas_liquidacion = _calculate_ventas_liquidacion(counters)
-    ventas_pasivas = _calculate_ventas_pasivas(
-        db, tenant, start_datetime, end_datetime, counters
-    )
+    ventas_pasivas = _calculate_ventas_pasivas(ctx, counters)
     cuentas_por_cobrar = _calculate_cuentas_por_cobrar(
         sales_data['apartados_pendientes'],
         pedidos_data['pedidos_pendientes'],
-        db,
-        tenant,
-        start_datetime,
-        end_datetime,
+        ctx,
     )
     
     # Build vendor stats
     vendor_stats = _build_vendor_stats(
-        db, ventas_contado_period, pedidos_data['pedidos_contado'],
+        ctx, ventas_contado_period, pedidos_data['pedidos_contado'],
         pedidos_data['pedidos_liquidados'], sales_data['apartados_pendientes'],
-        pedidos_data['pedidos_pendientes'], start_datetime, end_datetime, tenant
+        pedidos_data['pedidos_pendientes']
     )
     
     # Build dashboard (ahora incluye historiales internamente)
@@ -193,38 +215,29 @@ def get_detailed_corte_caja(
         ventas_liquidacion,
         pedidos_data['pedidos_contado'],
         pedidos_data['pedidos_liquidados'],
-        db,  # Parámetros adicionales
-        tenant,
-        start_datetime,
-        end_datetime,
+        ctx,
         pedidos_data['pedidos_pendientes']
     )
     
     # Extraer historiales del dashboard para compatibilidad con frontend
     historiales = dashboard.get('historiales', {})
     sales_details = _build_sales_details(
-        db, ventas_contado_period, pedidos_data['pedidos_contado'],
-        tenant, start_datetime, end_datetime
+        ctx, ventas_contado_period, pedidos_data['pedidos_contado']
     )
     
     # Build piezas lists
-    piezas_recibidas = _build_piezas_recibidas(db, tenant, start_datetime, end_datetime)
-    piezas_solicitadas_cliente = _build_piezas_solicitadas_cliente(db, tenant, start_datetime, end_datetime)
-    piezas_pedidas_proveedor = _build_piezas_pedidas_proveedor(db, tenant, start_datetime, end_datetime)
+    piezas_recibidas = _build_piezas_recibidas(ctx)
+    piezas_solicitadas_cliente = _build_piezas_solicitadas_cliente(ctx)
+    piezas_pedidas_proveedor = _build_piezas_pedidas_proveedor(ctx)
     
-    additional_metrics = _calculate_additional_metrics(
-        db, tenant, start_datetime, end_datetime
-    )
+    additional_metrics = _calculate_additional_metrics(ctx)
     
     # Build resumen piezas
     resumen_piezas = _build_resumen_piezas(
-        db,
+        ctx,
         sales_data['apartados_pendientes'],
         pedidos_data['pedidos_pendientes'],
         pedidos_data['pedidos_liquidados'],
-        tenant,
-        start_datetime,
-        end_datetime
     )
     piezas_por_nombre = _build_piezas_por_nombre(resumen_piezas)
     
@@ -233,17 +246,14 @@ def get_detailed_corte_caja(
     daily_summaries = _build_daily_summaries(
         ventas_contado_period,
         pedidos_data['pedidos_contado'],
-        db
+        ctx
     )
     
     # Build resumen ventas activas and pagos
     resumen_ventas_activas = _build_resumen_ventas_activas(
-        db, tenant, start_datetime, end_datetime, pedidos_data['pedidos_contado']
-    )
-    resumen_pagos = _build_resumen_pagos(
-        db, tenant, start_datetime, end_datetime,
-        sales_data['apartados_pendientes'], pedidos_data['pedidos_pendientes']
+        ctx, pedidos_data['pedidos_contado']
     )
+    resumen_pagos = _build_resumen_pagos(pagos_pendientes)
     
     # Assemble final report
     return {
@@ -320,126 +330,42 @@ def get_detailed_corte_caja(
     }
 
 
-def _get_apartados_liquidados_by_payment_date(
-    db: Session,
-    tenant: Tenant,
-    start_datetime: datetime,
-    end_datetime: datetime
-) -> List[Apartado]:
-    """Get apartados liquidados filtered by last payment date (liquidation moment)."""
-    # Obtener la fecha del último pago para cada apartado pagado
-    # Usar CreditPayment que es la tabla de pagos de apartados
-    last_payment_subq = (
-        db.query(
-            CreditPayment.apartado_id.label("apartado_id"),
-            func.max(CreditPayment.created_at).label("last_payment_at")
-        )
-        .filter(CreditPayment.apartado_id.isnot(None))
-        .group_by(CreditPayment.apartado_id)
-        .subquery()
-    )
-    
-    apartados_liquidados = (
-        db.query(Apartado)
-        .join(last_payment_subq, last_payment_subq.c.apartado_id == Apartado.id)
-        .filter(
-            Apartado.tenant_id == tenant.id,
-            Apartado.credit_status.in_(['pagado', 'entregado']),
-            last_payment_subq.c.last_payment_at >= start_datetime,
-            last_payment_subq.c.last_payment_at <= end_datetime
-        )
-        .all()
-    )
-    
-    return apartados_liquidados
-
-
-def _get_sales_by_payment_date(
-    db: Session,
-    tenant: Tenant,
-    start_datetime: datetime,
-    end_datetime: datetime
-) -> SalesData:
+def _get_sales_by_payment_date(ctx: CorteContext) -> SalesData:
     """Get sales filtered by payment date within the period."""
-    ventas_contado = db.query(VentasContado).filter(
-        VentasContado.tenant_id == tenant.id,
-        VentasContado.created_at >= start_datetime,
-        VentasContado.created_at <= end_datetime
-    ).all()
-    
-    # Obtener apartados pendientes por fecha de creación
-    apartados_pendientes = db.query(Apartado).filter(
-        Apartado.tenant_id == tenant.id,
-        Apartado.credit_status.in_(['pendiente', 'vencido']),
-        Apartado.created_at >= start_datetime,
-        Apartado.created_at <= end_datetime
-    ).all()
-    
-    # Obtener apartados liquidados por fecha de liquidación (último pago)
-    apartados_liquidados = _get_apartados_liquidados_by_payment_date(
-        db, tenant, start_datetime, end_datetime
-    )
+    # Apartados pendientes por fecha de creación
+    apartados_pendientes = [
+        a for a in ctx.apartados_periodo
+        if a.credit_status in ('pendiente', 'vencido')
+    ]
     
     return {
-        'ventas_contado': ventas_contado,
+        'ventas_contado': ctx.ventas_contado,
         'apartados_pendientes': apartados_pendientes,
-        'apartados_liquidados': apartados_liquidados,
+        # Apartados liquidados por fecha de liquidación (último pago)
+        'apartados_liquidados': ctx.apartados_liquidados,
     }
 
 
-def _get_pedidos_by_payment_date(
-    db: Session,
-    tenant: Tenant,
-    start_datetime: datetime,
-    end_datetime: datetime
-) -> PedidosData:
+def _get_pedidos_by_payment_date(ctx: CorteContext) -> PedidosData:
     """Get pedidos filtered by payment date within the period."""
-    # Get pedidos liquidados: usar fecha del último pago tipo saldo/total (momento en que se liquidan)
-    pagos_saldo_subq = (
-        db.query(
-            PagoPedido.pedido_id.label("pedido_id"),
-            func.max(PagoPedido.created_at).label("last_payment_at")
-        )
-        .filter(PagoPedido.tipo_pago.in_(['saldo', 'total']))
-        .group_by(PagoPedido.pedido_id)
-        .subquery()
-    )
-    
-    pedidos_liquidados = (
-        db.query(Pedido)
-        .join(pagos_saldo_subq, pagos_saldo_subq.c.pedido_id == Pedido.id)
-        .filter(
-            Pedido.tenant_id == tenant.id,
-            Pedido.tipo_pedido == 'apartado',
-            Pedido.estado == 'pagado',
-            pagos_saldo_subq.c.last_payment_at >= start_datetime,
-            pagos_saldo_subq.c.last_payment_at <= end_datetime
-        )
-        .all()
-    )
-    
-    # Get pedidos de contado: filtrar por fecha de CREACIÓN del pedido
+    # Pedidos de contado: filtrar por fecha de CREACIÓN del pedido
     # Incluir también pedidos cancelados para sumarlos en ventas activas
-    pedidos_contado = db.query(Pedido).filter(
-        Pedido.tenant_id == tenant.id,
-        Pedido.tipo_pedido == 'contado',
-        Pedido.estado.in_(['pagado', 'cancelado']),
-        Pedido.created_at >= start_datetime,
-        Pedido.created_at <= end_datetime
-    ).all()
-    
-    # Get pedidos pendientes filtrados por fecha de CREACIÓN en el periodo
-    # Solo incluir pedidos creados en el periodo seleccionado
-    pedidos_pendientes = db.query(Pedido).filter(
-        Pedido.tenant_id == tenant.id,
-        Pedido.tipo_pedido == 'apartado',
-        ~Pedido.estado.in_(['pagado', 'entregado', 'cancelado']),
-        Pedido.created_at >= start_datetime,
-        Pedido.created_at <= end_datetime
-    ).all()
+    pedidos_contado = [
+        p for p in ctx.pedidos_periodo
+        if p.tipo_pedido == 'contado' and p.estado in ('pagado', 'cancelado')
+    ]
+    
+    # Pedidos pendientes creados en el periodo (estado NULL no cuenta, igual que NOT IN en SQL)
+    pedidos_pendientes = [
+        p for p in ctx.pedidos_periodo
+        if p.tipo_pedido == 'apartado'
+        and p.estado is not None
+        and p.estado not in ('pagado', 'entregado', 'cancelado')
+    ]
     
     return {
-        'pedidos_liquidados': pedidos_liquidados,
+        # Pedidos liquidados: fecha del último pago tipo saldo/total
+        'pedidos_liquidados': ctx.pedidos_liquidados,
         'pedidos_contado': pedidos_contado,
         'pedidos_pendientes': pedidos_pendientes,
     }
@@ -532,10 +458,7 @@ def _initialize_counters() -> Dict[str, Any]:
 
 
 def _process_new_schema_stats(
-    db: Session,
-    tenant: Tenant,
-    start_datetime: datetime,
-    end_datetime: datetime,
+    ctx: CorteContext,
     counters: Dict[str, Any],
     apartados_liquidados: List[Apartado] = None,
 ) -> None:
@@ -548,34 +471,9 @@ def _process_new_schema_stats(
         apartados_liquidados: Pre-filtered apartados liquidados (if provided, skips liquidados query)
     """
     # --- Ventas de contado nuevas ---
-    ventas_contado = db.query(VentasContado).filter(
-        VentasContado.tenant_id == tenant.id,
-        VentasContado.created_at >= start_datetime,
-        VentasContado.created_at <= end_datetime,
-    ).all()
+    ventas_contado = ctx.ventas_contado
 
     if ventas_contado:
-        venta_ids = [v.id for v in ventas_contado]
-        items = db.query(ItemVentaContado).filter(ItemVentaContado.venta_id.in_(venta_ids)).all()
-        items_by_venta: Dict[int, list[ItemVentaContado]] = {}
-        for it in items:
-            items_by_venta.setdefault(it.venta_id, []).append(it)
-
-        product_ids = list({it.product_id for it in items if it.product_id})
-        products = {
-            p.id: p for p in db.query(Product).filter(Product.id.in_(product_ids)).all()
-        } if product_ids else {}
-
-        # Load all payments for ventas de contado
-        venta_ids = [v.id for v in ventas_contado]
-        payments = db.query(Payment).filter(
-            Payment.venta_contado_id.in_(venta_ids)
-        ).all()
-        payments_by_venta: Dict[int, list[Payment]] = {}
-        for p in payments:
-            if p.venta_contado_id:
-                payments_by_venta.setdefault(p.venta_contado_id, []).append(p)
-
         for venta in ventas_contado:
             total = float(venta.total or 0)
             
@@ -593,20 +491,20 @@ def _process_new_schema_stats(
                 counters['total_vendido'] += total  # total es negativo, así que se resta
                 
                 # Calcular pagos de la devolución (si los hay)
-                venta_payments = payments_by_venta.get(venta.id, [])
+                venta_payments = ctx.pagos_venta(venta.id)
                 efectivo_venta = sum(float(p.amount) for p in venta_payments if p.method in ['efectivo', 'cash', 'transferencia'])
                 tarjeta_venta = sum(float(p.amount) for p in venta_payments if p.method in ['tarjeta', 'card'])
                 counters['total_efectivo_contado'] += abs(efectivo_venta)  # Valor absoluto
                 counters['total_tarjeta_contado'] += abs(tarjeta_venta)  # Valor absoluto
                 
                 # Costos y piezas (usar valor absoluto para cantidad)
-                venta_items = items_by_venta.get(venta.id, [])
+                venta_items = ctx.items_venta(venta.id)
                 costo_venta = 0.0
                 for it in venta_items:
                     qty = abs(int(it.quantity or 0))  # Valor absoluto
                     counters['num_piezas_vendidas'] += qty
-                    if it.product_id and it.product_id in products:
-                        prod = products[it.product_id]
+                    prod = ctx.product(it.product_id) if it.product_id else None
+                    if prod is not None:
                         if getattr(prod, 'cost_price', None) is not None:
                             costo_venta += float(prod.cost_price) * qty
                 counters['costo_ventas_contado'] += costo_venta
@@ -622,13 +520,13 @@ def _process_new_schema_stats(
             counters['total_vendido'] += total
 
             # Costos y piezas
-            venta_items = items_by_venta.get(venta.id, [])
+            venta_items = ctx.items_venta(venta.id)
             costo_venta = 0.0
             for it in venta_items:
                 qty = int(it.quantity or 0)
                 counters['num_piezas_vendidas'] += qty
-                if it.product_id and it.product_id in products:
-                    prod = products[it.product_id]
+                prod = ctx.product(it.product_id) if it.product_id else None
+                if prod is not None:
                     if getattr(prod, 'cost_price', None) is not None:
                         costo_venta += float(prod.cost_price) * qty
             counters['costo_ventas_contado'] += costo_venta
@@ -637,7 +535,7 @@ def _process_new_schema_stats(
             counters['utilidad_total'] += total - costo_venta
             
             # Calcular pagos en efectivo y tarjeta
-            venta_payments = payments_by_venta.get(venta.id, [])
+            venta_payments = ctx.pagos_venta(venta.id)
             efectivo_venta = sum(float(p.amount) for p in venta_payments if p.method in ['efectivo', 'cash', 'transferencia'])
             tarjeta_venta = sum(float(p.amount) for p in venta_payments if p.method in ['tarjeta', 'card'])
             counters['total_efectivo_contado'] += efectivo_venta
@@ -656,25 +554,23 @@ def _process_new_schema_stats(
             counters['credito_count'] += 1
             
             # Calcular costos y piezas
-            items = db.query(ItemApartado).filter(ItemApartado.apartado_id == ap.id).all()
+            items = ctx.items_apartado(ap.id)
             for item in items:
                 qty = int(item.quantity or 0)
                 counters['num_piezas_pedidos_apartados_liquidados'] += qty
                 
                 if item.product_id:
-                    product = db.query(Product).filter(Product.id == item.product_id).first()
+                    product = ctx.product(item.product_id)
                     if product and product.cost_price:
                         cost = float(product.cost_price) * qty
                         counters['costo_apartados_liquidados'] += cost
                         counters['costo_total'] += cost
 
     # --- Apartados pendientes y vencidos/cancelados (filtrar por fecha de creación) ---
-    apartados_otros = db.query(Apartado).filter(
-        Apartado.tenant_id == tenant.id,
-        Apartado.credit_status.in_(['pendiente', 'vencido', 'cancelado']),
-        Apartado.created_at >= start_datetime,
-        Apartado.created_at <= end_datetime,
-    ).all()
+    apartados_otros = [
+        a for a in ctx.apartados_periodo
+        if a.credit_status in ('pendiente', 'vencido', 'cancelado')
+    ]
 
     for ap in apartados_otros:
         total = get_total_with_vip_discount(ap)
@@ -689,7 +585,7 @@ def _process_new_schema_stats(
         if ap.credit_status == 'vencido':
             # El saldo vencido es el monto total pagado (anticipo + abonos) porque el cliente puede pedirlo de regreso
             # Calcular todos los abonos (anticipo inicial + abonos adicionales)
-            abonos_apartado = db.query(CreditPayment).filter(CreditPayment.apartado_id == ap.id).all()
+            abonos_apartado = ctx.abonos_apartado(ap.id)
             abonos_efectivo = sum(
                 float(p.amount) for p in abonos_apartado
                 if p.payment_method in ['efectivo', 'cash', 'transferencia']
@@ -704,7 +600,7 @@ def _process_new_schema_stats(
         elif ap.credit_status == 'cancelado':
             # Reembolsos y cancelaciones de apartados
             # Calcular todos los abonos (anticipo inicial + abonos adicionales)
-            abonos_apartado = db.query(CreditPayment).filter(CreditPayment.apartado_id == ap.id).all()
+            abonos_apartado = ctx.abonos_apartado(ap.id)
             abonos_efectivo = sum(
                 float(p.amount) for p in abonos_apartado
                 if p.payment_method in ['efectivo', 'cash', 'transferencia']
@@ -720,7 +616,7 @@ def _process_new_schema_stats(
 
 
 def _process_pedidos_contado(
-    db: Session,
+    ctx: CorteContext,
     pedidos_contado: List[Pedido],
     counters: Dict[str, Any],
 ) -> None:
@@ -736,9 +632,7 @@ def _process_pedidos_contado(
     for pedido in pedidos_contado:
         es_cancelado = pedido.estado == 'cancelado'
         
-        pagos_pedido_contado = db.query(PagoPedido).filter(
-            PagoPedido.pedido_id == pedido.id
-        ).all()
+        pagos_pedido_contado = ctx.pagos_pedido(pedido.id)
         
         efectivo_pedido = sum(float(p.monto) for p in pagos_pedido_contado if p.metodo_pago in ['efectivo', 'transferencia'])
         tarjeta_pedido = sum(float(p.monto) for p in pagos_pedido_contado if p.metodo_pago == 'tarjeta')
@@ -759,9 +653,7 @@ def _process_pedidos_contado(
         counters['total_tarjeta_contado'] += tarjeta_pedido
         
         # Get product to calculate cost
-        producto = db.query(ProductoPedido).filter(
-            ProductoPedido.id == pedido.producto_pedido_id
-        ).first()
+        producto = ctx.producto_pedido(pedido.producto_pedido_id)
         
         if producto and producto.cost_price:
             costo_pedido = float(producto.cost_price) * pedido.cantidad
@@ -774,7 +666,7 @@ def _process_pedidos_contado(
 
 
 def _process_pedidos_liquidados(
-    db: Session,
+    ctx: CorteContext,
     pedidos_liquidados: List[Pedido],
     counters: Dict[str, Any],
 ) -> None:
@@ -793,7 +685,7 @@ def _process_pedidos_liquidados(
         counters['pedidos_saldo'] += float(pedido.saldo_pendiente)
         
         # Get product and calculate cost
-        producto = db.query(ProductoPedido).filter(ProductoPedido.id == pedido.producto_pedido_id).first()
+        producto = ctx.producto_pedido(pedido.producto_pedido_id)
         if producto and producto.cost_price:
             counters['costo_pedidos_liquidados'] += float(producto.cost_price) * pedido.cantidad
         
@@ -804,78 +696,139 @@ def _process_pedidos_liquidados(
             counters['num_piezas_entregadas'] += pedido.cantidad
 
 
-def _process_apartados_pendientes(
-    db: Session,
+def _aggregate_pending_payments(
+    ctx: CorteContext,
     apartados_pendientes: List[Apartado],
+    pedidos_pendientes: List[Pedido],
+) -> PagosPendientes:
+    """
+    Totales de anticipos y abonos de apartados/pedidos pendientes por (movimiento, método).
+
+    Se calculan en la base de datos con un GROUP BY por origen (y por lote de ids):
+    número de operaciones, bruto y neto (tarjeta con TARJETA_DISCOUNT_RATE), así que el
+    costo no crece con el número de apartados o pedidos abiertos. Los métodos fuera de
+    efectivo/tarjeta no se cuentan, igual que antes.
+    """
+    totals: PagosPendientes = {
+        (movimiento, metodo): {'count': 0, 'bruto': 0.0, 'neto': 0.0}
+        for movimiento, _ in MOVIMIENTOS_PAGOS
+        for metodo in ('efectivo', 'tarjeta')
+    }
+
+    # Apartados: anticipo inicial por notes; notes NULL no es anticipo ni abono (ver is_abono)
+    _accumulate_payments(
+        ctx.db,
+        totals,
+        parent_column=CreditPayment.apartado_id,
+        parent_ids=[a.id for a in apartados_pendientes],
+        movimiento=case(
+            (CreditPayment.notes == ANTICIPO_INICIAL_NOTE, 'anticipo_apartado'),
+            else_='abono_apartado',
+        ),
+        metodo=case(
+            (CreditPayment.payment_method.in_(APARTADO_EFECTIVO_METHODS), 'efectivo'),
+            (CreditPayment.payment_method.in_(APARTADO_TARJETA_METHODS), 'tarjeta'),
+        ),
+        amount=CreditPayment.amount,
+        filters=[CreditPayment.notes.isnot(None)],
+    )
+
+    # Pedidos apartados: tipo_pago anticipo / saldo
+    _accumulate_payments(
+        ctx.db,
+        totals,
+        parent_column=PagoPedido.pedido_id,
+        parent_ids=[p.id for p in pedidos_pendientes],
+        movimiento=case(
+            (PagoPedido.tipo_pago == 'anticipo', 'anticipo_pedido'),
+            else_='abono_pedido',
+        ),
+        metodo=case(
+            (PagoPedido.metodo_pago.in_(EFECTIVO_METHODS), 'efectivo'),
+            (PagoPedido.metodo_pago == TARJETA_METHOD, 'tarjeta'),
+        ),
+        amount=PagoPedido.monto,
+        filters=[PagoPedido.tipo_pago.in_(['anticipo', 'saldo'])],
+    )
+    return totals
+
+
+def _accumulate_payments(
+    db: Session,
+    totals: PagosPendientes,
+    parent_column: Any,
+    parent_ids: List[int],
+    movimiento: Any,
+    metodo: Any,
+    amount: Any,
+    filters: List[Any],
+) -> None:
+    """GROUP BY (movimiento, metodo) sobre los pagos de parent_ids, sumado en totals."""
+    for chunk in _chunks(parent_ids):
+        pagos = (
+            db.query(
+                movimiento.label('movimiento'),
+                metodo.label('metodo'),
+                amount.label('monto'),
+            )
+            .filter(parent_column.in_(chunk), *filters)
+            .subquery()
+        )
+        neto = case(
+            (pagos.c.metodo == 'tarjeta', pagos.c.monto * TARJETA_DISCOUNT_RATE),
+            else_=pagos.c.monto,
+        )
+        rows = (
+            db.query(
+                pagos.c.movimiento,
+                pagos.c.metodo,
+                func.count(),
+                func.sum(pagos.c.monto),
+                func.sum(neto),
+            )
+            .filter(pagos.c.metodo.isnot(None))
+            .group_by(pagos.c.movimiento, pagos.c.metodo)
+            .all()
+        )
+        for mov, met, count, bruto, neto_total in rows:
+            entry = totals[(mov, met)]
+            entry['count'] += count
+            entry['bruto'] += float(bruto or 0)
+            entry['neto'] += float(neto_total or 0)
+
+
+def _net_total(pagos: PagosPendientes, movimiento: str) -> float:
+    """Efectivo + tarjeta neta de un movimiento."""
+    return pagos[(movimiento, 'efectivo')]['neto'] + pagos[(movimiento, 'tarjeta')]['neto']
+
+
+def _process_apartados_pendientes(
+    pagos: PagosPendientes,
     counters: Dict[str, Any],
 ) -> None:
     """Process pending apartados (apartados pendientes) for passive sales."""
-    for apartado in apartados_pendientes:
-        # Get initial down payment (anticipo inicial)
-        # Buscar en CreditPayment con notes="Anticipo inicial"
-        pagos_iniciales = db.query(CreditPayment).filter(
-            CreditPayment.apartado_id == apartado.id,
-            CreditPayment.notes == "Anticipo inicial"
-        ).all()
-        
-        anticipo_efectivo = sum(float(p.amount) for p in pagos_iniciales if p.payment_method in ['efectivo', 'cash', 'transferencia'])
-        anticipo_tarjeta = sum(float(p.amount) for p in pagos_iniciales if p.payment_method in ['tarjeta', 'card'])
-        anticipo_inicial = anticipo_efectivo + (anticipo_tarjeta * TARJETA_DISCOUNT_RATE)
-        
-        # Solo actualizar contadores específicos de apartados pendientes
-        # Los contadores generales de anticipos/abonos se calculan en _calculate_ventas_pasivas
-        counters['apartados_pendientes_anticipos'] += anticipo_inicial
-        
-        # Get additional payments (abonos posteriores)
-        pagos_posteriores = db.query(CreditPayment).filter(
-            CreditPayment.apartado_id == apartado.id,
-            CreditPayment.notes != "Anticipo inicial"  # Excluir anticipo inicial
-        ).all()
-        
-        abonos_efectivo = sum(float(p.amount) for p in pagos_posteriores if p.payment_method in ['efectivo', 'cash', 'transferencia'])
-        abonos_tarjeta = sum(float(p.amount) for p in pagos_posteriores if p.payment_method in ['tarjeta', 'card'])
-        abonos_posteriores = abonos_efectivo + (abonos_tarjeta * TARJETA_DISCOUNT_RATE)
-        
-        counters['apartados_pendientes_abonos_adicionales'] += abonos_posteriores
+    # Solo actualizar contadores específicos de apartados pendientes
+    # Los contadores generales de anticipos/abonos se calculan en _calculate_ventas_pasivas
+    counters['apartados_pendientes_anticipos'] += _net_total(pagos, 'anticipo_apartado')
+    counters['apartados_pendientes_abonos_adicionales'] += _net_total(pagos, 'abono_apartado')
 
 
 def _process_pedidos_pendientes(
-    db: Session,
     pedidos_pendientes: List[Pedido],
+    pagos: PagosPendientes,
     counters: Dict[str, Any],
 ) -> None:
     """Process pending orders (pedidos pendientes) for passive sales."""
     for pedido in pedidos_pendientes:
-        # Get down payments (anticipos)
-        pagos_anticipo = db.query(PagoPedido).filter(
-            PagoPedido.pedido_id == pedido.id,
-            PagoPedido.tipo_pago == 'anticipo'
-        ).all()
-        
-        anticipo_totals = _calculate_payment_totals(pagos_anticipo)
-        anticipo_efectivo = anticipo_totals['efectivo']
-        anticipo_tarjeta = anticipo_totals['tarjeta']
-        anticipo_neto = anticipo_efectivo + (anticipo_tarjeta * TARJETA_DISCOUNT_RATE)
-        
-        # Solo actualizar contadores específicos de pedidos pendientes
-        # Los contadores generales de anticipos/abonos se calculan en _calculate_ventas_pasivas
-        counters['pedidos_pendientes_anticipos'] += anticipo_neto
         counters['pedidos_total'] += get_pedido_total_with_vip_discount(pedido)
-        counters['pedidos_anticipos'] += anticipo_neto
         counters['pedidos_saldo'] += float(pedido.saldo_pendiente)
-        
-        # Get additional payments (abonos)
-        pagos_pedido_abonos = db.query(PagoPedido).filter(
-            PagoPedido.pedido_id == pedido.id,
-            PagoPedido.tipo_pago == 'saldo'
-        ).all()
-        
-        abonos_totals = _calculate_payment_totals(pagos_pedido_abonos)
-        abonos_efectivo = abonos_totals['efectivo']
-        abonos_tarjeta = abonos_totals['tarjeta']
-        abonos_posteriores = abonos_efectivo + (abonos_tarjeta * TARJETA_DISCOUNT_RATE)
-        
-        counters['pedidos_pendientes_abonos'] += abonos_posteriores
+
+    # Solo actualizar contadores específicos de pedidos pendientes
+    # Los contadores generales de anticipos/abonos se calculan en _calculate_ventas_pasivas
+    anticipo_neto = _net_total(pagos, 'anticipo_pedido')
+    counters['pedidos_pendientes_anticipos'] += anticipo_neto
+    counters['pedidos_anticipos'] += anticipo_neto
+    counters['pedidos_pendientes_abonos'] += _net_total(pagos, 'abono_pedido')
 
 
 def _calculate_ventas_activas(counters: Dict[str, Any]) -> VentasActivas:
@@ -918,10 +871,7 @@ def _calculate_ventas_liquidacion(counters: Dict[str, Any]) -> VentasLiquidacion
 
 
 def _calculate_ventas_pasivas(
-    db: Session,
-    tenant: Tenant,
-    start_datetime: datetime,
-    end_datetime: datetime,
+    ctx: CorteContext,
     counters: Dict[str, Any]
 ) -> VentasPasivas:
     """Calculate passive sales metrics (anticipos and abonos).
@@ -932,21 +882,13 @@ def _calculate_ventas_pasivas(
     """
     # ========== ANTICIPOS DE APARTADOS ==========
     # Filtrar por fecha de creación del apartado (el anticipo se crea al mismo tiempo)
-    apartados_ids_query = db.query(Apartado.id).filter(
-        Apartado.tenant_id == tenant.id,
-        Apartado.created_at >= start_datetime,
-        Apartado.created_at <= end_datetime
-    )
-    apartados_ids_list = [id for id, in apartados_ids_query.all()]
-    
-    # Obtener los anticipos iniciales de esos apartados
     # Los anticipos iniciales están en CreditPayment con notes="Anticipo inicial"
-    anticipos_apartados_dia = []
-    if apartados_ids_list:
-        anticipos_apartados_dia = db.query(CreditPayment).filter(
-            CreditPayment.apartado_id.in_(apartados_ids_list),
-            CreditPayment.notes == "Anticipo inicial"
-    ).all()
+    anticipos_apartados_dia = [
+        pago
+        for apartado in ctx.apartados_periodo
+        for pago in ctx.abonos_apartado(apartado.id)
+        if is_anticipo_inicial(pago)
+    ]
     
     anticipos_apartados_dia_total = 0.0
     anticipos_apartados_efectivo = 0.0
@@ -990,13 +932,8 @@ def _calculate_ventas_pasivas(
     # ========== ABONOS DE APARTADOS ==========
     # Filtrar por fecha de CREACIÓN del abono (CreditPayment.created_at)
     # Solo considerar abonos del nuevo esquema (apartado_id IS NOT NULL)
-    abonos_apartados_dia = db.query(CreditPayment).filter(
-        CreditPayment.tenant_id == tenant.id,
-        CreditPayment.apartado_id.isnot(None),  # Solo abonos del nuevo esquema
-        CreditPayment.created_at >= start_datetime,
-        CreditPayment.created_at <= end_datetime,
-        CreditPayment.notes != "Anticipo inicial"  # Excluir anticipos iniciales
-    ).all()
+    # Solo considerar abonos del nuevo esquema (apartado_id IS NOT NULL), sin anticipos iniciales
+    abonos_apartados_dia = [a for a in ctx.abonos_apartados_periodo if is_abono(a)]
     
     abonos_apartados_dia_total = 0.0
     abonos_apartados_efectivo = 0.0
@@ -1009,16 +946,13 @@ def _calculate_ventas_pasivas(
     for abono in abonos_apartados_dia:
         # Verificar si este abono liquidó el apartado (es el último abono)
         if abono.apartado_id:
-            apartado = db.query(Apartado).filter(
-                Apartado.id == abono.apartado_id,
-                Apartado.tenant_id == tenant.id
-            ).first()
+            apartado = ctx.apartado(abono.apartado_id)
+            if apartado and apartado.tenant_id != ctx.tenant.id:
+                apartado = None
         
             if apartado and apartado.credit_status in ['pagado', 'entregado']:
                 # Obtener todos los abonos del apartado para identificar el último
-                todos_abonos = db.query(CreditPayment).filter(
-                    CreditPayment.apartado_id == abono.apartado_id
-                ).order_by(CreditPayment.created_at.desc()).all()
+                todos_abonos = _latest_first(ctx.abonos_apartado(abono.apartado_id))
                 
                 # Si este es el último abono que liquidó, excluirlo (ya se cuenta en liquidación)
                 if todos_abonos and abono.id == todos_abonos[0].id:
@@ -1048,13 +982,10 @@ def _calculate_ventas_pasivas(
     
     # Anticipos de pedidos apartados: filtrar por fecha de creación del pago (anticipo)
     # Los anticipos se filtran por su fecha de creación (PagoPedido.created_at)
-    anticipos_pedidos_dia = db.query(PagoPedido).join(Pedido).filter(
-        Pedido.tenant_id == tenant.id,
-        Pedido.tipo_pedido == 'apartado',
-        PagoPedido.tipo_pago == 'anticipo',
-        PagoPedido.created_at >= start_datetime,
-        PagoPedido.created_at <= end_datetime
-    ).all()
+    anticipos_pedidos_dia = [
+        pago for pago in ctx.pagos_pedido_periodo
+        if pago.tipo_pago == 'anticipo' and ctx.pedido(pago.pedido_id).tipo_pedido == 'apartado'
+    ]
     
     anticipos_pedidos_dia_total = 0.0
     anticipos_pedidos_efectivo = 0.0
@@ -1095,23 +1026,10 @@ def _calculate_ventas_pasivas(
     counters['anticipos_pedidos_tarjeta_count'] = anticipos_pedidos_tarjeta_count
     
     # Abonos de pedidos apartados: filtrar por fecha de creación del abono (PagoPedido.created_at)
-    # Primero obtenemos los IDs de pedidos apartados para verificar
-    pedidos_apartados_ids_query = db.query(Pedido.id).filter(
-        Pedido.tenant_id == tenant.id,
-        Pedido.tipo_pedido == 'apartado'
-    )
-    pedidos_apartados_ids_list = [id for id, in pedidos_apartados_ids_query.all()]
-    
-    # Luego obtenemos los abonos (tipo_pago == 'saldo') creados en el periodo
-    if pedidos_apartados_ids_list:
-        abonos_pedidos_dia = db.query(PagoPedido).filter(
-            PagoPedido.pedido_id.in_(pedidos_apartados_ids_list),
-        PagoPedido.tipo_pago == 'saldo',
-        PagoPedido.created_at >= start_datetime,
-        PagoPedido.created_at <= end_datetime
-    ).all()
-    else:
-        abonos_pedidos_dia = []
+    abonos_pedidos_dia = [
+        pago for pago in ctx.pagos_pedido_periodo
+        if pago.tipo_pago == 'saldo' and ctx.pedido(pago.pedido_id).tipo_pedido == 'apartado'
+    ]
     
     abonos_pedidos_dia_total = 0.0
     abonos_pedidos_efectivo = 0.0
@@ -1123,13 +1041,10 @@ def _calculate_ventas_pasivas(
     
     for abono in abonos_pedidos_dia:
         # Verificar si este abono liquidó el pedido (es el último abono que cambió el estado a pagado)
-        pedido = db.query(Pedido).filter(Pedido.id == abono.pedido_id).first()
+        pedido = ctx.pedido(abono.pedido_id)
         
         # Obtener todos los abonos del pedido para identificar el último que liquidó
-        todos_abonos = db.query(PagoPedido).filter(
-            PagoPedido.pedido_id == abono.pedido_id,
-            PagoPedido.tipo_pago == 'saldo'
-        ).order_by(PagoPedido.created_at.desc()).all()
+        todos_abonos = _latest_first(ctx.pagos_pedido(abono.pedido_id, 'saldo'))
         
         # Identificar el último abono que cambió el estado a pagado
         ultimo_abono_liquidante = None
@@ -1176,10 +1091,7 @@ def _calculate_ventas_pasivas(
 def _calculate_cuentas_por_cobrar(
     apartados_pendientes: List[Apartado],  # Cambiado de List[Sale] a List[Apartado]
     pedidos_pendientes: List[Pedido],
-    db: Session,
-    tenant: Tenant,
-    start_datetime: datetime,
-    end_datetime: datetime,
+    ctx: CorteContext,
 ) -> float:
     """Calculate accounts receivable (cuentas por cobrar)."""
     cuentas_por_cobrar = 0.0
@@ -1190,12 +1102,10 @@ def _calculate_cuentas_por_cobrar(
         cuentas_por_cobrar += saldo
 
     # Apartados nuevos (Apartado) pendientes o vencidos creados en el periodo
-    apartados_nuevos_pendientes = db.query(Apartado).filter(
-        Apartado.tenant_id == tenant.id,
-        Apartado.created_at >= start_datetime,
-        Apartado.created_at <= end_datetime,
-        Apartado.credit_status.in_(["pendiente", "vencido"]),
-    ).all()
+    apartados_nuevos_pendientes = [
+        a for a in ctx.apartados_periodo
+        if a.credit_status in ("pendiente", "vencido")
+    ]
     for ap in apartados_nuevos_pendientes:
         total_with_vip = get_total_with_vip_discount(ap)
         saldo = total_with_vip - float(ap.amount_paid or 0)
@@ -1206,17 +1116,16 @@ def _calculate_cuentas_por_cobrar(
 
 
 def _build_vendor_stats(
-    db: Session,
+    ctx: CorteContext,
     ventas_contado: List[VentasContado],
     pedidos_contado: List[Pedido],
     pedidos_liquidados: List[Pedido],
     apartados_pendientes: List[Apartado],
     pedidos_pendientes: List[Pedido],
-    start_datetime: datetime,
-    end_datetime: datetime,
-    tenant: Tenant
 ) -> Dict[int, Dict[str, Any]]:
     """Build vendor statistics."""
+    start_datetime = ctx.start_datetime
+    end_datetime = ctx.end_datetime
     vendor_stats = {}
     
     # Process nuevas ventas de contado
@@ -1224,13 +1133,12 @@ def _build_vendor_stats(
         vendedor_id = venta.vendedor_id or 0
         vendedor = "Mostrador"
         if venta.vendedor_id:
-            vendor = db.query(User).filter(User.id == venta.vendedor_id).first()
-            vendedor = vendor.email if vendor else "Unknown"
+            vendedor = ctx.user_email(venta.vendedor_id)
         
         if vendedor_id not in vendor_stats:
             vendor_stats[vendedor_id] = _init_vendor_stat(vendedor_id, vendedor)
         
-        payments_vendor = db.query(Payment).filter(Payment.venta_contado_id == venta.id).all()
+        payments_vendor = ctx.pagos_venta(venta.id)
         efectivo_vendor = sum(float(p.amount) for p in payments_vendor if p.method in ['efectivo', 'cash', 'transferencia'])
         tarjeta_vendor = sum(float(p.amount) for p in payments_vendor if p.method in ['tarjeta', 'card'])
         tarjeta_neto = tarjeta_vendor * TARJETA_DISCOUNT_RATE
@@ -1248,11 +1156,10 @@ def _build_vendor_stats(
     for pedido in pedidos_contado:
         if pedido.user_id:
             if pedido.user_id not in vendor_stats:
-                vendor = db.query(User).filter(User.id == pedido.user_id).first()
-                vendedor = vendor.email if vendor else "Unknown"
+                vendedor = ctx.user_email(pedido.user_id)
                 vendor_stats[pedido.user_id] = _init_vendor_stat(pedido.user_id, vendedor)
             
-            pagos = db.query(PagoPedido).filter(PagoPedido.pedido_id == pedido.id).all()
+            pagos = ctx.pagos_pedido(pedido.id)
             pagos_totals = _calculate_payment_totals(pagos)
             efectivo = pagos_totals['efectivo']
             tarjeta = pagos_totals['tarjeta']
@@ -1272,15 +1179,11 @@ def _build_vendor_stats(
             continue
         
         if vendedor_id not in vendor_stats:
-            vendor = db.query(User).filter(User.id == vendedor_id).first()
-            vendedor = vendor.email if vendor else "Unknown"
+            vendedor = ctx.user_email(vendedor_id)
             vendor_stats[vendedor_id] = _init_vendor_stat(vendedor_id, vendedor)
             
             # Buscar anticipos iniciales en CreditPayment con notes="Anticipo inicial"
-            pagos_iniciales = db.query(CreditPayment).filter(
-                CreditPayment.apartado_id == apartado.id,
-                CreditPayment.notes == "Anticipo inicial"
-            ).all()
+            pagos_iniciales = [p for p in ctx.abonos_apartado(apartado.id) if is_anticipo_inicial(p)]
             
             anticipo_efectivo = sum(float(p.amount) for p in pagos_iniciales if p.payment_method in ['efectivo', 'cash', 'transferencia'])
             anticipo_tarjeta = sum(float(p.amount) for p in pagos_iniciales if p.payment_method in ['tarjeta', 'card'])
@@ -1290,10 +1193,7 @@ def _build_vendor_stats(
             vendor_stats[vendedor_id]["venta_total_pasiva"] += anticipo_neto
             
             # Abonos de apartados: obtener todos los abonos del apartado (excluyendo anticipo inicial)
-            todos_abonos = db.query(CreditPayment).filter(
-                CreditPayment.apartado_id == apartado.id,
-                CreditPayment.notes != "Anticipo inicial"
-            ).all()
+            todos_abonos = [p for p in ctx.abonos_apartado(apartado.id) if is_abono(p)]
             
             # Solo excluir el último abono si el apartado está pagado (fue el abono liquidante)
             if todos_abonos and apartado.credit_status == 'pagado':
@@ -1324,14 +1224,14 @@ def _build_vendor_stats(
             vendor_stats[vendedor_id]["cuentas_por_cobrar"] += total_with_vip - float(apartado.amount_paid or 0)
     
     # También incluir apartados que tienen abonos en el periodo pero fueron creados fuera del periodo
-    apartados_con_abonos = db.query(Apartado).join(CreditPayment).filter(
-        Apartado.tenant_id == tenant.id,
-        Apartado.credit_status.in_(['pendiente', 'vencido']),
-        CreditPayment.apartado_id == Apartado.id,
-        CreditPayment.notes != "Anticipo inicial",  # Excluir anticipos iniciales
-        CreditPayment.created_at >= start_datetime,
-        CreditPayment.created_at <= end_datetime
-    ).distinct().all()
+    apartados_con_abonos = [
+        a for a in _distinct_by_id(
+            ctx.apartado(abono.apartado_id)
+            for abono in ctx.abonos_apartados_periodo
+            if is_abono(abono)  # Excluir anticipos iniciales
+        )
+        if a.tenant_id == ctx.tenant.id and a.credit_status in ('pendiente', 'vencido')
+    ]
     
     apartados_ids_procesados = {a.id for a in apartados_pendientes}
     for apartado in apartados_con_abonos:
@@ -1343,15 +1243,11 @@ def _build_vendor_stats(
             continue
         
         if vendedor_id not in vendor_stats:
-            vendor = db.query(User).filter(User.id == vendedor_id).first()
-            vendedor = vendor.email if vendor else "Unknown"
+            vendedor = ctx.user_email(vendedor_id)
             vendor_stats[vendedor_id] = _init_vendor_stat(vendedor_id, vendedor)
             
             # Solo contar abonos en el periodo (no anticipos)
-            todos_abonos = db.query(CreditPayment).filter(
-                CreditPayment.apartado_id == apartado.id,
-                CreditPayment.notes != "Anticipo inicial"
-            ).all()
+            todos_abonos = [p for p in ctx.abonos_apartado(apartado.id) if is_abono(p)]
             
             # Solo excluir el último abono si el apartado está pagado (fue el abono liquidante)
             if todos_abonos and apartado.credit_status == 'pagado':
@@ -1383,11 +1279,10 @@ def _build_vendor_stats(
     for pedido in pedidos_pendientes:
         if pedido.user_id:
             if pedido.user_id not in vendor_stats:
-                vendor = db.query(User).filter(User.id == pedido.user_id).first()
-                vendedor = vendor.email if vendor else "Unknown"
+                vendedor = ctx.user_email(pedido.user_id)
                 vendor_stats[pedido.user_id] = _init_vendor_stat(pedido.user_id, vendedor)
             
-            pagos_todos = db.query(PagoPedido).filter(PagoPedido.pedido_id == pedido.id).all()
+            pagos_todos = ctx.pagos_pedido(pedido.id)
             
             anticipos_pagos = [p for p in pagos_todos if p.tipo_pago == 'anticipo']
             anticipos_totals = _calculate_payment_totals(anticipos_pagos)
@@ -1399,10 +1294,7 @@ def _build_vendor_stats(
             vendor_stats[pedido.user_id]["venta_total_pasiva"] += anticipo_neto
             
             # Abonos de pedidos: obtener todos los abonos del pedido
-            todos_abonos = db.query(PagoPedido).filter(
-                PagoPedido.pedido_id == pedido.id,
-                PagoPedido.tipo_pago == 'saldo'
-            ).all()
+            todos_abonos = ctx.pagos_pedido(pedido.id, 'saldo')
             
             # Solo excluir el último abono si el pedido está pagado (fue el abono liquidante)
             if todos_abonos and pedido.estado == 'pagado':
@@ -1433,14 +1325,16 @@ def _build_vendor_stats(
             vendor_stats[pedido.user_id]["cuentas_por_cobrar"] += float(pedido.saldo_pendiente)
     
     # También incluir pedidos que tienen abonos en el periodo pero fueron creados fuera del periodo
-    pedidos_con_abonos = db.query(Pedido).join(PagoPedido).filter(
-        Pedido.tenant_id == tenant.id,
-        Pedido.tipo_pedido == 'apartado',
-        ~Pedido.estado.in_(['pagado', 'entregado', 'cancelado']),
-        PagoPedido.tipo_pago == 'saldo',
-        PagoPedido.created_at >= start_datetime,
-        PagoPedido.created_at <= end_datetime
-    ).distinct().all()
+    pedidos_con_abonos = [
+        p for p in _distinct_by_id(
+            ctx.pedido(pago.pedido_id)
+            for pago in ctx.pagos_pedido_periodo
+            if pago.tipo_pago == 'saldo'
+        )
+        if p.tipo_pedido == 'apartado'
+        and p.estado is not None
+        and p.estado not in ('pagado', 'entregado', 'cancelado')
+    ]
     
     pedidos_ids_procesados = {p.id for p in pedidos_pendientes}
     for pedido in pedidos_con_abonos:
@@ -1449,15 +1343,11 @@ def _build_vendor_stats(
         
         if pedido.user_id:
             if pedido.user_id not in vendor_stats:
-                vendor = db.query(User).filter(User.id == pedido.user_id).first()
-                vendedor = vendor.email if vendor else "Unknown"
+                vendedor = ctx.user_email(pedido.user_id)
                 vendor_stats[pedido.user_id] = _init_vendor_stat(pedido.user_id, vendedor)
             
             # Solo contar abonos en el periodo (no anticipos)
-            todos_abonos = db.query(PagoPedido).filter(
-                PagoPedido.pedido_id == pedido.id,
-                PagoPedido.tipo_pago == 'saldo'
-            ).all()
+            todos_abonos = ctx.pagos_pedido(pedido.id, 'saldo')
             
             # Solo excluir el último abono si el pedido está pagado (fue el abono liquidante)
             if todos_abonos and pedido.estado == 'pagado':
@@ -1487,21 +1377,10 @@ def _build_vendor_stats(
                 vendor_stats[pedido.user_id]["venta_total_pasiva"] += abonos_neto
     
     # Calculate productos liquidados for new Apartado schema
-    apartados_pagados = db.query(Apartado).filter(
-        Apartado.tenant_id == tenant.id,
-        Apartado.credit_status.in_(["pagado", "entregado"])
-    ).all()
-    
-    for apartado in apartados_pagados:
+    # (el contexto solo trae apartados pagados cuyo último abono cae cerca del periodo)
+    for apartado in ctx.apartados_pagados:
         # FIX: Incluir pagos con notes NULL o diferentes de "Anticipo inicial"
-        # En SQL, NULL != "valor" devuelve NULL, por lo que se excluyen los pagos sin notes
-        pagos = db.query(CreditPayment).filter(
-            CreditPayment.apartado_id == apartado.id,
-            or_(
-                CreditPayment.notes.is_(None),
-            CreditPayment.notes != "Anticipo inicial"
-            )
-        ).all()
+        pagos = [p for p in ctx.abonos_apartado(apartado.id) if not is_anticipo_inicial(p)]
         
         if not pagos:
             continue
@@ -1517,8 +1396,7 @@ def _build_vendor_stats(
             vendedor = "Mostrador"
             referencia_usuario = vendedor_id if vendedor_id else None
             if referencia_usuario:
-                vendor = db.query(User).filter(User.id == referencia_usuario).first()
-                vendedor = vendor.email if vendor else "Unknown"
+                vendedor = ctx.user_email(referencia_usuario)
             vendor_stats[vendedor_id] = _init_vendor_stat(vendedor_id, vendedor)
         
         monto_neto = _calculate_net_payment_amount(
@@ -1553,17 +1431,8 @@ def _build_vendor_stats(
             # Mantener fecha_datetime para futuras comparaciones
             vendor_stats[vendedor_id]["ultimo_abono_apartado"]["fecha_datetime"] = fecha_ultimo_abono
     
-    pedidos_pagados = db.query(Pedido).filter(
-        Pedido.tenant_id == tenant.id,
-        Pedido.tipo_pedido == 'apartado',
-        Pedido.estado.in_(['pagado', 'entregado'])
-    ).all()
-    
-    for pedido in pedidos_pagados:
-        abonos = db.query(PagoPedido).filter(
-            PagoPedido.pedido_id == pedido.id,
-            PagoPedido.tipo_pago.in_(['saldo', 'total'])
-        ).all()
+    for pedido in ctx.pedidos_pagados:
+        abonos = ctx.pagos_pedido(pedido.id, 'saldo', 'total')
         
         if not abonos:
             continue
@@ -1579,8 +1448,7 @@ def _build_vendor_stats(
             vendedor = "Mostrador"
             referencia_usuario = pedido.user_id or pedido.vendedor_id
             if referencia_usuario:
-                user = db.query(User).filter(User.id == referencia_usuario).first()
-                vendedor = user.email if user else "Unknown"
+                vendedor = ctx.user_email(referencia_usuario)
             vendor_stats[vendedor_id] = _init_vendor_stat(vendedor_id, vendedor)
         
         monto_neto = _calculate_net_payment_amount(
@@ -1667,17 +1535,13 @@ def _build_dashboard_data(
     ventas_liquidacion: Dict[str, Any],
     pedidos_contado: List[Pedido],
     pedidos_liquidados: List[Pedido],
-    db: Session,  # Agregar parámetros
-    tenant: Tenant,
-    start_datetime: datetime,
-    end_datetime: datetime,
+    ctx: CorteContext,
     pedidos_pendientes: List[Pedido]
 ) -> Dict[str, Any]:
     """Build dashboard data structure with all metrics and historiales."""
     # CORRECCIÓN: Procesar historiales PRIMERO para actualizar contadores
     historiales = _build_historiales(
-        db, tenant, start_datetime, end_datetime, counters,
-        pedidos_liquidados, pedidos_pendientes
+        ctx, counters, pedidos_liquidados, pedidos_pendientes
     )
     
     # Calculate pedidos_contado totals
@@ -2008,10 +1872,7 @@ def _build_dashboard_data(
 
 
 def _build_historiales(
-    db: Session,
-    tenant: Tenant,
-    start_datetime: datetime,
-    end_datetime: datetime,
+    ctx: CorteContext,
     counters: Dict[str, Any],
     pedidos_liquidados: List[Pedido],
     pedidos_pendientes: List[Pedido]
@@ -2028,15 +1889,14 @@ def _build_historiales(
     for pedido in pedidos_liquidados:
         vendedor = "Unknown"
         if pedido.user_id:
-            vendor = db.query(User).filter(User.id == pedido.user_id).first()
-            vendedor = vendor.email if vendor else "Unknown"
+            vendedor = ctx.user_email(pedido.user_id)
         
         total_pedido = get_pedido_total_with_vip_discount(pedido)
         anticipo_pedido = float(pedido.anticipo_pagado)
         saldo_pedido = float(pedido.saldo_pendiente)
         
         # Obtener items del pedido
-        pedido_items = db.query(PedidoItem).filter(PedidoItem.pedido_id == pedido.id).all()
+        pedido_items = ctx.items_pedido(pedido.id)
         
         if pedido_items:
             # Calcular costo y ganancia totales
@@ -2045,7 +1905,7 @@ def _build_historiales(
             cantidad_total = 0
             for item in pedido_items:
                 if item.producto_pedido_id:
-                    producto = db.query(ProductoPedido).filter(ProductoPedido.id == item.producto_pedido_id).first()
+                    producto = ctx.producto_pedido(item.producto_pedido_id)
                     if producto:
                         costo_unitario = float(producto.cost_price or 0)
                         cantidad = int(item.cantidad or 1)
@@ -2080,7 +1940,7 @@ def _build_historiales(
                 producto_name = item.nombre or item.modelo or "Sin nombre"
                 
                 if item.producto_pedido_id:
-                    producto = db.query(ProductoPedido).filter(ProductoPedido.id == item.producto_pedido_id).first()
+                    producto = ctx.producto_pedido(item.producto_pedido_id)
                     if producto:
                         codigo = producto.codigo if producto.codigo else (item.codigo if item.codigo else 'N/A')
                         producto_name = producto.modelo if producto.modelo else producto_name
@@ -2116,7 +1976,7 @@ def _build_historiales(
                 })
         else:
             # Si no tiene items, usar producto_pedido_id (comportamiento anterior)
-            producto = db.query(ProductoPedido).filter(ProductoPedido.id == pedido.producto_pedido_id).first()
+            producto = ctx.producto_pedido(pedido.producto_pedido_id)
             producto_name = producto.modelo if producto else "Producto desconocido"
             codigo_producto = producto.codigo if producto else "N/A"
             
@@ -2149,15 +2009,14 @@ def _build_historiales(
     for pedido in pedidos_pendientes:
         vendedor = "Unknown"
         if pedido.user_id:
-            vendor = db.query(User).filter(User.id == pedido.user_id).first()
-            vendedor = vendor.email if vendor else "Unknown"
+            vendedor = ctx.user_email(pedido.user_id)
         
         total_pedido = get_pedido_total_with_vip_discount(pedido)
         anticipo_pedido = float(pedido.anticipo_pagado)
         saldo_pedido = float(pedido.saldo_pendiente)
         
         # Obtener items del pedido
-        pedido_items = db.query(PedidoItem).filter(PedidoItem.pedido_id == pedido.id).all()
+        pedido_items = ctx.items_pedido(pedido.id)
         
         if pedido_items:
             # Calcular costo y ganancia totales
@@ -2166,7 +2025,7 @@ def _build_historiales(
             cantidad_total = 0
             for item in pedido_items:
                 if item.producto_pedido_id:
-                    producto = db.query(ProductoPedido).filter(ProductoPedido.id == item.producto_pedido_id).first()
+                    producto = ctx.producto_pedido(item.producto_pedido_id)
                     if producto:
                         costo_unitario = float(producto.cost_price or 0)
                         cantidad = int(item.cantidad or 1)
@@ -2201,7 +2060,7 @@ def _build_historiales(
                 producto_name = item.nombre or item.modelo or "Sin nombre"
                 
                 if item.producto_pedido_id:
-                    producto = db.query(ProductoPedido).filter(ProductoPedido.id == item.producto_pedido_id).first()
+                    producto = ctx.producto_pedido(item.producto_pedido_id)
                     if producto:
                         codigo = producto.codigo if producto.codigo else (item.codigo if item.codigo else 'N/A')
                         producto_name = producto.modelo if producto.modelo else producto_name
@@ -2237,7 +2096,7 @@ def _build_historiales(
                 })
         else:
             # Si no tiene items, usar producto_pedido_id (comportamiento anterior)
-            producto = db.query(ProductoPedido).filter(ProductoPedido.id == pedido.producto_pedido_id).first()
+            producto = ctx.producto_pedido(pedido.producto_pedido_id)
             producto_name = producto.modelo if producto else "Producto desconocido"
             codigo_producto = producto.codigo if producto else "N/A"
             
@@ -2267,25 +2126,23 @@ def _build_historiales(
             })
     
     # Historial de apartados activos (nuevo esquema)
-    apartados_activos = db.query(Apartado).filter(
-        Apartado.tenant_id == tenant.id,
-        Apartado.created_at >= start_datetime,
-        Apartado.created_at <= end_datetime,
-        ~Apartado.credit_status.in_(['cancelado', 'vencido'])
-    ).order_by(Apartado.created_at.desc()).all()
+    # NOT IN de SQL: credit_status NULL tampoco entra
+    apartados_activos = _latest_first(
+        a for a in ctx.apartados_periodo
+        if a.credit_status is not None and a.credit_status not in ('cancelado', 'vencido')
+    )
     
     for apartado in apartados_activos:
         vendedor = "Unknown"
         if apartado.vendedor_id:
-            vendor = db.query(User).filter(User.id == apartado.vendedor_id).first()
-            vendedor = vendor.email if vendor else "Unknown"
+            vendedor = ctx.user_email(apartado.vendedor_id)
 
         total_apartado = get_total_with_vip_discount(apartado)
         anticipo_apartado = float(apartado.amount_paid or 0)
         saldo_apartado = total_apartado - anticipo_apartado
         
         # Obtener items del apartado
-        items = db.query(ItemApartado).filter(ItemApartado.apartado_id == apartado.id).all()
+        items = ctx.items_apartado(apartado.id)
         
         # Si no hay items, crear una entrada con total del apartado
         if not items:
@@ -2309,7 +2166,7 @@ def _build_historiales(
             ganancia_total = 0.0
             for item in items:
                 if item.product_id:
-                    product = db.query(Product).filter(Product.id == item.product_id).first()
+                    product = ctx.product(item.product_id)
                     if product:
                         costo_unitario = float(product.cost_price or 0)
                         cantidad = int(item.quantity or 0)
@@ -2340,7 +2197,7 @@ def _build_historiales(
                 ganancia_item = 0.0
                 
                 if item.product_id:
-                    product = db.query(Product).filter(Product.id == item.product_id).first()
+                    product = ctx.product(item.product_id)
                     if product:
                         # Priorizar código del producto, luego del item
                         codigo = product.codigo if product.codigo else (item.codigo if item.codigo else 'N/A')
@@ -2377,18 +2234,15 @@ def _build_historiales(
                 })
     
     # Apartados cancelados y vencidos (nuevo esquema Apartado)
-    apartados_nuevos_cancelados_vencidos = db.query(Apartado).filter(
-        Apartado.tenant_id == tenant.id,
-        Apartado.created_at >= start_datetime,
-        Apartado.created_at <= end_datetime,
-        Apartado.credit_status.in_(['cancelado', 'vencido'])
-    ).order_by(Apartado.created_at.desc()).all()
+    apartados_nuevos_cancelados_vencidos = _latest_first(
+        a for a in ctx.apartados_periodo
+        if a.credit_status in ('cancelado', 'vencido')
+    )
 
     for ap in apartados_nuevos_cancelados_vencidos:
         vendedor = "Unknown"
         if ap.vendedor_id:
-            vendor = db.query(User).filter(User.id == ap.vendedor_id).first()
-            vendedor = vendor.email if vendor else "Unknown"
+            vendedor = ctx.user_email(ap.vendedor_id)
 
         total_apartado = float(ap.total or 0)
         anticipo_apartado = float(ap.amount_paid or 0)
@@ -2396,10 +2250,10 @@ def _build_historiales(
         motivo = "Vencido" if ap.credit_status == "vencido" else "Cancelado"
 
         # Obtener items del apartado
-        items = db.query(ItemApartado).filter(ItemApartado.apartado_id == ap.id).all()
+        items = ctx.items_apartado(ap.id)
 
         # Para el nuevo esquema, todos los pagos (anticipos+abonos) viven en credit_payments.apartado_id
-        abonos_apartado = db.query(CreditPayment).filter(CreditPayment.apartado_id == ap.id).all()
+        abonos_apartado = ctx.abonos_apartado(ap.id)
         abonos_efectivo = sum(
             float(p.amount) for p in abonos_apartado
             if p.payment_method in ['efectivo', 'cash', 'transferencia']
@@ -2448,7 +2302,7 @@ def _build_historiales(
             ganancia_total = 0.0
             for item in items:
                 if item.product_id:
-                    product = db.query(Product).filter(Product.id == item.product_id).first()
+                    product = ctx.product(item.product_id)
                     if product:
                         costo_unitario = float(product.cost_price or 0)
                         cantidad = int(item.quantity or 0)
@@ -2480,7 +2334,7 @@ def _build_historiales(
                 ganancia_item = 0.0
                 
                 if item.product_id:
-                    product = db.query(Product).filter(Product.id == item.product_id).first()
+                    product = ctx.product(item.product_id)
                     if product:
                         # Priorizar código del producto, luego del item
                         codigo = product.codigo if product.codigo else (item.codigo if item.codigo else 'N/A')
@@ -2518,28 +2372,22 @@ def _build_historiales(
                 })
     
     # Historial de abonos de apartados: filtrar por fecha de creación del abono
-    todos_abonos_apartados = db.query(CreditPayment).filter(
-        CreditPayment.tenant_id == tenant.id,
-        CreditPayment.apartado_id.isnot(None),  # Solo abonos del nuevo esquema
-        CreditPayment.created_at >= start_datetime,
-        CreditPayment.created_at <= end_datetime
-    ).order_by(CreditPayment.created_at.desc()).all()
+    todos_abonos_apartados = ctx.abonos_apartados_periodo  # Ya ordenados por fecha desc
     
     for abono in todos_abonos_apartados:
-        apartado = db.query(Apartado).filter(Apartado.id == abono.apartado_id).first() if abono.apartado_id else None
+        apartado = ctx.apartado(abono.apartado_id) if abono.apartado_id else None
         vendedor = "Unknown"
         if abono.user_id:
-            vendor = db.query(User).filter(User.id == abono.user_id).first()
-            vendedor = vendor.email if vendor else "Unknown"
+            vendedor = ctx.user_email(abono.user_id)
         
         # Obtener códigos de productos del apartado
         codigo_producto = "N/A"
         if apartado:
-            items = db.query(ItemApartado).filter(ItemApartado.apartado_id == apartado.id).all()
+            items = ctx.items_apartado(apartado.id)
             codigos = []
             for item in items:
                 if item.product_id:
-                    product = db.query(Product).filter(Product.id == item.product_id).first()
+                    product = ctx.product(item.product_id)
                     if product:
                         # Priorizar código del producto, luego del item
                         codigo = product.codigo if product.codigo else (item.codigo if item.codigo else 'N/A')
@@ -2563,25 +2411,23 @@ def _build_historiales(
         })
     
     # Historial de abonos de pedidos: solo pedidos CREADOS en el periodo
-    todos_abonos_pedidos = db.query(PagoPedido).join(Pedido).filter(
-        Pedido.tenant_id == tenant.id,
-        Pedido.created_at >= start_datetime,
-        Pedido.created_at <= end_datetime,
-        PagoPedido.tipo_pago == 'saldo'
-    ).order_by(PagoPedido.created_at.desc()).all()
+    todos_abonos_pedidos = _latest_first(
+        pago
+        for pedido in ctx.pedidos_periodo
+        for pago in ctx.pagos_pedido(pedido.id, 'saldo')
+    )
     
     for abono in todos_abonos_pedidos:
-        pedido = db.query(Pedido).filter(Pedido.id == abono.pedido_id).first()
+        pedido = ctx.pedido(abono.pedido_id)
         vendedor = "Unknown"
         producto_name = "Desconocido"
         codigo_producto = "N/A"
         
         if pedido:
             if pedido.user_id:
-                vendor = db.query(User).filter(User.id == pedido.user_id).first()
-                vendedor = vendor.email if vendor else "Unknown"
+                vendedor = ctx.user_email(pedido.user_id)
             
-            producto = db.query(ProductoPedido).filter(ProductoPedido.id == pedido.producto_pedido_id).first()
+            producto = ctx.producto_pedido(pedido.producto_pedido_id)
             producto_name = producto.modelo if producto else "Producto desconocido"
             codigo_producto = producto.codigo if producto else "N/A"
         
@@ -2597,24 +2443,15 @@ def _build_historiales(
         })
     
     # Pedidos cancelados y vencidos
-    pedidos_cancelados_vencidos_query = db.query(Pedido).filter(
-        Pedido.tenant_id == tenant.id,
-        Pedido.created_at >= start_datetime,
-        Pedido.created_at <= end_datetime,
-        or_(
-            Pedido.estado == 'cancelado',
-            and_(
-                Pedido.tipo_pedido == 'apartado',
-                Pedido.estado == 'vencido'
-            )
-        )
-    ).order_by(Pedido.created_at.desc()).all()
+    pedidos_cancelados_vencidos_query = _latest_first(
+        p for p in ctx.pedidos_periodo
+        if p.estado == 'cancelado' or (p.tipo_pedido == 'apartado' and p.estado == 'vencido')
+    )
     
     for pedido in pedidos_cancelados_vencidos_query:
         vendedor = "Unknown"
         if pedido.user_id:
-            vendor = db.query(User).filter(User.id == pedido.user_id).first()
-            vendedor = vendor.email if vendor else "Unknown"
+            vendedor = ctx.user_email(pedido.user_id)
         
         total_pedido = get_pedido_total_with_vip_discount(pedido)
         anticipo_pedido = float(pedido.anticipo_pagado)
@@ -2622,7 +2459,7 @@ def _build_historiales(
         motivo = "Vencido" if pedido.estado == "vencido" else "Cancelado"
         
         # IMPORTANTE: Calcular métricas ANTES de desglosar items (no modificar estas métricas)
-        pagos_pedido_all = db.query(PagoPedido).filter(PagoPedido.pedido_id == pedido.id).all()
+        pagos_pedido_all = ctx.pagos_pedido(pedido.id)
         pagos_totals = _calculate_payment_totals(pagos_pedido_all)
         pagos_efectivo = pagos_totals['efectivo']
         pagos_tarjeta = pagos_totals['tarjeta']
@@ -2647,7 +2484,7 @@ def _build_historiales(
                 counters['piezas_vencidas_pedidos_apartados'] += pedido.cantidad or 0
         
         # Obtener items del pedido
-        pedido_items = db.query(PedidoItem).filter(PedidoItem.pedido_id == pedido.id).all()
+        pedido_items = ctx.items_pedido(pedido.id)
         
         if pedido_items:
             # Calcular costo y ganancia totales
@@ -2656,7 +2493,7 @@ def _build_historiales(
             cantidad_total = 0
             for item in pedido_items:
                 if item.producto_pedido_id:
-                    producto = db.query(ProductoPedido).filter(ProductoPedido.id == item.producto_pedido_id).first()
+                    producto = ctx.producto_pedido(item.producto_pedido_id)
                     if producto:
                         costo_unitario = float(producto.cost_price or 0)
                         cantidad = int(item.cantidad or 1)
@@ -2692,7 +2529,7 @@ def _build_historiales(
                 producto_name = item.nombre or item.modelo or "Sin nombre"
                 
                 if item.producto_pedido_id:
-                    producto = db.query(ProductoPedido).filter(ProductoPedido.id == item.producto_pedido_id).first()
+                    producto = ctx.producto_pedido(item.producto_pedido_id)
                     if producto:
                         codigo = producto.codigo if producto.codigo else (item.codigo if item.codigo else 'N/A')
                         producto_name = producto.modelo if producto.modelo else producto_name
@@ -2729,7 +2566,7 @@ def _build_historiales(
                 })
         else:
             # Si no tiene items, usar producto_pedido_id (comportamiento anterior)
-            producto = db.query(ProductoPedido).filter(ProductoPedido.id == pedido.producto_pedido_id).first()
+            producto = ctx.producto_pedido(pedido.producto_pedido_id)
             producto_name = producto.modelo if producto else "Producto desconocido"
             codigo_producto = producto.codigo if producto else "N/A"
             
@@ -2770,12 +2607,9 @@ def _build_historiales(
 
 
 def _build_sales_details(
-    db: Session,
+    ctx: CorteContext,
     ventas_contado: List[VentasContado],
     pedidos_contado: List[Pedido],
-    tenant: Tenant,
-    start_datetime: datetime,
-    end_datetime: datetime
 ) -> List[Dict[str, Any]]:
     """Build sales details list."""
     sales_details = []
@@ -2784,15 +2618,14 @@ def _build_sales_details(
     for venta in ventas_contado:
         vendedor = "Mostrador"
         if venta.vendedor_id:
-            vendor = db.query(User).filter(User.id == venta.vendedor_id).first()
-            vendedor = vendor.email if vendor else "Unknown"
+            vendedor = ctx.user_email(venta.vendedor_id)
         
-        payments = db.query(Payment).filter(Payment.venta_contado_id == venta.id).all()
+        payments = ctx.pagos_venta(venta.id)
         efectivo_amount = sum(float(p.amount) for p in payments if p.method in ['efectivo', 'cash', 'transferencia'])
         tarjeta_amount = sum(float(p.amount) for p in payments if p.method in ['tarjeta', 'card'])
         
         # Obtener items de la venta
-        items = db.query(ItemVentaContado).filter(ItemVentaContado.venta_id == venta.id).all()
+        items = ctx.items_venta(venta.id)
         
         # Si no hay items, crear una entrada con total de la venta
         if not items:
@@ -2819,7 +2652,7 @@ def _build_sales_details(
             piezas_total = sum(int(item.quantity or 0) for item in items)
             for item in items:
                 if item.product_id:
-                    product = db.query(Product).filter(Product.id == item.product_id).first()
+                    product = ctx.product(item.product_id)
                     if product:
                         costo_unitario = float(product.cost_price or 0)
                         cantidad = int(item.quantity or 0)
@@ -2853,7 +2686,7 @@ def _build_sales_details(
                 cantidad = int(item.quantity or 0)
                 
                 if item.product_id:
-                    product = db.query(Product).filter(Product.id == item.product_id).first()
+                    product = ctx.product(item.product_id)
                     if product:
                         # Priorizar código del producto, luego del item
                         codigo = product.codigo if product.codigo else (item.codigo if item.codigo else 'N/A')
@@ -2901,22 +2734,19 @@ def _build_sales_details(
                 })
     
     for pedido in pedidos_contado:
-        pagos_pedido_contado = db.query(PagoPedido).filter(
-            PagoPedido.pedido_id == pedido.id
-        ).all()
+        pagos_pedido_contado = ctx.pagos_pedido(pedido.id)
         
         efectivo_pedido = sum(float(p.monto) for p in pagos_pedido_contado if p.metodo_pago in ['efectivo', 'transferencia'])
         tarjeta_pedido = sum(float(p.monto) for p in pagos_pedido_contado if p.metodo_pago == 'tarjeta')
         
         vendedor = "Unknown"
         if pedido.user_id:
-            vendor = db.query(User).filter(User.id == pedido.user_id).first()
-            vendedor = vendor.email if vendor else "Unknown"
+            vendedor = ctx.user_email(pedido.user_id)
         
         total_pedido = get_pedido_total_with_vip_discount(pedido)
         
         # Obtener items del pedido
-        pedido_items = db.query(PedidoItem).filter(PedidoItem.pedido_id == pedido.id).all()
+        pedido_items = ctx.items_pedido(pedido.id)
         
         if pedido_items:
             # Calcular costo y ganancia totales
@@ -2925,7 +2755,7 @@ def _build_sales_details(
             piezas_total = 0
             for item in pedido_items:
                 if item.producto_pedido_id:
-                    producto = db.query(ProductoPedido).filter(ProductoPedido.id == item.producto_pedido_id).first()
+                    producto = ctx.producto_pedido(item.producto_pedido_id)
                     if producto:
                         costo_unitario = float(producto.cost_price or 0)
                         cantidad = int(item.cantidad or 1)
@@ -2963,7 +2793,7 @@ def _build_sales_details(
                 cantidad = int(item.cantidad or 1)
                 
                 if item.producto_pedido_id:
-                    producto = db.query(ProductoPedido).filter(ProductoPedido.id == item.producto_pedido_id).first()
+                    producto = ctx.producto_pedido(item.producto_pedido_id)
                     if producto:
                         codigo = producto.codigo if producto.codigo else (item.codigo if item.codigo else 'N/A')
                         producto_name = producto.modelo if producto.modelo else producto_name
@@ -3009,7 +2839,7 @@ def _build_sales_details(
                 })
         else:
             # Si no tiene items, usar producto_pedido_id (comportamiento anterior)
-            producto = db.query(ProductoPedido).filter(ProductoPedido.id == pedido.producto_pedido_id).first()
+            producto = ctx.producto_pedido(pedido.producto_pedido_id)
             producto_name = producto.modelo if producto else "Producto desconocido"
             codigo_producto = producto.codigo if producto else "N/A"
             
@@ -3043,31 +2873,20 @@ def _build_sales_details(
     return sales_details
 
 
-def _build_piezas_recibidas(
-    db: Session,
-    tenant: Tenant,
-    start_datetime: datetime,
-    end_datetime: datetime
-) -> List[Dict[str, Any]]:
+def _build_piezas_recibidas(ctx: CorteContext) -> List[Dict[str, Any]]:
     """Build list of received pieces (piezas recibidas)."""
     piezas_recibidas = []
     
     # Obtener pedidos con estado "recibido" creados en el periodo
-    pedidos_recibidos = db.query(Pedido).filter(
-        Pedido.tenant_id == tenant.id,
-        Pedido.estado == 'recibido',
-        Pedido.created_at >= start_datetime,
-        Pedido.created_at <= end_datetime
-    ).all()
+    pedidos_recibidos = [p for p in ctx.pedidos_periodo if p.estado == 'recibido']
     
     for pedido in pedidos_recibidos:
         # Obtener items del pedido
-        pedido_items = db.query(PedidoItem).filter(PedidoItem.pedido_id == pedido.id).all()
+        pedido_items = ctx.items_pedido(pedido.id)
         
         vendedor = "Unknown"
         if pedido.user_id:
-            vendor = db.query(User).filter(User.id == pedido.user_id).first()
-            vendedor = vendor.email if vendor else "Unknown"
+            vendedor = ctx.user_email(pedido.user_id)
         
         if pedido_items:
             # Si tiene items múltiples
@@ -3091,7 +2910,7 @@ def _build_piezas_recibidas(
                 })
         else:
             # Fallback: usar producto_pedido_id si no hay items
-            producto = db.query(ProductoPedido).filter(ProductoPedido.id == pedido.producto_pedido_id).first()
+            producto = ctx.producto_pedido(pedido.producto_pedido_id)
             producto_name = producto.nombre or producto.modelo if producto else "Producto desconocido"
             
             piezas_recibidas.append({
@@ -3115,45 +2934,34 @@ def _build_piezas_recibidas(
     return piezas_recibidas
 
 
-def _build_piezas_solicitadas_cliente(
-    db: Session,
-    tenant: Tenant,
-    start_datetime: datetime,
-    end_datetime: datetime
-) -> List[Dict[str, Any]]:
+def _build_piezas_solicitadas_cliente(ctx: CorteContext) -> List[Dict[str, Any]]:
     """Build list of pieces requested by clients (anticipos pedidos apartados)."""
     piezas_solicitadas = []
     
     # Obtener pedidos apartados con estado "pendiente" y con anticipo pagado
     # Filtrar por fecha de creación del anticipo (PagoPedido.created_at)
-    pedidos_apartados_ids = db.query(PagoPedido.pedido_id).join(Pedido).filter(
-        Pedido.tenant_id == tenant.id,
-        Pedido.tipo_pedido == 'apartado',
-        Pedido.estado == 'pendiente',
-        PagoPedido.tipo_pago == 'anticipo',
-        PagoPedido.created_at >= start_datetime,
-        PagoPedido.created_at <= end_datetime
-    ).distinct().all()
-    
-    pedidos_apartados_ids_list = [id for id, in pedidos_apartados_ids]
-    pedidos_apartados = db.query(Pedido).filter(
-        Pedido.id.in_(pedidos_apartados_ids_list)
-    ).all() if pedidos_apartados_ids_list else []
+    pedidos_apartados = sorted(
+        (
+            p for p in _distinct_by_id(
+                ctx.pedido(pago.pedido_id)
+                for pago in ctx.pagos_pedido_periodo
+                if pago.tipo_pago == 'anticipo'
+            )
+            if p.tipo_pedido == 'apartado' and p.estado == 'pendiente'
+        ),
+        key=lambda p: p.id,
+    )
     
     for pedido in pedidos_apartados:
         # Obtener items del pedido
-        pedido_items = db.query(PedidoItem).filter(PedidoItem.pedido_id == pedido.id).all()
+        pedido_items = ctx.items_pedido(pedido.id)
         
         vendedor = "Unknown"
         if pedido.user_id:
-            vendor = db.query(User).filter(User.id == pedido.user_id).first()
-            vendedor = vendor.email if vendor else "Unknown"
+            vendedor = ctx.user_email(pedido.user_id)
         
         # Obtener anticipos pagados
-        anticipos = db.query(PagoPedido).filter(
-            PagoPedido.pedido_id == pedido.id,
-            PagoPedido.tipo_pago == 'anticipo'
-        ).all()
+        anticipos = ctx.pagos_pedido(pedido.id, 'anticipo')
         
         anticipo_efectivo = sum(float(p.monto) for p in anticipos if p.metodo_pago in ['efectivo', 'transferencia'])
         anticipo_tarjeta = sum(float(p.monto) for p in anticipos if p.metodo_pago == 'tarjeta')
@@ -3184,7 +2992,7 @@ def _build_piezas_solicitadas_cliente(
                 })
         else:
             # Fallback: usar producto_pedido_id si no hay items
-            producto = db.query(ProductoPedido).filter(ProductoPedido.id == pedido.producto_pedido_id).first()
+            producto = ctx.producto_pedido(pedido.producto_pedido_id)
             producto_name = producto.nombre or producto.modelo if producto else "Producto desconocido"
             
             piezas_solicitadas.append({
@@ -3212,31 +3020,20 @@ def _build_piezas_solicitadas_cliente(
     return piezas_solicitadas
 
 
-def _build_piezas_pedidas_proveedor(
-    db: Session,
-    tenant: Tenant,
-    start_datetime: datetime,
-    end_datetime: datetime
-) -> List[Dict[str, Any]]:
+def _build_piezas_pedidas_proveedor(ctx: CorteContext) -> List[Dict[str, Any]]:
     """Build list of pieces ordered to suppliers (pedidas a proveedores)."""
     piezas_pedidas = []
     
     # Obtener pedidos con estado "pedidas" que fueron pedidos al proveedor
-    pedidos_proveedor = db.query(Pedido).filter(
-        Pedido.tenant_id == tenant.id,
-        Pedido.estado == 'pedidas',
-        Pedido.created_at >= start_datetime,
-        Pedido.created_at <= end_datetime
-    ).all()
+    pedidos_proveedor = [p for p in ctx.pedidos_periodo if p.estado == 'pedidas']
     
     for pedido in pedidos_proveedor:
         # Obtener items del pedido
-        pedido_items = db.query(PedidoItem).filter(PedidoItem.pedido_id == pedido.id).all()
+        pedido_items = ctx.items_pedido(pedido.id)
         
         vendedor = "Unknown"
         if pedido.user_id:
-            vendor = db.query(User).filter(User.id == pedido.user_id).first()
-            vendedor = vendor.email if vendor else "Unknown"
+            vendedor = ctx.user_email(pedido.user_id)
         
         if pedido_items:
             # Si tiene items múltiples
@@ -3262,7 +3059,7 @@ def _build_piezas_pedidas_proveedor(
                 })
         else:
             # Fallback: usar producto_pedido_id si no hay items
-            producto = db.query(ProductoPedido).filter(ProductoPedido.id == pedido.producto_pedido_id).first()
+            producto = ctx.producto_pedido(pedido.producto_pedido_id)
             producto_name = producto.nombre or producto.modelo if producto else "Producto desconocido"
             
             piezas_pedidas.append({
@@ -3288,66 +3085,28 @@ def _build_piezas_pedidas_proveedor(
     return piezas_pedidas
 
 
-def _calculate_additional_metrics(
-    db: Session,
-    tenant: Tenant,
-    start_datetime: datetime,
-    end_datetime: datetime
-) -> Dict[str, int]:
+def _calculate_additional_metrics(ctx: CorteContext) -> Dict[str, int]:
     """Calculate additional metrics."""
-    num_solicitudes_apartado = db.query(Apartado).filter(
-        Apartado.tenant_id == tenant.id,
-        Apartado.created_at >= start_datetime,
-        Apartado.created_at <= end_datetime
-    ).count()
+    apartados = ctx.apartados_periodo
+    pedidos = ctx.pedidos_periodo
     
-    num_pedidos_hechos = db.query(Pedido).filter(
-        Pedido.tenant_id == tenant.id,
-        Pedido.created_at >= start_datetime,
-        Pedido.created_at <= end_datetime
-    ).count()
-    
-    num_apartados_vencidos = db.query(Apartado).filter(
-        Apartado.tenant_id == tenant.id,
-        Apartado.created_at >= start_datetime,
-        Apartado.created_at <= end_datetime,
-        Apartado.credit_status == "vencido"
-    ).count()
+    num_solicitudes_apartado = len(apartados)
+    num_pedidos_hechos = len(pedidos)
+    num_apartados_vencidos = sum(1 for a in apartados if a.credit_status == "vencido")
     
-    num_pedidos_vencidos = db.query(Pedido).filter(
-        Pedido.tenant_id == tenant.id,
-        Pedido.created_at <= end_datetime,
+    # Sin límite inferior de fecha: incluye pedidos vencidos creados antes del periodo
+    num_pedidos_vencidos = ctx.db.query(Pedido).filter(
+        Pedido.tenant_id == ctx.tenant.id,
+        Pedido.created_at <= ctx.end_datetime,
         Pedido.tipo_pedido == 'apartado',
         Pedido.estado == "vencido"
     ).count()
     
-    num_cancelaciones = db.query(Pedido).filter(
-        Pedido.tenant_id == tenant.id,
-        Pedido.created_at >= start_datetime,
-        Pedido.created_at <= end_datetime,
-        Pedido.estado == "cancelado"
-    ).count()
-    
-    num_cancelaciones += db.query(Apartado).filter(
-        Apartado.tenant_id == tenant.id,
-        Apartado.created_at >= start_datetime,
-        Apartado.created_at <= end_datetime,
-        Apartado.credit_status == "cancelado"
-    ).count()
+    num_cancelaciones = sum(1 for p in pedidos if p.estado == "cancelado")
+    num_cancelaciones += sum(1 for a in apartados if a.credit_status == "cancelado")
     
-    num_abonos_apartados = db.query(CreditPayment).filter(
-        CreditPayment.tenant_id == tenant.id,
-        CreditPayment.apartado_id.isnot(None),  # Solo abonos del nuevo esquema
-        CreditPayment.created_at >= start_datetime,
-        CreditPayment.created_at <= end_datetime
-    ).count()
-    
-    num_abonos_pedidos = db.query(PagoPedido).join(Pedido).filter(
-        Pedido.tenant_id == tenant.id,
-        Pedido.created_at >= start_datetime,
-        Pedido.created_at <= end_datetime,
-        PagoPedido.tipo_pago == 'saldo'
-    ).count()
+    num_abonos_apartados = len(ctx.abonos_apartados_periodo)
+    num_abonos_pedidos = sum(len(ctx.pagos_pedido(p.id, 'saldo')) for p in pedidos)
     
     return {
         'num_solicitudes_apartado': num_solicitudes_apartado,
@@ -3363,7 +3122,7 @@ def _calculate_additional_metrics(
 def _build_daily_summaries(
     ventas_contado: List[VentasContado],
     pedidos_contado: List[Pedido],
-    db: Session
+    ctx: CorteContext
 ) -> List[Dict[str, Any]]:
     """Build daily summaries."""
     daily_stats = {}
@@ -3396,9 +3155,7 @@ def _build_daily_summaries(
             }
         
         # Calcular costo del pedido
-        producto = db.query(ProductoPedido).filter(
-            ProductoPedido.id == pedido.producto_pedido_id
-        ).first()
+        producto = ctx.producto_pedido(pedido.producto_pedido_id)
         if producto and producto.cost_price:
             costo_pedido = float(producto.cost_price) * pedido.cantidad
             daily_stats[sale_date]["costo"] += costo_pedido
@@ -3414,10 +3171,7 @@ def _build_daily_summaries(
 
 
 def _build_resumen_ventas_activas(
-    db: Session,
-    tenant: Tenant,
-    start_datetime: datetime,
-    end_datetime: datetime,
+    ctx: CorteContext,
     pedidos_contado: List[Pedido]
 ) -> List[Dict[str, Any]]:
     """Build resumen de ventas activas."""
@@ -3429,14 +3183,8 @@ def _build_resumen_ventas_activas(
     ventas_contado_tarjeta_count = 0
     ventas_contado_tarjeta_bruto = 0.0
     
-    ventas_contado_query = db.query(VentasContado).filter(
-        VentasContado.tenant_id == tenant.id,
-        VentasContado.created_at >= start_datetime,
-        VentasContado.created_at <= end_datetime
-    ).all()
-    
-    for venta in ventas_contado_query:
-        pagos = db.query(Payment).filter(Payment.venta_contado_id == venta.id).all()
+    for venta in ctx.ventas_contado:
+        pagos = ctx.pagos_venta(venta.id)
         for pago in pagos:
             if pago.method in ['efectivo', 'cash', 'transferencia']:
                 ventas_contado_efectivo_count += 1
@@ -3452,7 +3200,7 @@ def _build_resumen_ventas_activas(
     pedidos_contado_tarjeta_bruto = 0.0
     
     for pedido in pedidos_contado:
-        pagos = db.query(PagoPedido).filter(PagoPedido.pedido_id == pedido.id).all()
+        pagos = ctx.pagos_pedido(pedido.id)
         for pago in pagos:
             if pago.metodo_pago in EFECTIVO_METHODS:
                 pedidos_contado_efectivo_count += 1
@@ -3509,191 +3257,35 @@ def _build_resumen_ventas_activas(
     return resumen_ventas_activas
 
 
-def _build_resumen_pagos(
-    db: Session,
-    tenant: Tenant,
-    start_datetime: datetime,
-    end_datetime: datetime,
-    apartados_pendientes: List[Apartado],  # Cambiado de List[Sale] a List[Apartado]
-    pedidos_pendientes: List[Pedido]
-) -> List[Dict[str, Any]]:
-    """Build resumen de pagos (ventas pasivas)."""
+def _build_resumen_pagos(pagos: PagosPendientes) -> List[Dict[str, Any]]:
+    """Build resumen de pagos (ventas pasivas) a partir de _aggregate_pending_payments."""
     resumen_pagos = []
     
-    # Anticipos de apartados
-    anticipos_apart_efectivo_count = 0
-    anticipos_apart_efectivo_bruto = 0.0
-    anticipos_apart_tarjeta_count = 0
-    anticipos_apart_tarjeta_bruto = 0.0
-    
-    # Abonos de apartados
-    abonos_apart_efectivo_count = 0
-    abonos_apart_efectivo_bruto = 0.0
-    abonos_apart_tarjeta_count = 0
-    abonos_apart_tarjeta_bruto = 0.0
-    
-    # Anticipos de pedidos apartados
-    anticipos_ped_efectivo_count = 0
-    anticipos_ped_efectivo_bruto = 0.0
-    anticipos_ped_tarjeta_count = 0
-    anticipos_ped_tarjeta_bruto = 0.0
-    
-    # Abonos de pedidos apartados
-    abonos_ped_efectivo_count = 0
-    abonos_ped_efectivo_bruto = 0.0
-    abonos_ped_tarjeta_count = 0
-    abonos_ped_tarjeta_bruto = 0.0
-    
-    # Contar anticipos de apartados pendientes
-    for apartado in apartados_pendientes:
-        # Buscar anticipos iniciales en CreditPayment con notes="Anticipo inicial"
-        pagos_iniciales = db.query(CreditPayment).filter(
-            CreditPayment.apartado_id == apartado.id,
-            CreditPayment.notes == "Anticipo inicial"
-        ).all()
-        for pago in pagos_iniciales:
-            if pago.payment_method in ['efectivo', 'cash', 'transferencia']:
-                anticipos_apart_efectivo_count += 1
-                anticipos_apart_efectivo_bruto += float(pago.amount)
-            elif pago.payment_method in ['tarjeta', 'card']:
-                anticipos_apart_tarjeta_count += 1
-                anticipos_apart_tarjeta_bruto += float(pago.amount)
-    
-    # Contar abonos de apartados pendientes
-    for apartado in apartados_pendientes:
-        # Buscar abonos (excluyendo anticipo inicial)
-        abonos = db.query(CreditPayment).filter(
-            CreditPayment.apartado_id == apartado.id,
-            CreditPayment.notes != "Anticipo inicial"
-        ).all()
-        for abono in abonos:
-            if abono.payment_method in ['efectivo', 'cash', 'transferencia']:
-                abonos_apart_efectivo_count += 1
-                abonos_apart_efectivo_bruto += float(abono.amount)
-            elif abono.payment_method in ['tarjeta', 'card']:
-                abonos_apart_tarjeta_count += 1
-                abonos_apart_tarjeta_bruto += float(abono.amount)
-    
-    # Contar anticipos de pedidos apartados pendientes
-    for pedido in pedidos_pendientes:
-        pagos_anticipo = db.query(PagoPedido).filter(
-            PagoPedido.pedido_id == pedido.id,
-            PagoPedido.tipo_pago == 'anticipo'
-        ).all()
-        for pago in pagos_anticipo:
-            if pago.metodo_pago in EFECTIVO_METHODS:
-                anticipos_ped_efectivo_count += 1
-                anticipos_ped_efectivo_bruto += float(pago.monto)
-            elif pago.metodo_pago == TARJETA_METHOD:
-                anticipos_ped_tarjeta_count += 1
-                anticipos_ped_tarjeta_bruto += float(pago.monto)
-    
-    # Contar abonos de pedidos apartados pendientes
-    for pedido in pedidos_pendientes:
-        pagos_abono = db.query(PagoPedido).filter(
-            PagoPedido.pedido_id == pedido.id,
-            PagoPedido.tipo_pago == 'saldo'
-        ).all()
-        for pago in pagos_abono:
-            if pago.metodo_pago in EFECTIVO_METHODS:
-                abonos_ped_efectivo_count += 1
-                abonos_ped_efectivo_bruto += float(pago.monto)
-            elif pago.metodo_pago == TARJETA_METHOD:
-                abonos_ped_tarjeta_count += 1
-                abonos_ped_tarjeta_bruto += float(pago.monto)
-    
     # Construir la tabla de resumen con subtotales
-    # Anticipos de apartado
-    resumen_pagos.append({
-        "tipo_movimiento": "Anticipo de apartado",
-        "metodo_pago": "Efectivo",
-        "cantidad_operaciones": anticipos_apart_efectivo_count,
-        "subtotal": anticipos_apart_efectivo_bruto,
-        "total": anticipos_apart_efectivo_bruto
-    })
-    resumen_pagos.append({
-        "tipo_movimiento": "Anticipo de apartado",
-        "metodo_pago": "Tarjeta",
-        "cantidad_operaciones": anticipos_apart_tarjeta_count,
-        "subtotal": anticipos_apart_tarjeta_bruto,
-        "total": anticipos_apart_tarjeta_bruto * TARJETA_DISCOUNT_RATE
-    })
-    resumen_pagos.append({
-        "tipo_movimiento": "Anticipo de apartado",
-        "metodo_pago": "SUBTOTAL",
-        "cantidad_operaciones": anticipos_apart_efectivo_count + anticipos_apart_tarjeta_count,
-        "subtotal": anticipos_apart_efectivo_bruto + anticipos_apart_tarjeta_bruto,
-        "total": anticipos_apart_efectivo_bruto + (anticipos_apart_tarjeta_bruto * TARJETA_DISCOUNT_RATE)
-    })
-    
-    # Abonos de apartado
-    resumen_pagos.append({
-        "tipo_movimiento": "Abono de apartado",
-        "metodo_pago": "Efectivo",
-        "cantidad_operaciones": abonos_apart_efectivo_count,
-        "subtotal": abonos_apart_efectivo_bruto,
-        "total": abonos_apart_efectivo_bruto
-    })
-    resumen_pagos.append({
-        "tipo_movimiento": "Abono de apartado",
-        "metodo_pago": "Tarjeta",
-        "cantidad_operaciones": abonos_apart_tarjeta_count,
-        "subtotal": abonos_apart_tarjeta_bruto,
-        "total": abonos_apart_tarjeta_bruto * TARJETA_DISCOUNT_RATE
-    })
-    resumen_pagos.append({
-        "tipo_movimiento": "Abono de apartado",
-        "metodo_pago": "SUBTOTAL",
-        "cantidad_operaciones": abonos_apart_efectivo_count + abonos_apart_tarjeta_count,
-        "subtotal": abonos_apart_efectivo_bruto + abonos_apart_tarjeta_bruto,
-        "total": abonos_apart_efectivo_bruto + (abonos_apart_tarjeta_bruto * TARJETA_DISCOUNT_RATE)
-    })
-    
-    # Anticipos de pedido apartado
-    resumen_pagos.append({
-        "tipo_movimiento": "Anticipo de pedido apartado",
-        "metodo_pago": "Efectivo",
-        "cantidad_operaciones": anticipos_ped_efectivo_count,
-        "subtotal": anticipos_ped_efectivo_bruto,
-        "total": anticipos_ped_efectivo_bruto
-    })
-    resumen_pagos.append({
-        "tipo_movimiento": "Anticipo de pedido apartado",
-        "metodo_pago": "Tarjeta",
-        "cantidad_operaciones": anticipos_ped_tarjeta_count,
-        "subtotal": anticipos_ped_tarjeta_bruto,
-        "total": anticipos_ped_tarjeta_bruto * TARJETA_DISCOUNT_RATE
-    })
-    resumen_pagos.append({
-        "tipo_movimiento": "Anticipo de pedido apartado",
-        "metodo_pago": "SUBTOTAL",
-        "cantidad_operaciones": anticipos_ped_efectivo_count + anticipos_ped_tarjeta_count,
-        "subtotal": anticipos_ped_efectivo_bruto + anticipos_ped_tarjeta_bruto,
-        "total": anticipos_ped_efectivo_bruto + (anticipos_ped_tarjeta_bruto * TARJETA_DISCOUNT_RATE)
-    })
-    
-    # Abonos de pedido apartado
-    resumen_pagos.append({
-        "tipo_movimiento": "Abono de pedido apartado",
-        "metodo_pago": "Efectivo",
-        "cantidad_operaciones": abonos_ped_efectivo_count,
-        "subtotal": abonos_ped_efectivo_bruto,
-        "total": abonos_ped_efectivo_bruto
-    })
-    resumen_pagos.append({
-        "tipo_movimiento": "Abono de pedido apartado",
-        "metodo_pago": "Tarjeta",
-        "cantidad_operaciones": abonos_ped_tarjeta_count,
-        "subtotal": abonos_ped_tarjeta_bruto,
-        "total": abonos_ped_tarjeta_bruto * TARJETA_DISCOUNT_RATE
-    })
-    resumen_pagos.append({
-        "tipo_movimiento": "Abono de pedido apartado",
-        "metodo_pago": "SUBTOTAL",
-        "cantidad_operaciones": abonos_ped_efectivo_count + abonos_ped_tarjeta_count,
-        "subtotal": abonos_ped_efectivo_bruto + abonos_ped_tarjeta_bruto,
-        "total": abonos_ped_efectivo_bruto + (abonos_ped_tarjeta_bruto * TARJETA_DISCOUNT_RATE)
-    })
+    for movimiento, tipo_movimiento in MOVIMIENTOS_PAGOS:
+        efectivo = pagos[(movimiento, 'efectivo')]
+        tarjeta = pagos[(movimiento, 'tarjeta')]
+        resumen_pagos.append({
+            "tipo_movimiento": tipo_movimiento,
+            "metodo_pago": "Efectivo",
+            "cantidad_operaciones": efectivo['count'],
+            "subtotal": efectivo['bruto'],
+            "total": efectivo['neto']
+        })
+        resumen_pagos.append({
+            "tipo_movimiento": tipo_movimiento,
+            "metodo_pago": "Tarjeta",
+            "cantidad_operaciones": tarjeta['count'],
+            "subtotal": tarjeta['bruto'],
+            "total": tarjeta['neto']
+        })
+        resumen_pagos.append({
+            "tipo_movimiento": tipo_movimiento,
+            "metodo_pago": "SUBTOTAL",
+            "cantidad_operaciones": efectivo['count'] + tarjeta['count'],
+            "subtotal": efectivo['bruto'] + tarjeta['bruto'],
+            "total": efectivo['neto'] + tarjeta['neto']
+        })
     
     return resumen_pagos
 
@@ -3738,6 +3330,26 @@ def _calculate_payment_totals_by_method(pagos: List[Any], method_attr: str = 'me
     return {'efectivo': efectivo, 'tarjeta': tarjeta}
 
 
+def _latest_first(rows: Iterable[Any]) -> List[Any]:
+    """Ordena por created_at descendente (como ORDER BY created_at DESC; NULL al final)."""
+    rows = list(rows)
+    with_date = [r for r in rows if r.created_at is not None]
+    without_date = [r for r in rows if r.created_at is None]
+    return sorted(with_date, key=lambda r: r.created_at, reverse=True) + without_date
+
+
+def _distinct_by_id(rows: Iterable[Any]) -> List[Any]:
+    """Elimina duplicados (y None) conservando el primer orden de aparición."""
+    seen = set()
+    result = []
+    for row in rows:
+        if row is None or row.id in seen:
+            continue
+        seen.add(row.id)
+        result.append(row)
+    return result
+
+
 _MEXICO_TZ = timezone(timedelta(hours=-6))
 
 
@@ -3786,13 +3398,10 @@ def _build_piezas_por_nombre(resumen_piezas: List[Dict[str, Any]]) -> Dict[str,
 
 
 def _build_resumen_piezas(
-    db: Session,
+    ctx: CorteContext,
     apartados_pendientes: List[Apartado],
     pedidos_pendientes: List[Pedido],
     pedidos_liquidados: List[Pedido],
-    tenant: Tenant,
-    start_datetime: datetime,
-    end_datetime: datetime
 ) -> List[dict]:
     """
     Build summary of pieces by product (name, model, quilataje).
@@ -3803,16 +3412,10 @@ def _build_resumen_piezas(
     resumen_piezas_dict: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
 
     # Procesar VentasContado (nuevo esquema)
-    ventas_contado = db.query(VentasContado).filter(
-        VentasContado.tenant_id == tenant.id,
-        VentasContado.created_at >= start_datetime,
-        VentasContado.created_at <= end_datetime
-    ).all()
-    
-    for venta in ventas_contado:
-        items = db.query(ItemVentaContado).filter(ItemVentaContado.venta_id == venta.id).all()
+    for venta in ctx.ventas_contado:
+        items = ctx.items_venta(venta.id)
         for item in items:
-            product = db.query(Product).filter(Product.id == item.product_id).first()
+            product = ctx.product(item.product_id)
             if not product:
                 continue
             key = (product.name or "Sin nombre", product.modelo or "N/A", product.quilataje or "N/A")
@@ -3832,9 +3435,9 @@ def _build_resumen_piezas(
 
     # Process pending apartados (nuevo esquema)
     for apartado in apartados_pendientes:
-        items = db.query(ItemApartado).filter(ItemApartado.apartado_id == apartado.id).all()
+        items = ctx.items_apartado(apartado.id)
         for item in items:
-            product = db.query(Product).filter(Product.id == item.product_id).first()
+            product = ctx.product(item.product_id)
             if not product:
                 continue
             key = (product.name or "Sin nombre", product.modelo or "N/A", product.quilataje or "N/A")
@@ -3853,17 +3456,15 @@ def _build_resumen_piezas(
             resumen_piezas_dict[key]["piezas_apartadas"] += int(item.quantity or 0)
 
     # Process liquidated apartados (nuevo esquema)
-    apartados_liquidados = db.query(Apartado).filter(
-        Apartado.tenant_id == tenant.id,
-        Apartado.credit_status.in_(['pagado', 'entregado']),
-        Apartado.created_at >= start_datetime,
-        Apartado.created_at <= end_datetime
-    ).all()
+    apartados_liquidados = [
+        a for a in ctx.apartados_periodo
+        if a.credit_status in ('pagado', 'entregado')
+    ]
     
     for apartado in apartados_liquidados:
-        items = db.query(ItemApartado).filter(ItemApartado.apartado_id == apartado.id).all()
+        items = ctx.items_apartado(apartado.id)
         for item in items:
-            product = db.query(Product).filter(Product.id == item.product_id).first()
+            product = ctx.product(item.product_id)
             if not product:
                 continue
             key = (product.name or "Sin nombre", product.modelo or "N/A", product.quilataje or "N/A")
@@ -3886,7 +3487,7 @@ def _build_resumen_piezas(
     # Estos son pedidos con anticipo, por lo que se suman a piezas_pedidas
     for pedido in pedidos_pendientes:
         # Obtener items del pedido (puede tener múltiples items)
-        pedido_items = db.query(PedidoItem).filter(PedidoItem.pedido_id == pedido.id).all()
+        pedido_items = ctx.items_pedido(pedido.id)
         
         if pedido_items:
             # Si tiene items, usar los items
@@ -3913,7 +3514,7 @@ def _build_resumen_piezas(
                 resumen_piezas_dict[key]["piezas_pedidas"] += item.cantidad
         else:
             # Fallback: usar producto_pedido_id si no hay items (compatibilidad hacia atrás)
-            producto = db.query(ProductoPedido).filter(ProductoPedido.id == pedido.producto_pedido_id).first()
+            producto = ctx.producto_pedido(pedido.producto_pedido_id)
             if not producto:
                 continue
             key = (producto.nombre or producto.modelo or "Sin nombre", producto.modelo or "N/A", producto.quilataje or "N/A")
@@ -3935,7 +3536,7 @@ def _build_resumen_piezas(
     # Estos pedidos se suman solo a piezas_liquidadas
     for pedido in pedidos_liquidados:
         # Obtener items del pedido (puede tener múltiples items)
-        pedido_items = db.query(PedidoItem).filter(PedidoItem.pedido_id == pedido.id).all()
+        pedido_items = ctx.items_pedido(pedido.id)
         
         if pedido_items:
             # Si tiene items, usar los items
@@ -3963,7 +3564,7 @@ def _build_resumen_piezas(
                 resumen_piezas_dict[key]["piezas_liquidadas"] += item.cantidad
         else:
             # Fallback: usar producto_pedido_id si no hay items (compatibilidad hacia atrás)
-            producto = db.query(ProductoPedido).filter(ProductoPedido.id == pedido.producto_pedido_id).first()
+            producto = ctx.producto_pedido(pedido.producto_pedido_id)
             if not producto:
                 continue
             key = (producto.nombre or producto.modelo or "Sin nombre", producto.modelo or "N/A", producto.quilataje or "N/A")
@@ -0,0 +1,402 @@
+"""
+Contexto precargado para el corte de caja.
+
+get_detailed_corte_caja recorre las mismas ventas, apartados y pedidos desde
+muchos helpers distintos. En lugar de que cada helper consulte producto,
+usuario, items o pagos fila por fila, CorteContext.load() trae todo lo que el
+reporte necesita en un número acotado de consultas masivas (IN por lotes) y
+expone diccionarios indexados por id.
+
+Los conjuntos del periodo se cargan con los mismos filtros SQL que usaban los
+helpers; los subconjuntos por estado se derivan en Python respetando la
+semántica de NULL de SQL (``x != 'a'`` y ``NOT IN`` excluyen NULL).
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from app.models.tenant import Tenant
+from app.models.user import User
+from app.models.product import Product
+from app.models.payment import Payment
+from app.models.credit_payment import CreditPayment
+from app.models.producto_pedido import Pedido, PagoPedido, ProductoPedido, PedidoItem
+from app.models.venta_contado import VentasContado, ItemVentaContado
+from app.models.apartado import Apartado, ItemApartado
+
+ANTICIPO_INICIAL_NOTE = "Anticipo inicial"
+
+# Tamaño máximo de cada lista IN (...); mantiene los parámetros por debajo del
+# límite de SQLite y las sentencias de Postgres en un tamaño razonable.
+IN_CHUNK_SIZE = 5000
+
+# Margen para el prefiltro SQL de "último abono en el periodo". La comprobación
+# exacta se hace en Python con _normalize_datetime (que interpreta las fechas
+# naive como hora de México), así que basta con un margen mayor a 6 horas.
+_LAST_PAYMENT_MARGIN = timedelta(days=1)
+
+
+def _chunks(ids: Iterable[int], size: int = IN_CHUNK_SIZE) -> Iterable[List[int]]:
+    ordered = sorted(set(ids))
+    for i in range(0, len(ordered), size):
+        yield ordered[i:i + size]
+
+
+def is_anticipo_inicial(pago: CreditPayment) -> bool:
+    """Equivalente a ``CreditPayment.notes == 'Anticipo inicial'``."""
+    return pago.notes == ANTICIPO_INICIAL_NOTE
+
+
+def is_abono(pago: CreditPayment) -> bool:
+    """Equivalente SQL de ``CreditPayment.notes != 'Anticipo inicial'`` (NULL no cumple)."""
+    return pago.notes is not None and pago.notes != ANTICIPO_INICIAL_NOTE
+
+
+class CorteContext:
+    """Datos del corte de caja cargados una sola vez por reporte."""
+
+    def __init__(
+        self,
+        db: Session,
+        tenant: Tenant,
+        start_datetime: datetime,
+        end_datetime: datetime,
+    ) -> None:
+        self.db = db
+        self.tenant = tenant
+        self.start_datetime = start_datetime
+        self.end_datetime = end_datetime
+
+        # Conjuntos del periodo
+        self.ventas_contado: List[VentasContado] = []
+        self.apartados_periodo: List[Apartado] = []
+        self.apartados_liquidados: List[Apartado] = []
+        self.apartados_pagados: List[Apartado] = []
+        self.abonos_apartados_periodo: List[CreditPayment] = []
+        self.pedidos_periodo: List[Pedido] = []
+        self.pedidos_liquidados: List[Pedido] = []
+        self.pedidos_pagados: List[Pedido] = []
+        self.pagos_pedido_periodo: List[PagoPedido] = []
+
+        # Índices por id
+        self._apartados: Dict[int, Optional[Apartado]] = {}
+        self._pedidos: Dict[int, Optional[Pedido]] = {}
+        self._products: Dict[int, Optional[Product]] = {}
+        self._productos_pedido: Dict[int, Optional[ProductoPedido]] = {}
+        self._users: Dict[int, Optional[User]] = {}
+        self._items_venta: Dict[int, List[ItemVentaContado]] = {}
+        self._pagos_venta: Dict[int, List[Payment]] = {}
+        self._items_apartado: Dict[int, List[ItemApartado]] = {}
+        self._abonos_apartado: Dict[int, List[CreditPayment]] = {}
+        self._items_pedido: Dict[int, List[PedidoItem]] = {}
+        self._pagos_pedido: Dict[int, List[PagoPedido]] = {}
+
+    # ------------------------------------------------------------------
+    # Carga
+    # ------------------------------------------------------------------
+    @classmethod
+    def load(
+        cls,
+        db: Session,
+        tenant: Tenant,
+        start_datetime: datetime,
+        end_datetime: datetime,
+    ) -> "CorteContext":
+        ctx = cls(db, tenant, start_datetime, end_datetime)
+        ctx._load_periodo()
+        ctx._load_children()
+        ctx._load_references()
+        return ctx
+
+    def _load_periodo(self) -> None:
+        db, tenant = self.db, self.tenant
+        start, end = self.start_datetime, self.end_datetime
+
+        self.ventas_contado = db.query(VentasContado).filter(
+            VentasContado.tenant_id == tenant.id,
+            VentasContado.created_at >= start,
+            VentasContado.created_at <= end,
+        ).order_by(VentasContado.id).all()
+
+        self.apartados_periodo = db.query(Apartado).filter(
+            Apartado.tenant_id == tenant.id,
+            Apartado.created_at >= start,
+            Apartado.created_at <= end,
+        ).order_by(Apartado.id).all()
+
+        # Apartados liquidados: fecha del último pago (momento de liquidación)
+        last_payment_subq = (
+            db.query(
+                CreditPayment.apartado_id.label("apartado_id"),
+                func.max(CreditPayment.created_at).label("last_payment_at"),
+            )
+            .filter(CreditPayment.apartado_id.isnot(None))
+            .group_by(CreditPayment.apartado_id)
+            .subquery()
+        )
+        self.apartados_liquidados = (
+            db.query(Apartado)
+            .join(last_payment_subq, last_payment_subq.c.apartado_id == Apartado.id)
+            .filter(
+                Apartado.tenant_id == tenant.id,
+                Apartado.credit_status.in_(['pagado', 'entregado']),
+                last_payment_subq.c.last_payment_at >= start,
+                last_payment_subq.c.last_payment_at <= end,
+            )
+            .order_by(Apartado.id)
+            .all()
+        )
+
+        # Apartados pagados cuyo último abono (sin anticipo inicial) cae cerca del periodo;
+        # _build_vendor_stats hace la comparación exacta.
+        last_abono_subq = (
+            db.query(
+                CreditPayment.apartado_id.label("apartado_id"),
+                func.max(CreditPayment.created_at).label("last_payment_at"),
+            )
+            .filter(
+                CreditPayment.apartado_id.isnot(None),
+                or_(
+                    CreditPayment.notes.is_(None),
+                    CreditPayment.notes != ANTICIPO_INICIAL_NOTE,
+                ),
+            )
+            .group_by(CreditPayment.apartado_id)
+            .subquery()
+        )
+        self.apartados_pagados = (
+            db.query(Apartado)
+            .join(last_abono_subq, last_abono_subq.c.apartado_id == Apartado.id)
+            .filter(
+                Apartado.tenant_id == tenant.id,
+                Apartado.credit_status.in_(["pagado", "entregado"]),
+                last_abono_subq.c.last_payment_at >= start - _LAST_PAYMENT_MARGIN,
+                last_abono_subq.c.last_payment_at <= end + _LAST_PAYMENT_MARGIN,
+            )
+            .order_by(Apartado.id)
+            .all()
+        )
+
+        self.abonos_apartados_periodo = db.query(CreditPayment).filter(
+            CreditPayment.tenant_id == tenant.id,
+            CreditPayment.apartado_id.isnot(None),
+            CreditPayment.created_at >= start,
+            CreditPayment.created_at <= end,
+        ).order_by(CreditPayment.created_at.desc()).all()
+
+        self.pedidos_periodo = db.query(Pedido).filter(
+            Pedido.tenant_id == tenant.id,
+            Pedido.created_at >= start,
+            Pedido.created_at <= end,
+        ).order_by(Pedido.id).all()
+
+        # Pedidos liquidados: fecha del último pago tipo saldo/total
+        pagos_saldo_subq = (
+            db.query(
+                PagoPedido.pedido_id.label("pedido_id"),
+                func.max(PagoPedido.created_at).label("last_payment_at"),
+            )
+            .filter(PagoPedido.tipo_pago.in_(['saldo', 'total']))
+            .group_by(PagoPedido.pedido_id)
+            .subquery()
+        )
+        self.pedidos_liquidados = (
+            db.query(Pedido)
+            .join(pagos_saldo_subq, pagos_saldo_subq.c.pedido_id == Pedido.id)
+            .filter(
+                Pedido.tenant_id == tenant.id,
+                Pedido.tipo_pedido == 'apartado',
+                Pedido.estado == 'pagado',
+                pagos_saldo_subq.c.last_payment_at >= start,
+                pagos_saldo_subq.c.last_payment_at <= end,
+            )
+            .order_by(Pedido.id)
+            .all()
+        )
+
+        # Candidatos para productos liquidados por vendedor (comparación exacta en
+        # _build_vendor_stats)
+        self.pedidos_pagados = (
+            db.query(Pedido)
+            .join(pagos_saldo_subq, pagos_saldo_subq.c.pedido_id == Pedido.id)
+            .filter(
+                Pedido.tenant_id == tenant.id,
+                Pedido.tipo_pedido == 'apartado',
+                Pedido.estado.in_(['pagado', 'entregado']),
+                pagos_saldo_subq.c.last_payment_at >= start - _LAST_PAYMENT_MARGIN,
+                pagos_saldo_subq.c.last_payment_at <= end + _LAST_PAYMENT_MARGIN,
+            )
+            .order_by(Pedido.id)
+            .all()
+        )
+
+        self.pagos_pedido_periodo = db.query(PagoPedido).join(Pedido).filter(
+            Pedido.tenant_id == tenant.id,
+            PagoPedido.created_at >= start,
+            PagoPedido.created_at <= end,
+        ).order_by(PagoPedido.created_at.desc()).all()
+
+        for apartado in (
+            self.apartados_periodo + self.apartados_liquidados + self.apartados_pagados
+        ):
+            self._apartados[apartado.id] = apartado
+        for pedido in self.pedidos_periodo + self.pedidos_liquidados + self.pedidos_pagados:
+            self._pedidos[pedido.id] = pedido
+
+        # Apartados/pedidos creados fuera del periodo que recibieron pagos en él
+        self._load_apartados(a.apartado_id for a in self.abonos_apartados_periodo)
+        self._load_pedidos(p.pedido_id for p in self.pagos_pedido_periodo)
+
+    def _load_apartados(self, ids: Iterable[Optional[int]]) -> None:
+        missing = {i for i in ids if i is not None and i not in self._apartados}
+        for chunk in _chunks(missing):
+            for apartado in self.db.query(Apartado).filter(Apartado.id.in_(chunk)).all():
+                self._apartados[apartado.id] = apartado
+        for i in missing:
+            self._apartados.setdefault(i, None)
+
+    def _load_pedidos(self, ids: Iterable[Optional[int]]) -> None:
+        missing = {i for i in ids if i is not None and i not in self._pedidos}
+        for chunk in _chunks(missing):
+            for pedido in self.db.query(Pedido).filter(Pedido.id.in_(chunk)).all():
+                self._pedidos[pedido.id] = pedido
+        for i in missing:
+            self._pedidos.setdefault(i, None)
+
+    def _load_children(self) -> None:
+        venta_ids = [v.id for v in self.ventas_contado]
+        self._items_venta = self._group(
+            venta_ids, ItemVentaContado, ItemVentaContado.venta_id, 'venta_id'
+        )
+        self._pagos_venta = self._group(
+            venta_ids, Payment, Payment.venta_contado_id, 'venta_contado_id'
+        )
+
+        apartado_ids = [i for i, a in self._apartados.items() if a is not None]
+        self._items_apartado = self._group(
+            apartado_ids, ItemApartado, ItemApartado.apartado_id, 'apartado_id'
+        )
+        self._abonos_apartado = self._group(
+            apartado_ids, CreditPayment, CreditPayment.apartado_id, 'apartado_id'
+        )
+
+        pedido_ids = [i for i, p in self._pedidos.items() if p is not None]
+        self._items_pedido = self._group(
+            pedido_ids, PedidoItem, PedidoItem.pedido_id, 'pedido_id'
+        )
+        self._pagos_pedido = self._group(
+            pedido_ids, PagoPedido, PagoPedido.pedido_id, 'pedido_id'
+        )
+
+    def _group(self, parent_ids: List[int], model: Any, fk_column: Any, fk_attr: str) -> Dict[int, list]:
+        grouped: Dict[int, list] = {parent_id: [] for parent_id in parent_ids}
+        for chunk in _chunks(parent_ids):
+            rows = self.db.query(model).filter(fk_column.in_(chunk)).order_by(model.id).all()
+            for row in rows:
+                grouped[getattr(row, fk_attr)].append(row)
+        return grouped
+
+    def _load_references(self) -> None:
+        product_ids = set()
+        for items in list(self._items_venta.values()) + list(self._items_apartado.values()):
+            product_ids.update(it.product_id for it in items if it.product_id)
+        self._products = self._index(Product, product_ids)
+
+        producto_pedido_ids = {
+            p.producto_pedido_id for p in self._pedidos.values()
+            if p is not None and p.producto_pedido_id
+        }
+        for items in self._items_pedido.values():
+            producto_pedido_ids.update(
+                it.producto_pedido_id for it in items if it.producto_pedido_id
+            )
+        self._productos_pedido = self._index(ProductoPedido, producto_pedido_ids)
+
+        user_ids = set()
+        for venta in self.ventas_contado:
+            user_ids.add(venta.vendedor_id)
+        for apartado in self._apartados.values():
+            if apartado is not None:
+                user_ids.update((apartado.vendedor_id, apartado.user_id))
+        for pedido in self._pedidos.values():
+            if pedido is not None:
+                user_ids.add(pedido.user_id)
+        for abonos in self._abonos_apartado.values():
+            user_ids.update(a.user_id for a in abonos)
+        user_ids.update(a.user_id for a in self.abonos_apartados_periodo)
+        self._users = self._index(User, {i for i in user_ids if i})
+
+    def _index(self, model: Any, ids: Iterable[int]) -> Dict[int, Any]:
+        ids = set(ids)
+        index: Dict[int, Any] = {i: None for i in ids}
+        for chunk in _chunks(ids):
+            for row in self.db.query(model).filter(model.id.in_(chunk)).all():
+                index[row.id] = row
+        return index
+
+    # ------------------------------------------------------------------
+    # Búsquedas. Si un id no fue precargado se consulta y se guarda, de modo
+    # que un helper nuevo nunca obtiene un resultado distinto al de la BD.
+    # ------------------------------------------------------------------
+    def _get(self, index: Dict[int, Any], model: Any, obj_id: Optional[int]) -> Any:
+        if obj_id is None:
+            return None
+        if obj_id not in index:
+            index[obj_id] = self.db.query(model).filter(model.id == obj_id).first()
+        return index[obj_id]
+
+    def _children(
+        self, index: Dict[int, list], model: Any, fk_column: Any, parent_id: Optional[int]
+    ) -> list:
+        if parent_id is None:
+            return []
+        if parent_id not in index:
+            index[parent_id] = (
+                self.db.query(model).filter(fk_column == parent_id).order_by(model.id).all()
+            )
+        return index[parent_id]
+
+    def user(self, user_id: Optional[int]) -> Optional[User]:
+        return self._get(self._users, User, user_id)
+
+    def user_email(self, user_id: Optional[int], default: str = "Unknown") -> str:
+        """Email del usuario o ``"Unknown"`` si no existe (como hacían los helpers)."""
+        user = self.user(user_id)
+        return user.email if user else default
+
+    def product(self, product_id: Optional[int]) -> Optional[Product]:
+        return self._get(self._products, Product, product_id)
+
+    def producto_pedido(self, producto_pedido_id: Optional[int]) -> Optional[ProductoPedido]:
+        return self._get(self._productos_pedido, ProductoPedido, producto_pedido_id)
+
+    def apartado(self, apartado_id: Optional[int]) -> Optional[Apartado]:
+        return self._get(self._apartados, Apartado, apartado_id)
+
+    def pedido(self, pedido_id: Optional[int]) -> Optional[Pedido]:
+        return self._get(self._pedidos, Pedido, pedido_id)
+
+    def items_venta(self, venta_id: int) -> List[ItemVentaContado]:
+        return self._children(self._items_venta, ItemVentaContado, ItemVentaContado.venta_id, venta_id)
+
+    def pagos_venta(self, venta_id: int) -> List[Payment]:
+        return self._children(self._pagos_venta, Payment, Payment.venta_contado_id, venta_id)
+
+    def items_apartado(self, apartado_id: int) -> List[ItemApartado]:
+        return self._children(self._items_apartado, ItemApartado, ItemApartado.apartado_id, apartado_id)
+
+    def abonos_apartado(self, apartado_id: int) -> List[CreditPayment]:
+        """Todos los CreditPayment del apartado (anticipo inicial incluido)."""
+        return self._children(self._abonos_apartado, CreditPayment, CreditPayment.apartado_id, apartado_id)
+
+    def items_pedido(self, pedido_id: int) -> List[PedidoItem]:
+        return self._children(self._items_pedido, PedidoItem, PedidoItem.pedido_id, pedido_id)
+
+    def pagos_pedido(self, pedido_id: int, *tipos: str) -> List[PagoPedido]:
+        """PagoPedido del pedido, opcionalmente filtrados por tipo_pago."""
+        pagos = self._children(self._pagos_pedido, PagoPedido, PagoPedido.pedido_id, pedido_id)
+        if tipos:
+            return [p for p in pagos if p.tipo_pago in tipos]
+        return pagos
@@ -0,0 +1,129 @@
+"""
+Listado de apartados a crédito (pantalla de abonos).
+
+- filtered_query(): filtros del lado del servidor (estado, vendedor, rango de fechas,
+  teléfono del cliente).
+- list_page(): una página por llave (created_at desc, id desc) con cursor opaco.
+- serialize(): abonos y correos de vendedores de toda la página en una consulta IN cada
+  uno (antes eran dos consultas por apartado).
+- totals(): totales de todo el conjunto filtrado en una consulta agrupada por estado.
+"""
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Query, Session
+
+from app.models.apartado import Apartado
+from app.models.credit_payment import CreditPayment
+from app.models.user import User
+from app.services import pagination
+
+
+def filtered_query(
+    db: Session,
+    tenant_id: int,
+    status: Optional[str] = None,
+    vendedor_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    customer_phone: Optional[str] = None,
+) -> Query:
+    query = db.query(Apartado).filter(Apartado.tenant_id == tenant_id)
+    if status:
+        query = query.filter(Apartado.credit_status == status)
+    if vendedor_id:
+        query = query.filter(Apartado.vendedor_id == vendedor_id)
+    if date_from:
+        query = query.filter(Apartado.created_at >= datetime.combine(date_from, dt_time.min))
+    if date_to:
+        query = query.filter(Apartado.created_at < datetime.combine(date_to + timedelta(days=1), dt_time.min))
+    if customer_phone:
+        query = query.filter(Apartado.customer_phone.contains(customer_phone.strip()))
+    return query
+
+
+def list_page(query: Query, limit: int, cursor: Optional[str] = None) -> Tuple[List[Apartado], Optional[str]]:
+    """Página de apartados (más recientes primero) y el cursor de la siguiente, si hay."""
+    columns = (Apartado.created_at, Apartado.id)
+    if cursor:
+        created_at, sale_id = pagination.decode_cursor(cursor, 2)
+        query = query.filter(pagination.after(columns, (pagination.parse_datetime(created_at), sale_id)))
+    rows = query.order_by(Apartado.created_at.desc(), Apartado.id.desc()).limit(limit + 1).all()
+    return rows[:limit], pagination.next_cursor(rows, limit, lambda sale: (sale.created_at, sale.id))
+
+
+def serialize(db: Session, sales: List[Apartado]) -> List[dict]:
+    """Apartados con sus abonos y el correo del vendedor (dos consultas para toda la lista)."""
+    sale_ids = [sale.id for sale in sales]
+    payments_by_sale: Dict[int, List[dict]] = {sale_id: [] for sale_id in sale_ids}
+    # Todos los abonos viven en credit_payments.apartado_id (ya no se consolidan desde Payment)
+    for start in range(0, len(sale_ids), 1000):
+        for p in (
+            db.query(CreditPayment)
+            .filter(CreditPayment.apartado_id.in_(sale_ids[start:start + 1000]))
+            .order_by(CreditPayment.apartado_id, CreditPayment.created_at, CreditPayment.id)
+        ):
+            payments_by_sale[p.apartado_id].append({
+                "id": p.id,
+                "sale_id": p.apartado_id,
+                "amount": float(p.amount),
+                "payment_method": p.payment_method,
+                "user_id": p.user_id,
+                "notes": p.notes,
+                "created_at": p.created_at.isoformat(),
+            })
+
+    vendedor_ids = {sale.vendedor_id for sale in sales if sale.vendedor_id}
+    emails = dict(db.query(User.id, User.email).filter(User.id.in_(vendedor_ids)).all()) if vendedor_ids else {}
+
+    return [
+        {
+            "id": sale.id,
+            "customer_name": sale.customer_name,
+            "customer_phone": sale.customer_phone,
+            "notas_cliente": sale.notas_cliente,
+            "total": float(sale.total),
+            "amount_paid": float(sale.amount_paid or 0),
+            "balance": float(sale.total) - float(sale.amount_paid or 0),
+            "credit_status": sale.credit_status,
+            "vendedor_id": sale.vendedor_id,
+            "vendedor_email": emails.get(sale.vendedor_id),
+            "created_at": sale.created_at.isoformat(),
+            "vip_discount_pct": float(sale.vip_discount_pct),
+            "payments": payments_by_sale[sale.id],
+        }
+        for sale in sales
+    ]
+
+
+def totals(query: Query) -> dict:
+    """Conteo, total, pagado y saldo de todo el conjunto filtrado, global y por estado."""
+    paid = func.coalesce(Apartado.amount_paid, 0)
+    rows = (
+        query.with_entities(
+            Apartado.credit_status,
+            func.count(Apartado.id),
+            func.coalesce(func.sum(Apartado.total), 0),
+            func.coalesce(func.sum(paid), 0),
+        )
+        .order_by(None)
+        .group_by(Apartado.credit_status)
+        .all()
+    )
+    result = {"count": 0, "total": 0.0, "amount_paid": 0.0, "balance": 0.0, "by_status": {}}
+    for status, count, total, amount_paid in rows:
+        total, amount_paid = float(total), float(amount_paid)
+        # Un estado NULL se muestra como pendiente (valor por defecto de la columna)
+        bucket = result["by_status"].setdefault(
+            status or "pendiente", {"count": 0, "total": 0.0, "amount_paid": 0.0, "balance": 0.0}
+        )
+        for target in (bucket, result):
+            target["count"] += count
+            target["total"] += total
+            target["amount_paid"] += amount_paid
+    for target in (result, *result["by_status"].values()):
+        target["total"] = round(target["total"], 2)
+        target["amount_paid"] = round(target["amount_paid"], 2)
+        target["balance"] = round(target["total"] - target["amount_paid"], 2)
+    return result
@@ -0,0 +1,374 @@
+"""
+Estadísticas de clientes (customer_stats) mantenidas al escribir.
+
+La pantalla de clientes necesitaba, en cada GET, tres GROUP BY customer_phone completos
+sobre ventas de contado, apartados y pedidos. Ahora:
+- Un listener after_flush calcula, para cada VentasContado, Apartado o Pedido nuevo,
+  modificado o borrado, la diferencia en su aporte (total de la venta, lo pagado del
+  apartado, el anticipo del pedido y el conteo) y la suma a customer_stats con un
+  upsert por cliente, en la misma transacción. Si no se conoce el valor anterior
+  (atributo no cargado) se recalcula ese cliente desde las tablas de origen.
+- rebuild() recalcula todo (o un tenant) con un INSERT ... SELECT:
+
+      python -m app.services.customer_stats [--tenant ID]
+
+  backfill() lo corre para todos los tenants desde init_db (compuerta de
+  app.core.startup): sin él, los clientes con ventas anteriores a la tabla saldrían en 0
+  y los upserts incrementales partirían de ahí.
+
+- list_customers() une customers con customer_stats y filtra, ordena y pagina en SQL.
+  En PostgreSQL la búsqueda usa índices GIN pg_trgm sobre lower(name) y phone
+  (ensure_search_indexes, desde init_db), como la búsqueda de productos.
+
+Igual que antes, sólo cuentan las ventas con nombre de cliente y el teléfono se compara
+tal cual; las ventas sin teléfono se agrupan en phone ''.
+"""
+import argparse
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, event, func, insert, literal, or_, select, text, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Query, Session, attributes
+
+from app.models.apartado import Apartado
+from app.models.customer import Customer
+from app.models.customer_stats import CustomerStats
+from app.models.producto_pedido import Pedido
+from app.models.venta_contado import VentasContado
+from app.services.product_search import _like_pattern
+
+STAT_COLUMNS = ("total_ventas", "num_ventas", "total_apartados", "num_apartados", "total_pedidos", "num_pedidos")
+
+# modelo -> (posición en STAT_COLUMNS del total, atributo del monto, teléfono, nombre)
+SOURCES = {
+    VentasContado: (0, "total", "customer_phone", "customer_name"),
+    Apartado: (2, "amount_paid", "customer_phone", "customer_name"),
+    Pedido: (4, "anticipo_pagado", "cliente_telefono", "cliente_nombre"),
+}
+
+ORDER_COLUMNS = ("nombre", "telefono", "total_gastado", "fecha_registro")
+
+Key = Tuple[int, str]
+
+_table_ready = False
+_UNKNOWN = object()
+
+
+def _ensure(connection) -> bool:
+    global _table_ready
+    if not _table_ready:
+        try:
+            with connection.begin_nested():
+                CustomerStats.__table__.create(bind=connection, checkfirst=True)
+            _table_ready = True
+        except Exception as e:
+            print(f"⚠️ No se pudo crear la tabla customer_stats: {e}")
+    return _table_ready
+
+
+def ensure_table(db: Session) -> bool:
+    """Crea customer_stats si no existe (una vez por proceso)."""
+    return _ensure(db.connection())
+
+
+# ---------------------------------------------------------------------------
+# Recalcular desde las tablas de origen
+# ---------------------------------------------------------------------------
+
+def _source_rows(tenant_id: Optional[int] = None, phones: Optional[List[str]] = None):
+    """Un renglón por venta/apartado/pedido con nombre: (tenant_id, phone, columnas de STAT_COLUMNS)."""
+    selects = []
+    for model, (position, amount, phone_attr, name_attr) in SOURCES.items():
+        phone = func.coalesce(getattr(model, phone_attr), "")
+        values = [literal(0)] * len(STAT_COLUMNS)
+        values[position] = func.coalesce(getattr(model, amount), 0)
+        values[position + 1] = literal(1)
+        stmt = select(
+            model.tenant_id.label("tenant_id"),
+            phone.label("phone"),
+            *(value.label(column) for value, column in zip(values, STAT_COLUMNS)),
+        ).where(getattr(model, name_attr).isnot(None), getattr(model, name_attr) != "")
+        if tenant_id is not None:
+            stmt = stmt.where(model.tenant_id == tenant_id)
+        if phones is not None:
+            stmt = stmt.where(phone.in_(phones))
+        selects.append(stmt)
+    rows = union_all(*selects).subquery("rows")
+    sums = [func.sum(rows.c[column]) for column in STAT_COLUMNS]
+    return select(
+        rows.c.tenant_id,
+        rows.c.phone,
+        *(total.label(column) for total, column in zip(sums, STAT_COLUMNS)),
+        (sums[0] + sums[2] + sums[4]).label("total_gastado"),
+        literal(datetime.utcnow(), CustomerStats.updated_at.type).label("updated_at"),
+    ).group_by(rows.c.tenant_id, rows.c.phone)
+
+
+def rebuild(db: Session, tenant_id: Optional[int] = None) -> int:
+    """Recalcular customer_stats de un tenant (o de todos). No hace commit."""
+    ensure_table(db)
+    table = CustomerStats.__table__
+    stmt = delete(table)
+    if tenant_id is not None:
+        stmt = stmt.where(table.c.tenant_id == tenant_id)
+    db.execute(stmt)
+    result = db.execute(
+        insert(table).from_select(
+            ["tenant_id", "phone", *STAT_COLUMNS, "total_gastado", "updated_at"], _source_rows(tenant_id)
+        )
+    )
+    return max(result.rowcount or 0, 0)
+
+
+def backfill(engine: Engine) -> int:
+    """Paso de init_db: recalcular customer_stats de todos los tenants y hacer commit."""
+    try:
+        with Session(engine) as db:
+            rows = rebuild(db)
+            db.commit()
+        print(f"✅ customer_stats recalculado desde ventas, apartados y pedidos: {rows} clientes")
+        return rows
+    except Exception as e:
+        print(f"⚠️ No se pudo recalcular customer_stats: {e}")
+        return 0
+
+
+def _recompute(connection, tenant_id: int, phones: List[str]) -> None:
+    table = CustomerStats.__table__
+    connection.execute(delete(table).where(table.c.tenant_id == tenant_id, table.c.phone.in_(phones)))
+    connection.execute(
+        insert(table).from_select(
+            ["tenant_id", "phone", *STAT_COLUMNS, "total_gastado", "updated_at"], _source_rows(tenant_id, phones)
+        )
+    )
+
+
+# ---------------------------------------------------------------------------
+# Mantenimiento incremental
+# ---------------------------------------------------------------------------
+
+def _values(obj, attrs, old: bool, deleted: bool = False):
+    """Valores (antes o después del flush) de attrs; _UNKNOWN si no se conoce el anterior."""
+    state = attributes.instance_state(obj)
+    values = []
+    for attr in attrs:
+        history = state.attrs[attr].history
+        if history.added:
+            if not old:
+                value = history.added[0]
+            elif history.deleted:
+                value = history.deleted[0]
+            else:
+                value = _UNKNOWN  # se asignó sin tener cargado el valor anterior
+        elif history.unchanged:
+            value = history.unchanged[0]
+        elif history.deleted:
+            value = None if not old else history.deleted[0]
+        elif deleted:
+            value = state.dict.get(attr, _UNKNOWN)
+        else:
+            value = getattr(obj, attr)  # sin cambios: el anterior es el actual
+        values.append(value)
+    return values
+
+
+def _contribution(tenant_id, amount, phone, name):
+    """(clave, monto, conteo) del renglón, o None si no cuenta (sin nombre de cliente)."""
+    if name is None or name == "":
+        return None
+    return (tenant_id, phone or ""), float(amount or 0), 1
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+# active_history: al asignar un atributo expirado (p. ej. después de un commit) el ORM carga
+# antes el valor anterior, así la diferencia se calcula sin releer la tabla de origen
+for _model, (_position, *_attrs) in SOURCES.items():
+    for _attr in _attrs:
+        event.listen(getattr(_model, _attr), "set", _keep_old_value, retval=True, active_history=True)
+
+
+@event.listens_for(Session, "after_flush")
+def _record_changes(session: Session, flush_context) -> None:
+    deltas: Dict[Key, List[float]] = {}
+    recompute: Dict[int, set] = {}
+
+    def add(contribution, position: int, sign: int) -> None:
+        if contribution is None:
+            return
+        key, amount, count = contribution
+        delta = deltas.setdefault(key, [0.0] * len(STAT_COLUMNS))
+        delta[position] += sign * amount
+        delta[position + 1] += sign * count
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        source = SOURCES.get(type(obj))
+        if source is None:
+            continue
+        position, *attrs = source
+        tenant_id = obj.tenant_id
+        if obj in session.new:
+            add(_contribution(tenant_id, *_values(obj, attrs, old=False)), position, 1)
+            continue
+        state = attributes.instance_state(obj)
+        if obj not in session.deleted and not any(state.attrs[attr].history.has_changes() for attr in attrs):
+            continue
+        is_deleted = obj in session.deleted
+        old = _values(obj, attrs, old=True, deleted=is_deleted)
+        new = None if is_deleted else _values(obj, attrs, old=False)
+        if _UNKNOWN in old:
+            # Sin el valor anterior no hay diferencia: recalcular los clientes involucrados
+            phones = recompute.setdefault(tenant_id, set())
+            for values in (old, new):
+                if values is not None and values[1] is not _UNKNOWN:
+                    phones.add(values[1] or "")
+            continue
+        add(_contribution(tenant_id, *old), position, -1)
+        if new is not None:
+            add(_contribution(tenant_id, *new), position, 1)
+
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas and not recompute:
+        return
+    connection = session.connection()
+    if not _ensure(connection):
+        return
+    _apply_deltas(connection, deltas)
+    for tenant_id, phones in recompute.items():
+        if phones:
+            _recompute(connection, tenant_id, sorted(phones))
+
+
+def _apply_deltas(connection, deltas: Dict[Key, List[float]]) -> None:
+    if not deltas:
+        return
+    table = CustomerStats.__table__
+    now = datetime.utcnow()
+    rows = [
+        {
+            "tenant_id": tenant_id,
+            "phone": phone,
+            **dict(zip(STAT_COLUMNS, delta)),
+            "total_gastado": delta[0] + delta[2] + delta[4],
+            "updated_at": now,
+        }
+        for (tenant_id, phone), delta in deltas.items()
+    ]
+    dialect = connection.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert_fn = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = insert_fn(table)
+        increments = {column: table.c[column] + stmt.excluded[column] for column in (*STAT_COLUMNS, "total_gastado")}
+        connection.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["tenant_id", "phone"],
+                set_={**increments, "updated_at": stmt.excluded.updated_at},
+            ),
+            rows,
+        )
+        return
+    for row in rows:
+        key = (table.c.tenant_id == row["tenant_id"], table.c.phone == row["phone"])
+        updated = connection.execute(
+            table.update().where(*key).values(
+                {column: table.c[column] + row[column] for column in (*STAT_COLUMNS, "total_gastado")},
+                updated_at=row["updated_at"],
+            )
+        ).rowcount
+        if not updated:
+            connection.execute(table.insert().values(**row))
+
+
+# ---------------------------------------------------------------------------
+# Listado de clientes
+# ---------------------------------------------------------------------------
+
+def ensure_search_indexes(engine: Engine) -> bool:
+    """Índices GIN pg_trgm para buscar clientes por nombre y teléfono (sólo PostgreSQL)."""
+    if engine.dialect.name != "postgresql":
+        return False
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            connection.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_customers_name_trgm ON customers USING gin (lower(name) gin_trgm_ops)"
+            ))
+            connection.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_customers_phone_trgm ON customers USING gin (phone gin_trgm_ops)"
+            ))
+            connection.commit()
+        return True
+    except Exception as e:
+        print(f"⚠️ No se pudieron crear los índices de búsqueda de clientes: {e}")
+        return False
+
+
+def customers_query(db: Session, tenant_id: int, search: Optional[str] = None) -> Query:
+    """customers + customer_stats del tenant, filtrado por nombre o teléfono."""
+    ensure_table(db)
+    query = (
+        db.query(Customer, CustomerStats)
+        .outerjoin(
+            CustomerStats,
+            (CustomerStats.tenant_id == Customer.tenant_id)
+            & (CustomerStats.phone == func.coalesce(Customer.phone, "")),
+        )
+        .filter(Customer.tenant_id == tenant_id)
+    )
+    term = (search or "").strip().lower()
+    if term:
+        pattern = _like_pattern(term)
+        query = query.filter(or_(
+            func.lower(Customer.name).like(pattern, escape="\\"),
+            Customer.phone.like(pattern, escape="\\"),
+        ))
+    return query
+
+
+def list_customers(
+    db: Session,
+    tenant_id: int,
+    search: Optional[str] = None,
+    order_by: Optional[str] = "nombre",
+    order_dir: Optional[str] = "asc",
+    skip: int = 0,
+    limit: Optional[int] = None,
+) -> Tuple[List[Tuple[Customer, Optional[CustomerStats]]], int]:
+    """
+    Página de (cliente, estadísticas) ordenada en SQL (limit None = todos desde skip), y el
+    total de clientes que coinciden.
+    """
+    query = customers_query(db, tenant_id, search)
+    total = query.with_entities(func.count(Customer.id)).order_by(None).scalar()
+    column = {
+        "nombre": func.lower(Customer.name),
+        "telefono": func.coalesce(Customer.phone, ""),
+        "total_gastado": func.coalesce(CustomerStats.total_gastado, 0),
+        "fecha_registro": Customer.created_at,
+    }.get(order_by)
+    if order_dir == "desc":
+        ordering = [column.desc(), Customer.id.desc()] if column is not None else [Customer.id.desc()]
+    else:
+        ordering = [column.asc(), Customer.id.asc()] if column is not None else [Customer.id.asc()]
+    return query.order_by(*ordering).offset(skip).limit(limit).all(), total
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Recalcular customer_stats desde ventas, apartados y pedidos")
+    parser.add_argument("--tenant", type=int, default=None, help="Sólo este tenant")
+    args = parser.parse_args(argv)
+
+    from app.core.database import SessionLocal
+
+    with SessionLocal() as db:
+        rows = rebuild(db, args.tenant)
+        db.commit()
+    print(f"✅ customer_stats recalculado: {rows} clientes")
+
+
+if __name__ == "__main__":
+    main()
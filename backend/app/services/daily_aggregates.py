@@ -0,0 +1,414 @@
+"""
+Agregados diarios incrementales para los reportes de caja.
+
+Cada venta de contado, abono de apartado (CreditPayment) y pago de pedido (PagoPedido)
+suma su importe en una fila de DailyAggregate identificada por
+(tenant, día local, vendedor, concepto, método). Los reportes por rango suman esas filas
+en lugar de recorrer las transacciones, y rebuild_range() recalcula cualquier rango
+desde las tablas fuente para verificación.
+
+Uso desde consola:
+    python -m app.services.daily_aggregates rebuild --tenant <slug> --start 2025-01-01 --end 2025-12-31
+    python -m app.services.daily_aggregates verify --tenant <slug> --start 2025-01-01 --end 2025-01-31
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.models.apartado import Apartado
+from app.models.credit_payment import CreditPayment
+from app.models.daily_aggregate import DailyAggregate
+from app.models.payment import Payment
+from app.models.producto_pedido import PagoPedido, Pedido
+from app.models.venta_contado import VentasContado
+from app.services.corte_caja_service import TARJETA_DISCOUNT_RATE
+from app.services.corte_context import ANTICIPO_INICIAL_NOTE
+
+# Mismo criterio que corte_caja_service: hora de México fija (-6h)
+MEXICO_TZ = timezone(timedelta(hours=-6))
+
+_METODO_ALIASES = {"cash": "efectivo", "card": "tarjeta"}
+_PEDIDO_CONCEPTOS = {"anticipo": "anticipo_pedido", "saldo": "abono_pedido", "total": "contado_pedido"}
+
+# (fecha, vendedor_id, concepto, metodo)
+BucketKey = Tuple[date, int, str, str]
+
+_table_ready = False
+
+
+def ensure_table(db: Session) -> bool:
+    """Crea la tabla si no existe (una vez por proceso). Devuelve False si no se pudo."""
+    global _table_ready
+    if not _table_ready:
+        try:
+            # Savepoint: si falla no se aborta la transacción de la venta en curso
+            with db.begin_nested():
+                DailyAggregate.__table__.create(bind=db.connection(), checkfirst=True)
+            _table_ready = True
+        except Exception as e:
+            print(f"⚠️ No se pudo crear la tabla daily_aggregates: {e}")
+    return _table_ready
+
+
+def local_day(value: Optional[datetime]) -> date:
+    """Día local (México) de un timestamp. Los naive se consideran UTC, como los guarda la BD."""
+    if value is None:
+        value = datetime.now(timezone.utc)
+    elif value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(MEXICO_TZ).date()
+
+
+def day_bounds(start: date, end: date) -> Tuple[datetime, datetime]:
+    """Rango UTC [inicio, fin) que cubre los días locales start..end."""
+    start_dt = datetime.combine(start, time.min).replace(tzinfo=MEXICO_TZ)
+    end_dt = datetime.combine(end + timedelta(days=1), time.min).replace(tzinfo=MEXICO_TZ)
+    return start_dt.astimezone(timezone.utc), end_dt.astimezone(timezone.utc)
+
+
+def normalize_metodo(metodo: Optional[str]) -> str:
+    value = (metodo or "").strip().lower()
+    return _METODO_ALIASES.get(value, value)
+
+
+def _dec(value: Any) -> Decimal:
+    return Decimal(str(value or 0))
+
+
+# ---------------------------------------------------------------------------
+# Contribuciones: qué filas suma cada transacción (compartido entre hooks y rebuild)
+# ---------------------------------------------------------------------------
+
+def _venta_contributions(venta: VentasContado, payments: Iterable[Payment]):
+    fecha = local_day(venta.created_at)
+    vendedor = venta.vendedor_id or venta.user_id or 0
+    concepto = "devolucion" if venta.return_of_id else "venta_contado"
+    yield (fecha, vendedor, concepto, ""), 1, _dec(venta.total), _dec(venta.total_cost)
+    for p in payments:
+        yield (fecha, vendedor, "pago_venta", normalize_metodo(p.method)), 1, _dec(p.amount), Decimal("0")
+
+
+def _credit_payment_contributions(payment: CreditPayment, apartado: Optional[Apartado]):
+    vendedor = 0
+    if apartado is not None:
+        vendedor = apartado.vendedor_id or apartado.user_id or 0
+    concepto = "anticipo_apartado" if payment.notes == ANTICIPO_INICIAL_NOTE else "abono_apartado"
+    key = (local_day(payment.created_at), vendedor, concepto, normalize_metodo(payment.payment_method))
+    yield key, 1, _dec(payment.amount), Decimal("0")
+
+
+def _pago_pedido_contributions(pago: PagoPedido, pedido: Optional[Pedido]):
+    vendedor = pedido.user_id if pedido is not None and pedido.user_id else 0
+    concepto = _PEDIDO_CONCEPTOS.get(pago.tipo_pago, "abono_pedido")
+    key = (local_day(pago.created_at), vendedor, concepto, normalize_metodo(pago.metodo_pago))
+    yield key, 1, _dec(pago.monto), Decimal("0")
+
+
+# ---------------------------------------------------------------------------
+# Escritura incremental
+# ---------------------------------------------------------------------------
+
+def _upsert_insert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    return None
+
+
+def _apply(db: Session, tenant_id: int, contributions) -> None:
+    if not ensure_table(db):
+        return
+
+    buckets: Dict[BucketKey, List[Any]] = defaultdict(lambda: [0, Decimal("0"), Decimal("0")])
+    for key, count, monto, costo in contributions:
+        bucket = buckets[key]
+        bucket[0] += count
+        bucket[1] += monto
+        bucket[2] += costo
+
+    insert = _upsert_insert(db)
+    table = DailyAggregate.__table__
+    now = datetime.utcnow()
+    for (fecha, vendedor_id, concepto, metodo), (count, monto, costo) in buckets.items():
+        if insert is not None:
+            stmt = insert(table).values(
+                tenant_id=tenant_id, fecha=fecha, vendedor_id=vendedor_id, concepto=concepto,
+                metodo=metodo, num_operaciones=count, monto=monto, costo=costo, updated_at=now,
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["tenant_id", "fecha", "vendedor_id", "concepto", "metodo"],
+                set_={
+                    "num_operaciones": table.c.num_operaciones + stmt.excluded.num_operaciones,
+                    "monto": table.c.monto + stmt.excluded.monto,
+                    "costo": table.c.costo + stmt.excluded.costo,
+                    "updated_at": now,
+                },
+            )
+            db.execute(stmt)
+            continue
+
+        # Otros motores: leer y sumar
+        row = db.query(DailyAggregate).filter(
+            DailyAggregate.tenant_id == tenant_id,
+            DailyAggregate.fecha == fecha,
+            DailyAggregate.vendedor_id == vendedor_id,
+            DailyAggregate.concepto == concepto,
+            DailyAggregate.metodo == metodo,
+        ).with_for_update().first()
+        if row is None:
+            db.add(DailyAggregate(
+                tenant_id=tenant_id, fecha=fecha, vendedor_id=vendedor_id, concepto=concepto,
+                metodo=metodo, num_operaciones=count, monto=monto, costo=costo,
+            ))
+        else:
+            row.num_operaciones += count
+            row.monto = _dec(row.monto) + monto
+            row.costo = _dec(row.costo) + costo
+
+
+def record_venta(db: Session, venta: VentasContado, payments: Iterable[Payment] = ()) -> None:
+    """Sumar una venta de contado (o devolución) y sus pagos. Llamar antes del commit."""
+    _apply(db, venta.tenant_id, _venta_contributions(venta, payments))
+
+
+def record_credit_payment(db: Session, payment: CreditPayment, apartado: Optional[Apartado]) -> None:
+    """Sumar un anticipo/abono de apartado. Llamar antes del commit."""
+    if payment.apartado_id is None:
+        return
+    _apply(db, payment.tenant_id, _credit_payment_contributions(payment, apartado))
+
+
+def record_pago_pedido(db: Session, pago: PagoPedido, pedido: Pedido) -> None:
+    """Sumar un pago de pedido. Llamar antes del commit."""
+    _apply(db, pedido.tenant_id, _pago_pedido_contributions(pago, pedido))
+
+
+# ---------------------------------------------------------------------------
+# Reconstrucción desde tablas fuente
+# ---------------------------------------------------------------------------
+
+def compute_from_source(db: Session, tenant_id: int, start: date, end: date) -> Dict[BucketKey, List[Any]]:
+    """Recalcular los buckets de start..end leyendo ventas, abonos y pagos de pedidos."""
+    start_dt, end_dt = day_bounds(start, end)
+    # ventas_contado.created_at es naive en UTC
+    start_naive, end_naive = start_dt.replace(tzinfo=None), end_dt.replace(tzinfo=None)
+
+    buckets: Dict[BucketKey, List[Any]] = defaultdict(lambda: [0, Decimal("0"), Decimal("0")])
+
+    def add(contributions):
+        for key, count, monto, costo in contributions:
+            bucket = buckets[key]
+            bucket[0] += count
+            bucket[1] += monto
+            bucket[2] += costo
+
+    ventas = db.query(VentasContado).filter(
+        VentasContado.tenant_id == tenant_id,
+        VentasContado.created_at >= start_naive,
+        VentasContado.created_at < end_naive,
+    ).all()
+    payments_by_venta: Dict[int, List[Payment]] = defaultdict(list)
+    if ventas:
+        payments = db.query(Payment).join(
+            VentasContado, Payment.venta_contado_id == VentasContado.id
+        ).filter(
+            VentasContado.tenant_id == tenant_id,
+            VentasContado.created_at >= start_naive,
+            VentasContado.created_at < end_naive,
+        ).all()
+        for p in payments:
+            payments_by_venta[p.venta_contado_id].append(p)
+    for venta in ventas:
+        add(_venta_contributions(venta, payments_by_venta.get(venta.id, [])))
+
+    abonos = db.query(CreditPayment, Apartado).outerjoin(
+        Apartado, CreditPayment.apartado_id == Apartado.id
+    ).filter(
+        CreditPayment.tenant_id == tenant_id,
+        CreditPayment.apartado_id.isnot(None),
+        CreditPayment.created_at >= start_dt,
+        CreditPayment.created_at < end_dt,
+    ).all()
+    for payment, apartado in abonos:
+        add(_credit_payment_contributions(payment, apartado))
+
+    pagos = db.query(PagoPedido, Pedido).join(
+        Pedido, PagoPedido.pedido_id == Pedido.id
+    ).filter(
+        Pedido.tenant_id == tenant_id,
+        PagoPedido.created_at >= start_dt,
+        PagoPedido.created_at < end_dt,
+    ).all()
+    for pago, pedido in pagos:
+        add(_pago_pedido_contributions(pago, pedido))
+
+    return buckets
+
+
+def _stored_buckets(db: Session, tenant_id: int, start: date, end: date) -> Dict[BucketKey, List[Any]]:
+    rows = db.query(DailyAggregate).filter(
+        DailyAggregate.tenant_id == tenant_id,
+        DailyAggregate.fecha >= start,
+        DailyAggregate.fecha <= end,
+    ).all()
+    return {
+        (r.fecha, r.vendedor_id, r.concepto, r.metodo): [r.num_operaciones, _dec(r.monto), _dec(r.costo)]
+        for r in rows
+    }
+
+
+def rebuild_range(db: Session, tenant_id: int, start: date, end: date) -> int:
+    """Reemplazar los agregados de start..end con lo calculado desde las tablas fuente."""
+    ensure_table(db)
+    buckets = compute_from_source(db, tenant_id, start, end)
+    db.query(DailyAggregate).filter(
+        DailyAggregate.tenant_id == tenant_id,
+        DailyAggregate.fecha >= start,
+        DailyAggregate.fecha <= end,
+    ).delete(synchronize_session=False)
+    db.bulk_insert_mappings(DailyAggregate, [
+        {
+            "tenant_id": tenant_id, "fecha": fecha, "vendedor_id": vendedor_id,
+            "concepto": concepto, "metodo": metodo,
+            "num_operaciones": count, "monto": monto, "costo": costo,
+        }
+        for (fecha, vendedor_id, concepto, metodo), (count, monto, costo) in buckets.items()
+        if start <= fecha <= end
+    ])
+    db.commit()
+    return len(buckets)
+
+
+def verify_range(db: Session, tenant_id: int, start: date, end: date) -> List[Dict[str, Any]]:
+    """Comparar lo guardado contra lo recalculado. Devuelve las diferencias (vacío = consistente)."""
+    ensure_table(db)
+    expected = {
+        k: v for k, v in compute_from_source(db, tenant_id, start, end).items() if start <= k[0] <= end
+    }
+    stored = _stored_buckets(db, tenant_id, start, end)
+    diffs = []
+    for key in sorted(set(expected) | set(stored)):
+        exp = expected.get(key, [0, Decimal("0"), Decimal("0")])
+        got = stored.get(key, [0, Decimal("0"), Decimal("0")])
+        if exp != got:
+            fecha, vendedor_id, concepto, metodo = key
+            diffs.append({
+                "fecha": fecha.isoformat(), "vendedor_id": vendedor_id, "concepto": concepto,
+                "metodo": metodo, "esperado": [exp[0], float(exp[1]), float(exp[2])],
+                "guardado": [got[0], float(got[1]), float(got[2])],
+            })
+    return diffs
+
+
+# ---------------------------------------------------------------------------
+# Lectura por rango
+# ---------------------------------------------------------------------------
+
+def get_range_summary(db: Session, tenant_id: int, start: date, end: date) -> Dict[str, Any]:
+    """Sumar los agregados de start..end: totales por concepto/método, por vendedor y por día."""
+    ensure_table(db)
+    base = db.query(DailyAggregate).filter(
+        DailyAggregate.tenant_id == tenant_id,
+        DailyAggregate.fecha >= start,
+        DailyAggregate.fecha <= end,
+    )
+    count_col = func.sum(DailyAggregate.num_operaciones)
+    monto_col = func.sum(DailyAggregate.monto)
+    costo_col = func.sum(DailyAggregate.costo)
+
+    conceptos: Dict[str, Dict[str, Dict[str, float]]] = defaultdict(dict)
+    for concepto, metodo, count, monto, costo in base.with_entities(
+        DailyAggregate.concepto, DailyAggregate.metodo, count_col, monto_col, costo_col
+    ).group_by(DailyAggregate.concepto, DailyAggregate.metodo):
+        conceptos[concepto][metodo or "total"] = {
+            "count": int(count or 0), "monto": float(monto or 0), "costo": float(costo or 0),
+        }
+
+    vendedores: Dict[int, Dict[str, float]] = defaultdict(dict)
+    for vendedor_id, concepto, monto in base.with_entities(
+        DailyAggregate.vendedor_id, DailyAggregate.concepto, monto_col
+    ).group_by(DailyAggregate.vendedor_id, DailyAggregate.concepto):
+        vendedores[vendedor_id][concepto] = float(monto or 0)
+
+    dias: Dict[str, Dict[str, float]] = defaultdict(dict)
+    for fecha, concepto, monto in base.with_entities(
+        DailyAggregate.fecha, DailyAggregate.concepto, monto_col
+    ).group_by(DailyAggregate.fecha, DailyAggregate.concepto).order_by(DailyAggregate.fecha):
+        dias[fecha.isoformat()][concepto] = float(monto or 0)
+
+    def _monto(concepto: str, *metodos: str) -> float:
+        by_metodo = conceptos.get(concepto, {})
+        return sum(v["monto"] for m, v in by_metodo.items() if not metodos or m in metodos)
+
+    efectivo = ("efectivo", "transferencia")
+    pasivos = ("anticipo_apartado", "abono_apartado", "anticipo_pedido", "abono_pedido", "contado_pedido")
+    total_efectivo = _monto("pago_venta", *efectivo) + sum(_monto(c, *efectivo) for c in pasivos)
+    total_tarjeta = _monto("pago_venta", "tarjeta") + sum(_monto(c, "tarjeta") for c in pasivos)
+    venta = conceptos.get("venta_contado", {}).get("total", {})
+    devolucion = conceptos.get("devolucion", {}).get("total", {})
+
+    return {
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "ventas_contado_count": int(venta.get("count", 0)),
+        "ventas_contado_total": float(venta.get("monto", 0)),
+        "ventas_contado_costo": float(venta.get("costo", 0)),
+        "returns_count": int(devolucion.get("count", 0)),
+        "returns_total": float(devolucion.get("monto", 0)),
+        "anticipos_apartados": _monto("anticipo_apartado"),
+        "abonos_apartados": _monto("abono_apartado"),
+        "anticipos_pedidos": _monto("anticipo_pedido"),
+        "abonos_pedidos": _monto("abono_pedido"),
+        "pedidos_contado": _monto("contado_pedido"),
+        "total_efectivo": total_efectivo,
+        "total_tarjeta": total_tarjeta,
+        "total_tarjeta_neto": total_tarjeta * TARJETA_DISCOUNT_RATE,
+        "conceptos": conceptos,
+        "vendedores": [
+            {"vendedor_id": vendedor_id, **totales} for vendedor_id, totales in sorted(vendedores.items())
+        ],
+        "dias": [{"fecha": fecha, **totales} for fecha, totales in dias.items()],
+    }
+
+
+def _main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+
+    from app.core.database import SessionLocal
+    from app.models.tenant import Tenant
+
+    parser = argparse.ArgumentParser(description="Reconstruir o verificar agregados diarios de caja")
+    parser.add_argument("action", choices=["rebuild", "verify"])
+    parser.add_argument("--tenant", required=True, help="slug del tenant")
+    parser.add_argument("--start", required=True, type=date.fromisoformat)
+    parser.add_argument("--end", type=date.fromisoformat, help="por defecto igual a --start")
+    args = parser.parse_args(argv)
+    end = args.end or args.start
+
+    with SessionLocal() as db:
+        tenant = db.query(Tenant).filter(Tenant.slug == args.tenant).first()
+        if not tenant:
+            print(f"Tenant no encontrado: {args.tenant}")
+            return 1
+        if args.action == "rebuild":
+            n = rebuild_range(db, tenant.id, args.start, end)
+            print(f"✅ {n} filas reconstruidas para {args.start}..{end}")
+            return 0
+        diffs = verify_range(db, tenant.id, args.start, end)
+        for d in diffs:
+            print(d)
+        print("✅ Agregados consistentes" if not diffs else f"⚠️ {len(diffs)} diferencias")
+        return 0 if not diffs else 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(_main())
@@ -0,0 +1,185 @@
+"""
+Versión de datos por tenant y recurso, para los ETag de los listados que las cajas
+consultan una y otra vez (/products/, /productos-pedido/, /metal-rates, /tasas-pedido/).
+
+- Los cambios hechos con el ORM (alta, edición, archivo, borrado, actualización masiva,
+  importación de productos sobre pedido, tasas) se detectan en cada flush.
+- Los que van con SQL directo (reserve_stock/release_stock, importación de productos,
+  recálculo por tasa de metal, el DELETE del modo replace de la importación de productos
+  sobre pedido) llaman a touch().
+- Al hacer commit sube la versión de cada (tenant, recurso) tocado, en una transacción
+  corta aparte: la venta no retiene el renglón de la versión. Un rollback lo descarta.
+
+current() lee la versión con caché en proceso de settings.data_version_ttl_seconds: un
+listado sin cambios se responde sin ir a la base. Los commits de este proceso la
+actualizan al momento; los de otro worker se ven al vencer el TTL.
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Set, Tuple
+
+from sqlalchemy import event, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.data_version import DataVersion
+from app.models.metal_rate import MetalRate
+from app.models.product import Product
+from app.models.producto_pedido import ProductoPedido
+from app.models.tasa_metal_pedido import TasaMetalPedido
+
+PRODUCTS = "products"
+PRODUCTOS_PEDIDO = "productos_pedido"
+METAL_RATES = "metal_rates"
+TASAS_PEDIDO = "tasas_pedido"
+
+RESOURCES = {
+    Product: PRODUCTS,
+    ProductoPedido: PRODUCTOS_PEDIDO,
+    MetalRate: METAL_RATES,
+    TasaMetalPedido: TASAS_PEDIDO,
+}
+
+Key = Tuple[int, str]
+
+_PENDING_KEY = "data_versions_pending"
+
+_versions: Dict[Key, Tuple[int, float]] = {}  # (tenant, recurso) -> (versión, leída en)
+_lock = threading.Lock()
+_table_ready = False
+
+
+def _ensure(connection) -> bool:
+    global _table_ready
+    if not _table_ready:
+        try:
+            with connection.begin_nested():
+                DataVersion.__table__.create(bind=connection, checkfirst=True)
+            _table_ready = True
+        except Exception as e:
+            print(f"⚠️ No se pudo crear la tabla data_versions: {e}")
+    return _table_ready
+
+
+def _remember(key: Key, version: int) -> None:
+    with _lock:
+        _versions[key] = (version, time.monotonic())
+
+
+def forget(tenant_id: Optional[int] = None) -> None:
+    """Descartar las versiones en caché (de un tenant o todas)."""
+    with _lock:
+        if tenant_id is None:
+            _versions.clear()
+        else:
+            for key in [k for k in _versions if k[0] == tenant_id]:
+                del _versions[key]
+
+
+# ---------------------------------------------------------------------------
+# Lectura
+# ---------------------------------------------------------------------------
+
+def current(db: Session, tenant_id: int, resource: str) -> int:
+    """Versión actual del recurso (0 si nunca ha cambiado)."""
+    key = (tenant_id, resource)
+    ttl = settings.data_version_ttl_seconds
+    if ttl > 0:
+        with _lock:
+            cached = _versions.get(key)
+        if cached is not None and time.monotonic() - cached[1] < ttl:
+            return cached[0]
+    if not _ensure(db.connection()):
+        return 0
+    version = db.execute(
+        select(DataVersion.version).where(DataVersion.tenant_id == tenant_id, DataVersion.resource == resource)
+    ).scalar() or 0
+    _remember(key, version)
+    return version
+
+
+# ---------------------------------------------------------------------------
+# Escritura
+# ---------------------------------------------------------------------------
+
+def touch(db: Session, tenant_id: int, resource: str) -> None:
+    """Marcar el recurso como modificado con SQL directo; la versión sube en el commit."""
+    db.info.setdefault(_PENDING_KEY, set()).add((tenant_id, resource))
+
+
+def _bump(connection, key: Key) -> int:
+    tenant_id, resource = key
+    table = DataVersion.__table__
+    now = datetime.utcnow()
+    dialect = connection.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = insert(table).values(tenant_id=tenant_id, resource=resource, version=1, updated_at=now)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["tenant_id", "resource"],
+            set_={"version": table.c.version + 1, "updated_at": now},
+        ).returning(table.c.version)
+        return connection.execute(stmt).scalar()
+    version = connection.execute(
+        update(table)
+        .where(table.c.tenant_id == tenant_id, table.c.resource == resource)
+        .values(version=table.c.version + 1, updated_at=now)
+        .returning(table.c.version)
+    ).scalar()
+    if version is None:
+        connection.execute(table.insert().values(tenant_id=tenant_id, resource=resource, version=1, updated_at=now))
+        version = 1
+    return version
+
+
+def bump(bind, keys: Set[Key]) -> None:
+    """Subir la versión de cada (tenant, recurso), en su propia transacción."""
+    try:
+        with bind.connect() as connection:
+            for key in sorted(keys):
+                with connection.begin():
+                    if not _ensure(connection):
+                        raise RuntimeError("sin tabla data_versions")
+                    _remember(key, _bump(connection, key))
+    except Exception as e:
+        # Sin la versión nueva, al menos este proceso no sirve la anterior
+        with _lock:
+            for key in keys:
+                _versions.pop(key, None)
+        print(f"⚠️ No se pudo actualizar la versión de datos {sorted(keys)}: {e}")
+
+
+# ---------------------------------------------------------------------------
+# Eventos de sesión
+# ---------------------------------------------------------------------------
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session: Session, flush_context) -> None:
+    pending: Optional[Set[Key]] = None
+    for obj in session.new | session.dirty | session.deleted:
+        resource = RESOURCES.get(type(obj))
+        if resource is None or obj.tenant_id is None:
+            continue
+        if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+            continue
+        pending = pending if pending is not None else session.info.setdefault(_PENDING_KEY, set())
+        pending.add((obj.tenant_id, resource))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_changes(session: Session) -> None:
+    # También se dispara al liberar un SAVEPOINT: la versión sube con el commit de afuera
+    if session.in_nested_transaction():
+        return
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        bump(session.get_bind(), pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session: Session) -> None:
+    # Un SAVEPOINT deshecho no descarta lo tocado antes en la transacción
+    if not session.in_nested_transaction():
+        session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,205 @@
+"""
+Vencimiento de apartados y pedidos con saldo (antes se hacía al listarlos).
+
+Un apartado o pedido con saldo pendiente pasa a 'vencido' cuando tiene más de
+settings.expiry_days días y no está pagado, entregado ni cancelado. Por tenant:
+- un INSERT ... SELECT escribe el StatusHistory de todos los que vencen (con el estado
+  anterior), y después
+- un UPDATE los marca como 'vencido'.
+
+Corre en un hilo de la app cada settings.expiry_sweep_interval_seconds (start_scheduler,
+en el arranque) o desde la línea de comandos:
+
+    python -m app.services.expiry_sweeper [--tenant ID]
+
+Con varios procesos, en PostgreSQL un candado consultivo por tenant evita que dos
+barridos del mismo tenant se encimen (el segundo lo salta).
+"""
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, insert, literal, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.apartado import Apartado
+from app.models.producto_pedido import Pedido
+from app.models.status_history import StatusHistory
+from app.models.tenant import Tenant
+from app.models.user import User
+
+VENCIDO = "vencido"
+# Estados que ya no vencen (credits usaba también los nombres en inglés)
+APARTADO_CLOSED_STATUSES = ("pagado", "entregado", "cancelado", VENCIDO, "paid", "cancelled")
+PEDIDO_CLOSED_STATUSES = ("pagado", "entregado", "cancelado", VENCIDO)
+
+SYSTEM_EMAIL = "sistema"
+NOTE = "Vencido automáticamente ({days} días sin liquidar)"
+
+# Llave del candado consultivo: (clase, tenant_id)
+_LOCK_CLASS = 75_001
+
+
+def _overdue_apartados(tenant_id: int, cutoff: datetime) -> list:
+    table = Apartado.__table__
+    return [
+        table.c.tenant_id == tenant_id,
+        table.c.created_at < cutoff,
+        table.c.total - func.coalesce(table.c.amount_paid, 0) > 0,
+        or_(table.c.credit_status.is_(None), table.c.credit_status.notin_(APARTADO_CLOSED_STATUSES)),
+    ]
+
+
+def _overdue_pedidos(tenant_id: int, cutoff: datetime) -> list:
+    table = Pedido.__table__
+    return [
+        table.c.tenant_id == tenant_id,
+        table.c.created_at < cutoff,
+        table.c.saldo_pendiente > 0,
+        or_(table.c.estado.is_(None), table.c.estado.notin_(PEDIDO_CLOSED_STATUSES)),
+    ]
+
+
+def _system_user_id(db: Session, tenant_id: int) -> Optional[int]:
+    """Usuario al que se atribuye el historial (StatusHistory.user_id es obligatorio)."""
+    return db.execute(
+        select(User.id)
+        .where(User.tenant_id == tenant_id)
+        .order_by((User.role.in_(("owner", "admin"))).desc(), User.id)
+        .limit(1)
+    ).scalar()
+
+
+def _try_lock(db: Session, tenant_id: int) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return True
+    return bool(db.execute(select(func.pg_try_advisory_xact_lock(_LOCK_CLASS, tenant_id))).scalar())
+
+
+def _expire(db: Session, table, status_column, entity_type: str, conditions: list,
+            user_id: Optional[int], now: datetime, note: str) -> int:
+    if user_id is not None:
+        db.execute(
+            insert(StatusHistory.__table__).from_select(
+                ["tenant_id", "entity_type", "entity_id", "old_status", "new_status",
+                 "user_id", "user_email", "notes", "created_at"],
+                select(
+                    table.c.tenant_id,
+                    literal(entity_type),
+                    table.c.id,
+                    status_column,
+                    literal(VENCIDO),
+                    literal(user_id),
+                    literal(SYSTEM_EMAIL),
+                    literal(note),
+                    literal(now, StatusHistory.created_at.type),
+                ).where(*conditions),
+            )
+        )
+    result = db.execute(update(table).where(*conditions).values({status_column.name: VENCIDO}))
+    return max(result.rowcount or 0, 0)
+
+
+def sweep_tenant(db: Session, tenant_id: int, now: Optional[datetime] = None) -> Dict[str, int]:
+    """Marcar como vencidos los apartados y pedidos del tenant. No hace commit."""
+    now = now or datetime.utcnow()
+    if not _try_lock(db, tenant_id):
+        return {"apartados": 0, "pedidos": 0}
+    days = settings.expiry_days
+    cutoff = now - timedelta(days=days)
+    note = NOTE.format(days=days)
+    user_id = _system_user_id(db, tenant_id)
+
+    apartados = Apartado.__table__
+    pedidos = Pedido.__table__
+    return {
+        "apartados": _expire(db, apartados, apartados.c.credit_status, "sale",
+                             _overdue_apartados(tenant_id, cutoff), user_id, now, note),
+        # pedidos.created_at lleva zona horaria; apartados no
+        "pedidos": _expire(db, pedidos, pedidos.c.estado, "pedido",
+                           _overdue_pedidos(tenant_id, cutoff.replace(tzinfo=timezone.utc)), user_id, now, note),
+    }
+
+
+def sweep_all(db: Session, tenant_ids: Optional[List[int]] = None) -> Dict[int, Dict[str, int]]:
+    """Barrido de todos los tenants (o los indicados), con commit por tenant."""
+    if tenant_ids is None:
+        tenant_ids = [tenant_id for (tenant_id,) in db.query(Tenant.id).order_by(Tenant.id).all()]
+    swept = {}
+    for tenant_id in tenant_ids:
+        try:
+            swept[tenant_id] = sweep_tenant(db, tenant_id)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️ Error al vencer apartados/pedidos del tenant {tenant_id}: {e}")
+    return swept
+
+
+class ExpiryScheduler:
+    """Hilo que corre sweep_all al arrancar y luego cada interval_seconds."""
+
+    def __init__(self, session_factory, interval_seconds: float):
+        self.session_factory = session_factory
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._loop, name="expiry-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                with self.session_factory() as db:
+                    sweep_all(db)
+            except Exception as e:
+                print(f"⚠️ Error en el barrido de vencimientos: {e}")
+            self._stop.wait(self.interval_seconds)
+
+
+_scheduler: Optional[ExpiryScheduler] = None
+
+
+def start_scheduler(session_factory=None) -> None:
+    global _scheduler
+    if _scheduler is not None or settings.expiry_sweep_interval_seconds <= 0:
+        return
+    if session_factory is None:
+        from app.core.database import SessionLocal
+        session_factory = SessionLocal
+    _scheduler = ExpiryScheduler(session_factory, settings.expiry_sweep_interval_seconds)
+    _scheduler.start()
+
+
+def stop_scheduler() -> None:
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.stop()
+        _scheduler = None
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Marcar como vencidos apartados y pedidos con saldo")
+    parser.add_argument("--tenant", type=int, action="append", default=None, help="Sólo este tenant (repetible)")
+    args = parser.parse_args(argv)
+
+    from app.core.database import SessionLocal
+
+    with SessionLocal() as db:
+        swept = sweep_all(db, args.tenant)
+    apartados = sum(s["apartados"] for s in swept.values())
+    pedidos = sum(s["pedidos"] for s in swept.values())
+    print(f"✅ Vencidos: {apartados} apartados y {pedidos} pedidos en {len(swept)} tenants")
+
+
+if __name__ == "__main__":
+    main()
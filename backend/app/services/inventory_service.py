@@ -3,8 +3,8 @@ Service for generating inventory control reports.
 This service contains the business logic for inventory tracking and reporting.
 """
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
-from typing import Dict, List, Any, Optional, TypedDict
+from sqlalchemy import and_, or_, func, case
+from typing import Dict, Iterable, List, Any, Optional, Tuple, TypedDict
 from datetime import datetime, date, timezone as tz, timedelta, timezone
 
 from app.models.tenant import Tenant
@@ -13,6 +13,7 @@ from app.models.product import Product
 from app.models.venta_contado import VentasContado, ItemVentaContado
 from app.models.apartado import Apartado, ItemApartado
 from app.models.producto_pedido import Pedido, ProductoPedido, PedidoItem
+from app.services import stock_ledger
 
 
 # TypedDict definitions for better type safety
@@ -577,6 +578,47 @@ def _build_inventory_snapshot(
     }
 
 
+STOCK_GROUP_FIELDS = ('name', 'modelo', 'quilataje', 'marca', 'color', 'base', 'tipo_joya', 'talla')
+
+
+def _stock_group_key(product: Product) -> str:
+    return "|".join(str(getattr(product, field) or '') for field in STOCK_GROUP_FIELDS)
+
+
+def _new_stock_group(product: Product) -> Dict[str, Any]:
+    return {
+        'nombre': product.name,
+        'modelo': product.modelo,
+        'quilataje': product.quilataje,
+        'marca': product.marca,
+        'color': product.color,
+        'base': product.base,
+        'tipo_joya': product.tipo_joya,
+        'talla': product.talla,
+    }
+
+
+def _group_stock(items: Iterable[Tuple[Product, int]]) -> List[Dict[str, Any]]:
+    """Agrupar (producto, stock) por nombre, modelo, quilataje, marca, color, base, tipo_joya, talla."""
+    groups: Dict[str, Dict[str, Any]] = {}
+
+    for product, stock in items:
+        key = _stock_group_key(product)
+        if key not in groups:
+            groups[key] = {**_new_stock_group(product), 'cantidad_total': 0, 'productos': []}
+
+        groups[key]['cantidad_total'] += stock
+        groups[key]['productos'].append({
+            'id': product.id,
+            'codigo': product.codigo,
+            'stock': stock,
+            'precio': float(product.price),
+            'costo': float(product.cost_price),
+        })
+
+    return list(groups.values())
+
+
 def get_stock_grouped(
     db: Session,
     tenant: Tenant
@@ -593,45 +635,77 @@ def get_stock_grouped(
         Product.stock > 0
     ).all()
     
-    groups: Dict[str, Dict[str, Any]] = {}
-    
+    return _group_stock((product, product.stock) for product in products)
+
+
+def _replay_stock_before(db: Session, tenant: Tenant, cutoff: datetime) -> List[Tuple[Product, int]]:
+    """
+    Stock a una fecha anterior al kardex: stock actual menos los movimientos y ventas de
+    contado posteriores, sumados por producto en la base (dos consultas agrupadas).
+    """
+    movements_after = dict(
+        db.query(
+            InventoryMovement.product_id,
+            func.sum(case(
+                (InventoryMovement.movement_type == 'entrada', -InventoryMovement.quantity),
+                else_=InventoryMovement.quantity,
+            )),
+        )
+        .filter(
+            InventoryMovement.tenant_id == tenant.id,
+            InventoryMovement.created_at > cutoff,
+        )
+        .group_by(InventoryMovement.product_id)
+        .all()
+    )
+    sold_after = dict(
+        db.query(ItemVentaContado.product_id, func.sum(ItemVentaContado.quantity))
+        .join(VentasContado)
+        .filter(
+            VentasContado.tenant_id == tenant.id,
+            ItemVentaContado.product_id.isnot(None),
+            VentasContado.created_at > cutoff,
+        )
+        .group_by(ItemVentaContado.product_id)
+        .all()
+    )
+
+    products = db.query(Product).filter(
+        Product.tenant_id == tenant.id,
+        Product.active == True
+    ).order_by(Product.id).all()
+
+    items = []
     for product in products:
-        # Create grouping key from all relevant attributes
-        key = "|".join([
-            str(product.name or ''),
-            str(product.modelo or ''),
-            str(product.quilataje or ''),
-            str(product.marca or ''),
-            str(product.color or ''),
-            str(product.base or ''),
-            str(product.tipo_joya or ''),
-            str(product.talla or ''),
-        ])
-        
-        if key not in groups:
-            groups[key] = {
-                'nombre': product.name,
-                'modelo': product.modelo,
-                'quilataje': product.quilataje,
-                'marca': product.marca,
-                'color': product.color,
-                'base': product.base,
-                'tipo_joya': product.tipo_joya,
-                'talla': product.talla,
-                'cantidad_total': 0,
-                'productos': []
-            }
-        
-        groups[key]['cantidad_total'] += product.stock
-        groups[key]['productos'].append({
-            'id': product.id,
-            'codigo': product.codigo,
-            'stock': product.stock,
-            'precio': float(product.price),
-            'costo': float(product.cost_price),
-        })
-    
-    return list(groups.values())
+        historical_stock = (
+            (int(product.stock) if product.stock else 0)
+            + int(movements_after.get(product.id) or 0)
+            + int(sold_after.get(product.id) or 0)
+        )
+        # Stock can't be negative (data inconsistency protection)
+        if historical_stock > 0:
+            items.append((product, historical_stock))
+    return items
+
+
+def _stock_items_as_of(target_date: date, db: Session, tenant: Tenant) -> List[Tuple[Product, int]]:
+    """(producto activo, stock > 0) al cierre de target_date."""
+    if target_date >= date.today():
+        products = db.query(Product).filter(
+            Product.tenant_id == tenant.id,
+            Product.active == True,
+            Product.stock > 0
+        ).order_by(Product.id).all()
+        return [(product, product.stock) for product in products]
+
+    # Note: After running fix_all_timestamps_timezone.sql, dates are already in Mexico time
+    # We want to include all movements UP TO the end of target_date
+    cutoff = stock_ledger.day_cutoff(target_date)
+    items = stock_ledger.stock_as_of(db, tenant.id, cutoff)
+    if items is None:
+        # Fecha anterior al inicio del kardex
+        items = _replay_stock_before(db, tenant, cutoff)
+    return items
 
 
 def get_stock_grouped_historical(
@@ -640,8 +714,12 @@ def get_stock_grouped_historical(
     tenant: Tenant
 ) -> List[Dict[str, Any]]:
     """
-    Calculate historical stock grouped by nombre, modelo, quilataje, marca, color, base, tipo_joya, talla
-    for a specific date by working backwards from current stock.
+    Stock grouped by nombre, modelo, quilataje, marca, color, base, tipo_joya, talla
+    as it was at the end of target_date.
+
+    Se lee del kardex de stock (última foto diaria + cambios posteriores, una consulta).
+    Para fechas anteriores al inicio del kardex se reconstruye hacia atrás desde el stock
+    actual con los movimientos y ventas de contado posteriores.
     
     Args:
         target_date: The date to calculate stock for
@@ -651,110 +729,56 @@ def get_stock_grouped_historical(
     Returns:
         List of grouped stock entries with total quantities as they were on target_date
     """
-    from datetime import timedelta
-    
     # If target_date is today or future, use current stock
     if target_date >= date.today():
         return get_stock_grouped(db=db, tenant=tenant)
-    
-    # Note: After running fix_all_timestamps_timezone.sql, dates are already in Mexico time
-    # We want to include all movements UP TO the end of target_date
-    target_datetime_end = datetime.combine(
-        target_date, 
-        datetime.max.time()
-    ).replace(tzinfo=tz.utc)
-    
-    # Get all products that existed on or before target_date
-    products = db.query(Product).filter(
-        Product.tenant_id == tenant.id,
-        Product.active == True
-    ).all()
-    
-    # Calculate historical stock for each product
-    historical_stocks: Dict[int, int] = {}
-    
-    for product in products:
-        current_stock = int(product.stock) if product.stock else 0
-        
-        # Get movements that happened AFTER target_date
-        movements_after = db.query(InventoryMovement).filter(
-            InventoryMovement.tenant_id == tenant.id,
-            InventoryMovement.product_id == product.id,
-            InventoryMovement.created_at > target_datetime_end
-        ).all()
-        
-        # Get sale items that happened AFTER target_date (usar VentasContado)
-        ventas_contado_after = db.query(ItemVentaContado).join(VentasContado).filter(
-            VentasContado.tenant_id == tenant.id,
-            ItemVentaContado.product_id == product.id,
-            VentasContado.created_at > target_datetime_end
-        ).all()
-        
-        # Calculate historical stock by reversing future changes
-        historical_stock = current_stock
-        
-        # Reverse movements after target date
-        for movement in movements_after:
-            if movement.movement_type == 'entrada':
-                # If it was an entrada (addition), subtract it to get historical stock
-                historical_stock -= movement.quantity
-            else:  # salida
-                # If it was a salida (removal), add it back to get historical stock
-                historical_stock += movement.quantity
-        
-        # Reverse ventas de contado after target date
-        for item in ventas_contado_after:
-            # Sales reduce stock, so add them back
-            historical_stock += item.quantity
-        
-        # Stock can't be negative (data inconsistency protection)
-        historical_stocks[product.id] = max(0, historical_stock)
-    
-    # Now group products with their historical stocks
+    return _group_stock(_stock_items_as_of(target_date, db, tenant))
+
+
+def get_stock_grouped_diff(
+    from_date: date,
+    to_date: date,
+    db: Session,
+    tenant: Tenant
+) -> List[Dict[str, Any]]:
+    """
+    Compare grouped stock at the end of from_date and to_date.
+
+    Cada grupo trae cantidad_inicial, cantidad_final y diferencia; cada producto, su stock
+    en ambas fechas. Los productos sin stock en ninguna de las dos no aparecen.
+    """
+    before = {product.id: (product, stock) for product, stock in _stock_items_as_of(from_date, db, tenant)}
+    after = {product.id: (product, stock) for product, stock in _stock_items_as_of(to_date, db, tenant)}
+
     groups: Dict[str, Dict[str, Any]] = {}
-    
-    for product in products:
-        historical_stock = historical_stocks.get(product.id, 0)
-        
-        # Skip products with no historical stock
-        if historical_stock <= 0:
-            continue
-        
-        # Create grouping key from all relevant attributes
-        key = "|".join([
-            str(product.name or ''),
-            str(product.modelo or ''),
-            str(product.quilataje or ''),
-            str(product.marca or ''),
-            str(product.color or ''),
-            str(product.base or ''),
-            str(product.tipo_joya or ''),
-            str(product.talla or ''),
-        ])
-        
+    for product_id in sorted(set(before) | set(after)):
+        product = (after.get(product_id) or before[product_id])[0]
+        stock_inicial = before[product_id][1] if product_id in before else 0
+        stock_final = after[product_id][1] if product_id in after else 0
+
+        key = _stock_group_key(product)
         if key not in groups:
             groups[key] = {
-                'nombre': product.name,
-                'modelo': product.modelo,
-                'quilataje': product.quilataje,
-                'marca': product.marca,
-                'color': product.color,
-                'base': product.base,
-                'tipo_joya': product.tipo_joya,
-                'talla': product.talla,
-                'cantidad_total': 0,
-                'productos': []
+                **_new_stock_group(product),
+                'cantidad_inicial': 0,
+                'cantidad_final': 0,
+                'diferencia': 0,
+                'productos': [],
             }
-        
-        groups[key]['cantidad_total'] += historical_stock
-        groups[key]['productos'].append({
+        group = groups[key]
+        group['cantidad_inicial'] += stock_inicial
+        group['cantidad_final'] += stock_final
+        group['diferencia'] += stock_final - stock_inicial
+        group['productos'].append({
             'id': product.id,
             'codigo': product.codigo,
-            'stock': historical_stock,
+            'stock_inicial': stock_inicial,
+            'stock_final': stock_final,
+            'diferencia': stock_final - stock_inicial,
             'precio': float(product.price),
             'costo': float(product.cost_price),
         })
-    
+
     return list(groups.values())
 
 
@@ -0,0 +1,300 @@
+"""
+Trabajos en segundo plano (importaciones, exportaciones, cierres del día).
+
+La cola es la tabla jobs, así que no hace falta un broker externo y los trabajos
+sobreviven a reinicios:
+- enqueue() guarda el trabajo como 'queued' (con el archivo de entrada, si hay) y despierta
+  a los workers del proceso.
+- Cada proceso levanta settings.job_workers hilos (start_runner, en el arranque de la app).
+  Un worker reclama el siguiente trabajo con un UPDATE condicional (status='queued' ->
+  'running'), así que aunque haya varios procesos cada trabajo lo toma uno solo.
+- El handler registrado con @register(kind) recibe (db, job, progress) y devuelve un dict
+  (queda en job.result) o un JobFile (se guarda para descargarlo).
+- Mientras corre, un latido actualiza heartbeat_at; los trabajos 'running' sin latido por
+  más de settings.job_stale_seconds (proceso caído) se marcan como fallidos.
+- Los trabajos terminados se borran después de settings.job_retention_hours.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, NamedTuple, Optional
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.job import Job
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+
+ProgressFn = Callable[..., None]
+Handler = Callable[[Session, Job, ProgressFn], object]
+
+
+class JobFile(NamedTuple):
+    """Resultado descargable de un trabajo."""
+    content: bytes
+    filename: str
+    media_type: str
+    summary: Optional[dict] = None
+
+
+class JobError(Exception):
+    """Error esperado de un handler; el mensaje se muestra tal cual al usuario."""
+
+
+class TooManyJobsError(Exception):
+    pass
+
+
+_handlers: Dict[str, Handler] = {}
+_table_ready = False
+_wakeup = threading.Event()
+
+
+def register(kind: str):
+    """Registrar el handler de un tipo de trabajo."""
+    def decorator(fn: Handler) -> Handler:
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def ensure_table(db: Session) -> bool:
+    """Crea la tabla si no existe (una vez por proceso). Devuelve False si no se pudo."""
+    global _table_ready
+    if not _table_ready:
+        try:
+            with db.begin_nested():
+                Job.__table__.create(bind=db.connection(), checkfirst=True)
+            _table_ready = True
+        except Exception as e:
+            print(f"⚠️ No se pudo crear la tabla jobs: {e}")
+    return _table_ready
+
+
+def enqueue(
+    db: Session,
+    tenant_id: int,
+    user_id: Optional[int],
+    kind: str,
+    params: Optional[dict] = None,
+    input_file: Optional[bytes] = None,
+) -> Job:
+    """Encolar un trabajo y hacer commit. Lanza TooManyJobsError si el tenant ya tiene demasiados pendientes."""
+    if kind not in _handlers:
+        raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+    ensure_table(db)
+    pending = db.query(func.count(Job.id)).filter(
+        Job.tenant_id == tenant_id, Job.status.in_(("queued", "running"))
+    ).scalar()
+    if pending >= settings.job_max_pending_per_tenant:
+        raise TooManyJobsError(f"Hay {pending} trabajos pendientes; espera a que terminen")
+
+    job = Job(
+        tenant_id=tenant_id,
+        user_id=user_id,
+        kind=kind,
+        status="queued",
+        params=params or {},
+        input_file=input_file,
+    )
+    db.add(job)
+    db.commit()
+    _wakeup.set()
+    return job
+
+
+def _now() -> datetime:
+    return datetime.utcnow()
+
+
+def _claim_next(db: Session) -> Optional[int]:
+    table = Job.__table__
+    for _ in range(5):
+        candidate = db.execute(
+            select(table.c.id).where(table.c.status == "queued").order_by(table.c.id).limit(1)
+        ).scalar()
+        if candidate is None:
+            return None
+        now = _now()
+        claimed = db.execute(
+            update(table)
+            .where(table.c.id == candidate, table.c.status == "queued")
+            .values(status="running", started_at=now, heartbeat_at=now, progress=0)
+        ).rowcount
+        db.commit()
+        if claimed == 1:
+            return candidate
+        # Otro worker lo tomó primero: intentar con el siguiente
+    return None
+
+
+def _touch(bind, job_id: int, **values) -> None:
+    """Actualizar el renglón del trabajo en una transacción propia (visible de inmediato)."""
+    try:
+        with bind.begin() as conn:
+            conn.execute(update(Job.__table__).where(Job.__table__.c.id == job_id).values(heartbeat_at=_now(), **values))
+    except Exception:
+        # Progreso y latido son informativos: nunca deben tumbar el trabajo
+        pass
+
+
+class _Heartbeat:
+    def __init__(self, bind, job_id: int):
+        self.bind = bind
+        self.job_id = job_id
+        self.stop = threading.Event()
+        self.interval = max(1.0, min(30.0, settings.job_stale_seconds / 3))
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self._run, name=f"job-heartbeat-{self.job_id}", daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while not self.stop.wait(self.interval):
+            _touch(self.bind, self.job_id)
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.thread.join()
+
+
+def _error_message(e: Exception) -> str:
+    # HTTPException de las funciones compartidas con las rutas trae el mensaje en .detail
+    detail = getattr(e, "detail", None)
+    if isinstance(detail, str):
+        return detail
+    if isinstance(e, JobError):
+        return str(e)
+    return f"{type(e).__name__}: {e}"
+
+
+def run_next(session_factory) -> Optional[int]:
+    """Reclamar y ejecutar un trabajo. Devuelve su id, o None si la cola está vacía."""
+    with session_factory() as db:
+        if not ensure_table(db):
+            return None
+        job_id = _claim_next(db)
+        if job_id is None:
+            return None
+
+        job = db.get(Job, job_id)
+        bind = db.get_bind()
+
+        def progress(pct: int, message: Optional[str] = None) -> None:
+            _touch(bind, job_id, progress=max(0, min(99, int(pct))), message=message)
+
+        values = {}
+        try:
+            handler = _handlers.get(job.kind)
+            if handler is None:
+                raise JobError(f"Tipo de trabajo desconocido: {job.kind}")
+            with _Heartbeat(bind, job_id):
+                outcome = handler(db, job, progress)
+            db.commit()
+            values.update(status="succeeded", progress=100, message=None)
+            if isinstance(outcome, JobFile):
+                values.update(
+                    result=outcome.summary,
+                    result_file=outcome.content,
+                    result_filename=outcome.filename,
+                    result_media_type=outcome.media_type,
+                )
+            else:
+                values["result"] = outcome
+        except Exception as e:
+            db.rollback()
+            values.update(status="failed", error=_error_message(e))
+
+        values["finished_at"] = _now()
+        db.execute(update(Job.__table__).where(Job.__table__.c.id == job_id).values(**values))
+        db.commit()
+        return job_id
+
+
+def cleanup(db: Session) -> None:
+    """Marcar como fallidos los trabajos sin latido y borrar los terminados viejos."""
+    table = Job.__table__
+    now = _now()
+    db.execute(
+        update(table)
+        .where(table.c.status == "running", table.c.heartbeat_at < now - timedelta(seconds=settings.job_stale_seconds))
+        .values(status="failed", error="Trabajo interrumpido (el servidor se reinició)", finished_at=now)
+    )
+    db.execute(
+        delete(table).where(
+            table.c.status.in_(("succeeded", "failed")),
+            table.c.finished_at < now - timedelta(hours=settings.job_retention_hours),
+        )
+    )
+    db.commit()
+
+
+class JobRunner:
+    """Pool acotado de hilos que consumen la cola."""
+
+    def __init__(self, session_factory, workers: int, poll_seconds: float):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self._stop = threading.Event()
+        self._threads = []
+        self._last_cleanup = 0.0
+        self._cleanup_lock = threading.Lock()
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._loop, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        _wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _maybe_cleanup(self) -> None:
+        with self._cleanup_lock:
+            if time.monotonic() - self._last_cleanup < 60:
+                return
+            self._last_cleanup = time.monotonic()
+        with self.session_factory() as db:
+            if ensure_table(db):
+                cleanup(db)
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            job_id = None
+            try:
+                self._maybe_cleanup()
+                job_id = run_next(self.session_factory)
+            except Exception as e:
+                print(f"⚠️ Error en el worker de trabajos: {e}")
+            if job_id is None:
+                # Cola vacía: esperar un aviso de enqueue() o revisar de nuevo (trabajos de otros procesos)
+                _wakeup.wait(self.poll_seconds)
+                _wakeup.clear()
+
+
+_runner: Optional[JobRunner] = None
+
+
+def start_runner(session_factory=None) -> None:
+    global _runner
+    if _runner is not None or settings.job_workers <= 0:
+        return
+    if session_factory is None:
+        from app.core.database import SessionLocal
+        session_factory = SessionLocal
+    _runner = JobRunner(session_factory, settings.job_workers, settings.job_poll_seconds)
+    _runner.start()
+
+
+def stop_runner() -> None:
+    global _runner
+    if _runner is not None:
+        _runner.stop()
+        _runner = None
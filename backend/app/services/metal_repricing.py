@@ -0,0 +1,191 @@
+"""
+Recálculo de precios de productos al cambiar una tasa de metal.
+
+El precio de un producto con quilataje y peso (y sin precio manual) es
+round(tasa × peso) menos el descuento, redondeado a entero: el mismo cálculo de la
+importación de Excel. En lugar de cargar cada producto y recalcularlo en Python:
+- preview() devuelve el impacto agregado del cambio en un solo SELECT, sin escribir.
+- reprice() guarda el historial con un INSERT ... SELECT y actualiza los precios con un
+  UPDATE ... FROM metal_rates para el tipo de metal; sólo toca productos cuyo precio
+  cambia. Con batch_size el trabajo se parte en rangos de id (trabajo en segundo plano
+  con progreso), y con commit=True cada lote hace commit para no retener los candados
+  de todo el catálogo.
+
+El redondeo es el de ROUND en SQL (mitades hacia arriba).
+"""
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Callable, List, Optional
+
+from sqlalchemy import Integer, Numeric, case, func, insert, literal, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.models.metal_rate import MetalRate
+from app.models.price_history import PriceHistory
+from app.models.product import Product
+from app.services import data_versions
+
+products = Product.__table__
+metal_rates = MetalRate.__table__
+
+_table_ready = False
+
+
+def ensure_table(db: Session) -> bool:
+    """Crea price_history si no existe (una vez por proceso)."""
+    global _table_ready
+    if not _table_ready:
+        try:
+            with db.begin_nested():
+                PriceHistory.__table__.create(bind=db.connection(), checkfirst=True)
+            _table_ready = True
+        except Exception as e:
+            print(f"⚠️ No se pudo crear la tabla price_history: {e}")
+    return _table_ready
+
+
+def _new_price(rate):
+    base = func.round(rate * products.c.peso_gramos)
+    return func.round(base - base * func.coalesce(products.c.descuento_porcentaje, 0) / 100)
+
+
+def _eligible(tenant_id: int, metal_type) -> list:
+    """Productos con precio por tasa: del metal, con peso y sin precio manual."""
+    return [
+        products.c.tenant_id == tenant_id,
+        products.c.quilataje == metal_type,
+        products.c.precio_manual.is_(None),
+        products.c.peso_gramos.isnot(None),
+    ]
+
+
+def _changed(new_price):
+    return or_(products.c.price != new_price, products.c.precio_venta.is_(None), products.c.precio_venta != new_price)
+
+
+def _money(value) -> float:
+    return round(float(value or 0), 2)
+
+
+def preview(db: Session, tenant_id: int, metal_type: str, rate_per_gram: float) -> dict:
+    """Impacto de aplicar rate_per_gram a los productos del metal, sin escribir nada."""
+    new_price = _new_price(literal(Decimal(str(rate_per_gram)), Numeric(10, 2)))
+    stock = func.coalesce(products.c.stock, 0)
+    row = db.execute(
+        select(
+            func.count(),
+            func.coalesce(func.sum(case((_changed(new_price), 1), else_=0)), 0),
+            func.sum(products.c.price),
+            func.sum(new_price),
+            func.sum(products.c.price * stock),
+            func.sum(new_price * stock),
+        ).where(*_eligible(tenant_id, metal_type))
+    ).one()
+    count, changed, *totals = row
+    total_before, total_after, stock_before, stock_after = (float(t or 0) for t in totals)
+    return {
+        "metal_type": metal_type,
+        "rate_per_gram": float(rate_per_gram),
+        "products": count,
+        "changed": int(changed),
+        "total_before": _money(total_before),
+        "total_after": _money(total_after),
+        "difference": _money(total_after - total_before),
+        # Valor del inventario (precio × existencias)
+        "inventory_before": _money(stock_before),
+        "inventory_after": _money(stock_after),
+        "inventory_difference": _money(stock_after - stock_before),
+    }
+
+
+def _batch_starts(db: Session, tenant_id: int, metal_type: str, batch_size: int) -> List[int]:
+    """Primer id de cada lote de batch_size productos del metal (una consulta)."""
+    numbered = select(
+        products.c.id,
+        func.row_number().over(order_by=products.c.id).label("rn"),
+    ).where(*_eligible(tenant_id, metal_type)).subquery()
+    return list(
+        db.execute(
+            select(numbered.c.id).where((numbered.c.rn - 1) % batch_size == 0).order_by(numbered.c.id)
+        ).scalars()
+    )
+
+
+def reprice(
+    db: Session,
+    tenant_id: int,
+    rate_id: int,
+    old_rate: Optional[float] = None,
+    user_id: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+    commit: bool = False,
+) -> dict:
+    """
+    Aplicar la tasa guardada en metal_rates (rate_id) a los productos de su metal.
+    Hace flush para leer la tasa ya modificada en la sesión. Sin commit=True no hace commit.
+    Devuelve {"metal_type", "updated", "batches"}.
+    """
+    db.flush()
+    rate = db.query(MetalRate).filter(MetalRate.id == rate_id, MetalRate.tenant_id == tenant_id).first()
+    if rate is None:
+        raise ValueError("Tasa de metal no encontrada")
+    metal_type = rate.metal_type
+    history = ensure_table(db)
+
+    new_price = _new_price(metal_rates.c.rate_per_gram)
+    conditions = [
+        metal_rates.c.id == rate_id,
+        products.c.quilataje == metal_rates.c.metal_type,
+        *_eligible(tenant_id, metal_type),
+        _changed(new_price),
+    ]
+    if batch_size:
+        starts = _batch_starts(db, tenant_id, metal_type, batch_size)
+        windows = [(start, starts[i + 1] if i + 1 < len(starts) else None) for i, start in enumerate(starts)]
+    else:
+        windows = [(None, None)]
+
+    now = datetime.now(timezone.utc)
+    old_rate_value = Decimal(str(old_rate)) if old_rate is not None else None
+    updated = 0
+    for done, (low, high) in enumerate(windows, start=1):
+        window = list(conditions)
+        if low is not None:
+            window.append(products.c.id >= low)
+        if high is not None:
+            window.append(products.c.id < high)
+
+        # Historial primero: el SELECT ve todavía el precio anterior
+        if history:
+            db.execute(
+                insert(PriceHistory.__table__).from_select(
+                    ["tenant_id", "product_id", "metal_rate_id", "metal_type", "old_rate", "new_rate",
+                     "old_price", "new_price", "user_id", "created_at"],
+                    select(
+                        products.c.tenant_id,
+                        products.c.id,
+                        metal_rates.c.id,
+                        metal_rates.c.metal_type,
+                        literal(old_rate_value, Numeric(10, 2)),
+                        metal_rates.c.rate_per_gram,
+                        products.c.price,
+                        new_price,
+                        literal(user_id, Integer),
+                        literal(now, PriceHistory.created_at.type),
+                    ).where(*window),
+                )
+            )
+        result = db.execute(
+            update(products).values(price=new_price, precio_venta=new_price).where(*window)
+        )
+        updated += max(result.rowcount or 0, 0)
+        if result.rowcount:
+            # El UPDATE no pasa por el flush: la versión del catálogo sube con este commit
+            data_versions.touch(db, tenant_id, data_versions.PRODUCTS)
+        if commit:
+            db.commit()
+        if progress:
+            progress(done, len(windows))
+
+    return {"metal_type": metal_type, "updated": updated, "batches": len(windows)}
@@ -0,0 +1,64 @@
+"""
+Paginación por llave (keyset) con cursor opaco.
+
+El cursor es la llave de orden del último renglón de la página (por ejemplo
+(created_at, id)) serializada en JSON y codificada en base64 url-safe. La siguiente
+página se pide con "renglones después de esta llave", así que cada página cuesta lo
+mismo sin importar qué tan atrás esté (a diferencia de OFFSET) y un renglón nuevo no
+desplaza los ya vistos.
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from typing import Any, List, Optional, Sequence
+
+from sqlalchemy import literal, tuple_
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"No se puede serializar {type(value).__name__} en un cursor")
+
+
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps(list(values), default=_default, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Valores del cursor; InvalidCursorError si no es un cursor de `size` valores."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise InvalidCursorError("Cursor inválido")
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursorError("Cursor inválido")
+    return values
+
+
+def parse_datetime(value: Any) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise InvalidCursorError("Cursor inválido")
+
+
+def after(columns: Sequence, values: Sequence, descending: bool = True):
+    """Condición 'después de la llave' para un orden por columns (todas desc o todas asc)."""
+    key = tuple_(*columns)
+    bound = tuple_(*(literal(value, column.type) for column, value in zip(columns, values)))
+    return key < bound if descending else key > bound
+
+
+def next_cursor(rows: Sequence, limit: int, key) -> Optional[str]:
+    """Cursor de la siguiente página si rows (pedidos con limit + 1) trae una más."""
+    if len(rows) <= limit:
+        return None
+    return encode_cursor(*key(rows[limit - 1]))
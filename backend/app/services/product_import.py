@@ -0,0 +1,270 @@
+"""
+Importación masiva de productos desde Excel.
+
+Todo el archivo se procesa por columnas con pandas, sin consultas por fila:
+1. Normalizar encabezados y valores (texto recortado, números con pd.to_numeric).
+2. Validar y juntar los errores por fila ("Fila N: ...", N = renglón de Excel).
+3. Calcular precios con las tasas de MetalRate del tenant (una consulta).
+4. Cargar los códigos existentes del tenant con su stock (una consulta) para contar
+   altas/actualizaciones.
+5. Escribir con INSERT ... ON CONFLICT (tenant_id, codigo) DO UPDATE en bloques y anotar
+   en el kardex de stock los productos cuyo stock cambió (una consulta por bloque).
+
+Reglas de precio (las mismas que el importador anterior):
+- precio_manual si viene y no es 0
+- si hay quilataje y peso: round(tasa * peso) menos el descuento, redondeado
+- si no: costo * 1.5 redondeado (0 sin costo). También se usa cuando el quilataje
+  no tiene tasa registrada.
+"""
+from io import BytesIO
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.models.metal_rate import MetalRate
+from app.models.product import Product
+from app.services import data_versions, stock_ledger
+
+IMPORT_CHUNK_SIZE = 1000
+
+TEXT_COLUMNS = ("marca", "modelo", "color", "base", "tipo_joya", "talla")
+
+# columna numérica -> límite (exclusivo) del valor absoluto que cabe en la columna
+NUMERIC_COLUMNS = {
+    "peso_gramos": 10 ** 7,
+    "descuento_porcentaje": 10 ** 3,
+    "precio_manual": 10 ** 8,
+    "costo": 10 ** 8,
+    "stock": 2 ** 31,
+}
+
+UPDATE_COLUMNS = (
+    "name", "marca", "modelo", "color", "quilataje", "base", "tipo_joya", "talla",
+    "peso_gramos", "descuento_porcentaje", "precio_manual", "costo", "cost_price",
+    "precio_venta", "price", "stock", "active",
+)
+
+
+def _text(series: pd.Series) -> pd.Series:
+    """str(valor).strip() para los valores no nulos; NaN se queda como NaN."""
+    return series.map(lambda v: str(v).strip(), na_action="ignore")
+
+
+def _column(df: pd.DataFrame, name: str) -> pd.Series:
+    if name in df.columns:
+        return df[name]
+    return pd.Series(np.nan, index=df.index, dtype=object)
+
+
+def normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Encabezados en minúsculas y sin espacios; 'nombre' se acepta como 'name'."""
+    df = df.copy()
+    df.columns = [str(c).lower().strip() for c in df.columns]
+    if "nombre" in df.columns and "name" not in df.columns:
+        df["name"] = df["nombre"]
+    return df.reset_index(drop=True)
+
+
+def _load_metal_rates(db: Session, tenant_id: int) -> Dict[str, float]:
+    rates: Dict[str, float] = {}
+    for metal_type, rate in db.query(MetalRate.metal_type, MetalRate.rate_per_gram).filter(
+        MetalRate.tenant_id == tenant_id
+    ).all():
+        rates[metal_type] = float(rate)
+    return rates
+
+
+def _compute_prices(quilataje: pd.Series, numbers: Dict[str, pd.Series], rates: Dict[str, float]) -> pd.Series:
+    rates_lower = {k.lower(): v for k, v in rates.items()}
+    # Primero coincidencia exacta, luego sin distinguir mayúsculas
+    rate = quilataje.map(rates).astype(float)
+    rate = rate.fillna(quilataje.map(str.lower, na_action="ignore").map(rates_lower).astype(float))
+
+    peso = numbers["peso_gramos"]
+    descuento = numbers["descuento_porcentaje"].fillna(0)
+    manual = numbers["precio_manual"]
+    costo = numbers["costo"].fillna(0)
+
+    base_price = np.round(rate * peso)
+    metal_price = np.round(base_price - base_price * descuento / 100)
+    cost_price = np.where(costo > 0, np.round(costo * 1.5), 0)
+
+    use_manual = manual.notna() & (manual != 0)
+    use_metal = quilataje.notna() & peso.notna() & (peso != 0) & rate.notna() & (rate != 0)
+    return pd.Series(
+        np.select([use_manual, use_metal], [manual, metal_price], default=cost_price),
+        index=quilataje.index,
+    )
+
+
+def prepare_rows(df: pd.DataFrame, tenant_id: int, rates: Dict[str, float]):
+    """
+    Convertir el DataFrame ya normalizado en renglones para products.
+    Devuelve (rows, errors). Si un código se repite en el archivo gana la última fila.
+    """
+    errors: Dict[int, str] = {}
+    excel_row = df.index + 2
+
+    codigo = _text(_column(df, "codigo")).replace("", np.nan)
+    for i in df.index[codigo.isna()]:
+        errors[i] = "código es requerido"
+
+    numbers: Dict[str, pd.Series] = {}
+    for name, limit in NUMERIC_COLUMNS.items():
+        raw = _column(df, name)
+        value = pd.to_numeric(raw, errors="coerce")
+        invalid = raw.notna() & value.isna()
+        out_of_range = value.abs() >= limit
+        for i in df.index[invalid]:
+            errors.setdefault(i, f"valor inválido en {name}: {raw[i]!r}")
+        for i in df.index[out_of_range]:
+            errors.setdefault(i, f"valor fuera de rango en {name}: {raw[i]}")
+        numbers[name] = value.astype(float)
+
+    duplicated = codigo.notna() & codigo.duplicated(keep="last")
+    last_row = pd.Series(df.index, index=codigo).groupby(level=0).last() if codigo.notna().any() else {}
+    for i in df.index[duplicated]:
+        errors.setdefault(i, f"código {codigo[i]} repetido en el archivo (se usa la fila {last_row[codigo[i]] + 2})")
+
+    quilataje = _text(_column(df, "quilataje"))
+    quilataje = quilataje.where(quilataje.notna() & ~quilataje.isin(["", "nan", "NaN"]))
+    price = _compute_prices(quilataje, numbers, rates)
+    costo = numbers["costo"].fillna(0)
+
+    frame = pd.DataFrame({
+        "tenant_id": tenant_id,
+        "codigo": codigo,
+        "name": _text(_column(df, "name")).fillna(""),
+        "quilataje": quilataje,
+        "peso_gramos": numbers["peso_gramos"],
+        "descuento_porcentaje": numbers["descuento_porcentaje"].fillna(0),
+        "precio_manual": numbers["precio_manual"],
+        "costo": costo,
+        "cost_price": costo,
+        "precio_venta": price,
+        "price": price,
+        "stock": np.trunc(numbers["stock"].fillna(0)),
+        "active": True,
+    })
+    for name in TEXT_COLUMNS:
+        frame[name] = _text(_column(df, name))
+
+    valid = ~df.index.isin(list(errors))
+    frame = frame[valid]
+    frame = frame.astype(object).where(frame.notna(), None)
+    frame["stock"] = frame["stock"].map(int)
+    rows = frame.to_dict("records")
+
+    error_list = [f"Fila {excel_row[i]}: {errors[i]}" for i in sorted(errors)]
+    return rows, error_list
+
+
+def _existing_stock(db: Session, tenant_id: int) -> Dict[str, Optional[int]]:
+    """codigo -> stock de los productos existentes del tenant."""
+    table = Product.__table__
+    return dict(db.execute(
+        select(table.c.codigo, table.c.stock).where(table.c.tenant_id == tenant_id, table.c.codigo.isnot(None))
+    ).all())
+
+
+def _record_stock_changes(db: Session, tenant_id: int, rows: List[dict], existing: Dict[str, Optional[int]]) -> None:
+    table = Product.__table__
+    written = db.execute(
+        select(table.c.id, table.c.codigo, table.c.stock).where(
+            table.c.tenant_id == tenant_id, table.c.codigo.in_([row["codigo"] for row in rows])
+        )
+    ).all()
+    changes = []
+    for product_id, codigo, stock in written:
+        if stock is None:
+            continue
+        if codigo not in existing:
+            changes.append((product_id, stock, stock))
+        elif existing[codigo] != stock:
+            old = existing[codigo]
+            changes.append((product_id, stock - old if old is not None else None, stock))
+    stock_ledger.record(db, tenant_id, changes, "importacion")
+
+
+def _write_chunk(db: Session, rows: List[dict], existing: Dict[str, Optional[int]]) -> None:
+    table = Product.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["tenant_id", "codigo"],
+            set_={name: stmt.excluded[name] for name in UPDATE_COLUMNS},
+        )
+        # executemany: la sentencia se compila una vez; en psycopg2 SQLAlchemy la agrupa en
+        # INSERT multi-fila (insertmanyvalues) y en SQLite usa cursor.executemany
+        db.execute(stmt, rows)
+        return
+
+    # Otros motores: UPDATE (executemany) de los existentes e INSERT multi-fila del resto
+    new_rows = [r for r in rows if r["codigo"] not in existing]
+    old_rows = [r for r in rows if r["codigo"] in existing]
+    if old_rows:
+        db.execute(
+            table.update()
+            .where(table.c.tenant_id == bindparam("b_tenant_id"), table.c.codigo == bindparam("b_codigo"))
+            .values({name: bindparam(f"b_{name}") for name in UPDATE_COLUMNS}),
+            [{f"b_{k}": v for k, v in row.items()} for row in old_rows],
+        )
+    if new_rows:
+        db.execute(table.insert(), new_rows)
+
+
+def import_products_frame(
+    db: Session,
+    tenant_id: int,
+    df: pd.DataFrame,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> dict:
+    """
+    Importar (alta o actualización por código) los productos del DataFrame.
+    No hace commit. Devuelve {"added", "updated", "errors", "total_rows"}.
+    progress(escritos, total) se llama después de cada bloque.
+    """
+    df = normalize_frame(df)
+    rows, errors = prepare_rows(df, tenant_id, _load_metal_rates(db, tenant_id))
+    existing = _existing_stock(db, tenant_id)
+
+    updated = sum(1 for row in rows if row["codigo"] in existing)
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        _write_chunk(db, chunk, existing)
+        _record_stock_changes(db, tenant_id, chunk, existing)
+        if progress:
+            progress(min(start + chunk_size, len(rows)), len(rows))
+    if rows:
+        data_versions.touch(db, tenant_id, data_versions.PRODUCTS)
+
+    return {
+        "added": len(rows) - updated,
+        "updated": updated,
+        "errors": errors,
+        "total_rows": len(df),
+    }
+
+
+def import_products_excel(
+    db: Session,
+    tenant_id: int,
+    contents: bytes,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> dict:
+    """Leer el Excel e importarlo. Lanza ValueError si el archivo no sirve. No hace commit."""
+    try:
+        df = pd.read_excel(BytesIO(contents))
+    except Exception as e:
+        raise ValueError(f"Error procesando archivo: {e}")
+    df = normalize_frame(df)
+    if "codigo" not in df.columns:
+        raise ValueError("Columnas requeridas faltantes: codigo")
+    return import_products_frame(db, tenant_id, df, progress=progress)
@@ -0,0 +1,86 @@
+"""
+Búsqueda de productos para el buscador del POS.
+
+La búsqueda es por subcadena (sin distinguir mayúsculas) sobre name, codigo, category,
+modelo y talla. En PostgreSQL cada columna tiene un índice GIN pg_trgm sobre lower(col),
+así que el OR de LIKE '%q%' se resuelve con un BitmapOr de índices en lugar de recorrer
+todo el catálogo del tenant. En SQLite (tests) la misma consulta corre sin índice.
+
+Orden: primero los productos cuyo codigo contiene el término, con el código más corto
+primero, y luego por id.
+
+Nota: pg_trgm necesita al menos 3 caracteres para usar el índice; con términos de 1-2
+caracteres el planner vuelve a recorrer la tabla (sigue filtrando por tenant).
+"""
+from typing import List, Optional
+
+from sqlalchemy import case, func, or_, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Query, Session
+
+from app.models.product import Product
+
+SEARCH_COLUMNS = ("name", "codigo", "category", "modelo", "talla")
+
+
+def _trgm_index_name(column: str) -> str:
+    return f"ix_products_{column}_trgm"
+
+
+def ensure_search_indexes(engine: Engine) -> bool:
+    """
+    Crear la extensión pg_trgm y los índices GIN de búsqueda si no existen.
+    No hace nada fuera de PostgreSQL. Devuelve True si los índices quedaron disponibles.
+    """
+    if engine.dialect.name != "postgresql":
+        return False
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            for column in SEARCH_COLUMNS:
+                connection.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS {_trgm_index_name(column)} "
+                    f"ON products USING gin (lower({column}) gin_trgm_ops)"
+                ))
+            connection.commit()
+        return True
+    except Exception as e:
+        print(f"⚠️ No se pudieron crear los índices de búsqueda de productos: {e}")
+        return False
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def normalize_term(q: Optional[str]) -> str:
+    return (q or "").strip().lower()
+
+
+def apply_search(query: Query, term: str) -> Query:
+    """Filtrar y ordenar una consulta de Product por el término ya normalizado."""
+    pattern = _like_pattern(term)
+    codigo_match = func.lower(Product.codigo).like(pattern, escape="\\")
+    query = query.filter(
+        or_(*(func.lower(getattr(Product, column)).like(pattern, escape="\\") for column in SEARCH_COLUMNS))
+    )
+    # 1) codigo contiene el término, 2) código más corto, 3) id
+    return query.order_by(case((codigo_match, 0), else_=1), func.length(Product.codigo), Product.id)
+
+
+def search_products(
+    db: Session,
+    tenant_id: int,
+    q: Optional[str] = None,
+    active: Optional[bool] = None,
+    skip: int = 0,
+    limit: int = 50,
+) -> List[Product]:
+    query = db.query(Product).filter(Product.tenant_id == tenant_id)
+    if active is not None:
+        query = query.filter(Product.active == active)
+    term = normalize_term(q)
+    if term:
+        query = apply_search(query, term)
+    return query.offset(skip).limit(limit).all()
@@ -0,0 +1,142 @@
+"""
+Feed de ventas (GET /ventas/): ventas de contado, apartados y, opcionalmente, pedidos en
+un solo UNION ALL ordenado por (created_at, origen, id) descendente.
+
+Cada rama del UNION aplica los filtros, la llave del cursor y su propio LIMIT, así que la
+base de datos lee a lo más limit + 1 renglones por origen desde el índice
+(tenant_id, created_at) y la página N cuesta lo mismo que la primera. El correo del
+usuario sale de un LEFT JOIN con users en la misma consulta.
+
+El cursor (opaco, ver app.services.pagination) es la llave (created_at, origen, id) del
+último renglón; el origen desempata ventas de distintas tablas con el mismo instante.
+"""
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, func, literal, null, or_, select, union_all
+from sqlalchemy.orm import Session
+
+from app.models.apartado import Apartado
+from app.models.producto_pedido import Pedido
+from app.models.user import User
+from app.models.venta_contado import VentasContado
+from app.services import pagination
+
+# Orden de desempate entre orígenes (y tipo_venta de cada uno)
+SOURCES = ("contado", "abono", "pedido")
+
+
+def _seller_filter(model, user_id: int):
+    # Vendedor asignado o, si no hay, quien registró la venta
+    return or_(model.vendedor_id == user_id, and_(model.vendedor_id.is_(None), model.user_id == user_id))
+
+
+def _after(created_at, id_column, rank: int, cursor: Optional[Tuple[datetime, int, int]]):
+    """Llave (created_at, rank, id) < cursor, escrita para usar el índice de la rama."""
+    if cursor is None:
+        return None
+    at, cursor_rank, cursor_id = cursor
+    if rank < cursor_rank:
+        return created_at <= at
+    if rank > cursor_rank:
+        return created_at < at
+    return pagination.after((created_at, id_column), (at, cursor_id))
+
+
+def _branch(rank: int, model, folio, vendedor, created_at, conditions, cursor, fetch: int):
+    where = [c for c in conditions + [_after(created_at, model.id, rank, cursor)] if c is not None]
+    stmt = (
+        select(
+            literal(rank).label("rank"),
+            model.id.label("id"),
+            model.total.label("total"),
+            created_at.label("created_at"),
+            model.user_id.label("user_id"),
+            vendedor.label("vendedor_id"),
+            folio.label("folio"),
+        )
+        .where(*where)
+        .order_by(created_at.desc(), model.id.desc())
+        .limit(fetch)
+    )
+    # SQLite no acepta ORDER BY/LIMIT directamente en una rama del UNION
+    return select(stmt.subquery())
+
+
+def _pedido_created_at(db: Session):
+    # pedidos.created_at lleva zona horaria; las otras tablas guardan UTC sin zona
+    if db.get_bind().dialect.name == "postgresql":
+        return func.timezone("UTC", Pedido.created_at)
+    return Pedido.created_at
+
+
+def page(
+    db: Session,
+    tenant_id: int,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    user_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    include_pedidos: bool = False,
+) -> Tuple[List[dict], Optional[str]]:
+    """Una página del feed y el cursor de la siguiente (None si es la última)."""
+    key = None
+    if cursor:
+        at, rank, last_id = pagination.decode_cursor(cursor, 3)
+        key = (pagination.parse_datetime(at), rank, last_id)
+    # skip (compatibilidad) recorre desde el inicio: cada rama debe traer skip + limit + 1
+    fetch = skip + limit + 1
+
+    def common(model, created_at):
+        conditions = [model.tenant_id == tenant_id]
+        if date_from:
+            conditions.append(created_at >= date_from)
+        if date_to:
+            conditions.append(created_at <= date_to)
+        return conditions
+
+    branches = [
+        _branch(0, VentasContado, VentasContado.folio_venta, VentasContado.vendedor_id, VentasContado.created_at,
+                common(VentasContado, VentasContado.created_at)
+                + ([_seller_filter(VentasContado, user_id)] if user_id is not None else []),
+                key, fetch),
+        _branch(1, Apartado, Apartado.folio_apartado, Apartado.vendedor_id, Apartado.created_at,
+                common(Apartado, Apartado.created_at)
+                + ([_seller_filter(Apartado, user_id)] if user_id is not None else []),
+                key, fetch),
+    ]
+    if include_pedidos:
+        created_at = _pedido_created_at(db)
+        branches.append(
+            _branch(2, Pedido, Pedido.folio_pedido, null(), created_at,
+                    common(Pedido, created_at) + ([Pedido.user_id == user_id] if user_id is not None else []),
+                    key, fetch)
+        )
+
+    feed = union_all(*branches).subquery("feed")
+    rows = db.execute(
+        select(feed, User.email)
+        .outerjoin(User, User.id == feed.c.user_id)
+        .order_by(feed.c.created_at.desc(), feed.c.rank.desc(), feed.c.id.desc())
+        .offset(skip)
+        .limit(limit + 1)
+    ).all()
+
+    items = []
+    for row in rows[:limit]:
+        tipo_venta = SOURCES[row.rank]
+        item = {
+            "id": row.id,
+            "total": row.total,
+            "created_at": row.created_at,
+            "user_id": row.user_id,
+            "vendedor_id": row.vendedor_id,
+            "tipo_venta": tipo_venta,
+            "user": {"email": row.email} if row.email else None,
+        }
+        item[{"contado": "folio_venta", "abono": "folio_apartado", "pedido": "folio_pedido"}[tipo_venta]] = row.folio
+        items.append(item)
+    next_cursor = pagination.next_cursor(rows, limit, lambda row: (row.created_at, row.rank, row.id))
+    return items, next_cursor
@@ -0,0 +1,281 @@
+"""
+Kardex de stock con saldo corrido y fotos diarias.
+
+Cada cambio de Product.stock deja un renglón en stock_ledger con el saldo resultante:
+- reserve_stock/release_stock (ventas, apartados, devoluciones) llaman a record().
+- Los cambios hechos con el ORM (alta de producto, movimientos de entrada/salida,
+  edición, actualización masiva, pedidos recibidos) se capturan en cada flush; el motivo
+  sale del InventoryMovement creado en el mismo flush (entrada/salida) o es "ajuste".
+- La importación de Excel registra el saldo de los productos cuyo stock cambió.
+
+take_snapshot() guarda el saldo de cada producto con stock al corte de un día
+(stock_snapshots). La primera foto de un tenant se toma del stock actual y marca el
+inicio del kardex.
+
+El stock a una fecha es entonces una sola consulta: la última foto anterior al corte más
+los renglones del kardex posteriores a ella, quedándose con el más reciente por producto.
+Para fechas anteriores a la primera foto no hay kardex y inventory_service reconstruye el
+stock hacia atrás con los movimientos y ventas (consultas agrupadas).
+"""
+import argparse
+from datetime import date, datetime, time as dt_time, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, func, insert, literal, or_, select, union_all
+from sqlalchemy.orm import Session, attributes
+
+from app.models.inventory_movement import InventoryMovement
+from app.models.product import Product
+from app.models.stock_ledger import StockLedgerEntry, StockSnapshot
+
+_tables_ready = False
+
+# (product_id, delta, balance)
+Change = Tuple[int, Optional[int], int]
+
+
+def _ensure(connection) -> bool:
+    global _tables_ready
+    if not _tables_ready:
+        try:
+            with connection.begin_nested():
+                StockLedgerEntry.__table__.create(bind=connection, checkfirst=True)
+                StockSnapshot.__table__.create(bind=connection, checkfirst=True)
+            _tables_ready = True
+        except Exception as e:
+            print(f"⚠️ No se pudieron crear las tablas del kardex de stock: {e}")
+    return _tables_ready
+
+
+def ensure_tables(db: Session) -> bool:
+    """Crea stock_ledger y stock_snapshots si no existen (una vez por proceso)."""
+    return _ensure(db.connection())
+
+
+def day_cutoff(target_date: date) -> datetime:
+    """Fin del día, mismo criterio que el cálculo histórico anterior."""
+    return datetime.combine(target_date, dt_time.max).replace(tzinfo=timezone.utc)
+
+
+def _insert(connection, tenant_id: int, changes: Iterable[Change], reason: str) -> None:
+    now = datetime.now(timezone.utc)
+    rows = [
+        {
+            "tenant_id": tenant_id,
+            "product_id": product_id,
+            "delta": delta,
+            "balance": balance,
+            "reason": reason,
+            "created_at": now,
+        }
+        for product_id, delta, balance in changes
+    ]
+    if rows:
+        connection.execute(insert(StockLedgerEntry.__table__), rows)
+
+
+def record(db: Session, tenant_id: int, changes: Iterable[Change], reason: str) -> None:
+    """Registrar cambios de stock hechos con SQL directo, en la transacción actual."""
+    changes = list(changes)
+    if changes and ensure_tables(db):
+        _insert(db.connection(), tenant_id, changes, reason)
+
+
+# ---------------------------------------------------------------------------
+# Cambios hechos con el ORM
+# ---------------------------------------------------------------------------
+
+@event.listens_for(Session, "after_flush")
+def _record_orm_changes(session: Session, flush_context) -> None:
+    products = [
+        obj for obj in session.new | session.dirty
+        if isinstance(obj, Product) and obj.tenant_id is not None
+    ]
+    if not products:
+        return
+
+    reasons = {
+        obj.product_id: obj.movement_type
+        for obj in session.new
+        if isinstance(obj, InventoryMovement) and obj.movement_type in ("entrada", "salida")
+    }
+    by_reason: Dict[Tuple[int, str], List[Change]] = {}
+    for product in products:
+        if product in session.new:
+            if product.stock is None:
+                continue
+            change = (product.id, int(product.stock), int(product.stock))
+            reason = reasons.get(product.id, "alta")
+        else:
+            history = attributes.get_history(product, "stock")
+            if not history.added or history.added[0] is None:
+                continue
+            new = int(history.added[0])
+            old = history.deleted[0] if history.deleted else None
+            if old is not None and int(old) == new:
+                continue
+            change = (product.id, new - int(old) if old is not None else None, new)
+            reason = reasons.get(product.id, "ajuste")
+        by_reason.setdefault((product.tenant_id, reason), []).append(change)
+
+    if not by_reason:
+        return
+    connection = session.connection()
+    if not _ensure(connection):
+        return
+    for (tenant_id, reason), changes in by_reason.items():
+        _insert(connection, tenant_id, changes, reason)
+
+
+# ---------------------------------------------------------------------------
+# Fotos y consultas a una fecha
+# ---------------------------------------------------------------------------
+
+def ledger_start(db: Session, tenant_id: int) -> Optional[datetime]:
+    """Momento de la primera foto del tenant (desde ahí el kardex es completo)."""
+    if not ensure_tables(db):
+        return None
+    start = db.execute(
+        select(func.min(StockSnapshot.as_of)).where(StockSnapshot.tenant_id == tenant_id)
+    ).scalar()
+    return _aware(start) if start is not None else None
+
+
+def _aware(value: datetime) -> datetime:
+    # SQLite devuelve fechas sin zona; todo se guarda en UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def covers(db: Session, tenant_id: int, cutoff: datetime) -> bool:
+    start = ledger_start(db, tenant_id)
+    return start is not None and cutoff >= start
+
+
+def latest_balances(tenant_id: int, cutoff: datetime):
+    """
+    Subconsulta (product_id, balance) con el saldo de cada producto al corte: la última
+    foto con as_of <= cutoff y los renglones del kardex entre esa foto y el corte.
+    """
+    snap_as_of = (
+        select(func.max(StockSnapshot.as_of))
+        .where(StockSnapshot.tenant_id == tenant_id, StockSnapshot.as_of <= cutoff)
+        .scalar_subquery()
+    )
+    snapshot_rows = select(
+        StockSnapshot.product_id.label("product_id"),
+        StockSnapshot.balance.label("balance"),
+        StockSnapshot.as_of.label("at"),
+        literal(0).label("seq"),
+    ).where(StockSnapshot.tenant_id == tenant_id, StockSnapshot.as_of == snap_as_of)
+    ledger_rows = select(
+        StockLedgerEntry.product_id.label("product_id"),
+        StockLedgerEntry.balance.label("balance"),
+        StockLedgerEntry.created_at.label("at"),
+        StockLedgerEntry.id.label("seq"),
+    ).where(
+        StockLedgerEntry.tenant_id == tenant_id,
+        StockLedgerEntry.created_at <= cutoff,
+        or_(snap_as_of.is_(None), StockLedgerEntry.created_at > snap_as_of),
+    )
+    rows = union_all(snapshot_rows, ledger_rows).subquery("rows")
+    ranked = select(
+        rows.c.product_id,
+        rows.c.balance,
+        func.row_number().over(
+            partition_by=rows.c.product_id, order_by=(rows.c.at.desc(), rows.c.seq.desc())
+        ).label("rn"),
+    ).subquery("ranked")
+    return select(ranked.c.product_id, ranked.c.balance).where(ranked.c.rn == 1).subquery("balances")
+
+
+def stock_as_of(db: Session, tenant_id: int, cutoff: datetime) -> Optional[List[Tuple[Product, int]]]:
+    """
+    (producto activo, saldo) con saldo > 0 al corte, en una consulta.
+    None si el kardex del tenant no cubre esa fecha.
+    """
+    if not covers(db, tenant_id, cutoff):
+        return None
+    balances = latest_balances(tenant_id, cutoff)
+    return (
+        db.query(Product, balances.c.balance)
+        .join(balances, balances.c.product_id == Product.id)
+        .filter(Product.tenant_id == tenant_id, Product.active == True, balances.c.balance > 0)
+        .order_by(Product.id)
+        .all()
+    )
+
+
+def take_snapshot(db: Session, tenant_id: int, snapshot_date: Optional[date] = None) -> int:
+    """
+    Guardar la foto del día (saldo de cada producto con stock). Idempotente por día.
+    La primera foto del tenant se toma del stock actual. No hace commit.
+    Devuelve el número de productos guardados.
+    """
+    if not ensure_tables(db):
+        return 0
+    now = datetime.now(timezone.utc)
+    snapshot_date = snapshot_date or now.date()
+    exists = db.execute(
+        select(StockSnapshot.id).where(
+            StockSnapshot.tenant_id == tenant_id, StockSnapshot.snapshot_date == snapshot_date
+        ).limit(1)
+    ).first()
+    if exists:
+        return 0
+
+    start = ledger_start(db, tenant_id)
+    if start is None:
+        # Apertura del kardex: el stock actual
+        as_of = now
+        source = select(Product.id, Product.stock).where(
+            Product.tenant_id == tenant_id, Product.stock.isnot(None), Product.stock > 0
+        )
+    else:
+        # Un día en curso se fotografía hasta ahora; lo posterior sigue en el kardex
+        as_of = min(day_cutoff(snapshot_date), now)
+        if as_of < start:
+            return 0
+        balances = latest_balances(tenant_id, as_of)
+        source = select(balances.c.product_id, balances.c.balance).where(balances.c.balance > 0)
+
+    snapshot_rows = source.subquery("source")
+    result = db.execute(
+        insert(StockSnapshot.__table__).from_select(
+            ["tenant_id", "product_id", "snapshot_date", "as_of", "balance"],
+            select(
+                literal(tenant_id),
+                snapshot_rows.c[0],
+                literal(snapshot_date, StockSnapshot.snapshot_date.type),
+                literal(as_of, StockSnapshot.as_of.type),
+                snapshot_rows.c[1],
+            ),
+        )
+    )
+    return max(result.rowcount or 0, 0)
+
+
+def snapshot_all(db: Session, snapshot_date: Optional[date] = None) -> Dict[int, int]:
+    """Foto del día para todos los tenants, con commit por tenant. Devuelve {tenant_id: productos}."""
+    from app.models.tenant import Tenant
+
+    saved = {}
+    for (tenant_id,) in db.query(Tenant.id).order_by(Tenant.id).all():
+        saved[tenant_id] = take_snapshot(db, tenant_id, snapshot_date)
+        db.commit()
+    return saved
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Foto diaria del stock (kardex)")
+    parser.add_argument("--date", type=date.fromisoformat, default=None, help="Día (YYYY-MM-DD); por defecto hoy")
+    args = parser.parse_args(argv)
+
+    from app.core.database import SessionLocal
+
+    with SessionLocal() as db:
+        saved = snapshot_all(db, args.date)
+    print(f"✅ Fotos de stock guardadas: {sum(saved.values())} productos en {len(saved)} tenants")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Reserva atómica de stock para ventas y apartados.
+
+En lugar de leer Product.stock, validarlo en Python y escribir stock - q (dos cajeros
+podían vender la última pieza a la vez), todas las líneas de un carrito se descuentan
+con un solo UPDATE condicional:
+
+    WITH locked AS (SELECT id FROM products WHERE ... ORDER BY id FOR UPDATE)
+    UPDATE products SET stock = stock - v.q
+    FROM locked, (VALUES ...) AS v(id, q)
+    WHERE products.id = locked.id AND products.id = v.id
+      AND (products.stock IS NULL OR products.stock >= v.q)
+    RETURNING products.id, products.stock
+
+Los candados se toman en orden de id (sin deadlocks entre carritos que comparten
+productos) y la condición stock >= q se re-evalúa sobre la versión bloqueada de la fila.
+Si alguna línea no alcanza se lanza InsufficientStockError; las líneas que sí se
+descontaron quedan en la transacción y el llamador debe hacer rollback.
+Productos con stock NULL no llevan inventario y no se descuentan.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import Integer, column, literal, or_, select, union_all, update, values
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.models.product import Product
+from app.services import codigo_index, data_versions, stock_ledger
+
+
+class InsufficientStockError(ValueError):
+    """No hay stock suficiente (o el producto no existe) para una línea del carrito."""
+
+    def __init__(self, product_id: int):
+        self.product_id = product_id
+        super().__init__(f"Stock insuficiente para el producto {product_id}")
+
+
+def merge_quantities(lines: Iterable[Tuple[int, int]]) -> Dict[int, int]:
+    """Agrupar (product_id, cantidad) por producto, ordenado por id."""
+    merged: Dict[int, int] = {}
+    for product_id, quantity in lines:
+        merged[product_id] = merged.get(product_id, 0) + int(quantity)
+    return OrderedDict(sorted(merged.items()))
+
+
+def _adjust_stock(db: Session, tenant_id: int, quantities: Dict[int, int], sign: int, reason: str) -> Dict[int, int]:
+    if not quantities:
+        return {}
+
+    products = Product.__table__
+    ordered = sorted(quantities.items())
+    is_postgres = db.get_bind().dialect.name == "postgresql"
+    if is_postgres:
+        lines = values(column("id", Integer), column("q", Integer), name="v").data(ordered)
+    else:
+        # SQLite no acepta alias de columnas en VALUES
+        lines = union_all(*[
+            select(literal(pid, Integer).label("id"), literal(q, Integer).label("q")) for pid, q in ordered
+        ]).subquery("v")
+
+    stmt = (
+        update(products)
+        .where(products.c.tenant_id == tenant_id, products.c.id == lines.c.id)
+        .values(stock=products.c.stock - lines.c.q if sign < 0 else products.c.stock + lines.c.q)
+        .returning(products.c.id, products.c.stock)
+    )
+    if sign < 0:
+        stmt = stmt.where(or_(products.c.stock.is_(None), products.c.stock >= lines.c.q))
+    if is_postgres:
+        # Bloquear en orden de id antes de modificar; SQLite tiene un solo escritor y no lo necesita
+        locked = (
+            select(products.c.id)
+            .where(products.c.tenant_id == tenant_id, products.c.id.in_([pid for pid, _ in ordered]))
+            .order_by(products.c.id)
+            .with_for_update()
+            .cte("locked")
+        )
+        stmt = stmt.where(products.c.id == locked.c.id).add_cte(locked)
+
+    updated = {row.id: row.stock for row in db.execute(stmt)}
+
+    # Mantener los Product ya cargados en la sesión al día sin marcarlos como modificados
+    for product_id, stock in updated.items():
+        product = db.identity_map.get(identity_key(Product, product_id))
+        if product is not None:
+            set_committed_value(product, "stock", stock)
+
+    if sign < 0:
+        for product_id, _ in ordered:
+            if product_id not in updated:
+                raise InsufficientStockError(product_id)
+    codigo_index.stage_stock(db, tenant_id, updated)
+    if updated:
+        data_versions.touch(db, tenant_id, data_versions.PRODUCTS)
+    stock_ledger.record(
+        db,
+        tenant_id,
+        ((pid, sign * quantities[pid], stock) for pid, stock in updated.items() if stock is not None),
+        reason,
+    )
+    return updated
+
+
+def reserve_stock(db: Session, tenant_id: int, quantities: Dict[int, int], reason: str = "venta") -> Dict[int, int]:
+    """
+    Descontar todas las líneas de un carrito en un solo round trip.
+    Devuelve {product_id: stock_nuevo}. Lanza InsufficientStockError si alguna no alcanza.
+    reason queda en el kardex de stock.
+    """
+    return _adjust_stock(db, tenant_id, quantities, -1, reason)
+
+
+def release_stock(db: Session, tenant_id: int, quantities: Dict[int, int], reason: str = "devolucion") -> Dict[int, int]:
+    """Regresar piezas al inventario (devoluciones/cancelaciones) con un incremento atómico."""
+    return _adjust_stock(db, tenant_id, quantities, 1, reason)
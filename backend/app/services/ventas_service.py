@@ -12,6 +12,8 @@ from app.models.product import Product
 from app.models.venta_contado import VentasContado, ItemVentaContado
 from app.models.payment import Payment
 from app.core.folio_service import generate_folio
+from app.services.daily_aggregates import record_venta
+from app.services.stock_reservation import InsufficientStockError, merge_quantities, reserve_stock
 
 
 def calculate_sale_totals(
@@ -125,6 +127,14 @@ def create_venta_contado(
     # Validar stock y obtener productos
     product_map = validate_stock(db, tenant.id, items)
     
+    # Descontar inventario de forma atómica (validate_stock solo es una verificación previa)
+    try:
+        reserve_stock(db, tenant.id, merge_quantities(
+            (item['product_id'], max(1, int(item.get('quantity', 1)))) for item in items
+        ))
+    except InsufficientStockError as e:
+        raise ValueError(f"Stock insuficiente para {product_map[e.product_id].name}") from e
+    
     # Calcular totales por item
     calculated_items = []
     for item in items:
@@ -144,10 +154,6 @@ def create_venta_contado(
             'discount_amount': line_disc_amount,
             'total_price': line_total
         })
-        
-        # Decrementar stock
-        if p.stock is not None:
-            p.stock = int(p.stock) - q
     
     # Calcular totales
     totals = calculate_sale_totals(
@@ -207,15 +213,19 @@ def create_venta_contado(
         ))
     
     # Crear pagos
+    payment_rows = []
     if payments:
         for p_data in payments:
             amt = Decimal(str(p_data.get('amount', 0))).quantize(Decimal("0.01"))
-            db.add(Payment(
+            payment_row = Payment(
                 venta_contado_id=venta.id,
                 method=p_data.get('method', 'cash'),
                 amount=amt
-            ))
+            )
+            db.add(payment_row)
+            payment_rows.append(payment_row)
     
+    record_venta(db, venta, payment_rows)
     db.commit()
     db.refresh(venta)
     return venta
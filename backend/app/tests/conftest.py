@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Registrar todos los modelos en Base.metadata antes de create_all
+from app.models import (  # noqa: F401
+    apartado,
+    cash_closure,
+    credit_payment,
+    customer,
+    customer_stats,
+    daily_aggregate,
+    data_version,
+    folio_counter,
+    inventory_closure,
+    inventory_movement,
+    job,
+    metal_rate,
+    payment,
+    price_history,
+    product,
+    producto_pedido,
+    shift,
+    status_history,
+    stock_ledger,
+    tasa_metal_pedido,
+    ticket,
+    user,
+    venta_contado,
+)
+from app.models.tenant import Base
+
+
+@compiles(JSONB, 'sqlite')
+def _compile_jsonb_sqlite(type_, compiler, **kw):
+    # Los snapshots usan JSONB en Postgres; en SQLite basta con JSON
+    return 'JSON'
+
+
+@pytest.fixture(scope='session', autouse=True)
+def app_schema():
+    """Esquema de la base de la app (DATABASE_URL) para los tests con TestClient.
+
+    La app ya no lo crea al importarse; sin `with TestClient(...)` tampoco corren los
+    hooks de arranque, así que se pasa por la compuerta aquí.
+    """
+    from app.core import startup
+
+    startup.migrate()
+
+
+@pytest.fixture
+def db_session():
+    """Sesión sobre una base SQLite en memoria, aislada por test."""
+    engine = create_engine(
+        'sqlite://',
+        connect_args={'check_same_thread': False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
@@ -0,0 +1,41 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.core.database import engine
+from app.core.deps import invalidate_tenant, invalidate_user
+from app.main import app
+
+
+def test_warm_request_runs_no_auth_queries():
+    client = TestClient(app)
+    r = client.post('/auth/register', json={
+        'email': 'cache@test.com',
+        'password': 'secret',
+        'role': 'owner',
+        'tenant_name': 'Cache',
+        'tenant_slug': 'cache'
+    })
+    assert r.status_code == 200
+    headers = {'Authorization': f"Bearer {r.json()['access_token']}", 'X-Tenant-ID': 'cache'}
+    invalidate_tenant()
+    invalidate_user()
+
+    statements = []
+
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', _before_execute)
+    try:
+        assert client.get('/admin/users', headers=headers).status_code == 200
+        cold = list(statements)
+        statements.clear()
+        assert client.get('/admin/users', headers=headers).status_code == 200
+        warm = list(statements)
+    finally:
+        event.remove(engine, 'before_cursor_execute', _before_execute)
+
+    # En frío: tenant + usuario + listado. En caliente: solo el listado, sin pedir el logo
+    assert len(cold) == len(warm) + 2
+    assert not any('FROM tenants' in s for s in warm)
+    assert not any('logo' in s for s in cold)
@@ -0,0 +1,129 @@
+import random
+
+import pytest
+from sqlalchemy import event
+
+from app.models.product import Product
+from app.models.tenant import Tenant
+from app.services import codigo_index
+from app.services.stock_reservation import reserve_stock
+
+
+@pytest.fixture(autouse=True)
+def _clean_index():
+    codigo_index.invalidate_tenant()
+    yield
+    codigo_index.invalidate_tenant()
+
+
+def _count_statements(db):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    return statements, lambda: event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def _tenant(db):
+    tenant = Tenant(name='T', slug=f't{random.randint(0, 10**9)}')
+    db.add(tenant)
+    db.flush()
+    db.add_all([
+        Product(name=f'Anillo {i}', price=100 + i, stock=2, codigo=f'AN-{i:03d}', tenant_id=tenant.id)
+        for i in range(50)
+    ])
+    db.commit()
+    return tenant
+
+
+def test_warm_lookup_runs_no_sql(db_session):
+    tenant = _tenant(db_session)
+    assert codigo_index.warm(db_session, tenant.id) == 50
+
+    statements, stop = _count_statements(db_session)
+    try:
+        row = codigo_index.lookup(db_session, tenant.id, 'AN-007')
+        found = codigo_index.lookup_many(db_session, tenant.id, ['AN-001', 'NOPE', 'AN-049', 'AN-001'])
+    finally:
+        stop()
+
+    assert statements == []
+    assert row['name'] == 'Anillo 7' and row['stock'] == 2
+    assert sorted(found) == ['AN-001', 'AN-049']
+
+
+def test_cold_tenant_falls_back_to_database(db_session, monkeypatch):
+    tenant = _tenant(db_session)
+    monkeypatch.setattr(codigo_index, '_warm_in_background', lambda tenant_id: None)
+
+    assert codigo_index.lookup(db_session, tenant.id, 'AN-003')['price'] == 103
+    assert codigo_index.lookup(db_session, tenant.id, 'NOPE') is None
+    # Otro tenant no ve los códigos
+    assert codigo_index.lookup(db_session, tenant.id + 1, 'AN-003') is None
+
+
+def test_orm_changes_reach_index_only_on_commit(db_session):
+    tenant = _tenant(db_session)
+    codigo_index.warm(db_session, tenant.id)
+
+    product = db_session.query(Product).filter(Product.codigo == 'AN-001').one()
+    product.codigo = 'AN-001B'
+    product.active = False
+    db_session.flush()
+    assert codigo_index.lookup(db_session, tenant.id, 'AN-001') is not None
+    db_session.rollback()
+    assert codigo_index.lookup(db_session, tenant.id, 'AN-001B') is None
+
+    product = db_session.query(Product).filter(Product.codigo == 'AN-001').one()
+    product.codigo = 'AN-001B'
+    product.active = False
+    db_session.add(Product(name='Nuevo', price=5, codigo='NEW-1', tenant_id=tenant.id))
+    db_session.delete(db_session.query(Product).filter(Product.codigo == 'AN-002').one())
+    db_session.commit()
+
+    assert codigo_index.lookup(db_session, tenant.id, 'AN-001') is None
+    assert codigo_index.lookup(db_session, tenant.id, 'AN-001B')['active'] is False
+    assert codigo_index.lookup(db_session, tenant.id, 'NEW-1')['stock'] == 0
+    assert codigo_index.lookup(db_session, tenant.id, 'AN-002') is None
+
+
+def test_reserved_stock_is_reflected_after_commit(db_session):
+    tenant = _tenant(db_session)
+    codigo_index.warm(db_session, tenant.id)
+    product_id = codigo_index.lookup(db_session, tenant.id, 'AN-010')['id']
+
+    reserve_stock(db_session, tenant.id, {product_id: 1})
+    db_session.rollback()
+    assert codigo_index.lookup(db_session, tenant.id, 'AN-010')['stock'] == 2
+
+    reserve_stock(db_session, tenant.id, {product_id: 2})
+    db_session.commit()
+    assert codigo_index.lookup(db_session, tenant.id, 'AN-010')['stock'] == 0
+
+
+def test_savepoints_do_not_apply_or_discard_staged_changes(db_session):
+    tenant = _tenant(db_session)
+    codigo_index.warm(db_session, tenant.id)
+    product_id = codigo_index.lookup(db_session, tenant.id, 'AN-010')['id']
+
+    reserve_stock(db_session, tenant.id, {product_id: 1})
+    with db_session.begin_nested():  # como los ensure_table del camino de escritura
+        pass
+    assert codigo_index.lookup(db_session, tenant.id, 'AN-010')['stock'] == 2
+    try:
+        with db_session.begin_nested():
+            raise ValueError
+    except ValueError:
+        pass
+    db_session.commit()
+    assert codigo_index.lookup(db_session, tenant.id, 'AN-010')['stock'] == 1
+
+    # Y si la transacción de afuera se deshace, el índice no cambia
+    reserve_stock(db_session, tenant.id, {product_id: 1})
+    with db_session.begin_nested():
+        pass
+    db_session.rollback()
+    assert codigo_index.lookup(db_session, tenant.id, 'AN-010')['stock'] == 1
@@ -0,0 +1,134 @@
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+from app.models.apartado import Apartado, ItemApartado
+from app.models.credit_payment import CreditPayment
+from app.models.payment import Payment
+from app.models.product import Product
+from app.models.producto_pedido import PagoPedido, Pedido, PedidoItem, ProductoPedido
+from app.models.tenant import Tenant
+from app.models.user import User
+from app.models.venta_contado import ItemVentaContado, VentasContado
+from app.services.corte_caja_service import get_detailed_corte_caja
+
+
+def _seed(db, tenant, n):
+    """Crea n ventas, apartados y pedidos con items y pagos dentro de marzo 2025."""
+    user = User(email=f'v{n}@test.com', hashed_password='x', role='cashier', tenant_id=tenant.id)
+    db.add(user)
+    db.flush()
+    base = datetime(2025, 3, 10, 18, 0, tzinfo=timezone.utc)
+    for i in range(n):
+        when = base + timedelta(hours=i)
+        product = Product(name='Anillo', price=Decimal(500), cost_price=Decimal(100), stock=5,
+                          tenant_id=tenant.id, codigo=f'C{n}-{i}')
+        producto_pedido = ProductoPedido(tenant_id=tenant.id, modelo=f'M{n}-{i}', precio=Decimal(800),
+                                         cost_price=Decimal(200))
+        db.add_all([product, producto_pedido])
+        db.flush()
+
+        venta = VentasContado(tenant_id=tenant.id, user_id=user.id, vendedor_id=user.id,
+                              total=Decimal(500), created_at=when)
+        apartado = Apartado(tenant_id=tenant.id, user_id=user.id, vendedor_id=user.id,
+                            total=Decimal(1000), amount_paid=Decimal(300), credit_status='pendiente',
+                            created_at=when, folio_apartado=f'AP{n}-{i}')
+        pedido = Pedido(tenant_id=tenant.id, producto_pedido_id=producto_pedido.id, user_id=user.id,
+                        cliente_nombre='Cliente', cantidad=1, precio_unitario=Decimal(800),
+                        total=Decimal(800), anticipo_pagado=Decimal(200), saldo_pendiente=Decimal(600),
+                        estado='pendiente', tipo_pedido='apartado', created_at=when)
+        db.add_all([venta, apartado, pedido])
+        db.flush()
+
+        db.add_all([
+            ItemVentaContado(venta_id=venta.id, product_id=product.id, name='Anillo',
+                             quantity=1, total_price=Decimal(500)),
+            Payment(venta_contado_id=venta.id, method='efectivo', amount=Decimal(500)),
+            ItemApartado(apartado_id=apartado.id, product_id=product.id, name='Anillo',
+                         quantity=1, total_price=Decimal(1000)),
+            CreditPayment(tenant_id=tenant.id, apartado_id=apartado.id, amount=Decimal(200),
+                          payment_method='efectivo', user_id=user.id, notes='Anticipo inicial',
+                          created_at=when),
+            CreditPayment(tenant_id=tenant.id, apartado_id=apartado.id, amount=Decimal(100),
+                          payment_method='tarjeta', user_id=user.id, created_at=when + timedelta(days=1)),
+            PedidoItem(pedido_id=pedido.id, producto_pedido_id=producto_pedido.id, cantidad=1,
+                       precio_unitario=Decimal(800), total=Decimal(800)),
+            PagoPedido(pedido_id=pedido.id, monto=Decimal(200), metodo_pago='efectivo',
+                       tipo_pago='anticipo', created_at=when),
+        ])
+    db.commit()
+
+
+def _count_corte_queries(db, tenant):
+    statements = []
+
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db.get_bind()
+    event.listen(engine, 'before_cursor_execute', _before_execute)
+    try:
+        report = get_detailed_corte_caja(date(2025, 3, 1), date(2025, 3, 31), db, tenant)
+    finally:
+        event.remove(engine, 'before_cursor_execute', _before_execute)
+    return len(statements), report
+
+
+def test_corte_caja_query_count_does_not_grow_with_data(db_session):
+    small = Tenant(name='Small', slug='small')
+    large = Tenant(name='Large', slug='large')
+    db_session.add_all([small, large])
+    db_session.flush()
+    _seed(db_session, small, 3)
+    _seed(db_session, large, 40)
+
+    small_count, small_report = _count_corte_queries(db_session, small)
+    db_session.expire_all()
+    large_count, large_report = _count_corte_queries(db_session, large)
+
+    assert small_report['ventas_validas'] == 3
+    assert large_report['ventas_validas'] == 40
+    assert large_count == small_count
+
+
+def test_resumen_pagos_grouped_by_movement_and_method(db_session):
+    tenant = Tenant(name='Pagos', slug='pagos')
+    db_session.add(tenant)
+    db_session.flush()
+    _seed(db_session, tenant, 2)
+    when = datetime(2025, 3, 12, 18, 0, tzinfo=timezone.utc)
+    apartado = db_session.query(Apartado).filter(Apartado.tenant_id == tenant.id).first()
+    pedido = db_session.query(Pedido).filter(Pedido.tenant_id == tenant.id).first()
+    db_session.add_all([
+        CreditPayment(tenant_id=tenant.id, apartado_id=apartado.id, amount=Decimal(100),
+                      payment_method='card', user_id=apartado.user_id, notes='Abono', created_at=when),
+        CreditPayment(tenant_id=tenant.id, apartado_id=apartado.id, amount=Decimal(50),
+                      payment_method='cash', user_id=apartado.user_id, notes='Abono', created_at=when),
+        CreditPayment(tenant_id=tenant.id, apartado_id=apartado.id, amount=Decimal(70),
+                      payment_method='vale', user_id=apartado.user_id, notes='Abono', created_at=when),
+        PagoPedido(pedido_id=pedido.id, monto=Decimal(300), metodo_pago='tarjeta',
+                   tipo_pago='saldo', created_at=when),
+    ])
+    db_session.commit()
+
+    report = get_detailed_corte_caja(date(2025, 3, 1), date(2025, 3, 31), db_session, tenant)
+    rows = {(r['tipo_movimiento'], r['metodo_pago']): r for r in report['resumen_pagos']}
+
+    assert len(report['resumen_pagos']) == 12
+    assert rows[("Anticipo de apartado", "Efectivo")]['cantidad_operaciones'] == 2
+    assert rows[("Anticipo de apartado", "Efectivo")]['total'] == 400
+    # Abonos sin notas (NULL) y métodos desconocidos no cuentan
+    abono_tarjeta = rows[("Abono de apartado", "Tarjeta")]
+    assert (abono_tarjeta['cantidad_operaciones'], abono_tarjeta['subtotal']) == (1, 100)
+    assert abono_tarjeta['total'] == pytest.approx(97)
+    assert rows[("Abono de apartado", "SUBTOTAL")]['cantidad_operaciones'] == 2
+    assert rows[("Abono de apartado", "SUBTOTAL")]['total'] == pytest.approx(147)
+    assert rows[("Anticipo de pedido apartado", "SUBTOTAL")]['subtotal'] == 400
+    assert rows[("Abono de pedido apartado", "Tarjeta")]['total'] == pytest.approx(291)
+
+    assert report['apartados_pendientes_anticipos'] == 400
+    assert report['apartados_pendientes_abonos_adicionales'] == pytest.approx(147)
+    assert report['pedidos_pendientes_anticipos'] == 400
+    assert report['pedidos_pendientes_abonos'] == pytest.approx(291)
@@ -0,0 +1,89 @@
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app.models.apartado import Apartado
+from app.models.credit_payment import CreditPayment
+from app.models.tenant import Tenant
+from app.models.user import User
+from app.services import credit_sales, pagination
+
+
+def _seed(db, count=7):
+    tenant = Tenant(name='T', slug=f't{random.randint(0, 10**9)}')
+    db.add(tenant)
+    db.flush()
+    sellers = [User(email=f'v{i}-{tenant.id}@t.com', hashed_password='x', role='cashier', tenant_id=tenant.id)
+               for i in range(2)]
+    db.add_all(sellers)
+    db.flush()
+    base = datetime(2025, 3, 1, 12)
+    sales = []
+    for i in range(count):
+        # Dos apartados por instante: el id desempata el orden
+        sale = Apartado(tenant_id=tenant.id, user_id=sellers[0].id, vendedor_id=sellers[i % 2].id,
+                        total=100, amount_paid=10 * i, credit_status='pagado' if i == 0 else 'pendiente',
+                        customer_phone=f'55-{i:04d}', created_at=base + timedelta(days=i // 2))
+        sales.append(sale)
+    db.add_all(sales)
+    db.flush()
+    for sale in sales:
+        for amount in (3, 7):
+            db.add(CreditPayment(tenant_id=tenant.id, apartado_id=sale.id, amount=amount,
+                                 payment_method='efectivo', user_id=sellers[0].id))
+    db.commit()
+    return tenant, sellers, sales
+
+
+def test_keyset_pages_load_payments_and_vendors_in_bulk(db_session):
+    tenant, sellers, sales = _seed(db_session)
+    expected = [s.id for s in sorted(sales, key=lambda s: (s.created_at, s.id), reverse=True)]
+
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    tenant.id  # cargar antes de contar
+    engine = db_session.get_bind()
+    seen, cursor, pages = [], None, 0
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        while True:
+            query = credit_sales.filtered_query(db_session, tenant.id)
+            page, cursor = credit_sales.list_page(query, 3, cursor)
+            items = credit_sales.serialize(db_session, page)
+            seen += [item['id'] for item in items]
+            pages += 1
+            if cursor is None:
+                break
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+    assert seen == expected
+    # Página + abonos + vendedores, sin importar cuántos apartados trae
+    assert pages == 3 and len(statements) == 3 * pages
+    first = next(item for item in items if item['id'] == sales[0].id)
+    assert [p['amount'] for p in first['payments']] == [3, 7]
+    assert first['vendedor_email'] == sellers[0].email
+
+
+def test_filters_and_totals_cover_the_whole_filtered_set(db_session):
+    tenant, sellers, sales = _seed(db_session)
+
+    totals = credit_sales.totals(credit_sales.filtered_query(db_session, tenant.id))
+    assert (totals['count'], totals['total'], totals['amount_paid']) == (7, 700, 210)
+    assert totals['balance'] == 490
+    assert totals['by_status']['pagado'] == {'count': 1, 'total': 100, 'amount_paid': 0, 'balance': 100}
+
+    query = credit_sales.filtered_query(db_session, tenant.id, vendedor_id=sellers[1].id,
+                                        date_from=date(2025, 3, 2), date_to=date(2025, 3, 3))
+    assert sorted(s.id for s in query) == [sales[3].id, sales[5].id]
+    assert credit_sales.totals(query)['count'] == 2
+    phone = credit_sales.filtered_query(db_session, tenant.id, customer_phone='0004')
+    assert [s.id for s in phone] == [sales[4].id]
+
+    with pytest.raises(pagination.InvalidCursorError):
+        credit_sales.list_page(credit_sales.filtered_query(db_session, tenant.id), 3, 'no-es-un-cursor')
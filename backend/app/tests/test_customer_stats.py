@@ -0,0 +1,156 @@
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app.models.apartado import Apartado
+from app.models.customer import Customer
+from app.models.customer_stats import CustomerStats
+from app.models.producto_pedido import Pedido
+from app.models.tenant import Tenant
+from app.models.user import User
+from app.models.venta_contado import VentasContado
+from app.services import customer_stats
+
+
+def _stats(db, tenant):
+    rows = db.query(CustomerStats).filter(CustomerStats.tenant_id == tenant.id).all()
+    return {
+        r.phone: (float(r.total_ventas), r.num_ventas, float(r.total_apartados), r.num_apartados,
+                  float(r.total_pedidos), r.num_pedidos, float(r.total_gastado))
+        for r in rows if r.num_ventas or r.num_apartados or r.num_pedidos
+    }
+
+
+def _seed(db):
+    tenant = Tenant(name='T', slug=f't{random.randint(0, 10**9)}')
+    db.add(tenant)
+    db.flush()
+    user = User(email=f'u{tenant.id}@t.com', hashed_password='x', role='admin', tenant_id=tenant.id)
+    db.add(user)
+    db.flush()
+    return tenant, user
+
+
+def test_stats_follow_writes_and_match_rebuild(db_session):
+    tenant, user = _seed(db_session)
+    db_session.add_all([
+        VentasContado(tenant_id=tenant.id, user_id=user.id, total=100, customer_name='Ana', customer_phone='111'),
+        VentasContado(tenant_id=tenant.id, user_id=user.id, total=50, customer_name='Ana', customer_phone='111'),
+        VentasContado(tenant_id=tenant.id, user_id=user.id, total=999),  # sin cliente: no cuenta
+    ])
+    apartado = Apartado(tenant_id=tenant.id, user_id=user.id, total=300, amount_paid=30,
+                        customer_name='Ana', customer_phone='111')
+    pedido = Pedido(tenant_id=tenant.id, user_id=user.id, cliente_nombre='Beto', cliente_telefono='222',
+                    precio_unitario=1, total=400, anticipo_pagado=40, saldo_pendiente=360)
+    db_session.add_all([apartado, pedido])
+    db_session.commit()
+    assert _stats(db_session, tenant) == {
+        '111': (150, 2, 30, 1, 0, 0, 180),
+        '222': (0, 0, 0, 0, 40, 1, 40),
+    }
+
+    # Abono (como en credits), cambio de teléfono y venta borrada
+    apartado.amount_paid = float(apartado.amount_paid or 0) + 70
+    pedido.cliente_telefono = '333'
+    db_session.commit()
+    venta = db_session.query(VentasContado).filter(VentasContado.total == 50).one()
+    db_session.delete(venta)
+    db_session.commit()
+    # Asignación sobre un objeto expirado
+    db_session.expire(apartado)
+    apartado.amount_paid = 150
+    db_session.commit()
+
+    expected = {
+        '111': (100, 1, 150, 1, 0, 0, 250),
+        '333': (0, 0, 0, 0, 40, 1, 40),
+    }
+    assert _stats(db_session, tenant) == expected
+
+    customer_stats.rebuild(db_session, tenant.id)
+    db_session.commit()
+    assert _stats(db_session, tenant) == expected
+
+
+def test_backfill_fills_stats_for_sales_that_predate_the_table(db_session):
+    tenant, user = _seed(db_session)
+    db_session.add_all([
+        VentasContado(tenant_id=tenant.id, user_id=user.id, total=100, customer_name='Ana', customer_phone='111')
+        for _ in range(3)
+    ])
+    db_session.commit()
+    # Como en una base anterior a customer_stats: ventas sin estadísticas
+    db_session.query(CustomerStats).delete()
+    db_session.commit()
+
+    assert customer_stats.backfill(db_session.get_bind()) == 1
+    db_session.add(VentasContado(tenant_id=tenant.id, user_id=user.id, total=50, customer_name='Ana',
+                                 customer_phone='111'))
+    db_session.commit()
+    assert _stats(db_session, tenant) == {'111': (350, 4, 0, 0, 0, 0, 350)}
+
+
+def test_listing_searches_sorts_and_paginates_in_sql(db_session):
+    tenant, user = _seed(db_session)
+    base = datetime(2025, 1, 1)
+    for i, (name, phone, spent) in enumerate([('Ana', '111', 10), ('beto', '222', 300), ('Carla', '333', 0),
+                                              ('Dan_1', '444', 50)]):
+        db_session.add(Customer(tenant_id=tenant.id, name=name, phone=phone, created_at=base + timedelta(days=i)))
+        if spent:
+            db_session.add(VentasContado(tenant_id=tenant.id, user_id=user.id, total=spent,
+                                         customer_name=name, customer_phone=phone))
+    db_session.commit()
+
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    tenant.id  # cargar antes de contar
+    engine = db_session.get_bind()
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        rows, total = customer_stats.list_customers(db_session, tenant.id, order_by='total_gastado',
+                                                    order_dir='desc', skip=1, limit=2)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    assert total == 4 and len(statements) == 2  # conteo + página
+    assert [(c.name, float(s.total_gastado)) for c, s in rows] == [('Dan_1', 50), ('Ana', 10)]
+
+    rows, _ = customer_stats.list_customers(db_session, tenant.id, order_by='nombre')
+    assert [c.name for c, _ in rows] == ['Ana', 'beto', 'Carla', 'Dan_1']
+    rows, total = customer_stats.list_customers(db_session, tenant.id, search='BE')
+    assert total == 1 and rows[0][0].name == 'beto'
+    rows, total = customer_stats.list_customers(db_session, tenant.id, search='_')
+    assert total == 1 and rows[0][0].name == 'Dan_1'
+    rows, _ = customer_stats.list_customers(db_session, tenant.id, search='33')
+    assert rows[0][0].name == 'Carla' and rows[0][1] is None
+
+
+def test_customers_endpoint_is_unpaged_by_default_and_exposes_the_total():
+    import uuid
+
+    from fastapi.testclient import TestClient
+
+    from app.core.database import SessionLocal
+    from app.main import app
+
+    client = TestClient(app)
+    slug = f'cs-{uuid.uuid4().hex[:8]}'
+    r = client.post('/auth/register', json={
+        'email': f'owner@{slug}.com', 'password': 'secret', 'role': 'owner',
+        'tenant_name': 'T', 'tenant_slug': slug,
+    })
+    headers = {'Authorization': f"Bearer {r.json()['access_token']}", 'X-Tenant-ID': slug,
+               'Origin': 'http://localhost:5173'}
+    with SessionLocal() as db:
+        tenant = db.query(Tenant).filter(Tenant.slug == slug).one()
+        db.add_all([Customer(tenant_id=tenant.id, name=f'C{i}', phone=f'55{i}') for i in range(3)])
+        db.commit()
+
+    r = client.get('/customers/', headers=headers)
+    assert len(r.json()) == 3 and r.headers['x-total-count'] == '3'
+    assert 'X-Total-Count' in r.headers['access-control-expose-headers']
+    r = client.get('/customers/', params={'limit': 2}, headers=headers)
+    assert len(r.json()) == 2 and r.headers['x-total-count'] == '3'
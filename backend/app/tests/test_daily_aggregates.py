@@ -0,0 +1,83 @@
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from app.models.apartado import Apartado
+from app.models.credit_payment import CreditPayment
+from app.models.daily_aggregate import DailyAggregate
+from app.models.payment import Payment
+from app.models.producto_pedido import PagoPedido, Pedido
+from app.models.tenant import Tenant
+from app.models.user import User
+from app.models.venta_contado import VentasContado
+from app.services.daily_aggregates import (
+    get_range_summary,
+    rebuild_range,
+    record_credit_payment,
+    record_pago_pedido,
+    record_venta,
+    verify_range,
+)
+
+
+def test_incremental_aggregates_match_rebuild(db_session):
+    db = db_session
+    tenant = Tenant(name='T', slug='t')
+    db.add(tenant)
+    db.flush()
+    user = User(email='v@test.com', hashed_password='x', role='cashier', tenant_id=tenant.id)
+    db.add(user)
+    db.flush()
+
+    # 2025-03-10 03:00 UTC todavía es 9 de marzo en México
+    late = datetime(2025, 3, 10, 3, 0)
+    noon = datetime(2025, 3, 10, 18, 0)
+
+    for created_at in (late, noon):
+        venta = VentasContado(tenant_id=tenant.id, user_id=user.id, total=Decimal(500),
+                              total_cost=Decimal(200), created_at=created_at)
+        db.add(venta)
+        db.flush()
+        payments = [
+            Payment(venta_contado_id=venta.id, method='cash', amount=Decimal(300)),
+            Payment(venta_contado_id=venta.id, method='tarjeta', amount=Decimal(200)),
+        ]
+        db.add_all(payments)
+        record_venta(db, venta, payments)
+
+    apartado = Apartado(tenant_id=tenant.id, user_id=user.id, total=Decimal(1000), created_at=noon)
+    db.add(apartado)
+    db.flush()
+    for notes, amount in (('Anticipo inicial', 200), (None, 100)):
+        cp = CreditPayment(tenant_id=tenant.id, apartado_id=apartado.id, amount=Decimal(amount),
+                           payment_method='efectivo', user_id=user.id, notes=notes,
+                           created_at=noon.replace(tzinfo=timezone.utc))
+        db.add(cp)
+        record_credit_payment(db, cp, apartado)
+
+    pedido = Pedido(tenant_id=tenant.id, user_id=user.id, cliente_nombre='C', precio_unitario=Decimal(800),
+                    total=Decimal(800), saldo_pendiente=Decimal(600), created_at=noon)
+    db.add(pedido)
+    db.flush()
+    pago = PagoPedido(pedido_id=pedido.id, monto=Decimal(200), metodo_pago='tarjeta', tipo_pago='anticipo',
+                      created_at=noon.replace(tzinfo=timezone.utc))
+    db.add(pago)
+    record_pago_pedido(db, pago, pedido)
+    db.commit()
+
+    assert verify_range(db, tenant.id, date(2025, 3, 1), date(2025, 3, 31)) == []
+
+    summary = get_range_summary(db, tenant.id, date(2025, 3, 1), date(2025, 3, 31))
+    assert summary['ventas_contado_count'] == 2
+    assert summary['ventas_contado_total'] == 1000.0
+    assert summary['anticipos_apartados'] == 200.0
+    assert summary['abonos_apartados'] == 100.0
+    assert summary['anticipos_pedidos'] == 200.0
+    assert summary['total_efectivo'] == 900.0
+    assert summary['total_tarjeta'] == 600.0
+    assert [d['fecha'] for d in summary['dias']] == ['2025-03-09', '2025-03-10']
+
+    # Reconstruir desde fuente da el mismo resultado
+    db.query(DailyAggregate).delete()
+    db.commit()
+    rebuild_range(db, tenant.id, date(2025, 3, 1), date(2025, 3, 31))
+    assert get_range_summary(db, tenant.id, date(2025, 3, 1), date(2025, 3, 31)) == summary
@@ -0,0 +1,146 @@
+import uuid
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.core import http_cache
+from app.core.database import engine
+from app.models.data_version import DataVersion
+from app.models.product import Product
+from app.models.tenant import Tenant
+from app.services import data_versions
+from app.services.stock_reservation import reserve_stock
+
+
+def _client():
+    from app.main import app
+
+    data_versions.forget()
+    http_cache.clear()
+    client = TestClient(app)
+    slug = f'dv-{uuid.uuid4().hex[:8]}'
+    r = client.post('/auth/register', json={
+        'email': f'owner@{slug}.com', 'password': 'secret', 'role': 'owner',
+        'tenant_name': 'T', 'tenant_slug': slug,
+    })
+    return client, {'Authorization': f"Bearer {r.json()['access_token']}", 'X-Tenant-ID': slug}
+
+
+class _Statements:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(engine, 'before_cursor_execute', self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine, 'before_cursor_execute', self)
+
+
+def test_unchanged_lists_return_304_and_cached_bodies_without_sql():
+    client, headers = _client()
+    client.post('/products/', json={'name': 'Anillo', 'codigo': 'A1', 'price': 10, 'stock': 3}, headers=headers)
+    client.post('/metal-rates', json={'metal_type': '14k', 'rate_per_gram': 1000}, headers=headers)
+    client.post('/tasas-pedido/', json={'metal_type': '14k', 'tipo': 'precio', 'rate_per_gram': 900},
+                headers=headers)
+    client.post('/productos-pedido/', json={'modelo': 'M1', 'precio': 50}, headers=headers)
+
+    for path in ('/products/', '/productos-pedido/', '/metal-rates', '/tasas-pedido/'):
+        first = client.get(path, headers=headers)
+        assert first.status_code == 200 and len(first.json()) == 1
+        etag = first.headers['etag']
+        assert first.headers['cache-control'] == 'private, no-cache'
+
+        with _Statements() as statements:
+            again = client.get(path, headers=headers)
+            not_modified = client.get(path, headers={**headers, 'If-None-Match': f'W/{etag}'})
+        assert again.content == first.content and again.headers['etag'] == etag
+        assert not_modified.status_code == 304 and not_modified.content == b''
+        assert statements.count == 0, path
+
+    # Cada consulta distinta tiene su propia entrada
+    assert client.get('/products/', params={'q': 'nada'}, headers=headers).json() == []
+
+
+def test_writes_change_the_etag():
+    client, headers = _client()
+    product = client.post('/products/', json={'name': 'Anillo', 'codigo': 'A1', 'price': 10, 'stock': 3},
+                          headers=headers).json()
+    rate = client.post('/metal-rates', json={'metal_type': '14k', 'rate_per_gram': 1000}, headers=headers).json()
+    tasa = client.post('/tasas-pedido/', json={'metal_type': '14k', 'tipo': 'precio', 'rate_per_gram': 900},
+                       headers=headers).json()
+
+    def etag(path):
+        return client.get(path, headers=headers).headers['etag']
+
+    before = etag('/products/')
+    r = client.post('/ventas/', json={
+        'items': [{'product_id': product['id'], 'quantity': 1}],
+        'payments': [{'method': 'efectivo', 'amount': 10}],
+        'tipo_venta': 'contado',
+    }, headers=headers)
+    assert r.status_code == 200, r.text
+    after_sale = client.get('/products/', headers={**headers, 'If-None-Match': before})
+    assert after_sale.status_code == 200 and after_sale.json()[0]['stock'] == 2
+
+    client.post(f"/products/{product['id']}/archive", headers=headers)
+    assert etag('/products/') not in (before, after_sale.headers['etag'])
+
+    before = etag('/metal-rates')
+    client.put(f"/metal-rates/{rate['id']}", json={'rate_per_gram': 1100}, headers=headers)
+    assert etag('/metal-rates') != before
+
+    before = etag('/tasas-pedido/')
+    client.put(f"/tasas-pedido/{tasa['id']}", json={'metal_type': '14k', 'tipo': 'precio', 'rate_per_gram': 950},
+               headers=headers)
+    assert etag('/tasas-pedido/') != before
+    assert client.get('/tasas-pedido/', headers=headers).json()[0]['rate_per_gram'] == 950
+
+
+def test_replace_import_that_empties_the_catalog_changes_the_etag():
+    import io
+
+    import pandas as pd
+
+    client, headers = _client()
+    client.post('/productos-pedido/', json={'modelo': 'M1', 'codigo': 'PP-1', 'precio': 50}, headers=headers)
+    listed = client.get('/productos-pedido/', headers=headers)
+    assert len(listed.json()) == 1
+
+    # Hoja sin renglones: el modo replace sólo borra (DELETE masivo, sin flush de objetos)
+    sheet = io.BytesIO()
+    pd.DataFrame({'codigo': []}).to_excel(sheet, index=False)
+    r = client.post('/productos-pedido/import/', params={'mode': 'replace'}, headers=headers,
+                    files={'file': ('vacio.xlsx', sheet.getvalue())})
+    assert r.status_code == 200, r.text
+
+    again = client.get('/productos-pedido/', headers={**headers, 'If-None-Match': listed.headers['etag']})
+    assert again.status_code == 200 and again.json() == []
+
+
+def test_version_bumps_on_commit_only(db_session):
+    data_versions.forget()
+    tenant = Tenant(name='T', slug='dv')
+    db_session.add(tenant)
+    db_session.commit()
+    assert data_versions.current(db_session, tenant.id, data_versions.PRODUCTS) == 0
+
+    product = Product(tenant_id=tenant.id, name='P', codigo='P1', price=1, stock=5)
+    db_session.add(product)
+    db_session.commit()
+    assert data_versions.current(db_session, tenant.id, data_versions.PRODUCTS) == 1
+
+    # SQL directo (reserva de stock) deshecho con rollback: la versión no cambia
+    reserve_stock(db_session, tenant.id, {product.id: 1})
+    db_session.rollback()
+    assert db_session.get(DataVersion, (tenant.id, data_versions.PRODUCTS)).version == 1
+
+    reserve_stock(db_session, tenant.id, {product.id: 1})
+    db_session.commit()
+    assert db_session.get(DataVersion, (tenant.id, data_versions.PRODUCTS)).version == 2
+    # Otros recursos no se tocan
+    assert data_versions.current(db_session, tenant.id, data_versions.METAL_RATES) == 0
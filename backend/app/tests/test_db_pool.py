@@ -0,0 +1,83 @@
+import threading
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool
+
+from app.core import db_pool
+from app.core.config import settings
+
+PG_URL = 'postgresql+psycopg2://u:p@localhost/pos'
+
+
+def test_engine_options_follow_settings(monkeypatch):
+    monkeypatch.setattr(settings, 'db_pool_size', 12)
+    monkeypatch.setattr(settings, 'db_max_overflow', 3)
+    monkeypatch.setattr(settings, 'db_statement_timeout_ms', 5000)
+    options = db_pool.engine_options(PG_URL)
+    assert options['poolclass'] is db_pool.InstrumentedQueuePool
+    assert (options['pool_size'], options['max_overflow']) == (12, 3)
+    assert options['connect_args'] == {'options': '-c statement_timeout=5000'}
+
+    # PgBouncer: sin pool propio ni parámetros de arranque
+    monkeypatch.setattr(settings, 'db_pgbouncer', True)
+    options = db_pool.engine_options(PG_URL)
+    assert options['poolclass'] is NullPool and 'connect_args' not in options
+
+    assert 'poolclass' not in db_pool.engine_options('sqlite://')
+
+
+def test_pool_stats_count_waits_and_timeouts(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path}/pool.db', poolclass=db_pool.InstrumentedQueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=0.2)
+    db_pool.pool_stats(engine, reset=True)
+    held = engine.connect()
+    stats = db_pool.pool_stats(engine)
+    assert (stats['checked_out'], stats['idle'], stats['checkouts']) == (1, 0, 1)
+
+    with pytest.raises(PoolTimeoutError):
+        engine.connect()
+
+    # Otro hilo espera a que se libere la conexión
+    waiter = threading.Thread(target=lambda: engine.connect().close())
+    waiter.start()
+    threading.Event().wait(0.05)
+    held.close()
+    waiter.join()
+
+    stats = db_pool.pool_stats(engine, reset=True)
+    assert stats['timeouts'] == 1 and stats['checkouts'] == 2 and stats['waited'] == 1
+    assert stats['wait_max_ms'] >= 40 and stats['checked_out'] == 0
+    assert db_pool.pool_stats(engine)['checkouts'] == 0
+    engine.dispose()
+
+
+def test_statement_timeout_detection_and_admin_endpoint(monkeypatch):
+    class Canceled(Exception):
+        pgcode = '57014'
+
+    assert db_pool.is_statement_timeout(OperationalError('SELECT 1', {}, Canceled()))
+    assert not db_pool.is_statement_timeout(OperationalError('SELECT 1', {}, Exception()))
+
+    from app.main import app
+
+    client = TestClient(app)
+    slug = f'pool-{uuid.uuid4().hex[:8]}'
+    r = client.post('/auth/register', json={
+        'email': f'owner@{slug}.com', 'password': 'secret', 'role': 'owner',
+        'tenant_name': 'T', 'tenant_slug': slug,
+    })
+    headers = {'Authorization': f"Bearer {r.json()['access_token']}", 'X-Tenant-ID': slug}
+    stats = client.get('/admin/db-pool', headers=headers).json()
+    assert {'checked_out', 'idle', 'overflow', 'wait_avg_ms', 'wait_max_ms', 'timeouts'} <= set(stats)
+
+    # Contadores de todo el proceso: el owner de un tenant no los lee ni los reinicia
+    monkeypatch.setattr(settings, 'metrics_token', 's3cret')
+    assert client.get('/admin/db-pool', params={'reset': True}, headers=headers).status_code == 401
+    assert client.get('/admin/db-pool', headers={'Authorization': 'Bearer s3cret'}).status_code == 200
+    monkeypatch.setattr(settings, 'metrics_token', '')
+    monkeypatch.setattr(settings, 'env', 'prod')
+    assert client.get('/admin/db-pool', headers=headers).status_code == 404
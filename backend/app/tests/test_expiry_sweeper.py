@@ -0,0 +1,94 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event
+
+from app.models.apartado import Apartado
+from app.models.producto_pedido import Pedido
+from app.models.status_history import StatusHistory
+from app.models.tenant import Tenant
+from app.models.user import User
+from app.routes.credits import get_credit_sales
+from app.services import expiry_sweeper
+
+
+def _seed(db):
+    tenant = Tenant(name='T', slug=f't{random.randint(0, 10**9)}')
+    db.add(tenant)
+    db.flush()
+    cashier = User(email=f'c{tenant.id}@t.com', hashed_password='x', role='cashier', tenant_id=tenant.id)
+    admin = User(email=f'a{tenant.id}@t.com', hashed_password='x', role='admin', tenant_id=tenant.id)
+    db.add_all([cashier, admin])
+    db.flush()
+    old = datetime.utcnow() - timedelta(days=80)
+    recent = datetime.utcnow() - timedelta(days=10)
+
+    def apartado(created_at, total, paid, status):
+        return Apartado(tenant_id=tenant.id, user_id=cashier.id, total=total, amount_paid=paid,
+                        credit_status=status, created_at=created_at)
+
+    def pedido(created_at, saldo, estado):
+        return Pedido(tenant_id=tenant.id, user_id=cashier.id, cliente_nombre='C', precio_unitario=100, total=100,
+                      saldo_pendiente=saldo, estado=estado, created_at=created_at.replace(tzinfo=timezone.utc))
+
+    apartados = [
+        apartado(old, 100, 20, 'pendiente'),   # vence
+        apartado(old, 100, None, 'pendiente'), # vence
+        apartado(old, 100, 100, 'pendiente'),  # sin saldo
+        apartado(old, 100, 20, 'cancelado'),
+        apartado(recent, 100, 20, 'pendiente'),
+    ]
+    pedidos = [
+        pedido(old, 50, 'en_proceso'),         # vence
+        pedido(old, 50, 'entregado'),
+        pedido(old, 0, 'pendiente'),
+        pedido(recent, 50, 'pendiente'),
+    ]
+    db.add_all(apartados + pedidos)
+    db.commit()
+    return tenant, admin, apartados, pedidos
+
+
+def test_sweep_marks_overdue_and_writes_history_in_bulk(db_session):
+    tenant, admin, apartados, pedidos = _seed(db_session)
+
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = db_session.get_bind()
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        swept = expiry_sweeper.sweep_all(db_session, [tenant.id])
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+    assert swept == {tenant.id: {'apartados': 2, 'pedidos': 1}}
+    # Historial + UPDATE por tipo, sin importar cuántos vencen
+    writes = [s for s in statements if s.lstrip().upper().startswith(('INSERT', 'UPDATE'))]
+    assert len(writes) == 4
+
+    db_session.expire_all()
+    assert [a.credit_status for a in apartados] == ['vencido', 'vencido', 'pendiente', 'cancelado', 'pendiente']
+    assert [p.estado for p in pedidos] == ['vencido', 'entregado', 'pendiente', 'pendiente']
+    history = db_session.query(StatusHistory).filter(StatusHistory.tenant_id == tenant.id).order_by(StatusHistory.id).all()
+    assert [(h.entity_type, h.entity_id, h.old_status, h.new_status) for h in history] == [
+        ('sale', apartados[0].id, 'pendiente', 'vencido'),
+        ('sale', apartados[1].id, 'pendiente', 'vencido'),
+        ('pedido', pedidos[0].id, 'en_proceso', 'vencido'),
+    ]
+    assert {h.user_id for h in history} == {admin.id}
+
+    # Un segundo barrido no encuentra nada nuevo
+    assert expiry_sweeper.sweep_all(db_session, [tenant.id]) == {tenant.id: {'apartados': 0, 'pedidos': 0}}
+    assert db_session.query(StatusHistory).filter(StatusHistory.tenant_id == tenant.id).count() == 3
+
+
+def test_credit_sales_listing_is_read_only(db_session):
+    tenant, admin, apartados, _ = _seed(db_session)
+
+    sales = get_credit_sales(status=None, vendedor_id=None, db=db_session, tenant=tenant, current_user=admin)
+
+    assert not db_session.dirty
+    assert len(sales) == 5 and 'vencido' not in {s['credit_status'] for s in sales}
@@ -0,0 +1,78 @@
+import os
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.folio_service import generate_folio, get_next_folio_seq, reset_folio_leases
+from app.models.folio_counter import FolioCounter
+from app.models.tenant import Base, Tenant
+
+
+def test_strict_folios_are_consecutive_and_rollback_leaves_no_gap(db_session):
+    tenant = Tenant(name='T', slug='t')
+    db_session.add(tenant)
+    db_session.commit()
+
+    assert generate_folio(db_session, tenant.id, 'VENTA') == 'V-000001'
+    assert generate_folio(db_session, tenant.id, 'VENTA') == 'V-000002'
+    db_session.commit()
+
+    get_next_folio_seq(db_session, tenant.id, 'VENTA')
+    db_session.rollback()
+
+    assert generate_folio(db_session, tenant.id, 'VENTA') == 'V-000003'
+    assert generate_folio(db_session, tenant.id, 'APARTADO') == 'AP-000001'
+
+
+def test_leased_folios_reserve_blocks(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'folios.db'}")
+    Base.metadata.create_all(bind=engine, tables=[Tenant.__table__, FolioCounter.__table__])
+    db = sessionmaker(bind=engine, autoflush=False)()
+    tenant = Tenant(name='T', slug='t')
+    db.add(tenant)
+    db.commit()
+
+    monkeypatch.setattr(settings, 'folio_block_size', 3)
+    reset_folio_leases()
+    try:
+        seqs = [get_next_folio_seq(db, tenant.id, 'PEDIDO', mode='leased') for _ in range(5)]
+        assert seqs == [1, 2, 3, 4, 5]
+        # Dos bloques de 3 reservados en el contador, aunque la sesión no hizo commit
+        db.rollback()
+        counter = db.query(FolioCounter).filter(FolioCounter.tenant_id == tenant.id).one()
+        assert counter.next_seq == 7
+
+        # Otro proceso (sin bloque en memoria) continúa después del último bloque
+        reset_folio_leases()
+        assert get_next_folio_seq(db, tenant.id, 'PEDIDO', mode='leased') == 7
+    finally:
+        reset_folio_leases()
+        db.close()
+        engine.dispose()
+
+
+@pytest.mark.skipif(not os.getenv('TEST_POSTGRES_URL'), reason='TEST_POSTGRES_URL no configurado')
+def test_switching_between_sequence_and_counter_never_repeats_folios():
+    engine = create_engine(os.environ['TEST_POSTGRES_URL'])
+    Base.metadata.create_all(bind=engine, tables=[Tenant.__table__, FolioCounter.__table__])
+    db = sessionmaker(bind=engine, autoflush=False)()
+    tenant = Tenant(name='T', slug=f't{uuid.uuid4().hex[:8]}')
+    db.add(tenant)
+    db.commit()
+    try:
+        issued = []
+        for mode in ('strict', 'sequence', 'strict', 'leased', 'sequence'):
+            reset_folio_leases()  # cambio de modo = procesos nuevos
+            issued += [get_next_folio_seq(db, tenant.id, 'VENTA', mode=mode) for _ in range(3)]
+            db.commit()
+        assert len(set(issued)) == len(issued)
+        assert issued[:9] == list(range(1, 10))
+    finally:
+        reset_folio_leases()
+        db.execute(text(f'DROP SEQUENCE IF EXISTS folio_seq_{tenant.id}_venta'))
+        db.commit()
+        db.close()
+        engine.dispose()
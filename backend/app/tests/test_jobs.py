@@ -0,0 +1,83 @@
+import io
+import random
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+import app.routes.import_export  # noqa: F401  (registra products_import)
+from app.core.config import settings
+from app.models.job import Job
+from app.models.product import Product
+from app.models.tenant import Tenant
+from app.services import jobs
+
+
+@jobs.register("test_echo")
+def _echo(db, job, progress):
+    progress(50, "a la mitad")
+    if job.params.get("fail"):
+        raise jobs.JobError("falló a propósito")
+    if job.params.get("file"):
+        return jobs.JobFile(b"a,b\n1,2\n", "eco.csv", "text/csv")
+    return {"echo": job.params["value"]}
+
+
+@pytest.fixture
+def session_factory(db_session):
+    return sessionmaker(bind=db_session.get_bind(), autoflush=False)
+
+
+def _tenant(db):
+    tenant = Tenant(name='T', slug=f't{random.randint(0, 10**9)}')
+    db.add(tenant)
+    db.commit()
+    return tenant
+
+
+def test_jobs_run_in_order_and_record_outcome(db_session, session_factory):
+    tenant = _tenant(db_session)
+    ok = jobs.enqueue(db_session, tenant.id, None, "test_echo", {"value": 7})
+    failed = jobs.enqueue(db_session, tenant.id, None, "test_echo", {"fail": True})
+    with_file = jobs.enqueue(db_session, tenant.id, None, "test_echo", {"file": True})
+
+    assert [jobs.run_next(session_factory) for _ in range(4)] == [ok.id, failed.id, with_file.id, None]
+
+    db_session.expire_all()
+    assert (ok.status, ok.progress, ok.result) == ("succeeded", 100, {"echo": 7})
+    assert (failed.status, failed.error) == ("failed", "falló a propósito")
+    assert (with_file.status, with_file.result_filename, with_file.result_file) == ("succeeded", "eco.csv", b"a,b\n1,2\n")
+
+
+def test_products_import_job(db_session, session_factory):
+    tenant = _tenant(db_session)
+    buf = io.BytesIO()
+    pd.DataFrame({'codigo': ['A1', 'A2', None], 'nombre': ['x', 'y', 'z'], 'costo': [10, 20, 30]}).to_excel(buf, index=False)
+    job = jobs.enqueue(db_session, tenant.id, None, "products_import", input_file=buf.getvalue())
+
+    jobs.run_next(session_factory)
+
+    db_session.expire_all()
+    assert job.status == "succeeded"
+    assert (job.result["added"], job.result["errors"]) == (2, ["Fila 4: código es requerido"])
+    assert db_session.query(Product).filter(Product.tenant_id == tenant.id).count() == 2
+
+
+def test_pending_limit_and_stale_cleanup(db_session, monkeypatch):
+    tenant = _tenant(db_session)
+    monkeypatch.setattr(settings, "job_max_pending_per_tenant", 2)
+    first = jobs.enqueue(db_session, tenant.id, None, "test_echo", {"value": 1})
+    jobs.enqueue(db_session, tenant.id, None, "test_echo", {"value": 2})
+    with pytest.raises(jobs.TooManyJobsError):
+        jobs.enqueue(db_session, tenant.id, None, "test_echo", {"value": 3})
+
+    # Un trabajo 'running' sin latido (proceso caído) se marca como fallido
+    first.status = "running"
+    first.heartbeat_at = datetime.utcnow() - timedelta(seconds=settings.job_stale_seconds + 1)
+    db_session.commit()
+    jobs.cleanup(db_session)
+
+    db_session.expire_all()
+    assert first.status == "failed"
+    assert db_session.query(Job).filter(Job.status == "queued").count() == 1
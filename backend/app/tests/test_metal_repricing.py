@@ -0,0 +1,116 @@
+import random
+from decimal import Decimal
+
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+import app.routes.metal_rates  # noqa: F401  (registra metal_rate_reprice)
+from app.core.config import settings
+from app.models.metal_rate import MetalRate
+from app.models.price_history import PriceHistory
+from app.models.product import Product
+from app.models.tenant import Tenant
+from app.services import jobs, metal_repricing
+
+
+def _seed(db, count=30):
+    tenant = Tenant(name='T', slug=f't{random.randint(0, 10**9)}')
+    db.add(tenant)
+    db.flush()
+    rate = MetalRate(tenant_id=tenant.id, metal_type='14k', rate_per_gram=1000)
+    other = MetalRate(tenant_id=tenant.id, metal_type='10k', rate_per_gram=700)
+    db.add_all([rate, other])
+    for i in range(count):
+        db.add(Product(tenant_id=tenant.id, name=f'P{i}', codigo=f'C{i}', price=1, cost_price=1, stock=2,
+                       quilataje='14k', peso_gramos=Decimal('1.3') + i, descuento_porcentaje=(i % 3) * 10 or None))
+    db.add_all([
+        Product(tenant_id=tenant.id, name='Manual', codigo='M', price=999, cost_price=1, stock=1,
+                quilataje='14k', peso_gramos=2, precio_manual=999),
+        Product(tenant_id=tenant.id, name='Sin peso', codigo='S', price=5, cost_price=1, stock=1, quilataje='14k'),
+        Product(tenant_id=tenant.id, name='10k', codigo='D', price=5, cost_price=1, stock=1,
+                quilataje='10k', peso_gramos=2),
+    ])
+    db.commit()
+    return tenant, rate
+
+
+def _python_price(rate, product):
+    # Cálculo anterior, producto por producto
+    base_price = round(float(rate) * float(product.peso_gramos))
+    if product.descuento_porcentaje:
+        return round(base_price - base_price * (float(product.descuento_porcentaje) / 100))
+    return base_price
+
+
+def test_reprice_matches_python_formula_and_records_history(db_session):
+    tenant, rate = _seed(db_session)
+    rate.rate_per_gram = 1210
+    db_session.flush()
+
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = db_session.get_bind()
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        result = metal_repricing.reprice(db_session, tenant.id, rate.id, old_rate=1000, user_id=None)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    db_session.commit()
+
+    assert result == {'metal_type': '14k', 'updated': 30, 'batches': 1}
+    # Una escritura para el historial y un UPDATE ... FROM para los precios
+    writes = [s for s in statements if s.lstrip().upper().startswith(('INSERT', 'UPDATE'))]
+    assert len(writes) == 2 and 'FROM metal_rates' in writes[1]
+
+    for product in db_session.query(Product).filter(Product.tenant_id == tenant.id, Product.name.like('P%')):
+        assert float(product.price) == float(product.precio_venta) == _python_price(1210, product)
+    untouched = {p.codigo: float(p.price) for p in db_session.query(Product).filter(Product.codigo.in_(['M', 'S', 'D']))}
+    assert untouched == {'M': 999, 'S': 5, 'D': 5}
+
+    history = db_session.query(PriceHistory).filter(PriceHistory.tenant_id == tenant.id).all()
+    assert len(history) == 30
+    assert {(float(h.old_rate), float(h.new_rate), float(h.old_price)) for h in history} == {(1000, 1210, 1)}
+
+    # Sin cambio de tasa no hay nada que actualizar ni registrar
+    assert metal_repricing.reprice(db_session, tenant.id, rate.id, old_rate=1210)['updated'] == 0
+    assert db_session.query(PriceHistory).filter(PriceHistory.tenant_id == tenant.id).count() == 30
+
+
+def test_preview_reports_impact_without_writing(db_session):
+    tenant, rate = _seed(db_session, count=4)
+    metal_repricing.reprice(db_session, tenant.id, rate.id)
+    db_session.commit()
+    before = {p.id: float(p.price) for p in db_session.query(Product).filter(Product.tenant_id == tenant.id)}
+
+    impact = metal_repricing.preview(db_session, tenant.id, '14k', 1100)
+
+    products = db_session.query(Product).filter(
+        Product.tenant_id == tenant.id, Product.name.like('P%')
+    ).all()
+    expected_after = sum(_python_price(1100, p) for p in products)
+    assert impact['products'] == 4 and impact['changed'] == 4
+    assert impact['total_before'] == sum(before[p.id] for p in products)
+    assert impact['total_after'] == expected_after
+    assert impact['inventory_difference'] == 2 * impact['difference']
+    db_session.expire_all()
+    assert {p.id: float(p.price) for p in db_session.query(Product).filter(Product.tenant_id == tenant.id)} == before
+    assert db_session.query(PriceHistory).count() == 4
+
+
+def test_background_reprice_runs_in_batches(db_session, monkeypatch):
+    tenant, rate = _seed(db_session, count=25)
+    monkeypatch.setattr(settings, 'metal_repricing_batch_size', 10)
+    rate.rate_per_gram = 1500
+    db_session.commit()
+
+    job = jobs.enqueue(db_session, tenant.id, None, 'metal_rate_reprice', {'rate_id': rate.id, 'old_rate': 1000})
+    jobs.run_next(sessionmaker(bind=db_session.get_bind(), autoflush=False))
+
+    db_session.expire_all()
+    assert job.status == 'succeeded'
+    assert job.result == {'metal_type': '14k', 'updated': 25, 'batches': 3}
+    for product in db_session.query(Product).filter(Product.tenant_id == tenant.id, Product.name.like('P%')):
+        assert float(product.price) == _python_price(1500, product)
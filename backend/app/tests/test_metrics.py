@@ -0,0 +1,93 @@
+import uuid
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app.core import metrics
+from app.core.config import settings
+
+
+def _owner(client):
+    slug = f'mt-{uuid.uuid4().hex[:8]}'
+    r = client.post('/auth/register', json={
+        'email': f'owner@{slug}.com', 'password': 'secret', 'role': 'owner',
+        'tenant_name': 'T', 'tenant_slug': slug,
+    })
+    return slug, {'Authorization': f"Bearer {r.json()['access_token']}", 'X-Tenant-ID': slug}
+
+
+def test_statements_are_counted_per_request_context():
+    engine = create_engine('sqlite://')
+    metrics.instrument(engine)
+    stats = metrics.RequestStats('GET', 'demo')
+    token = metrics._current.set(stats)
+    try:
+        with engine.connect() as connection:
+            for i in range(3):
+                connection.execute(text('SELECT :i'), {'i': i})
+            connection.execute(text('SELECT   2\n  + 2'))
+    finally:
+        metrics._current.reset(token)
+    assert stats.queries == 4 and stats.db_seconds > 0
+    assert stats.most_repeated() == ('SELECT ?', 3)
+    assert 'SELECT 2 + 2' in [statement for _, _, statement in stats.slowest]
+
+    # Fuera de un request sólo cuenta en los totales del proceso
+    before = metrics._registry.statements['background']
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+    assert metrics._registry.statements['background'] == before + 1 and stats.queries == 4
+    engine.dispose()
+
+
+def test_metrics_endpoint_reports_routes_tenants_and_pool(monkeypatch):
+    from app.main import app
+
+    metrics.reset()
+    client = TestClient(app)
+    slug, headers = _owner(client)
+    for _ in range(2):
+        assert client.get('/products/', headers=headers).status_code == 200
+
+    body = client.get('/metrics').text
+    assert 'pos_http_request_duration_seconds_bucket{method="GET",route="/products/",le="+Inf"} 2' in body
+    assert 'pos_http_request_queries_count{method="GET",route="/products/"} 2' in body
+    assert 'pos_http_requests_total{method="POST",route="/auth/register",status="200"} 1' in body
+    assert f'pos_tenant_requests_total{{tenant="{slug}"}} 2' in body
+    assert 'pos_db_pool_checkouts_total' in body
+    queries = next(line for line in body.splitlines()
+                   if line.startswith('pos_http_request_queries_sum{method="GET",route="/products/"}'))
+    assert float(queries.split()[-1]) > 0
+
+    monkeypatch.setattr(settings, 'metrics_token', 's3cret')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).status_code == 200
+
+    # Fuera de dev/test y sin token: cerrado
+    monkeypatch.setattr(settings, 'metrics_token', '')
+    monkeypatch.setattr(settings, 'env', 'prod')
+    assert client.get('/metrics').status_code == 404
+
+
+def test_slow_requests_are_logged_with_their_sql(monkeypatch, capsys):
+    from app.main import app
+
+    metrics.reset()
+    client = TestClient(app)
+    slug, headers = _owner(client)
+    monkeypatch.setattr(settings, 'slow_request_ms', 0.001)
+    client.get('/products/', headers=headers)
+
+    assert 'Request lento: GET /products/' in capsys.readouterr().out
+    entry = client.get('/admin/slow-requests', headers=headers).json()[0]
+    assert (entry['route'], entry['tenant'], entry['status']) == ('/products/', slug, 200)
+    assert entry['queries'] > 0 and entry['slowest'][0]['sql'].startswith('SELECT')
+
+    # El log es de todo el proceso: el owner de un tenant no lo lee, el token de métricas sí
+    monkeypatch.setattr(settings, 'metrics_token', 's3cret')
+    assert client.get('/admin/slow-requests', headers=headers).status_code == 401
+    ops = {'Authorization': 'Bearer s3cret'}
+    assert slug in [e['tenant'] for e in client.get('/admin/slow-requests', headers=ops).json()]
+    monkeypatch.setattr(settings, 'metrics_token', '')
+    monkeypatch.setattr(settings, 'env', 'prod')
+    assert client.get('/admin/slow-requests', headers=headers).status_code == 404
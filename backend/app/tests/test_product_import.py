@@ -0,0 +1,75 @@
+import random
+
+import pandas as pd
+from sqlalchemy import event
+
+from app.models.metal_rate import MetalRate
+from app.models.product import Product
+from app.models.tenant import Tenant
+from app.services.product_import import import_products_frame
+
+
+def _tenant(db):
+    tenant = Tenant(name='T', slug=f't{random.randint(0, 10**9)}')
+    db.add(tenant)
+    db.flush()
+    db.add(MetalRate(tenant_id=tenant.id, metal_type='14k', rate_per_gram=1000))
+    db.add(Product(name='Viejo', price=1, stock=1, codigo='AN-001', tenant_id=tenant.id))
+    db.commit()
+    return tenant
+
+
+def test_import_prices_upserts_and_reports_row_errors(db_session):
+    tenant = _tenant(db_session)
+    df = pd.DataFrame({
+        'Codigo ': ['AN-001', 'AN-002', None, 'AN-004', 'AN-005', 'AN-006', 'AN-006', 1007],
+        'Nombre': ['Anillo', 'Cadena', 'Sin código', 'Dije', 'Arete', 'Broquel v1', 'Broquel', 'Numérico'],
+        'quilataje': ['14K', '14k', None, 'plata', None, None, None, None],
+        'peso_gramos': [2.5, 3, None, 4, None, None, None, None],
+        'descuento_porcentaje': [10, None, None, None, None, None, None, None],
+        'precio_manual': [None, 999, None, None, None, None, None, None],
+        'costo': [None, None, None, 100, 'abc', None, 7, None],
+        'stock': [3, 1, None, 2.9, None, None, 5, None],
+    })
+
+    result = import_products_frame(db_session, tenant.id, df)
+    db_session.commit()
+
+    assert (result['added'], result['updated'], result['total_rows']) == (4, 1, 8)
+    assert result['errors'] == [
+        'Fila 4: código es requerido',
+        "Fila 6: valor inválido en costo: 'abc'",
+        'Fila 7: código AN-006 repetido en el archivo (se usa la fila 8)',
+    ]
+
+    products = {p.codigo: p for p in db_session.query(Product).filter(Product.tenant_id == tenant.id)}
+    assert sorted(products) == ['1007', 'AN-001', 'AN-002', 'AN-004', 'AN-006']
+    # Tasa sin distinguir mayúsculas: round(1000 * 2.5) - 10%
+    assert (products['AN-001'].name, float(products['AN-001'].price), products['AN-001'].stock) == ('Anillo', 2250, 3)
+    assert float(products['AN-002'].price) == 999
+    # Quilataje sin tasa: costo * 1.5
+    assert (float(products['AN-004'].price), products['AN-004'].stock) == (150, 2)
+    assert (products['AN-006'].name, float(products['AN-006'].price)) == ('Broquel', 10)
+
+
+def test_import_statement_count_does_not_grow_with_rows(db_session):
+    tenant_id = _tenant(db_session).id
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db_session.get_bind()
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        counts = []
+        for size in (10, 900):
+            statements.clear()
+            df = pd.DataFrame({'codigo': [f'X{size}-{i}' for i in range(size)], 'nombre': 'Pieza', 'costo': 10})
+            import_products_frame(db_session, tenant_id, df)
+            counts.append(len(statements))
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    db_session.rollback()
+
+    assert counts[0] == counts[1]
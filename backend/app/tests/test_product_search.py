@@ -0,0 +1,31 @@
+from app.models.product import Product
+from app.models.tenant import Tenant
+from app.services.product_search import search_products
+
+
+def test_search_ranks_codigo_matches_first_shorter_codes_first(db_session):
+    tenant = Tenant(name='T', slug='t')
+    other = Tenant(name='O', slug='o')
+    db_session.add_all([tenant, other])
+    db_session.flush()
+    db_session.add_all([
+        Product(name='Anillo AB12 oro', codigo='X-1', tenant_id=tenant.id),
+        Product(name='Cadena', codigo='AB12-LARGO', tenant_id=tenant.id),
+        Product(name='Arete', codigo='ab12', tenant_id=tenant.id),
+        Product(name='Dije', codigo='Z9', modelo='mod-ab12', tenant_id=tenant.id, active=False),
+        Product(name='Pulso', codigo='Q1', tenant_id=tenant.id),
+        Product(name='Anillo', codigo='AB12', tenant_id=other.id),
+        Product(name='Descuento 50% oro', codigo='D50', tenant_id=tenant.id),
+        Product(name='Descuento 500 oro', codigo='D500', tenant_id=tenant.id),
+    ])
+    db_session.commit()
+
+    codes = [p.codigo for p in search_products(db_session, tenant.id, q='  AB12 ')]
+    assert codes == ['ab12', 'AB12-LARGO', 'Z9', 'X-1']
+
+    codes = [p.codigo for p in search_products(db_session, tenant.id, q='ab12', active=True)]
+    assert codes == ['ab12', 'AB12-LARGO', 'X-1']
+
+    # Los comodines de LIKE se buscan literalmente
+    assert [p.codigo for p in search_products(db_session, tenant.id, q='50%')] == ['D50']
+    assert search_products(db_session, tenant.id, q='a_12') == []
@@ -0,0 +1,223 @@
+"""
+Regresiones de plan: las consultas de reportes y listados por tenant/fecha deben usar
+índices, no recorrer la tabla completa.
+
+Por defecto corre sobre SQLite (EXPLAIN QUERY PLAN). Con QUERY_PLAN_DATABASE_URL
+apuntando a una base PostgreSQL de pruebas corre con EXPLAIN (FORMAT JSON); los datos
+se siembran dentro de una transacción que se revierte al final.
+"""
+import importlib.util
+import os
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, insert, inspect, select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app.models.apartado import Apartado
+from app.models.credit_payment import CreditPayment
+from app.models.inventory_movement import InventoryMovement
+from app.models.product import Product
+from app.models.producto_pedido import PagoPedido, Pedido, ProductoPedido
+from app.models.status_history import StatusHistory
+from app.models.tenant import Base, Tenant
+from app.models.ticket import Ticket
+from app.models.user import User
+from app.models.venta_contado import VentasContado
+
+TENANTS = 20
+ROWS_PER_TENANT = 300
+START = datetime(2025, 1, 1)
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+
+def _seed(conn):
+    conn.execute(insert(Tenant), [{'id': t, 'name': f'T{t}', 'slug': f'plan-{t}'} for t in range(1, TENANTS + 1)])
+    conn.execute(insert(User), [
+        {'id': t, 'email': f'u{t}@plan.test', 'hashed_password': 'x', 'role': 'admin', 'tenant_id': t}
+        for t in range(1, TENANTS + 1)
+    ])
+    rows = [(t, i) for t in range(1, TENANTS + 1) for i in range(ROWS_PER_TENANT)]
+    ids = {key: n for n, key in enumerate(rows, start=1)}
+
+    def when(i):
+        return START + timedelta(hours=i * 7)
+
+    conn.execute(insert(Product), [
+        {'id': ids[t, i], 'tenant_id': t, 'name': 'P', 'price': 1, 'cost_price': 1, 'stock': 1, 'codigo': f'{t}-{i}'}
+        for t, i in rows
+    ])
+    conn.execute(insert(VentasContado), [
+        {'id': ids[t, i], 'tenant_id': t, 'user_id': t, 'total': 10, 'created_at': when(i)} for t, i in rows
+    ])
+    conn.execute(insert(Apartado), [
+        {'id': ids[t, i], 'tenant_id': t, 'user_id': t, 'total': 10, 'created_at': when(i),
+         'credit_status': 'pendiente' if i % 10 == 0 else 'pagado'}
+        for t, i in rows
+    ])
+    conn.execute(insert(CreditPayment), [
+        {'tenant_id': t, 'apartado_id': ids[t, i], 'amount': 5, 'payment_method': 'efectivo',
+         'user_id': t, 'created_at': when(i)}
+        for t, i in rows
+    ])
+    conn.execute(insert(ProductoPedido), [
+        {'id': ids[t, i], 'tenant_id': t, 'modelo': 'M', 'precio': 1, 'cost_price': 1, 'active': i % 2 == 0}
+        for t, i in rows
+    ])
+    conn.execute(insert(Pedido), [
+        {'id': ids[t, i], 'tenant_id': t, 'user_id': t, 'cliente_nombre': 'C', 'precio_unitario': 1, 'total': 1,
+         'saldo_pendiente': 1, 'estado': 'pendiente', 'tipo_pedido': 'apartado', 'created_at': when(i)}
+        for t, i in rows
+    ])
+    conn.execute(insert(PagoPedido), [
+        {'pedido_id': ids[t, i], 'monto': 1, 'metodo_pago': 'efectivo',
+         'tipo_pago': 'anticipo' if i % 2 else 'saldo', 'created_at': when(i)}
+        for t, i in rows
+    ])
+    conn.execute(insert(InventoryMovement), [
+        {'tenant_id': t, 'product_id': ids[t, i], 'user_id': t, 'movement_type': 'entrada', 'quantity': 1,
+         'created_at': when(i)}
+        for t, i in rows
+    ])
+    conn.execute(insert(Ticket), [
+        {'tenant_id': t, 'venta_contado_id': ids[t, i], 'kind': 'sale', 'html': '<p/>', 'created_at': when(i)}
+        for t, i in rows
+    ])
+    conn.execute(insert(StatusHistory), [
+        {'tenant_id': t, 'entity_type': 'pedido', 'entity_id': ids[t, i], 'new_status': 'pendiente',
+         'user_id': t, 'user_email': 'u', 'created_at': when(i)}
+        for t, i in rows
+    ])
+    conn.execute(text('ANALYZE'))
+
+
+@pytest.fixture(scope='module')
+def plan_conn():
+    url = os.getenv('QUERY_PLAN_DATABASE_URL')
+    if url:
+        engine = create_engine(url)
+    else:
+        engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+    with engine.connect() as conn:
+        trans = conn.begin()
+        Base.metadata.create_all(bind=conn)
+        _seed(conn)
+        try:
+            yield conn
+        finally:
+            trans.rollback()
+    engine.dispose()
+
+
+def _full_scans(conn, stmt):
+    """Tablas que el plan recorre completas."""
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+    if conn.dialect.name == 'postgresql':
+        plan = conn.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + sql).scalar()
+        scans = set()
+
+        def walk(node):
+            if node.get('Node Type') == 'Seq Scan':
+                scans.add(node['Relation Name'])
+            for child in node.get('Plans', []):
+                walk(child)
+
+        walk(plan[0]['Plan'])
+        return scans
+    details = [row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql)]
+    # "SEARCH t USING INDEX ..." usa el índice; "SCAN t" (con o sin índice) recorre todo
+    return {m.group(1) for d in details if (m := re.match(r'SCAN (\w+)', d))}
+
+
+PERIOD = (START + timedelta(days=30), START + timedelta(days=60))
+
+KEY_QUERIES = {
+    'ventas_contado periodo': select(VentasContado.id).where(
+        VentasContado.tenant_id == 3, VentasContado.created_at.between(*PERIOD)),
+    'apartados periodo': select(Apartado.id).where(
+        Apartado.tenant_id == 3, Apartado.created_at.between(*PERIOD)),
+    'apartados abiertos': select(Apartado.id).where(
+        Apartado.tenant_id == 3, Apartado.credit_status.in_(['pendiente', 'vencido'])),
+    'abonos periodo': select(CreditPayment.id).where(
+        CreditPayment.tenant_id == 3, CreditPayment.apartado_id.isnot(None),
+        CreditPayment.created_at.between(*PERIOD)),
+    'abonos por apartado': select(CreditPayment.id).where(
+        CreditPayment.apartado_id.in_([5, 6, 7])).order_by(CreditPayment.created_at.desc()),
+    'pedidos periodo': select(Pedido.id).where(Pedido.tenant_id == 3, Pedido.created_at.between(*PERIOD)),
+    'pedidos apartados por estado': select(Pedido.id).where(
+        Pedido.tenant_id == 3, Pedido.tipo_pedido == 'apartado', Pedido.estado == 'pendiente'),
+    'pagos por pedido y tipo': select(PagoPedido.id).where(
+        PagoPedido.pedido_id == 42, PagoPedido.tipo_pago == 'saldo'),
+    'pagos de pedido periodo': select(PagoPedido.id).join(Pedido).where(
+        Pedido.tenant_id == 3, PagoPedido.created_at.between(*PERIOD)),
+    'productos pedido activos': select(ProductoPedido.id).where(
+        ProductoPedido.tenant_id == 3, ProductoPedido.active.is_(True)),
+    'movimientos periodo': select(InventoryMovement.id).where(
+        InventoryMovement.tenant_id == 3, InventoryMovement.created_at.between(*PERIOD)),
+    'kardex por producto': select(InventoryMovement.id).where(
+        InventoryMovement.product_id == 42).order_by(InventoryMovement.created_at),
+    'tickets por tipo': select(Ticket.id).where(Ticket.tenant_id == 3, Ticket.kind == 'sale'),
+    'historial de estados': select(StatusHistory.id).where(
+        StatusHistory.tenant_id == 3, StatusHistory.entity_type == 'pedido', StatusHistory.entity_id == 42),
+}
+
+
+@pytest.mark.parametrize('name', list(KEY_QUERIES))
+def test_key_queries_use_indexes(plan_conn, name):
+    assert _full_scans(plan_conn, KEY_QUERIES[name]) == set()
+
+
+def _migration_indexes():
+    path = BACKEND_DIR / 'alembic' / 'versions' / '0001_tenant_time_indexes.py'
+    spec = importlib.util.spec_from_file_location('tenant_time_indexes', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return {name: table for name, table, _, _ in module.INDEXES}
+
+
+def test_migration_creates_declared_indexes(tmp_path):
+    declared = _migration_indexes()
+    # Modelos y migración declaran los mismos índices
+    for name, table in declared.items():
+        assert name in {ix.name for ix in Base.metadata.tables[table].indexes}
+
+    engine = create_engine(f'sqlite:///{tmp_path / "plan.db"}')
+    Base.metadata.create_all(bind=engine)
+    # Base existente anterior a los índices compuestos
+    with engine.begin() as conn:
+        for name in declared:
+            conn.exec_driver_sql(f'DROP INDEX {name}')
+
+    def indexes():
+        inspector = inspect(engine)
+        return {ix['name'] for table in set(declared.values()) for ix in inspector.get_indexes(table)}
+
+    config = Config(str(BACKEND_DIR / 'alembic.ini'))
+    config.set_main_option('script_location', str(BACKEND_DIR / 'alembic'))
+    config.attributes['configure_logging'] = False
+    with engine.connect() as conn:
+        config.attributes['connection'] = conn
+        command.upgrade(config, 'head')
+        conn.commit()
+    assert set(declared) <= indexes()
+
+    with engine.connect() as conn:
+        config.attributes['connection'] = conn
+        command.downgrade(config, 'base')
+        conn.commit()
+    assert not set(declared) & indexes()
+    engine.dispose()
+
+
+def test_open_apartados_index_is_partial():
+    index = next(ix for ix in Apartado.__table__.indexes if ix.name == 'ix_apartados_tenant_open')
+    assert 'pendiente' in str(index.dialect_options['postgresql']['where'])
+    with Session(create_engine('sqlite://')) as db:
+        Base.metadata.create_all(bind=db.get_bind())
+        sql = db.execute(text("SELECT sql FROM sqlite_master WHERE name = 'ix_apartados_tenant_open'")).scalar()
+    assert 'WHERE' in sql
@@ -0,0 +1,76 @@
+import csv
+import gzip
+import io
+import random
+from datetime import datetime, timedelta
+
+from app.models.apartado import Apartado
+from app.models.credit_payment import CreditPayment
+from app.models.payment import Payment
+from app.models.tenant import Tenant
+from app.models.user import User
+from app.models.venta_contado import VentasContado
+from app.services import sales_export
+from app.services.sales_export import CSV_HEADER, iter_sales_csv
+
+
+def _seed(db):
+    tenant = Tenant(name='T', slug=f't{random.randint(0, 10**9)}')
+    db.add(tenant)
+    db.flush()
+    seller = User(email='v@t.com', hashed_password='x', role='cashier', tenant_id=tenant.id, username='vendedora')
+    db.add(seller)
+    db.flush()
+    base = datetime(2025, 1, 1, 12)
+    v1 = VentasContado(tenant_id=tenant.id, user_id=seller.id, total=100, created_at=base, folio_venta='V-000001')
+    v2 = VentasContado(tenant_id=tenant.id, user_id=seller.id, total=50, created_at=base + timedelta(hours=2))
+    ap = Apartado(tenant_id=tenant.id, user_id=seller.id, vendedor_id=seller.id, total=300,
+                  created_at=base + timedelta(hours=1), folio_apartado='AP-000001')
+    db.add_all([v1, v2, ap])
+    db.flush()
+    db.add_all([
+        Payment(venta_contado_id=v1.id, method='efectivo', amount=60),
+        Payment(venta_contado_id=v1.id, method='card', amount=40),
+        Payment(venta_contado_id=v2.id, method='vale', amount=50),
+        CreditPayment(tenant_id=tenant.id, apartado_id=ap.id, amount=120, payment_method='transferencia', user_id=seller.id),
+    ])
+    db.commit()
+    return tenant, seller
+
+
+def _rows(chunks, compressed=False):
+    data = b''.join(chunks)
+    if compressed:
+        data = gzip.decompress(data)
+    return list(csv.reader(io.StringIO(data.decode('utf-8'))))
+
+
+def test_export_merges_sources_with_payment_split(db_session):
+    tenant, seller = _seed(db_session)
+
+    rows = _rows(iter_sales_csv(db_session, tenant.id))
+
+    assert rows[0] == CSV_HEADER
+    assert [(r[4], r[3]) for r in rows[1:]] == [('contado', '50.00'), ('abono', '300.00'), ('contado', '100.00')]
+    by_total = {r[3]: dict(zip(CSV_HEADER, r)) for r in rows[1:]}
+    assert by_total['100.00']['folio'] == 'V-000001'
+    assert by_total['100.00']['vendedor'] == 'vendedora'
+    assert (by_total['100.00']['efectivo'], by_total['100.00']['tarjeta']) == ('60.00', '40.00')
+    assert by_total['50.00']['otros'] == '50.00'
+    assert by_total['300.00']['transferencia'] == '120.00'
+
+    # Filtros: rango de fechas
+    rows = _rows(iter_sales_csv(db_session, tenant.id, date_from='2025-01-01T12:30:00'))
+    assert [r[3] for r in rows[1:]] == ['50.00', '300.00']
+
+
+def test_export_streams_in_batches_and_gzip(db_session, monkeypatch):
+    tenant, _ = _seed(db_session)
+    monkeypatch.setattr(sales_export, 'STREAM_BATCH_ROWS', 1)
+
+    chunks = list(iter_sales_csv(db_session, tenant.id))
+    # Un bloque por renglón (el encabezado va con el primero); no hay bloque final vacío
+    assert len(chunks) == 3
+
+    plain = _rows(iter_sales_csv(db_session, tenant.id))
+    assert _rows(iter_sales_csv(db_session, tenant.id, gzip=True), compressed=True) == plain
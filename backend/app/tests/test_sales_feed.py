@@ -0,0 +1,120 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import event
+
+from app.models.apartado import Apartado
+from app.models.producto_pedido import Pedido
+from app.models.tenant import Tenant
+from app.models.user import User
+from app.models.venta_contado import VentasContado
+from app.services import pagination, sales_feed
+
+
+def _seed(db):
+    tenant = Tenant(name='T', slug=f't{random.randint(0, 10**9)}')
+    db.add(tenant)
+    db.flush()
+    seller = User(email=f'v{tenant.id}@t.com', hashed_password='x', role='cashier', tenant_id=tenant.id)
+    other = User(email=f'o{tenant.id}@t.com', hashed_password='x', role='cashier', tenant_id=tenant.id)
+    db.add_all([seller, other])
+    db.flush()
+    base = datetime(2025, 5, 1, 10)
+    rows = []
+    for i in range(6):
+        at = base + timedelta(hours=i // 2)  # instantes repetidos entre orígenes
+        rows.append(VentasContado(tenant_id=tenant.id, user_id=seller.id, total=10 + i, created_at=at,
+                                  folio_venta=f'V-{i}'))
+        if i % 2:
+            rows.append(Apartado(tenant_id=tenant.id, user_id=other.id, total=100 + i, created_at=at,
+                                 folio_apartado=f'AP-{i}'))
+    rows.append(Pedido(tenant_id=tenant.id, user_id=seller.id, cliente_nombre='C', precio_unitario=1, total=500,
+                       saldo_pendiente=0, folio_pedido='PED-1', created_at=base.replace(tzinfo=timezone.utc)))
+    db.add_all(rows)
+    db.commit()
+    return tenant, seller, other
+
+
+def _walk(db, tenant, limit, **filters):
+    items, cursor, pages = [], None, 0
+    while True:
+        page, cursor = sales_feed.page(db, tenant.id, limit=limit, cursor=cursor, **filters)
+        items += page
+        pages += 1
+        if cursor is None:
+            return items, pages
+
+
+def test_cursor_pages_follow_the_merged_order(db_session):
+    tenant, seller, other = _seed(db_session)
+
+    everything, _ = sales_feed.page(db_session, tenant.id, limit=100)
+    keys = [(i['created_at'], sales_feed.SOURCES.index(i['tipo_venta']), i['id']) for i in everything]
+    assert keys == sorted(keys, reverse=True) and len(keys) == 9
+
+    walked, pages = _walk(db_session, tenant, 2)
+    assert walked == everything and pages == 5
+    # skip sigue funcionando (y ya no pagina cada origen por separado)
+    skipped, _ = sales_feed.page(db_session, tenant.id, limit=2, skip=4)
+    assert skipped == everything[4:6]
+
+    first = next(i for i in everything if i['tipo_venta'] == 'abono')
+    assert first['user'] == {'email': other.email} and first['folio_apartado'].startswith('AP-')
+
+    with_pedidos, _ = _walk(db_session, tenant, 4, include_pedidos=True)
+    assert [i['folio_pedido'] for i in with_pedidos if i['tipo_venta'] == 'pedido'] == ['PED-1']
+    assert len(with_pedidos) == 10
+
+    mine, _ = _walk(db_session, tenant, 2, user_id=seller.id)
+    assert {i['tipo_venta'] for i in mine} == {'contado'} and len(mine) == 6
+
+
+def test_each_page_is_one_query(db_session):
+    tenant, _, _ = _seed(db_session)
+    _, cursor = sales_feed.page(db_session, tenant.id, limit=3)
+
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    tenant.id  # cargar antes de contar
+    engine = db_session.get_bind()
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        sales_feed.page(db_session, tenant.id, limit=3, cursor=cursor)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    assert len(statements) == 1 and 'UNION ALL' in statements[0]
+
+    with pytest.raises(pagination.InvalidCursorError):
+        sales_feed.page(db_session, tenant.id, cursor=pagination.encode_cursor(1, 2))
+
+
+def test_next_cursor_is_readable_cross_origin():
+    import uuid
+
+    from fastapi.testclient import TestClient
+
+    from app.core.database import SessionLocal
+    from app.main import app
+
+    client = TestClient(app)
+    slug = f'sf-{uuid.uuid4().hex[:8]}'
+    r = client.post('/auth/register', json={
+        'email': f'owner@{slug}.com', 'password': 'secret', 'role': 'owner',
+        'tenant_name': 'T', 'tenant_slug': slug,
+    })
+    with SessionLocal() as db:
+        owner = db.query(User).filter(User.email == f'owner@{slug}.com').one()
+        db.add_all([VentasContado(tenant_id=owner.tenant_id, user_id=owner.id, total=10 + i) for i in range(2)])
+        db.commit()
+    headers = {'Authorization': f"Bearer {r.json()['access_token']}", 'X-Tenant-ID': slug,
+               'Origin': 'http://localhost:5173'}
+
+    r = client.get('/ventas/', params={'limit': 1}, headers=headers)
+    assert r.status_code == 200 and len(r.json()) == 1 and r.headers['x-next-cursor']
+    assert 'X-Next-Cursor' in r.headers['access-control-expose-headers']
+    r = client.get('/ventas/', params={'limit': 1, 'cursor': r.headers['x-next-cursor']}, headers=headers)
+    assert len(r.json()) == 1
@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+from sqlalchemy import event
+
+from app.core import startup
+from app.core.database import engine
+
+# Cuenta intentos de conexión (do_connect corre antes de conectar, aunque falle)
+IMPORT_PROBE = textwrap.dedent('''
+    import json
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    attempts = []
+    event.listen(Engine, 'do_connect', lambda *args: attempts.append(1))
+
+    import app.main  # noqa: F401
+    from app.core import startup
+    print(json.dumps({'connections': len(attempts), 'startup': startup.report()}))
+''')
+
+
+def test_app_imports_without_touching_the_database():
+    env = dict(os.environ, DATABASE_URL='postgresql+psycopg2://u:p@127.0.0.1:1/nadie', ENV='dev')
+    backend = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    result = subprocess.run([sys.executable, '-c', IMPORT_PROBE], cwd=backend, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    assert probe['connections'] == 0
+    assert 'import' in probe['startup']['phases_ms'] and not probe['startup']['ready']
+
+
+def test_schema_gate_runs_once_per_version(monkeypatch):
+    startup.migrate()  # ya aplicada por conftest o la aplica aquí
+
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        assert startup.migrate() is False
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    # Un worker con la versión al día sólo hace un SELECT
+    assert len(statements) == 1 and 'app_schema_version' in statements[0]
+
+    monkeypatch.setattr(startup, 'SCHEMA_VERSION', 'test-next')
+    assert startup.migrate() is True
+    assert startup.applied_version(engine) == 'test-next'
+    assert startup.migrate() is False
@@ -0,0 +1,160 @@
+import random
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+import pandas as pd
+from sqlalchemy import event
+
+from app.models.inventory_movement import InventoryMovement
+from app.models.product import Product
+from app.models.stock_ledger import StockLedgerEntry, StockSnapshot
+from app.models.tenant import Tenant
+from app.models.user import User
+from app.models.venta_contado import ItemVentaContado, VentasContado
+from app.services import stock_ledger
+from app.services.inventory_service import get_stock_grouped_diff, get_stock_grouped_historical
+from app.services.product_import import import_products_frame
+from app.services.stock_reservation import release_stock, reserve_stock
+
+
+def _tenant(db):
+    tenant = Tenant(name='T', slug=f't{random.randint(0, 10**9)}')
+    db.add(tenant)
+    db.flush()
+    user = User(email=f'u{tenant.id}@t.com', hashed_password='x', role='admin', tenant_id=tenant.id)
+    db.add(user)
+    db.commit()
+    return tenant, user
+
+
+def _product(db, tenant, codigo, stock, name='Anillo'):
+    product = Product(tenant_id=tenant.id, name=name, codigo=codigo, price=Decimal(100),
+                      cost_price=Decimal(50), stock=stock, active=True)
+    db.add(product)
+    db.commit()
+    return product
+
+
+def _ledger(db, product_id):
+    return [
+        (e.reason, e.delta, e.balance)
+        for e in db.query(StockLedgerEntry).filter(StockLedgerEntry.product_id == product_id).order_by(StockLedgerEntry.id)
+    ]
+
+
+def test_every_stock_change_is_recorded(db_session):
+    tenant, user = _tenant(db_session)
+    product = _product(db_session, tenant, 'A1', 5)
+    product_id = product.id
+
+    # Movimiento de entrada con el ORM
+    db_session.add(InventoryMovement(tenant_id=tenant.id, product_id=product_id, user_id=user.id,
+                                     movement_type='entrada', quantity=3))
+    product.stock += 3
+    db_session.commit()
+    # Venta, apartado y devolución con SQL directo
+    reserve_stock(db_session, tenant.id, {product_id: 2})
+    reserve_stock(db_session, tenant.id, {product_id: 1}, reason='apartado')
+    release_stock(db_session, tenant.id, {product_id: 1})
+    db_session.commit()
+    # Edición directa (las rutas cargan el producto antes de editarlo)
+    assert product.stock == 6
+    product.stock = 10
+    db_session.commit()
+    # Importación
+    import_products_frame(db_session, tenant.id, pd.DataFrame({'codigo': ['A1', 'B2'], 'stock': [4, 7]}))
+    db_session.commit()
+    # Un rollback no deja renglones
+    reserve_stock(db_session, tenant.id, {product_id: 1})
+    db_session.rollback()
+
+    assert _ledger(db_session, product_id) == [
+        ('alta', 5, 5),
+        ('entrada', 3, 8),
+        ('venta', -2, 6),
+        ('apartado', -1, 5),
+        ('devolucion', 1, 6),
+        ('ajuste', 4, 10),
+        ('importacion', -6, 4),
+    ]
+    new_id = db_session.query(Product.id).filter(Product.codigo == 'B2').scalar()
+    assert _ledger(db_session, new_id) == [('importacion', 7, 7)]
+
+
+def _backdate(db, product_id, when):
+    db.query(StockLedgerEntry).filter(StockLedgerEntry.product_id == product_id).update({'created_at': when})
+
+
+def test_historical_stock_reads_snapshot_plus_ledger_in_one_query(db_session):
+    tenant, _ = _tenant(db_session)
+    day = date(2025, 3, 10)
+    at = lambda d, h=12: datetime.combine(d, datetime.min.time()).replace(hour=h, tzinfo=timezone.utc)  # noqa: E731
+
+    products = [_product(db_session, tenant, f'P{i}', 4, name='Anillo' if i % 2 else 'Arete') for i in range(6)]
+    ids = [p.id for p in products]
+    for product_id in ids:
+        _backdate(db_session, product_id, at(day - timedelta(days=1)))
+    # Foto del día 10; después cambios el 11 y el 12
+    stock_ledger.take_snapshot(db_session, tenant.id, day)
+    db_session.query(StockSnapshot).filter(StockSnapshot.tenant_id == tenant.id).update(
+        {'as_of': stock_ledger.day_cutoff(day)}
+    )
+    db_session.add_all([
+        StockLedgerEntry(tenant_id=tenant.id, product_id=ids[0], delta=-4, balance=0, reason='venta',
+                         created_at=at(day + timedelta(days=1))),
+        StockLedgerEntry(tenant_id=tenant.id, product_id=ids[1], delta=2, balance=6, reason='entrada',
+                         created_at=at(day + timedelta(days=1), 9)),
+        StockLedgerEntry(tenant_id=tenant.id, product_id=ids[1], delta=-1, balance=5, reason='venta',
+                         created_at=at(day + timedelta(days=1), 18)),
+        StockLedgerEntry(tenant_id=tenant.id, product_id=ids[2], delta=5, balance=9, reason='ajuste',
+                         created_at=at(day + timedelta(days=2))),
+    ])
+    db_session.commit()
+
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    tenant.id  # cargar antes de contar
+    engine = db_session.get_bind()
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        groups = get_stock_grouped_historical(day + timedelta(days=1), db_session, tenant)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+    stock = {p['id']: p['stock'] for g in groups for p in g['productos']}
+    assert stock == {ids[1]: 5, ids[2]: 4, ids[3]: 4, ids[4]: 4, ids[5]: 4}
+    assert sorted(g['cantidad_total'] for g in groups) == [8, 13]
+    # Sondeo de inicio del kardex + la consulta de saldos
+    assert len(statements) == 2
+
+    diff = get_stock_grouped_diff(day, day + timedelta(days=2), db_session, tenant)
+    by_id = {p['id']: p for g in diff for p in g['productos']}
+    assert (by_id[ids[0]]['stock_inicial'], by_id[ids[0]]['stock_final']) == (4, 0)
+    assert by_id[ids[2]]['diferencia'] == 5
+    assert sum(g['diferencia'] for g in diff) == -4 + 1 + 5
+
+
+def test_dates_before_the_ledger_replay_movements_with_grouped_queries(db_session):
+    tenant, user = _tenant(db_session)
+    product = _product(db_session, tenant, 'X1', 3)
+    other = _product(db_session, tenant, 'X2', 1)
+    after = datetime(2025, 2, 1, 12, tzinfo=timezone.utc)
+    venta = VentasContado(tenant_id=tenant.id, user_id=user.id, total=100, created_at=after)
+    db_session.add_all([
+        venta,
+        InventoryMovement(tenant_id=tenant.id, product_id=product.id, user_id=user.id,
+                          movement_type='entrada', quantity=2, created_at=after),
+        InventoryMovement(tenant_id=tenant.id, product_id=other.id, user_id=user.id,
+                          movement_type='salida', quantity=1, created_at=after),
+    ])
+    db_session.flush()
+    db_session.add(ItemVentaContado(venta_id=venta.id, product_id=product.id, name='Anillo', quantity=4))
+    db_session.commit()
+
+    groups = get_stock_grouped_historical(date(2025, 1, 31), db_session, tenant)
+
+    # X1: 3 - 2 (entrada posterior) + 4 (venta posterior) = 5; X2: 1 + 1 (salida posterior) = 2
+    assert {p['codigo']: p['stock'] for g in groups for p in g['productos']} == {'X1': 5, 'X2': 2}
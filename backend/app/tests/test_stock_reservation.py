@@ -0,0 +1,109 @@
+import os
+import random
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.product import Product
+from app.models.tenant import Base, Tenant
+from app.services.stock_reservation import (
+    InsufficientStockError,
+    merge_quantities,
+    release_stock,
+    reserve_stock,
+)
+
+
+def _products(db, *stocks):
+    tenant = Tenant(name='T', slug=f't{random.randint(0, 10**9)}')
+    db.add(tenant)
+    db.flush()
+    products = [Product(name=f'P{i}', price=100, stock=s, tenant_id=tenant.id) for i, s in enumerate(stocks)]
+    db.add_all(products)
+    db.commit()
+    return tenant, products
+
+
+def test_reserve_stock_is_all_or_nothing(db_session):
+    tenant, (a, b) = _products(db_session, 2, 1)
+
+    assert reserve_stock(db_session, tenant.id, merge_quantities([(a.id, 1), (a.id, 1)])) == {a.id: 0}
+    assert a.stock == 0
+    db_session.commit()
+
+    with pytest.raises(InsufficientStockError) as exc:
+        reserve_stock(db_session, tenant.id, {b.id: 1, a.id: 1})
+    assert exc.value.product_id == a.id
+    db_session.rollback()
+    assert (a.stock, b.stock) == (0, 1)
+
+    # Otro tenant no puede tocar el inventario
+    with pytest.raises(InsufficientStockError):
+        reserve_stock(db_session, tenant.id + 1, {b.id: 1})
+    db_session.rollback()
+
+    assert release_stock(db_session, tenant.id, {a.id: 3}) == {a.id: 3}
+
+
+@pytest.mark.skipif(not os.getenv('TEST_POSTGRES_URL'), reason='TEST_POSTGRES_URL no configurado')
+def test_concurrent_carts_never_oversell_postgres():
+    engine = create_engine(os.environ['TEST_POSTGRES_URL'], pool_size=40, max_overflow=0)
+    Base.metadata.create_all(bind=engine, tables=[Tenant.__table__, Product.__table__])
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    initial = 25
+    with Session() as db:
+        tenant, products = _products(db, initial, initial, initial)
+        tenant_id = tenant.id
+        ids = [p.id for p in products]
+
+    workers = 32
+    carts_per_worker = 20
+    barrier = threading.Barrier(workers)
+    sold = {pid: 0 for pid in ids}
+    errors = []
+    lock = threading.Lock()
+
+    def worker(seed):
+        rnd = random.Random(seed)
+        barrier.wait()
+        for _ in range(carts_per_worker):
+            # Carritos con varias líneas en orden aleatorio para forzar cruces de candados
+            lines = [(pid, 1) for pid in rnd.sample(ids, rnd.randint(1, len(ids)))]
+            with Session() as db:
+                try:
+                    reserve_stock(db, tenant_id, merge_quantities(lines))
+                    db.commit()
+                except InsufficientStockError:
+                    db.rollback()
+                    continue
+                except Exception as e:  # deadlocks u otros errores invalidan la prueba
+                    db.rollback()
+                    with lock:
+                        errors.append(e)
+                    continue
+            with lock:
+                for pid, q in lines:
+                    sold[pid] += q
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    try:
+        assert errors == []
+        with Session() as db:
+            stocks = dict(db.query(Product.id, Product.stock).filter(Product.id.in_(ids)).all())
+        for pid in ids:
+            assert stocks[pid] >= 0
+            assert sold[pid] == initial - stocks[pid]
+    finally:
+        with Session() as db:
+            db.query(Product).filter(Product.tenant_id == tenant_id).delete()
+            db.query(Tenant).filter(Tenant.id == tenant_id).delete()
+            db.commit()
+        engine.dispose()
@@ -0,0 +1,48 @@
+import asyncio
+import uuid
+
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+
+from app.core.database import get_db
+from app.main import app
+
+
+def _uses_db(dependant) -> bool:
+    return any(d.call is get_db or _uses_db(d) for d in dependant.dependencies)
+
+
+def test_routes_with_a_db_session_run_in_the_threadpool():
+    # Un `async def` con la sesión síncrona bloquea el event loop en cada consulta
+    blocking = [
+        f"{sorted(route.methods)} {route.path}"
+        for route in app.routes
+        if isinstance(route, APIRoute) and _uses_db(route.dependant)
+        and asyncio.iscoroutinefunction(route.endpoint)
+    ]
+    assert blocking == []
+
+
+def test_checkout_reads_the_raw_body_through_a_dependency():
+    client = TestClient(app)
+    slug = f'sync-{uuid.uuid4().hex[:8]}'
+    r = client.post('/auth/register', json={
+        'email': f'owner@{slug}.com', 'password': 'secret', 'role': 'owner',
+        'tenant_name': 'T', 'tenant_slug': slug,
+    })
+    assert r.status_code == 200
+    headers = {'Authorization': f"Bearer {r.json()['access_token']}", 'X-Tenant-ID': slug}
+
+    r = client.post('/products/', json={'name': 'Anillo', 'price': 100, 'stock': 3}, headers=headers)
+    assert r.status_code == 200
+    product_id = r.json()['id']
+
+    r = client.post('/ventas/', json={
+        'items': [{'product_id': product_id, 'quantity': 2}],
+        'payments': [{'method': 'efectivo', 'amount': 200}],
+        'tipo_venta': 'contado',
+        'customer_name': 'Ana',
+    }, headers=headers)
+    assert r.status_code == 200, r.text
+    assert float(r.json()['total']) == 200
+    assert client.get(f'/products/{product_id}', headers=headers).json()['stock'] == 1
@@ -0,0 +1,70 @@
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.apartado import Apartado
+from app.models.credit_payment import CreditPayment
+from app.models.customer_stats import CustomerStats
+from app.models.product import Product
+from app.models.tenant import Base
+from app.models.ticket import Ticket, TicketFragment
+from app.models.venta_contado import VentasContado
+from benchmarks import hot_paths, synthetic_data
+
+TINY = synthetic_data.SCALES['tiny']
+
+
+def _fingerprint(db, dataset):
+    tenant_id = dataset.tenant_id
+    return (
+        dataset.counts,
+        dataset.codigos,
+        db.query(Product.codigo, Product.name, Product.stock).filter(Product.tenant_id == tenant_id).order_by(Product.codigo).all(),
+        db.query(VentasContado.folio_venta, VentasContado.total, VentasContado.customer_phone, VentasContado.created_at)
+        .filter(VentasContado.tenant_id == tenant_id).order_by(VentasContado.folio_venta).all(),
+        db.query(Apartado.folio_apartado, Apartado.amount_paid, Apartado.credit_status)
+        .filter(Apartado.tenant_id == tenant_id).order_by(Apartado.folio_apartado).all(),
+        sorted(db.query(Ticket.etag).filter(Ticket.tenant_id == tenant_id).all()),
+    )
+
+
+def test_generator_is_deterministic_and_consistent(db_session):
+    first = synthetic_data.generate(db_session, TINY, seed=7, slug='syn-a')
+
+    engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as other:
+        second = synthetic_data.generate(other, TINY, seed=7, slug='syn-b')
+        assert _fingerprint(other, second) == _fingerprint(db_session, first)
+    engine.dispose()
+
+    # Abonos = amount_paid; customer_stats y un solo logo para todos los tickets
+    paid = db_session.query(func.sum(Apartado.amount_paid)).filter(Apartado.tenant_id == first.tenant_id).scalar()
+    abonos = db_session.query(func.sum(CreditPayment.amount)).filter(CreditPayment.tenant_id == first.tenant_id).scalar()
+    assert paid == abonos and first.counts['credit_payments'] >= first.counts['apartados'] > 0
+    assert db_session.query(CustomerStats).filter(CustomerStats.tenant_id == first.tenant_id).count() > 0
+    assert db_session.query(TicketFragment).count() == 2
+    assert first.counts['tickets'] == TINY.tickets
+
+
+def test_hot_path_suite_runs_every_endpoint():
+    from fastapi.testclient import TestClient
+
+    from app.core.database import SessionLocal
+    from app.main import app
+
+    with SessionLocal() as db:
+        dataset = synthetic_data.generate(db, TINY, seed=1)
+    results = hot_paths.run_suite(TestClient(app), dataset, iterations=2)
+
+    assert set(results) == {
+        'create_sale', 'list_products', 'lookup_product', 'get_detailed_corte_caja',
+        'get_inventory_report', 'get_stock_grouped_historical', 'get_customers', 'get_credit_sales',
+    }
+    assert results['create_sale']['queries'] > 0 and results['get_customers']['peak_kb'] > 0
+
+    baseline = {'results': results}
+    worse = {'results': {**results, 'get_customers': dict(results['get_customers'],
+                                                          queries=results['get_customers']['queries'] + 5)}}
+    assert hot_paths.compare(baseline, {'results': results}, 0.25) == []
+    assert hot_paths.compare(baseline, worse, 0.25)[0].startswith('get_customers')
@@ -0,0 +1,91 @@
+import base64
+import random
+import uuid
+
+from fastapi.testclient import TestClient
+
+from app.core import ticket_service
+from app.models.tenant import Tenant
+from app.models.ticket import Ticket, TicketFragment
+
+LOGO = 'data:image/png;base64,' + base64.b64encode(random.Random(1).randbytes(30_000)).decode()
+CSS = ''.join(f'.c{i} {{ margin: {i}px; font-family: monospace; }}\n' for i in range(200))
+
+
+def _ticket_html(folio: str) -> str:
+    return (f'<html><head><style>{CSS}</style></head><body><img src="{LOGO}" />'
+            f'<h1>Venta {folio}</h1><p>Total: $1,250.00</p>'
+            f'<div style="opacity: .2"><img src="{LOGO}" /></div></body></html>')
+
+
+def _tenant(db):
+    tenant = Tenant(name='T', slug=f't{random.randint(0, 10**9)}')
+    db.add(tenant)
+    db.commit()
+    return tenant
+
+
+def test_bodies_are_compressed_and_fragments_shared(db_session):
+    tenant = _tenant(db_session)
+    tickets = [
+        ticket_service.save_ticket(db_session, tenant.id, _ticket_html(f'V-{i}'), venta_contado_id=None, sale_id=i)
+        for i in range(20)
+    ]
+
+    # Logo y CSS una sola vez para los 20 tickets
+    assert db_session.query(TicketFragment).count() == 2
+    html_bytes = sum(len(_ticket_html(f'V-{i}').encode()) for i in range(20))
+    stored = sum(len(t.body) for t in tickets) + sum(len(f.data) for f in db_session.query(TicketFragment))
+    assert stored * 10 < html_bytes
+
+    for i, ticket in enumerate(tickets):
+        assert ticket.html is None and ticket.html_size == len(_ticket_html(f'V-{i}').encode())
+        assert ticket_service.ticket_html(db_session, ticket) == _ticket_html(f'V-{i}')
+
+    # Re-guardar reemplaza el mismo ticket
+    again = ticket_service.save_ticket(db_session, tenant.id, '<p>corregido</p>', sale_id=0)
+    assert again.id == tickets[0].id and ticket_service.ticket_html(db_session, again) == '<p>corregido</p>'
+
+
+def test_legacy_rows_are_read_and_compacted(db_session):
+    tenant = _tenant(db_session)
+    legacy = Ticket(tenant_id=tenant.id, sale_id=7, kind='sale', html=_ticket_html('OLD'))
+    db_session.add(legacy)
+    db_session.commit()
+    assert ticket_service.ticket_html(db_session, legacy) == _ticket_html('OLD')
+    etag = ticket_service.ticket_etag(legacy)
+
+    assert ticket_service.compact_legacy(db_session, batch_size=1) == 1
+    db_session.refresh(legacy)
+    assert legacy.html is None and legacy.body is not None
+    assert ticket_service.ticket_html(db_session, legacy) == _ticket_html('OLD')
+    assert ticket_service.ticket_etag(legacy) == etag
+
+
+def test_listings_are_metadata_only_and_html_uses_etag():
+    from app.main import app
+
+    client = TestClient(app)
+    slug = f'tk-{uuid.uuid4().hex[:8]}'
+    r = client.post('/auth/register', json={
+        'email': f'owner@{slug}.com', 'password': 'secret', 'role': 'owner',
+        'tenant_name': 'T', 'tenant_slug': slug,
+    })
+    headers = {'Authorization': f"Bearer {r.json()['access_token']}", 'X-Tenant-ID': slug}
+
+    html = _ticket_html('P-1')
+    r = client.post('/tickets', json={'pedido_id': None, 'sale_id': 99, 'kind': 'sale', 'html': html}, headers=headers)
+    assert r.status_code == 200 and 'html' not in r.json()
+    ticket_id = r.json()['id']
+
+    listing = client.get('/tickets/by-sale/99', headers=headers)
+    assert [t['id'] for t in listing.json()] == [ticket_id]
+    assert 'html' not in listing.json()[0] and len(listing.content) < 1000
+
+    r = client.get(f'/tickets/{ticket_id}/html', headers=headers)
+    assert r.status_code == 200 and r.text == html
+    etag = r.headers['etag']
+    r = client.get(f'/tickets/{ticket_id}/html', headers={**headers, 'If-None-Match': etag})
+    assert r.status_code == 304 and r.content == b''
+
+    assert client.get(f'/tickets/{ticket_id}', headers=headers).json()['html'] == html
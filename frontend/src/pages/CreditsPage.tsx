@@ -1,7 +1,7 @@
 import { useState, useEffect } from 'react';
 import Layout from '../components/Layout';
 import { api } from '../utils/api';
-import { getLogoAsBase64, openAndPrintTicket, saveTicket, generateApartadoPaymentTicketHTML } from '../utils/ticketGenerator';
+import { getLogoAsBase64, openAndPrintTicket, saveTicket, generateApartadoPaymentTicketHTML, fetchTicketHtml } from '../utils/ticketGenerator';
 
 interface CreditPayment {
   id: number;
@@ -16,7 +16,7 @@ interface TicketRecord {
   id: number;
   sale_id: number;
   kind: string;
-  html: string;
+  html_size?: number;
   created_at: string;
 }
 
@@ -221,9 +221,12 @@ export default function CreditsPage() {
     setShowPaymentForm(true);
   };
 
-  const openTicketHtml = (html: string) => {
+  const openTicketHtml = async (ticketId: number) => {
+    // Abrir la ventana antes de pedir el HTML (los listados ya no lo traen) para que el
+    // navegador no la bloquee como popup
     const w = window.open('', '_blank');
     if (!w) return;
+    const html = await fetchTicketHtml(ticketId);
     w.document.write(html);
     w.document.close();
     w.addEventListener('load', () => setTimeout(() => w.print(), 300));
@@ -841,7 +844,7 @@ export default function CreditsPage() {
                                 {ticket ? (
                                   <button
                                     className="text-blue-600 hover:text-blue-800 underline text-xs"
-                                    onClick={() => openTicketHtml(ticket.html)}
+                                    onClick={() => openTicketHtml(ticket.id)}
                                   >
                                     {ticketLabel}
                                   </button>
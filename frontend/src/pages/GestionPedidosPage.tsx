@@ -1,7 +1,7 @@
 import { useEffect, useState } from 'react'
 import Layout from '../components/Layout'
 import { api } from '../utils/api'
-import { getLogoAsBase64, generatePedidoTicketHTML, openAndPrintTicket, saveTicket } from '../utils/ticketGenerator'
+import { getLogoAsBase64, generatePedidoTicketHTML, openAndPrintTicket, saveTicket, fetchTicketHtml } from '../utils/ticketGenerator'
 
 type PedidoItem = {
   id: number
@@ -112,7 +112,7 @@ interface TicketRecord {
   id: number
   sale_id: number
   kind: string
-  html: string
+  html_size?: number
   created_at: string
 }
 
@@ -231,9 +231,12 @@ export default function GestionPedidosPage() {
     setShowPagoModal(true)
   }
 
-  const openTicketHtml = (html: string) => {
+  const openTicketHtml = async (ticketId: number) => {
+    // Abrir la ventana antes de pedir el HTML (los listados ya no lo traen) para que el
+    // navegador no la bloquee como popup
     const w = window.open('', '_blank');
     if (!w) return;
+    const html = await fetchTicketHtml(ticketId);
     w.document.write(html);
     w.document.close();
     w.addEventListener('load', () => setTimeout(() => w.print(), 300));
@@ -1274,7 +1277,7 @@ export default function GestionPedidosPage() {
                               {ticket ? (
                                 <button
                                   className="text-blue-600 hover:text-blue-800 underline text-xs"
-                                  onClick={() => openTicketHtml(ticket.html)}
+                                  onClick={() => openTicketHtml(ticket.id)}
                                 >
                                   {ticketLabel}
                                 </button>
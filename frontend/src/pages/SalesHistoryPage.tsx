@@ -2,6 +2,7 @@ import React, { useEffect, useRef, useState } from 'react'
 import Layout from '../components/Layout'
 import { api } from '../utils/api'
 import { cleanFolio } from '../utils/folioHelper'
+import { fetchTicketHtml } from '../utils/ticketGenerator'
 
 type Sale = { id: number; total: string; created_at: string; user_id?: number | null; vendedor_id?: number | null; tipo_venta?: string; folio_venta?: string; folio_apartado?: string; user?: { email: string } }
 type User = { id: number; email: string }
@@ -483,12 +484,13 @@ export default function SalesHistoryPage() {
         
         if (selectedTicket) {
           // DEBUG: Ver un preview del HTML para verificar que es el ticket correcto
-          const htmlPreview = selectedTicket.html.substring(0, 200)
+          const html = await fetchTicketHtml(selectedTicket.id)
+          const htmlPreview = html.substring(0, 200)
           console.log(`[DEBUG] HTML preview del ticket seleccionado:`, htmlPreview)
           
           const w = window.open('', '_blank')
           if (!w) return
-          w.document.write(selectedTicket.html)
+          w.document.write(html)
           w.document.close()
           // Asegurar impresión
           w.addEventListener('load', () => setTimeout(() => w.print(), 300))
@@ -387,6 +387,15 @@ export const saveTicket = async (params: {
   }
 }
 
+/**
+ * Fetch the HTML of a saved ticket (listings only return metadata).
+ * The browser revalidates with the ETag, so a ticket already seen is not downloaded again.
+ */
+export const fetchTicketHtml = async (ticketId: number): Promise<string> => {
+  const response = await api.get(`/tickets/${ticketId}/html`, { responseType: 'text' })
+  return response.data
+}
+
 /**
  * Generate HTML for apartado/credit payment ticket
  */